@@ -0,0 +1,53 @@
+# Copyright (c) 2025, RenderCores.com and contributors
+# For license information, please see license.txt
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("reconstruir-saldos-contables")
+@click.option("--desde", help="Primer mes a reconstruir (AAAA-MM-DD); por defecto desde el inicio")
+@click.option("--hasta", help="Último mes a reconstruir (AAAA-MM-DD); por defecto hasta hoy")
+@pass_context
+def reconstruir_saldos_contables(context, desde=None, hasta=None):
+	"""Recalcula Saldo de Cuenta desde las Pólizas y Asientos Contables enviados"""
+	import frappe
+
+	from endersuite.contabilidad.services.balance_service import reconstruir_saldos
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		filas = reconstruir_saldos(desde, hasta)
+		frappe.db.commit()
+		click.echo(f"Saldos de Cuenta reconstruidos: {filas} filas")
+	finally:
+		frappe.destroy()
+
+
+@click.command("importar-polizas")
+@click.argument("ruta")
+@click.option("--borrador", is_flag=True, default=False, help="Importar sin enviar las pólizas")
+@click.option("--tamano-lote", type=int, default=1000, help="Pólizas por lote y transacción")
+@pass_context
+def importar_polizas(context, ruta, borrador=False, tamano_lote=1000):
+	"""Importa pólizas desde un archivo CSV o JSONL, un renglón por movimiento"""
+	import frappe
+
+	from endersuite.contabilidad.services.poliza_import_service import importar_polizas as importar
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		frappe.set_user("Administrator")
+		resumen = importar(ruta, enviar=not borrador, tamano_lote=tamano_lote)
+		click.echo(f"Pólizas importadas: {resumen.polizas} ({resumen.movimientos} movimientos)")
+		if resumen.errores:
+			click.echo(f"Errores: {len(resumen.errores)}; reporte en {resumen.reporte}")
+	finally:
+		frappe.destroy()
+
+
+commands = [reconstruir_saldos_contables, importar_polizas]
@@ -0,0 +1,31 @@
+// Copyright (c) 2025, RenderCores.com and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Cierre de Periodo", {
+	setup(frm) {
+		// Solo cuentas de detalle del catálogo de la compañía
+		frm.set_query("cuenta_de_resultados", function () {
+			if (frm.doc.compania) {
+				return {
+					query: "endersuite.contabilidad.doctype.poliza.poliza.get_cuentas_by_compania",
+					filters: { compania: frm.doc.compania },
+				};
+			}
+		});
+	},
+
+	refresh(frm) {
+		const colores = { Pendiente: "gray", "En Proceso": "orange", Completado: "green", Error: "red" };
+		if (frm.doc.docstatus === 1 && frm.doc.estado) {
+			frm.dashboard.set_headline_alert(__("Estado del cierre: {0}", [__(frm.doc.estado)]), colores[frm.doc.estado]);
+		}
+
+		// El cierre corre en segundo plano; recargar al terminar
+		frappe.realtime.off("cierre_de_periodo");
+		frappe.realtime.on("cierre_de_periodo", (data) => {
+			if (data.cierre === frm.doc.name) {
+				frm.reload_doc();
+			}
+		});
+	},
+});
@@ -0,0 +1,78 @@
+# Copyright (c) 2025, RenderCores.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import getdate
+
+from endersuite.contabilidad.services import period_close_service
+
+
+class CierredePeriodo(Document):
+	def validate(self):
+		"""Validaciones antes de guardar"""
+		self.establecer_fechas()
+		self.validar_cuenta_de_resultados()
+		self.validar_orden_de_cierres()
+
+	def before_submit(self):
+		self.validar_polizas_en_borrador()
+
+	def on_submit(self):
+		period_close_service.encolar_cierre(self)
+
+	def before_cancel(self):
+		if self.estado == "En Proceso":
+			frappe.throw(_("El cierre está en proceso; espere a que termine para cancelarlo"))
+
+		posterior = frappe.db.exists("Cierre de Periodo", {
+			"compania": self.compania,
+			"docstatus": 1,
+			"fecha_cierre": [">", self.fecha_cierre]
+		})
+		if posterior:
+			frappe.throw(_("Primero cancele el cierre posterior {0}").format(posterior))
+
+	def on_cancel(self):
+		period_close_service.reabrir_cierre(self)
+
+	def establecer_fechas(self):
+		"""Toma el rango del año fiscal"""
+		desde, hasta = frappe.db.get_value("Anio Fiscal", self.anio_fiscal, ["desde", "hasta"])
+		self.fecha_inicio = desde
+		self.fecha_cierre = hasta
+
+	def validar_cuenta_de_resultados(self):
+		"""La cuenta de resultados debe ser una cuenta de detalle del catálogo de la compañía"""
+		catalogo = frappe.db.get_value("Compania", self.compania, "catalogo")
+		cuenta = frappe.db.get_value("Cuenta", self.cuenta_de_resultados, ["catalogo", "is_group"], as_dict=True)
+
+		if not cuenta or cuenta.catalogo != catalogo:
+			frappe.throw(_("La cuenta {0} no pertenece al catálogo {1}").format(self.cuenta_de_resultados, catalogo))
+		if cuenta.is_group:
+			frappe.throw(_("La cuenta de resultados {0} es un grupo").format(self.cuenta_de_resultados))
+
+	def validar_orden_de_cierres(self):
+		"""Un solo cierre por ejercicio y en orden: no se cierra un año anterior a uno ya cerrado"""
+		filtros = {"compania": self.compania, "docstatus": 1, "name": ["!=", self.name]}
+
+		duplicado = frappe.db.exists("Cierre de Periodo", {**filtros, "anio_fiscal": self.anio_fiscal})
+		if duplicado:
+			frappe.throw(_("El año fiscal {0} ya tiene el cierre {1}").format(self.anio_fiscal, duplicado))
+
+		posterior = frappe.db.exists("Cierre de Periodo", {**filtros, "fecha_cierre": [">", getdate(self.fecha_cierre)]})
+		if posterior:
+			frappe.throw(_("Ya existe un cierre posterior ({0}); los ejercicios se cierran en orden").format(posterior))
+
+	def validar_polizas_en_borrador(self):
+		"""Las pólizas en borrador del ejercicio no podrían enviarse después del cierre"""
+		borradores = frappe.db.count("Poliza", {
+			"compañia": self.compania,
+			"docstatus": 0,
+			"fecha": ["between", [self.fecha_inicio, f"{self.fecha_cierre} 23:59:59"]]
+		})
+		if borradores:
+			frappe.throw(_(
+				"Hay {0} pólizas en borrador en el ejercicio. Envíelas o elimínelas antes de cerrar."
+			).format(borradores))
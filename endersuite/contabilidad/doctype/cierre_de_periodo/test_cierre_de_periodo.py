@@ -0,0 +1,104 @@
+# Copyright (c) 2025, RenderCores.com and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from endersuite.contabilidad.services import balance_service, period_close_service
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+
+
+class IntegrationTestCierredePeriodo(IntegrationTestCase):
+	"""
+	Integration tests for CierredePeriodo.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def crear_compania(self):
+		"""Compañía con año fiscal 2016 propio y un catálogo mínimo, insertados directamente"""
+		sufijo = frappe.generate_hash(length=8)
+		anio, catalogo, compania = f"FY-{sufijo}", f"CAT-{sufijo}", f"CIA-{sufijo}"
+		frappe.get_doc({"doctype": "Anio Fiscal", "name": anio, "nombre": anio, "empresa": compania,
+			"desde": "2016-01-01", "hasta": "2016-12-31", "estado": "Abierto"}).db_insert()
+		frappe.get_doc({"doctype": "Catalogo", "name": catalogo, "nombre_del_catalogo": catalogo}).db_insert()
+		frappe.get_doc({"doctype": "Compania", "name": compania, "nombre_de_la_empresa": compania,
+			"catalogo": catalogo, "anio_fiscal": anio}).db_insert()
+
+		lft = (frappe.db.sql("SELECT MAX(rgt) FROM `tabCuenta`")[0][0] or 0) + 1
+		for raiz, hoja, izq in (("Activo", "Caja", 0), ("Ingreso", "Ventas", 4), ("Gasto", "Renta", 8), ("Capital", "Resultados", 12)):
+			frappe.get_doc({"doctype": "Cuenta", "name": f"{catalogo}-{raiz}", "cuenta": raiz, "catalogo": catalogo,
+				"is_group": 1, "protected_root": 1, "lft": lft + izq, "rgt": lft + izq + 3}).db_insert()
+			frappe.get_doc({"doctype": "Cuenta", "name": f"{catalogo}-{hoja}", "cuenta": hoja, "catalogo": catalogo,
+				"parent_cuenta": f"{catalogo}-{raiz}", "lft": lft + izq + 1, "rgt": lft + izq + 2}).db_insert()
+
+		return compania, catalogo, anio
+
+	def registrar_poliza(self, compania, catalogo, anio, fecha, movimientos):
+		"""Póliza enviada insertada directamente y sumada a los saldos; movimientos: [(cuenta, debe, haber)]"""
+		poliza = frappe.get_doc({
+			"doctype": "Poliza",
+			"name": frappe.generate_hash(length=10),
+			"fecha": fecha,
+			"compañia": compania,
+			"año_fiscal": anio,
+			"table_qbss": [{"cuenta": f"{catalogo}-{c}", "debe": d, "haber": h} for c, d, h in movimientos]
+		})
+		poliza.docstatus = 1
+		poliza.db_insert()
+		for fila in poliza.get_all_children():
+			fila.db_insert()
+		balance_service.registrar_poliza(poliza)
+
+	def test_cierre_salda_resultados_y_reportes_parten_del_cierre(self):
+		"""El cierre salda Ingreso y Gasto, guarda el Saldo de Cierre y bloquea el ejercicio"""
+		compania, catalogo, anio = self.crear_compania()
+		self.registrar_poliza(compania, catalogo, anio, "2016-03-01 10:00:00", [("Caja", 1000, 0), ("Ventas", 0, 1000)])
+		self.registrar_poliza(compania, catalogo, anio, "2016-05-01 10:00:00", [("Renta", 300, 0), ("Caja", 0, 300)])
+
+		cierre = frappe.get_doc({
+			"doctype": "Cierre de Periodo",
+			"compania": compania,
+			"anio_fiscal": anio,
+			"cuenta_de_resultados": f"{catalogo}-Resultados"
+		}).insert()
+		# Enviado sin encolar: el cierre se ejecuta aquí mismo
+		cierre.docstatus = 1
+		cierre.estado = "En Proceso"
+		cierre.db_update()
+		period_close_service.ejecutar_cierre(cierre.name)
+		cierre.reload()
+
+		self.assertEqual(cierre.estado, "Completado", cierre.error)
+		self.assertEqual(cierre.utilidad, 700)
+		poliza = frappe.get_doc("Poliza", cierre.poliza_de_cierre)
+		self.assertEqual(
+			sorted((m.cuenta, m.debe, m.haber) for m in poliza.table_qbss),
+			[(f"{catalogo}-Renta", 0, 300), (f"{catalogo}-Resultados", 0, 700), (f"{catalogo}-Ventas", 1000, 0)]
+		)
+
+		saldos = dict(frappe.get_all("Saldo de Cierre", filters={"cierre": cierre.name}, fields=["cuenta", "saldo"], as_list=True))
+		self.assertEqual(saldos[f"{catalogo}-Caja"], 700)
+		self.assertEqual(saldos[f"{catalogo}-Ventas"], 0)
+		self.assertEqual(saldos[f"{catalogo}-Resultados"], -700)
+
+		# El ejercicio queda bloqueado; el siguiente sigue abierto
+		self.assertEqual(period_close_service.get_cierre(compania, "2016-06-01"), cierre.name)
+		self.assertIsNone(period_close_service.get_cierre(compania, "2017-01-15"))
+		self.assertEqual(frappe.db.get_value("Anio Fiscal", anio, "estado"), "Cerrado")
+
+		# Los saldos posteriores parten del Saldo de Cierre más el periodo abierto
+		self.registrar_poliza(compania, catalogo, None, "2017-02-01 10:00:00", [("Caja", 50, 0), ("Ventas", 0, 50)])
+		self.assertEqual(balance_service.get_saldo("Cuenta", f"{catalogo}-Caja", compania=compania).saldo, 750)
+
+		balanza = {f.cuenta: f for f in balance_service.get_balanza(catalogo, compania=compania, desde="2017-01-01")}
+		caja = balanza[f"{catalogo}-Caja"]
+		self.assertEqual((caja.saldo_inicial, caja.debe, caja.saldo_final), (700, 50, 750))
+		self.assertEqual(balanza[f"{catalogo}-Ingreso"].saldo_final, -50)
+		self.assertEqual(balanza[f"{catalogo}-Capital"].saldo_final, -700)
@@ -1,9 +1,14 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import frappe
 from frappe.tests import IntegrationTestCase
 
+from endersuite.ventas.services import certificate_service, pac_service
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
@@ -19,4 +24,74 @@ class IntegrationTestConfiguracionPAC(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def crear_certificado(self, serial, rfc, desde, hasta):
+		"""Certificado autofirmado con serial y RFC al estilo de un CSD del SAT"""
+		from cryptography import x509
+		from cryptography.hazmat.primitives import hashes, serialization
+		from cryptography.hazmat.primitives.asymmetric import rsa
+		from cryptography.x509.oid import NameOID
+
+		llave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+		nombre = x509.Name([
+			x509.NameAttribute(NameOID.COMMON_NAME, "ESCUELA KEMPER URGATE"),
+			x509.NameAttribute(NameOID.X500_UNIQUE_IDENTIFIER, f"{rfc} / VADA800927DJ3".encode())
+		])
+		cert = (
+			x509.CertificateBuilder()
+			.subject_name(nombre)
+			.issuer_name(nombre)
+			.public_key(llave.public_key())
+			.serial_number(serial)
+			.not_valid_before(desde)
+			.not_valid_after(hasta)
+			.sign(llave, hashes.SHA256())
+		)
+		return cert.public_bytes(serialization.Encoding.PEM).decode()
+
+	def test_certificado_se_lee_una_vez(self):
+		"""El registro interpreta cada certificado una sola vez y extrae número, RFC y vigencia"""
+		ahora = datetime.now(timezone.utc)
+		cer_pem = self.crear_certificado(0x0102030405, "EKU9003173C9", ahora - timedelta(days=1), ahora + timedelta(days=365))
+
+		leer_original = certificate_service._leer_certificado
+		with patch.object(certificate_service, "_leer_certificado", wraps=leer_original) as leer:
+			primero = certificate_service.get_certificado(cer_pem)
+			segundo = certificate_service.get_certificado(cer_pem)
+
+		self.assertEqual(leer.call_count, 1)
+		self.assertIs(primero, segundo)
+		self.assertEqual(primero.numero, "00000000000000012345")
+		self.assertEqual(primero.rfc, "EKU9003173C9")
+		self.assertEqual(primero.huella, certificate_service.huella(cer_pem))
+		self.assertEqual(certificate_service.validar_vigencia(cer_pem), primero)
+
+	def test_certificado_vencido_se_rechaza(self):
+		"""Un certificado vencido se rechaza antes de enviarlo al PAC"""
+		ahora = datetime.now(timezone.utc)
+		cer_pem = self.crear_certificado(99, "EKU9003173C9", ahora - timedelta(days=30), ahora - timedelta(days=1))
+
+		with self.assertRaises(frappe.ValidationError):
+			certificate_service.validar_vigencia(cer_pem)
+
+	def test_configuracion_por_sitio(self):
+		"""Un worker con varios sitios usa la URL y la API Key del sitio actual aunque compartan versión"""
+		config = frappe.get_single("Configuracion PAC")
+		config.update({"activo": 1, "modo": "Pruebas", "api_key": "prueba", "url_timbrado_json": "https://pac.este-sitio.test"})
+		config.flags.ignore_mandatory = True
+		config.save(ignore_permissions=True)
+
+		otro_sitio = f"{frappe.generate_hash(length=8)}.test"
+		self.addCleanup(pac_service._configuracion.pop, otro_sitio, None)
+
+		with patch.object(frappe.local, "site", otro_sitio):
+			pac_service._configuracion[otro_sitio] = frappe._dict({
+				"version": pac_service._version_configuracion(),
+				"config": frappe._dict({"url_timbrado_json": "https://pac.otro-sitio.test"}),
+				"api_key": "llave-otro-sitio"
+			})
+			otro = pac_service.ServicioPAC()
+			self.assertEqual((otro.api_key, otro.config.url_timbrado_json), ("llave-otro-sitio", "https://pac.otro-sitio.test"))
+
+		este = pac_service.ServicioPAC()
+		self.assertNotEqual(este.api_key, "llave-otro-sitio")
+		self.assertEqual(este.config.url_timbrado_json, "https://pac.este-sitio.test")
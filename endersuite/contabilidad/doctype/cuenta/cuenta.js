@@ -1,5 +1,13 @@
 frappe.ui.form.on('Cuenta', {
     refresh: function (frm) {
-        // Configuración adicional del formulario si es necesario
+        // Saldo de la cuenta enviado por el backend (Saldo de Cuenta)
+        const saldo = frm.doc.__onload && frm.doc.__onload.saldo;
+        if (saldo) {
+            frm.dashboard.set_headline(__("Debe: {0} · Haber: {1} · Saldo: {2}", [
+                format_currency(saldo.debe),
+                format_currency(saldo.haber),
+                format_currency(saldo.saldo)
+            ]));
+        }
     }
 });
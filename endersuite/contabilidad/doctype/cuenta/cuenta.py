@@ -1,10 +1,17 @@
 import frappe
 from frappe.utils.nestedset import NestedSet
 
+from endersuite.contabilidad.services.balance_service import TIPO_CUENTA, get_balanza, get_saldo
+
 
 class Cuenta(NestedSet):
     DEFAULT_ROOTS = ["Activo", "Pasivo", "Capital", "Ingreso", "Gasto"]
 
+    def onload(self):
+        """Envía el saldo de la cuenta desde Saldo de Cuenta, sin recorrer las pólizas."""
+        if not self.get("is_group"):
+            self.set_onload("saldo", get_saldo(TIPO_CUENTA, self.name))
+
     def on_trash(self, allow_root_deletion: bool = False):
         """Impide eliminar cuentas raíz protegidas."""
         if self.get("protected_root") and not allow_root_deletion:
@@ -121,4 +128,28 @@ def get_children(doctype, parent="", include_disabled=False, catalogo=None, **fi
         ignore_permissions=True,
     )
 
+    # Saldos de los nodos visibles, cada grupo con su subárbol, en una sola consulta
+    if children:
+        saldos = {
+            s.cuenta: s
+            for s in get_balanza(catalogo, cuentas=[c.value for c in children])
+        }
+        for child in children:
+            saldo = saldos.get(child.value)
+            child.debe = saldo.debe if saldo else 0
+            child.haber = saldo.haber if saldo else 0
+            child.saldo = saldo.saldo_final if saldo else 0
+
     return children
+
+
+@frappe.whitelist()
+def get_balanza_catalogo(catalogo, compania=None, desde=None, hasta=None):
+    """Balanza de comprobación del catálogo completo, con los grupos sumados (ver balance_service.get_balanza)."""
+    frappe.has_permission("Cuenta", "read", throw=True)
+    return get_balanza(catalogo, compania=compania, desde=desde, hasta=hasta)
+
+
+def on_doctype_update():
+    # Los saldos por árbol buscan cuentas por intervalo lft dentro del catálogo
+    frappe.db.add_index("Cuenta", ["catalogo", "lft"])
@@ -107,7 +107,11 @@ frappe.treeview_settings['Cuenta'] = {
         });
     },
     get_label: function (node) {
-        // Mostrar solo el nombre de la cuenta
-        return __(node.title || node.label || node.value || 'Sin nombre');
+        // Mostrar el nombre de la cuenta y su saldo (los grupos suman su subárbol)
+        const label = __(node.title || node.label || node.value || 'Sin nombre');
+        if (node.data && node.data.saldo !== undefined) {
+            return label + ' <span class="text-muted small">' + format_currency(node.data.saldo) + '</span>';
+        }
+        return label;
     }
 };
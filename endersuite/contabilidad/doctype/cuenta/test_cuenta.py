@@ -0,0 +1,120 @@
+# Copyright (c) 2025, RenderCores.com and Contributors
+# See license.txt
+
+import os
+import time
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import now_datetime
+
+from endersuite.contabilidad.doctype.cuenta.cuenta import get_children
+from endersuite.contabilidad.services import balance_service
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+# Catálogo generado: 5 raíces × 10 grupos × 100 cuentas = 5,055 nodos
+RAICES = 5
+GRUPOS_POR_RAIZ = 10
+CUENTAS_POR_GRUPO = 100
+PERIODOS = ("2018-01-01", "2018-02-01", "2018-03-01")
+
+# Las mediciones de tiempo solo se reportan con ENDERSUITE_BENCHMARKS=1
+BENCHMARKS = bool(os.environ.get("ENDERSUITE_BENCHMARKS"))
+
+
+class IntegrationTestCuenta(IntegrationTestCase):
+	"""
+	Integration tests for Cuenta.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def generar_catalogo(self):
+		"""
+		Inserta el árbol con lft/rgt ya calculados y un saldo por cuenta y mes.
+
+		Returns:
+			tuple: (catalogo, raices, esperado) con esperado = {cuenta: (debe, haber)} por raíz
+		"""
+		catalogo = frappe.generate_hash(length=10)
+		siguiente = [(frappe.db.sql("SELECT MAX(rgt) FROM `tabCuenta`")[0][0] or 0) + 1]
+		ahora = now_datetime()
+		filas, saldos, raices, esperado = [], {}, [], {}
+
+		def nodo(nombre, padre, es_grupo, hijos=()):
+			lft = siguiente[0]
+			siguiente[0] += 1
+			for hijo in hijos:
+				hijo()
+			rgt = siguiente[0]
+			siguiente[0] += 1
+			filas.append((f"{catalogo}-{nombre}", ahora, ahora, "Administrator", "Administrator", 0, 0,
+				nombre, catalogo, es_grupo, padre, lft, rgt))
+
+		def hoja(nombre, padre, raiz, numero):
+			def crear():
+				nodo(nombre, padre, 0)
+				for mes, periodo in enumerate(PERIODOS, start=1):
+					debe, haber = numero % 7 + mes, numero % 3
+					balance_service._agregar(saldos, "Cuenta", f"{catalogo}-{nombre}", None, None, periodo,
+						debe=debe, haber=haber, movimientos=1)
+					total = esperado.setdefault(raiz, [0, 0])
+					total[0] += debe
+					total[1] += haber
+			return crear
+
+		def grupo(nombre, padre, raiz, indice):
+			return lambda: nodo(nombre, padre, 1, [
+				hoja(f"{nombre}.{c}", f"{catalogo}-{nombre}", raiz, indice * CUENTAS_POR_GRUPO + c)
+				for c in range(CUENTAS_POR_GRUPO)
+			])
+
+		for r in range(RAICES):
+			raiz = f"{catalogo}-R{r}"
+			raices.append(raiz)
+			nodo(f"R{r}", None, 1, [grupo(f"R{r}.{g}", raiz, raiz, g) for g in range(GRUPOS_POR_RAIZ)])
+
+		frappe.db.bulk_insert("Cuenta", [
+			"name", "creation", "modified", "owner", "modified_by", "docstatus", "idx",
+			"cuenta", "catalogo", "is_group", "parent_cuenta", "lft", "rgt"
+		], filas, chunk_size=1000)
+
+		filas_saldo = list(saldos.values())
+		for inicio in range(0, len(filas_saldo), 500):
+			balance_service.aplicar_saldos(filas_saldo[inicio:inicio + 500])
+
+		return catalogo, raices, esperado
+
+	def test_balanza_suma_subarboles_en_una_consulta(self):
+		"""Balanza de un catálogo de 5k cuentas en una consulta y saldos en el árbol"""
+		catalogo, raices, esperado = self.generar_catalogo()
+
+		inicio = time.perf_counter()
+		with self.assertQueryCount(1):
+			balanza = balance_service.get_balanza(catalogo)
+		transcurrido = time.perf_counter() - inicio
+		if BENCHMARKS:
+			print(f"\nBalanza de {len(balanza)} cuentas: {transcurrido * 1000:.1f} ms")
+
+		self.assertEqual(len(balanza), RAICES * (1 + GRUPOS_POR_RAIZ * (1 + CUENTAS_POR_GRUPO)))
+		por_cuenta = {f.cuenta: f for f in balanza}
+		for raiz in raices:
+			debe, haber = esperado[raiz]
+			self.assertEqual((por_cuenta[raiz].debe, por_cuenta[raiz].haber), (debe, haber))
+			self.assertEqual(por_cuenta[raiz].saldo_final, debe - haber)
+
+		# Con periodo: lo anterior pasa a saldo inicial y el saldo final no cambia
+		con_periodo = {f.cuenta: f for f in balance_service.get_balanza(catalogo, desde=PERIODOS[1])}
+		raiz = con_periodo[raices[0]]
+		self.assertEqual(raiz.saldo_inicial + raiz.debe - raiz.haber, por_cuenta[raices[0]].saldo_final)
+
+		# El árbol pide los saldos de los hijos visibles en una consulta, no uno por nodo
+		hijos = get_children("Cuenta", parent=raices[0], catalogo=catalogo)
+		self.assertEqual(len(hijos), GRUPOS_POR_RAIZ)
+		self.assertEqual(sum(h.saldo for h in hijos), por_cuenta[raices[0]].saldo_final)
+		self.assertEqual(hijos[0].saldo, por_cuenta[hijos[0].value].saldo_final)
@@ -1,9 +1,11 @@
 # Copyright (c) 2025, RenderCores.com and contributors
 # For license information, please see license.txt
 
-import frappe
+from frappe.utils import flt
 from frappe.utils.nestedset import NestedSet
 
+from endersuite.contabilidad.services.balance_service import TIPO_CUENTA_CONTABLE, get_saldos_por_periodo
+
 
 class CuentaContable(NestedSet):
 	def onload(self):
@@ -11,57 +13,33 @@ class CuentaContable(NestedSet):
 		self.generar_html_t()
 
 	def generar_html_t(self):
-		# Consulta SQL Corregida:
-		# 1. Busca en la tabla hija 'tabDetalle Asiento' (alias child)
-		# 2. Une con el padre 'tabAsiento Contable' (alias parent)
-		# 3. Importante: Filtra solo asientos validados (docstatus=1)
-		
-		sql = """
-			SELECT 
-				child.debito, 
-				child.credito, 
-				parent.posting_date, 
-				parent.name as asiento_id
-			FROM `tabDetalle Asiento` child
-			INNER JOIN `tabAsiento Contable` parent ON child.parent = parent.name
-			WHERE 
-				child.cuenta = %s 
-				AND parent.docstatus = 1
-			ORDER BY parent.posting_date DESC, parent.creation DESC
-			LIMIT 50
-		"""
-		
-		# Ejecutamos la consulta
-		movimientos = frappe.db.sql(sql, (self.name), as_dict=True)
+		# Los saldos se leen de Saldo de Cuenta (balance_service): una fila por
+		# mes, mantenida al enviar y cancelar Asientos Contables
+		periodos = get_saldos_por_periodo(TIPO_CUENTA_CONTABLE, self.name)
 
-		# Calculamos los totales matemáticos
-		suma_debe = sum(flt(m.debito) for m in movimientos)
-		suma_haber = sum(flt(m.credito) for m in movimientos)
+		suma_debe = sum(flt(p.debe) for p in periodos)
+		suma_haber = sum(flt(p.haber) for p in periodos)
 		saldo = suma_debe - suma_haber
+		self.saldo_actual = saldo
 
 		# Generamos el HTML visual
-		self.construir_visualizacion(movimientos, suma_debe, suma_haber, saldo)
+		self.construir_visualizacion(periodos, suma_debe, suma_haber, saldo)
 
-	def construir_visualizacion(self, movimientos, debe, haber, saldo):
+	def construir_visualizacion(self, periodos, debe, haber, saldo):
 		filas_html = ""
 		estilo_borde = "border-right: 2px solid #333;"
 		
-		for m in movimientos:
+		for p in periodos:
 			# Formato de moneda con comas
-			val_debe = f"{m.debito:,.2f}" if m.debito > 0 else ""
-			val_haber = f"{m.credito:,.2f}" if m.credito > 0 else ""
-			
-			# Crear enlace para ir al asiento al hacer clic
-			link = frappe.utils.get_url_to_form('Asiento Contable', m.asiento_id)
-			
+			val_debe = f"{flt(p.debe):,.2f}" if flt(p.debe) else ""
+			val_haber = f"{flt(p.haber):,.2f}" if flt(p.haber) else ""
+			mes = p.periodo.strftime("%m/%Y")
+
 			filas_html += f"""
 			<tr style="border-bottom: 1px solid #eee;">
-				<td style="{estilo_borde} text-align: right; padding: 4px; font-family: monospace;">
-					<a href="{link}" style="text-decoration: none; color: inherit;">{val_debe}</a>
-				</td>
-				<td style="text-align: right; padding: 4px; font-family: monospace;">
-					<a href="{link}" style="text-decoration: none; color: inherit;">{val_haber}</a>
-				</td>
+				<td style="padding: 4px; color: #888; width: 70px;">{mes}</td>
+				<td style="{estilo_borde} text-align: right; padding: 4px; font-family: monospace;">{val_debe}</td>
+				<td style="text-align: right; padding: 4px; font-family: monospace;">{val_haber}</td>
 			</tr>
 			"""
 
@@ -71,6 +49,7 @@ class CuentaContable(NestedSet):
 			<h3 style="text-align: center; border-bottom: 2px solid #333; margin: 0 0 10px 0; padding-bottom: 5px;">{self.nombre_cuenta}</h3>
 			
 			<div style="display: flex; border-bottom: 2px solid #333; font-weight: bold; background-color: #f9f9f9;">
+				<div style="width: 70px; padding: 5px;">MES</div>
 				<div style="flex: 1; text-align: center; {estilo_borde} padding: 5px;">DEBE</div>
 				<div style="flex: 1; text-align: center; padding: 5px;">HABER</div>
 			</div>
@@ -79,6 +58,7 @@ class CuentaContable(NestedSet):
 				{filas_html}
 				
 				<tr style="border-top: 2px solid #333; font-weight: bold; background-color: #f0f0f0;">
+					<td style="padding: 8px;"></td>
 					<td style="{estilo_borde} text-align: right; padding: 8px;">{debe:,.2f}</td>
 					<td style="text-align: right; padding: 8px;">{haber:,.2f}</td>
 				</tr>
@@ -2,6 +2,29 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on("Factura de Venta", {
+    setup(frm) {
+        // El timbrado corre en segundo plano; el resultado llega por realtime
+        frappe.realtime.on('timbrado_factura', (data) => {
+            if (data.name !== frm.doc.name) {
+                return;
+            }
+            frm.reload_doc();
+            if (data.estado === 'Timbrada') {
+                frappe.msgprint({
+                    title: __('Timbrado exitoso'),
+                    indicator: 'green',
+                    message: __('UUID: {0}', [data.uuid || ''])
+                });
+            } else if (data.estado === 'Error') {
+                frappe.msgprint({
+                    title: __('Error al timbrar'),
+                    indicator: 'red',
+                    message: data.error || __('Error desconocido')
+                });
+            }
+        });
+    },
+
     refresh(frm) {
         // Botón para obtener notas de venta (siempre visible si no está enviada)
         if (frm.doc.docstatus === 0) {
@@ -15,8 +38,13 @@ frappe.ui.form.on("Factura de Venta", {
             frm.dashboard.add_indicator(__('Timbrada - UUID: {0}', [frm.doc.uuid]), 'green');
         }
 
-        // Botón de timbrado (solo si está enviada y aún no timbrada)
-        if (frm.doc.docstatus === 1 && !frm.doc.uuid) {
+        const timbrando = ['Pendiente', 'Timbrando'].includes(frm.doc.estado_timbrado);
+        if (timbrando && !frm.doc.uuid) {
+            frm.dashboard.add_indicator(__('Timbrado en proceso'), 'orange');
+        }
+
+        // Botón de timbrado (solo si está enviada, aún no timbrada y no se está timbrando)
+        if (frm.doc.docstatus === 1 && !frm.doc.uuid && !timbrando) {
             frm.add_custom_button(__('Timbrar en SAT'), function () {
                 frappe.confirm(
                     __('Esto enviará la factura al PAC para timbrado. ¿Continuar?'),
@@ -42,15 +70,15 @@ function timbrar_en_sat(frm) {
             factura_name: frm.doc.name
         },
         freeze: true,
-        freeze_message: __('Timbrando en SAT...'),
+        freeze_message: __('Enviando a timbrar...'),
         callback: function (r) {
             if (r.message && r.message.success) {
+                // El resultado llega por el evento realtime timbrado_factura
+                frappe.show_alert({
+                    message: r.message.message,
+                    indicator: 'blue'
+                }, 5);
                 frm.reload_doc();
-                frappe.msgprint({
-                    title: __('Timbrado exitoso'),
-                    indicator: 'green',
-                    message: __('UUID: {0}', [r.message.uuid || frm.doc.uuid || ''])
-                });
             }
         }
     });
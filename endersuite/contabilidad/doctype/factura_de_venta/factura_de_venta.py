@@ -4,7 +4,9 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import nowdate
+
+from endersuite.ventas.services.global_invoice_service import actualizar_estado_notas, liberar_notas_reservadas
+from endersuite.ventas.services.tax_service import get_tabla_tasas
 
 
 def _bool(value):
@@ -26,24 +28,19 @@ class FacturadeVenta(Document):
 		frappe.msgprint(_("Factura de Venta {0} cancelada").format(self.name))
 
 	def actualizar_estado_notas(self, estado):
-		"""Actualiza el estado de las notas de venta relacionadas"""
-		if not self.notas_relacionadas:
-			return
-			
-		factura_link = self.name if estado == "Facturado" else None
-		
-		for item in self.notas_relacionadas:
-			if item.nota_de_venta:
-				frappe.db.set_value("Nota de Venta", item.nota_de_venta, {
-					"estado_facturacion": estado,
-					"factura_de_venta": factura_link
-				})
+		"""Actualiza el estado de las notas de venta relacionadas con un solo UPDATE"""
+		actualizar_estado_notas(self, estado)
+
+	def on_trash(self):
+		"""Libera las notas reservadas por la Factura Global en borrador"""
+		liberar_notas_reservadas(self)
 
 @frappe.whitelist()
 def get_notas_pendientes(cliente=None, fecha_inicio=None, fecha_fin=None):
 	"""Obtiene notas de venta pendientes de facturar"""
 	filters = {
 		"estado_facturacion": "Pendiente",
+		"factura_de_venta": ["is", "not set"],  # Sin reservar por una Factura Global en borrador
 		"docstatus": 1  # Solo notas enviadas
 	}
 	
@@ -75,6 +72,9 @@ def get_notas_details(notas_list):
 		
 	if not notas_list:
 		return {}
+	
+	# Tabla de impuestos en memoria, resuelta una vez para todas las líneas
+	tasas = get_tabla_tasas()
 		
 	data = {
 		"notas_relacionadas": [],
@@ -111,7 +111,7 @@ def get_notas_details(notas_list):
 				
 				# Si el monto es 0 pero tiene impuesto, intentamos recalcular (para notas antiguas)
 				if monto_impuesto == 0 and item.impuesto:
-					impuesto_data = frappe.db.get_value("Impuestos", item.impuesto, ["porciento_impuesto", "incluido_en_el_precio"], as_dict=True)
+					impuesto_data = tasas.get(item.impuesto)
 					if impuesto_data:
 						tasa = float(impuesto_data.porciento_impuesto or 0)
 						incluido = impuesto_data.incluido_en_el_precio
@@ -136,10 +136,8 @@ def get_notas_details(notas_list):
 							monto_impuesto = base * (tasa / 100)
 
 				if monto_impuesto > 0 and item.impuesto:
-					# Verificar si es retenido o trasladado
-					# Ya tenemos impuesto_data si recalculamos, sino lo buscamos
-					if 'impuesto_data' not in locals():
-						impuesto_data = frappe.db.get_value("Impuestos", item.impuesto, ["incluido_en_el_precio"], as_dict=True)
+					# Verificar si es retenido o trasladado (tabla de impuestos en memoria)
+					impuesto_data = tasas.get(item.impuesto)
 					
 					es_retenido = impuesto_data.incluido_en_el_precio if impuesto_data else 0
 					
@@ -177,9 +175,10 @@ def get_notas_details(notas_list):
 
 @frappe.whitelist()
 def timbrar_en_sat(factura_name: str):
-	"""Timbra una Factura de Venta mediante el servicio PAC.
+	"""Encola el timbrado de una Factura de Venta mediante el servicio PAC.
 
-	Guarda `uuid`, `xml_timbrado` y `fecha_de_timbrado` en el documento.
+	El job guarda `uuid`, `xml_timbrado` y `fecha_de_timbrado` en el documento
+	y avisa al formulario con el evento realtime `timbrado_factura`.
 	"""
 	if not factura_name:
 		frappe.throw(_("Falta el nombre de la factura"))
@@ -195,37 +194,14 @@ def timbrar_en_sat(factura_name: str):
 	if not _bool(getattr(config, "activo", 0)):
 		frappe.throw(_("El PAC no está activo. Revise Configuracion PAC"))
 
-	from endersuite.ventas.services.pac_service import ServicioPAC
-
-	servicio = ServicioPAC()
-	resultado = servicio.timbrar_factura(factura)
-
-	if not resultado or not resultado.get("success"):
-		error_msg = (resultado or {}).get("error") or _("Error al timbrar")
-		frappe.throw(error_msg)
-
-	uuid = resultado.get("uuid")
-	xml = resultado.get("xml")
-	fecha = resultado.get("fecha_timbrado")
-
-	# Persistir resultados
-	if uuid:
-		factura.db_set("uuid", uuid, update_modified=True)
-	if xml:
-		factura.db_set("xml_timbrado", xml, update_modified=True)
+	from endersuite.ventas.services.stamping_service import encolar_timbrado
 
-	# `fecha_de_timbrado` es Date, guardamos fecha simple
-	if fecha:
-		factura.db_set("fecha_de_timbrado", fecha.date(), update_modified=True)
-	else:
-		factura.db_set("fecha_de_timbrado", nowdate(), update_modified=True)
+	encolada = encolar_timbrado(factura)
 
 	return {
 		"success": True,
-		"uuid": uuid,
-		"xml": xml,
-		"fecha_de_timbrado": factura.get("fecha_de_timbrado"),
-		"message": _("Factura timbrada correctamente")
+		"encolada": True,
+		"message": _("Factura enviada a timbrar") if encolada else _("La factura ya está en proceso de timbrado")
 	}
 
 
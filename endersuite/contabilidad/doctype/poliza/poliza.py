@@ -6,6 +6,8 @@ from frappe import _
 from frappe.model.document import Document
 from frappe.utils import flt, getdate, get_datetime
 
+from endersuite.contabilidad.services import period_close_service
+
 
 class Poliza(Document):
 	def before_validate(self):
@@ -15,6 +17,7 @@ class Poliza(Document):
 	def validate(self):
 		"""Validaciones antes de guardar"""
 		self.validar_anio_fiscal()
+		self.validar_periodo_abierto()
 		self.calcular_totales()
 		self.validar_cuadre()
 		self.validar_movimientos()
@@ -72,12 +75,16 @@ class Poliza(Document):
 					"Fila {0}: No puede tener monto en Debe y Haber simultáneamente"
 				).format(idx))
 	
+	def before_cancel(self):
+		"""No se cancelan pólizas de un ejercicio cerrado"""
+		self.validar_periodo_abierto()
+	
 	def validar_anio_fiscal(self):
 		"""Valida que la fecha esté dentro del año fiscal"""
-		if not self.anio_fiscal:
+		if not self.get("año_fiscal"):
 			return
 		
-		anio = frappe.get_doc("Anio Fiscal", self.anio_fiscal)
+		anio = frappe.get_doc("Anio Fiscal", self.get("año_fiscal"))
 		fecha_poliza = get_datetime(self.fecha).date()
 		
 		if fecha_poliza < getdate(anio.desde) or fecha_poliza > getdate(anio.hasta):
@@ -95,6 +102,21 @@ class Poliza(Document):
 			frappe.throw(_(
 				"No se pueden crear pólizas en el año fiscal {0} porque está cerrado"
 			).format(anio.nombre))
+	
+	def validar_periodo_abierto(self):
+		"""Valida que el ejercicio de la compañía no tenga un Cierre de Periodo"""
+		# La póliza de cierre se registra con el ejercicio ya bloqueado por su cierre
+		if self.flags.cierre_de_periodo:
+			return
+		
+		period_close_service.validar_periodo_abierto(self.get("compañia"), get_datetime(self.fecha))
+
+
+def on_doctype_update():
+	# Libro Diario recorre las pólizas enviadas por fecha
+	frappe.db.add_index("Poliza", ["docstatus", "fecha"])
+	# La importación masiva busca las claves ya importadas por documento_origen
+	frappe.db.add_index("Poliza", ["documento_origen"])
 
 
 @frappe.whitelist()
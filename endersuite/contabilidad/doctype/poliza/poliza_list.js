@@ -0,0 +1,63 @@
+// Copyright (c) 2025, RenderCores.com and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Poliza"] = {
+	onload(listview) {
+		listview.page.add_inner_button(__("Importar Pólizas"), () => {
+			const dialog = new frappe.ui.Dialog({
+				title: __("Importar Pólizas"),
+				fields: [
+					{
+						fieldname: "archivo",
+						fieldtype: "Attach",
+						label: __("Archivo CSV o JSONL"),
+						reqd: 1,
+						description: __(
+							"Un renglón por movimiento: poliza, fecha, tipo_de_poliza, compania, anio_fiscal, concepto, cuenta, debe, haber, referencia"
+						),
+					},
+					{
+						fieldname: "enviar",
+						fieldtype: "Check",
+						label: __("Enviar pólizas"),
+						default: 1,
+					},
+				],
+				primary_action_label: __("Importar"),
+				primary_action(values) {
+					frappe.call({
+						method: "endersuite.contabilidad.services.poliza_import_service.importar_archivo",
+						args: { file_url: values.archivo, enviar: values.enviar },
+						callback() {
+							dialog.hide();
+							frappe.show_alert({ message: __("Importación en proceso"), indicator: "blue" });
+						},
+					});
+				},
+			});
+			dialog.show();
+		});
+
+		// Avance y resultado de la importación en segundo plano
+		frappe.realtime.off("importacion_polizas");
+		frappe.realtime.on("importacion_polizas", (data) => {
+			if (!data.terminada) {
+				frappe.show_alert({
+					message: __("{0} pólizas importadas", [data.polizas]),
+					indicator: "blue",
+				});
+				return;
+			}
+
+			let mensaje = __("{0} pólizas y {1} movimientos importados.", [data.polizas, data.movimientos]);
+			if (data.errores) {
+				mensaje += "<br>" + __("{0} errores: <a href='{1}' target='_blank'>descargar reporte</a>", [
+					data.errores,
+					data.reporte,
+				]);
+			}
+			frappe.msgprint({ title: __("Importación de Pólizas"), message: mensaje });
+			listview.refresh();
+		});
+	},
+};
@@ -1,9 +1,15 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+import csv
+import tempfile
+
+import frappe
 from frappe.tests import IntegrationTestCase
 
+from endersuite.contabilidad.report.libro_diario import libro_diario
+from endersuite.contabilidad.services import balance_service, poliza_import_service
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
@@ -19,4 +25,113 @@ class IntegrationTestPoliza(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def crear_poliza_enviada(self, compania, fecha, movimientos):
+		"""Póliza enviada insertada directamente; movimientos: [(cuenta, debe, haber)]"""
+		poliza = frappe.get_doc({
+			"doctype": "Poliza",
+			"name": frappe.generate_hash(length=10),
+			"fecha": fecha,
+			"compañia": compania,
+			"concepto": "Póliza de prueba",
+			"table_qbss": [{"cuenta": c, "debe": d, "haber": h} for c, d, h in movimientos]
+		})
+		poliza.docstatus = 1
+		poliza.db_insert()
+		for fila in poliza.get_all_children():
+			fila.db_insert()
+		# Lo que haría el hook on_submit
+		balance_service.registrar_polizas([poliza])
+		return poliza
+
+	def test_libro_diario_paginado_con_saldos(self):
+		"""Las páginas por llave reproducen el diario completo y el saldo parte del saldo inicial"""
+		compania = frappe.generate_hash(length=10)
+		self.crear_poliza_enviada(compania, "2020-12-31 09:00:00", [("Caja", 1000, 0), ("Capital", 0, 1000)])
+		for dia in range(1, 6):
+			self.crear_poliza_enviada(compania, f"2021-01-0{dia} 10:00:00", [("Caja", 0, 100), ("Gastos", 100, 0)])
+
+		filtros = frappe._dict({"from_date": "2021-01-01", "to_date": "2021-01-31", "compania": compania})
+		completo = libro_diario.get_pagina(filtros, limite=None)
+		self.assertEqual(len(completo), 10)
+
+		# El cursor lleva la llave y el saldo de cada cuenta, como «Página siguiente»
+		paginado = []
+		despues = None
+		while True:
+			pagina = libro_diario.get_pagina(filtros, despues=despues, limite=3)
+			if not pagina:
+				break
+			paginado.extend(pagina)
+			saldos = dict(despues["saldos"]) if despues else {}
+			saldos.update({f.cuenta: f.saldo for f in pagina})
+			despues = {"llave": [pagina[-1].fecha_orden, pagina[-1].numero, pagina[-1].idx], "saldos": saldos}
+
+		self.assertEqual(
+			[(f.numero, f.idx, f.saldo) for f in paginado], [(f.numero, f.idx, f.saldo) for f in completo]
+		)
+
+		saldos_caja = [f.saldo for f in completo if f.cuenta == "Caja"]
+		self.assertEqual(saldos_caja, [900, 800, 700, 600, 500])
+		self.assertEqual([f.saldo for f in completo if f.cuenta == "Gastos"][-1], 500)
+
+		# A mitad de mes, el saldo inicial suma los movimientos del mes anteriores a la fecha
+		filtros.from_date = "2021-01-03"
+		self.assertEqual([f.saldo for f in libro_diario.get_pagina(filtros, limite=None) if f.cuenta == "Caja"], [700, 600, 500])
+
+	def crear_catalogo_importacion(self):
+		"""Compañía, catálogo, año fiscal 2017 y cuentas insertados directamente"""
+		sufijo = frappe.generate_hash(length=8)
+		anio, catalogo, compania = f"FY-{sufijo}", f"CAT-{sufijo}", f"CIA-{sufijo}"
+		frappe.get_doc({"doctype": "Anio Fiscal", "name": anio, "nombre": anio,
+			"desde": "2017-01-01", "hasta": "2017-12-31", "estado": "Abierto"}).db_insert()
+		frappe.get_doc({"doctype": "Catalogo", "name": catalogo, "nombre_del_catalogo": catalogo}).db_insert()
+		frappe.get_doc({"doctype": "Compania", "name": compania, "nombre_de_la_empresa": compania,
+			"catalogo": catalogo, "anio_fiscal": anio}).db_insert()
+
+		lft = (frappe.db.sql("SELECT MAX(rgt) FROM `tabCuenta`")[0][0] or 0) + 1
+		for cuenta, padre, es_grupo, raiz, izq, der in (
+			("Activo", None, 1, 1, 0, 5), ("Caja", "Activo", 0, 0, 1, 2), ("Bancos", "Activo", 0, 0, 3, 4),
+			("Capital", None, 1, 1, 6, 9), ("Capital Social", "Capital", 0, 0, 7, 8)
+		):
+			frappe.get_doc({"doctype": "Cuenta", "name": f"{catalogo}-{cuenta}", "cuenta": cuenta,
+				"catalogo": catalogo, "is_group": es_grupo, "protected_root": raiz,
+				"parent_cuenta": f"{catalogo}-{padre}" if padre else None,
+				"lft": lft + izq, "rgt": lft + der}).db_insert()
+
+		return compania, catalogo
+
+	def test_importacion_masiva_por_lotes(self):
+		"""Las pólizas válidas entran por lotes con sus saldos; las demás quedan en el reporte"""
+		compania, catalogo = self.crear_catalogo_importacion()
+		clave = frappe.generate_hash(length=6)
+		renglones = [
+			(f"{clave}-1", "2017-03-01 10:00:00", "Caja", 100, 0),
+			(f"{clave}-1", "2017-03-01 10:00:00", "Capital Social", 0, 100),
+			(f"{clave}-2", "2017-03-02 10:00:00", "Caja", 100, 0),
+			(f"{clave}-2", "2017-03-02 10:00:00", "Capital Social", 0, 90),
+			(f"{clave}-3", "2017-03-03 10:00:00", "Inexistente", 10, 0),
+			(f"{clave}-3", "2017-03-03 10:00:00", "Caja", 0, 10),
+			(f"{clave}-4", "2017-03-04 10:00:00", f"{catalogo}-Bancos", 50, 0),
+			(f"{clave}-4", "2017-03-04 10:00:00", "Caja", 0, 50)
+		]
+		with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="", delete=False) as f:
+			writer = csv.writer(f)
+			writer.writerow(["poliza", "fecha", "compania", "concepto", "cuenta", "debe", "haber"])
+			for poliza, fecha, cuenta, debe, haber in renglones:
+				writer.writerow([poliza, fecha, compania, "Saldo inicial", cuenta, debe, haber])
+
+		resumen = poliza_import_service.importar_polizas(f.name, tamano_lote=2)
+
+		self.assertEqual((resumen.polizas, resumen.movimientos), (2, 4))
+		self.assertEqual(sorted((e[0], e[1]) for e in resumen.errores), [(4, f"{clave}-2"), (6, f"{clave}-3")])
+		self.assertTrue(resumen.reporte)
+
+		self.assertEqual(frappe.db.get_value(
+			"poliza_movimiento", {"cuenta": f"{catalogo}-Caja", "debe": 100}, "categoria_contable"
+		), f"{catalogo}-Activo")
+		self.assertEqual(balance_service.get_saldo("Cuenta", f"{catalogo}-Caja", compania=compania).saldo, 50)
+
+		# Reimportar el mismo archivo no duplica pólizas
+		otra = poliza_import_service.importar_polizas(f.name, tamano_lote=2)
+		self.assertEqual(otra.polizas, 0)
+		self.assertEqual(frappe.db.count("Poliza", {"documento_origen": ["like", f"{clave}-%"]}), 2)
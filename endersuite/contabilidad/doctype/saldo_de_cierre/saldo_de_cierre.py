@@ -0,0 +1,17 @@
+# Copyright (c) 2025, RenderCores.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SaldodeCierre(Document):
+	"""
+	Saldo de cada cuenta al cierre de un ejercicio, después de la póliza de cierre.
+	Escrito por Cierre de Periodo (ver period_close_service).
+	"""
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Saldo de Cierre", ["cierre", "cuenta"])
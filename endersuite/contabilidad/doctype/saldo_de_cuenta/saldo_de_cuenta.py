@@ -0,0 +1,17 @@
+# Copyright (c) 2025, RenderCores.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SaldodeCuenta(Document):
+	"""
+	Debe, haber y saldo de una cuenta por mes y año fiscal.
+	Mantenido por Póliza y Asiento Contable (ver balance_service).
+	"""
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Saldo de Cuenta", ["tipo_cuenta", "cuenta", "periodo"])
@@ -0,0 +1,72 @@
+# Copyright (c) 2025, RenderCores.com and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from endersuite.contabilidad.services import balance_service
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+
+
+class IntegrationTestSaldodeCuenta(IntegrationTestCase):
+	"""
+	Integration tests for SaldodeCuenta.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def crear_poliza(self, compania, fecha, movimientos):
+		"""Póliza sin guardar; movimientos: [(cuenta, debe, haber)]"""
+		return frappe.get_doc({
+			"doctype": "Poliza",
+			"name": frappe.generate_hash(length=10),
+			"fecha": fecha,
+			"compañia": compania,
+			"table_qbss": [{"cuenta": c, "debe": d, "haber": h} for c, d, h in movimientos]
+		})
+
+	def saldos(self, compania):
+		filas = frappe.get_all(
+			"Saldo de Cuenta",
+			filters={"compania": compania},
+			fields=["cuenta", "periodo", "debe", "haber", "saldo", "movimientos"]
+		)
+		return {(f.cuenta, str(f.periodo)): (f.debe, f.haber, f.saldo, f.movimientos) for f in filas}
+
+	def test_saldos_incrementales_igual_a_reconstruidos(self):
+		"""Enviar y cancelar pólizas deja los mismos saldos que reconstruirlos desde las pólizas"""
+		compania = frappe.generate_hash(length=10)
+		marzo = self.crear_poliza(compania, "2019-03-05 10:00:00", [("Caja", 1000, 0), ("Capital", 0, 1000)])
+		abril = self.crear_poliza(compania, "2019-04-10 10:00:00", [("Caja", 0, 300), ("Gastos", 300, 0)])
+		cancelada = self.crear_poliza(compania, "2019-04-20 10:00:00", [("Caja", 0, 50), ("Gastos", 50, 0)])
+
+		with self.assertQueryCount(2):
+			# Año fiscal de la fecha y un solo INSERT para todas las cuentas
+			balance_service.registrar_poliza(marzo)
+		balance_service.registrar_poliza(abril)
+		balance_service.registrar_poliza(cancelada)
+		balance_service.revertir_poliza(cancelada)
+
+		incremental = self.saldos(compania)
+		self.assertEqual(incremental[("Caja", "2019-03-01")], (1000, 0, 1000, 1))
+		self.assertEqual(incremental[("Caja", "2019-04-01")], (0, 300, -300, 1))
+
+		periodos = balance_service.get_saldos_por_periodo("Cuenta", "Caja", compania=compania)
+		self.assertEqual([p.saldo_acumulado for p in periodos], [1000, 700])
+		self.assertEqual(balance_service.get_saldo("Cuenta", "Gastos", compania=compania).saldo, 300)
+
+		# Solo marzo y abril quedan enviadas
+		for poliza in (marzo, abril):
+			poliza.docstatus = 1
+			poliza.db_insert()
+			for fila in poliza.get_all_children():
+				fila.db_insert()
+		balance_service.reconstruir_saldos("2019-03-01", "2019-04-30")
+
+		self.assertEqual(self.saldos(compania), incremental)
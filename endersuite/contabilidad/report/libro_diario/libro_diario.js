@@ -18,7 +18,74 @@ frappe.query_reports["Libro Diario"] = {
             "fieldname": "cuenta",
             "label": __("Filtrar por Cuenta"),
             "fieldtype": "Link",
-            "options": "Cuenta Contable"
+            "options": "Cuenta"
+        },
+        {
+            "fieldname": "compania",
+            "label": __("Compañía"),
+            "fieldtype": "Link",
+            "options": "Compania"
+        },
+        {
+            // Cursor de la página anterior (llave de la última fila y saldo de cada cuenta); lo maneja «Página siguiente»
+            "fieldname": "despues_de",
+            "label": __("Después de"),
+            "fieldtype": "Data",
+            "hidden": 1
+        }
+    ],
+
+    onload: function (report) {
+        report.page.add_inner_button(__("Primera página"), function () {
+            report.set_filter_value("despues_de", "");
+        });
+
+        report.page.add_inner_button(__("Página siguiente"), function () {
+            let data = report.data || [];
+            if (!data.length) {
+                return;
+            }
+            let anterior = report.get_filter_value("despues_de");
+            let saldos = anterior ? JSON.parse(anterior).saldos : {};
+            data.forEach(function (fila) {
+                saldos[fila.cuenta] = fila.saldo;
+            });
+            let ultima = data[data.length - 1];
+            report.set_filter_value("despues_de", JSON.stringify({
+                llave: [ultima.fecha_orden, ultima.numero, ultima.idx],
+                saldos: saldos
+            }));
+        });
+
+        report.page.add_inner_button(__("Exportar periodo (CSV)"), function () {
+            exportar_libro_diario(report, "CSV");
+        });
+
+        report.page.add_inner_button(__("Exportar periodo (XLSX)"), function () {
+            exportar_libro_diario(report, "XLSX");
+        });
+
+        frappe.realtime.on("libro_diario_exportado", function (data) {
+            frappe.msgprint({
+                title: __("Exportación lista"),
+                indicator: "green",
+                message: `<a href="${data.file_url}" target="_blank">${__("Descargar Libro Diario")}</a>`
+            });
+        });
+    }
+};
+
+function exportar_libro_diario(report, formato) {
+    let filters = report.get_values();
+    delete filters.despues_de;
+
+    frappe.call({
+        method: "endersuite.contabilidad.report.libro_diario.libro_diario.exportar_libro_diario",
+        args: { filters: filters, formato: formato },
+        callback: function (r) {
+            if (r.message && r.message.encolada) {
+                frappe.show_alert({ message: __("Generando exportación, recibirás el enlace al terminar"), indicator: "blue" });
+            }
         }
-    ]
-};
\ No newline at end of file
+    });
+}
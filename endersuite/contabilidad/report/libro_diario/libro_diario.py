@@ -1,48 +1,274 @@
+import csv
+import json
+import os
+
 import frappe
 from frappe import _
+from frappe.utils import cint, flt, getdate, now_datetime
+
+# Filas por página en el reporte y por lote en la exportación
+TAMANO_PAGINA = 500
+
+# Formatos de exportación
+FORMATOS_EXPORTACION = ("CSV", "XLSX")
+
+# Evento realtime con el archivo exportado
+EVENTO_EXPORTACION = "libro_diario_exportado"
+
 
 def execute(filters=None):
+    filters = frappe._dict(filters or {})
     columns = get_columns()
-    data = get_data(filters)
-    return columns, data
 
-def get_data(filters):
-    sql = """
-        SELECT
-            mc.fecha_contable as fecha,
-            mc.asiento_origen as numero,
-            mc.cuenta as cuenta,
-            mc.debe as debe,
-            mc.haber as haber,
-            mc.narracion as detalle
-        FROM
-            `tabMovimiento Contable` mc
-        WHERE
-            mc.fecha_contable BETWEEN %(from_date)s AND %(to_date)s
+    despues = json.loads(filters.despues_de) if filters.get("despues_de") else None
+    data = get_pagina(filters, despues=despues, limite=TAMANO_PAGINA + 1)
+
+    message = None
+    if len(data) > TAMANO_PAGINA:
+        data = data[:TAMANO_PAGINA]
+        message = _("Se muestran {0} movimientos. Use «Página siguiente» o exporte el periodo completo.").format(TAMANO_PAGINA)
+
+    return columns, data, message
+
+
+# ============================================================================
+# CONSULTA
+# ============================================================================
+
+def _consulta(filters, despues=None, limite=None):
+    """
+    SQL de los movimientos del libro diario desde las Pólizas enviadas.
+
+    La paginación es por llave (fecha, póliza, renglón) y se filtra en la misma
+    consulta que lee los movimientos, así que pedir la página N solo lee sus
+    filas. El saldo no se calcula aquí (ver _con_saldos).
+
+    Args:
+        filters (dict): from_date, to_date y opcionalmente cuenta y compania
+        despues (list): Llave [fecha, poliza, idx] de la última fila ya leída
+        limite (int): Máximo de filas (opcional)
+
+    Returns:
+        tuple: (sql, valores)
     """
-    
+    valores = {
+        "from_date": getdate(filters.get("from_date")),
+        "to_date": getdate(filters.get("to_date"))
+    }
+
+    condiciones = [
+        "p.docstatus = 1",
+        "p.fecha >= %(from_date)s",
+        "p.fecha < DATE_ADD(%(to_date)s, INTERVAL 1 DAY)"
+    ]
     if filters.get("cuenta"):
-        sql += " AND mc.cuenta = %(cuenta)s"
-
-    sql += " ORDER BY mc.fecha_contable ASC, mc.creation ASC"
-    
-    data = frappe.db.sql(sql, filters, as_dict=True)
-    
-    result = []
-    for row in data:
-        descripcion_completa = f"{row.cuenta}"
-        if row.detalle:
-            descripcion_completa += f" - {row.detalle}"
-
-        result.append({
-            "fecha": row.fecha,
-            "numero": row.numero,
-            "cuenta_y_detalle": descripcion_completa,
-            "debe": row.debe,
-            "haber": row.haber
+        condiciones.append("m.cuenta = %(cuenta)s")
+        valores["cuenta"] = filters.get("cuenta")
+    if filters.get("compania"):
+        condiciones.append("p.`compañia` = %(compania)s")
+        valores["compania"] = filters.get("compania")
+    if despues:
+        condiciones.append("""(p.fecha > %(ultima_fecha)s
+            OR (p.fecha = %(ultima_fecha)s AND (p.name > %(ultimo_numero)s
+                OR (p.name = %(ultimo_numero)s AND m.idx > %(ultimo_idx)s))))""")
+        valores.update({
+            "ultima_fecha": despues[0],
+            "ultimo_numero": despues[1],
+            "ultimo_idx": cint(despues[2])
         })
 
-    return result
+    sql = f"""
+        SELECT
+            DATE(p.fecha) AS fecha,
+            p.fecha AS fecha_orden,
+            p.name AS numero,
+            m.idx,
+            m.cuenta,
+            CONCAT(m.cuenta, CASE
+                WHEN COALESCE(m.referencia, '') != '' THEN CONCAT(' - ', m.referencia)
+                WHEN COALESCE(p.concepto, '') != '' THEN CONCAT(' - ', p.concepto)
+                ELSE ''
+            END) AS cuenta_y_detalle,
+            COALESCE(m.debe, 0) AS debe,
+            COALESCE(m.haber, 0) AS haber
+        FROM `tabPoliza` p
+        JOIN `tabpoliza_movimiento` m
+            ON m.parent = p.name AND m.parenttype = 'Poliza' AND m.parentfield = 'table_qbss'
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY p.fecha, p.name, m.idx
+    """
+    if limite:
+        sql += f" LIMIT {cint(limite)}"
+
+    return sql, valores
+
+
+def _saldos_iniciales(filters, cuentas=None):
+    """Saldo de cada cuenta antes de `from_date`, desde los saldos mensuales (balance_service)"""
+    from endersuite.contabilidad.services.balance_service import get_saldos_iniciales
+
+    if cuentas is None and filters.get("cuenta"):
+        cuentas = [filters.get("cuenta")]
+    return get_saldos_iniciales(filters.get("from_date"), compania=filters.get("compania"), cuentas=cuentas)
+
+
+def _con_saldos(filas, saldos, iniciales):
+    """
+    Agrega a cada fila el saldo acumulado de su cuenta.
+
+    Args:
+        filas (iterable): Filas de _consulta, en orden
+        saldos (dict): Saldo por cuenta al terminar la página anterior; se actualiza
+        iniciales (dict): Saldo inicial de las cuentas que aún no aparecen en `saldos`
+
+    Yields:
+        dict: Fila con `saldo`
+    """
+    for fila in filas:
+        if fila.cuenta not in saldos:
+            saldos[fila.cuenta] = flt(iniciales.get(fila.cuenta))
+        saldos[fila.cuenta] += flt(fila.debe) - flt(fila.haber)
+        fila.saldo = saldos[fila.cuenta]
+        yield fila
+
+
+def get_pagina(filters, despues=None, limite=TAMANO_PAGINA):
+    """
+    Una página del libro diario.
+
+    El cursor trae, además de la llave de la última fila, el saldo con el que
+    terminó cada cuenta ya mostrada; solo las cuentas nuevas de la página leen
+    su saldo inicial.
+
+    Args:
+        filters (dict): Filtros del reporte
+        despues (dict): Cursor {llave: [fecha, poliza, idx], saldos: {cuenta: saldo}}
+            de la página anterior (opcional)
+        limite (int): Filas por página
+
+    Returns:
+        list: Filas {fecha, fecha_orden, numero, idx, cuenta, cuenta_y_detalle, debe, haber, saldo}
+    """
+    despues = frappe._dict(despues or {})
+    saldos = {cuenta: flt(saldo) for cuenta, saldo in (despues.saldos or {}).items()}
+
+    sql, valores = _consulta(filters, despues.llave, limite)
+    filas = frappe.db.sql(sql, valores, as_dict=True)
+
+    nuevas = list({f.cuenta for f in filas if f.cuenta not in saldos})
+    iniciales = _saldos_iniciales(filters, nuevas) if nuevas else {}
+    return list(_con_saldos(filas, saldos, iniciales))
+
+
+def iterar_movimientos(filters):
+    """
+    Recorre todos los movimientos del periodo con un cursor del lado del
+    servidor: las filas llegan de la base de datos conforme se consumen y
+    nunca se cargan completas en memoria.
+
+    Args:
+        filters (dict): Filtros del reporte
+
+    Yields:
+        tuple: (fecha, numero, cuenta_y_detalle, debe, haber, saldo)
+    """
+    iniciales = _saldos_iniciales(filters)
+    sql, valores = _consulta(filters)
+    with frappe.db.unbuffered_cursor():
+        filas = frappe.db.sql(sql, valores, as_dict=True, as_iterator=True)
+        for fila in _con_saldos(filas, {}, iniciales):
+            yield fila.fecha, fila.numero, fila.cuenta_y_detalle, flt(fila.debe), flt(fila.haber), fila.saldo
+
+
+# ============================================================================
+# EXPORTACIÓN
+# ============================================================================
+
+@frappe.whitelist()
+def exportar_libro_diario(filters, formato="CSV"):
+    """
+    Encola la exportación del libro diario completo del periodo. El archivo se
+    escribe en disco fila por fila y el usuario recibe su URL por realtime.
+
+    Args:
+        filters (dict|str): Filtros del reporte
+        formato (str): "CSV" o "XLSX"
+
+    Returns:
+        dict: {encolada: True}
+    """
+    frappe.has_permission("Poliza", "read", throw=True)
+
+    if isinstance(filters, str):
+        filters = json.loads(filters)
+    if formato not in FORMATOS_EXPORTACION:
+        frappe.throw(_("Formato no válido: {0}").format(formato))
+
+    frappe.enqueue(
+        "endersuite.contabilidad.report.libro_diario.libro_diario.generar_exportacion",
+        queue="long",
+        filters=filters,
+        formato=formato,
+        usuario=frappe.session.user
+    )
+    return {"encolada": True}
+
+
+def generar_exportacion(filters, formato, usuario):
+    """Escribe el archivo de exportación, lo registra como archivo privado y avisa al usuario"""
+    filters = frappe._dict(filters)
+    extension = formato.lower()
+    nombre = "libro_diario_{0}_{1}_{2}.{3}".format(
+        filters.from_date, filters.to_date, frappe.generate_hash(length=6), extension
+    )
+    ruta = frappe.get_site_path("private", "files", nombre)
+
+    encabezados = [c["label"] for c in get_columns()]
+    filas = iterar_movimientos(filters)
+
+    if formato == "CSV":
+        _escribir_csv(ruta, encabezados, filas)
+    else:
+        _escribir_xlsx(ruta, encabezados, filas)
+
+    archivo = frappe.get_doc({
+        "doctype": "File",
+        "name": frappe.generate_hash(length=10),
+        "file_name": nombre,
+        "file_url": f"/private/files/{nombre}",
+        "is_private": 1,
+        "file_size": os.path.getsize(ruta),
+        "folder": "Home",
+        "owner": usuario,
+        "creation": now_datetime(),
+        "modified": now_datetime()
+    })
+    # El archivo ya está en disco: se registra sin que File lo vuelva a leer completo
+    archivo.db_insert()
+    frappe.db.commit()
+
+    frappe.publish_realtime(EVENTO_EXPORTACION, {"file_url": archivo.file_url}, user=usuario)
+
+
+def _escribir_csv(ruta, encabezados, filas):
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(encabezados)
+        for fila in filas:
+            writer.writerow(fila)
+
+
+def _escribir_xlsx(ruta, encabezados, filas):
+    from openpyxl import Workbook
+
+    # write_only escribe cada fila a disco en lugar de armar la hoja en memoria
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(_("Libro Diario"))
+    hoja.append(encabezados)
+    for fila in filas:
+        hoja.append(list(fila))
+    libro.save(ruta)
+
 
 def get_columns():
     return [
@@ -56,7 +282,7 @@ def get_columns():
             "fieldname": "numero",
             "label": _("Número"),
             "fieldtype": "Link",
-            "options": "Asiento Contable",
+            "options": "Poliza",
             "width": 140
         },
         {
@@ -76,5 +302,11 @@ def get_columns():
             "label": _("HABER"),
             "fieldtype": "Currency",
             "width": 120
+        },
+        {
+            "fieldname": "saldo",
+            "label": _("Saldo de la cuenta"),
+            "fieldtype": "Currency",
+            "width": 140
         }
-    ]
\ No newline at end of file
+    ]
@@ -0,0 +1,621 @@
+"""
+Servicio de saldos de cuentas (Saldo de Cuenta)
+
+Mantiene el debe, haber y saldo de cada cuenta por mes y año fiscal. Las
+Pólizas aportan a las cuentas del catálogo (Cuenta) y los Asientos Contables
+a Cuenta Contable. Cada documento suma o resta su aporte al enviarse o
+cancelarse con un solo INSERT ... ON DUPLICATE KEY UPDATE, así que la cuenta T
+y los reportes de saldos leen una fila por periodo en lugar de recorrer todos
+los movimientos.
+"""
+
+import hashlib
+
+import frappe
+from frappe.utils import add_days, flt, get_first_day, get_last_day, getdate, now_datetime
+
+TIPO_CUENTA = "Cuenta"
+TIPO_CUENTA_CONTABLE = "Cuenta Contable"
+
+MEDIDAS = ("debe", "haber", "saldo", "movimientos")
+
+# Inicio del mes de una columna de fecha, sin DATE_FORMAT (evita escapar % en las consultas)
+INICIO_DE_MES = "DATE_SUB(DATE({0}), INTERVAL DAYOFMONTH({0}) - 1 DAY)"
+
+
+# ============================================================================
+# SALDOS
+# ============================================================================
+
+def _nombre(tipo_cuenta, cuenta, compania, anio_fiscal, periodo):
+	"""Nombre determinista de la fila: la llave primaria hace de índice único de las dimensiones"""
+	llave = "|".join(str(v or "") for v in (tipo_cuenta, cuenta, compania, anio_fiscal, periodo))
+	return hashlib.md5(llave.encode()).hexdigest()[:20]
+
+
+def _agregar(saldos, tipo_cuenta, cuenta, compania, anio_fiscal, periodo, debe=0, haber=0, movimientos=0):
+	"""Acumula debe, haber y movimientos en `saldos` bajo las dimensiones de la fila"""
+	nombre = _nombre(tipo_cuenta, cuenta, compania, anio_fiscal, periodo)
+	fila = saldos.get(nombre)
+	if not fila:
+		fila = saldos[nombre] = frappe._dict({
+			"name": nombre,
+			"tipo_cuenta": tipo_cuenta,
+			"cuenta": cuenta,
+			"compania": compania or None,
+			"anio_fiscal": anio_fiscal or None,
+			"periodo": periodo,
+			**{m: 0 for m in MEDIDAS}
+		})
+
+	fila.debe += flt(debe)
+	fila.haber += flt(haber)
+	fila.saldo += flt(debe) - flt(haber)
+	fila.movimientos += movimientos
+
+
+def _anio_fiscal(fecha):
+	"""Año Fiscal que contiene la fecha; prefiere el marcado por defecto si hay traslapes"""
+	nombres = frappe.db.sql("""
+		SELECT name
+		FROM `tabAnio Fiscal`
+		WHERE desde <= %(fecha)s AND hasta >= %(fecha)s
+		ORDER BY es_por_defecto DESC, desde DESC
+		LIMIT 1
+	""", {"fecha": getdate(fecha)}, pluck=True)
+	return nombres[0] if nombres else None
+
+
+def _saldos_poliza(poliza, signo, saldos=None):
+	"""Filas de saldos de una Póliza, acumuladas en `saldos` si se pasa; signo -1 para revertirla"""
+	fecha = getdate(poliza.fecha)
+	periodo = get_first_day(fecha)
+	compania = poliza.get("compañia")
+	anio_fiscal = poliza.get("año_fiscal") or _anio_fiscal(fecha)
+
+	saldos = {} if saldos is None else saldos
+	for movimiento in poliza.table_qbss or []:
+		if movimiento.cuenta:
+			_agregar(
+				saldos, TIPO_CUENTA, movimiento.cuenta, compania, anio_fiscal, periodo,
+				debe=signo * flt(movimiento.debe), haber=signo * flt(movimiento.haber), movimientos=signo
+			)
+
+	return saldos
+
+
+def _saldos_asiento(asiento, signo):
+	"""Filas de saldos de un Asiento Contable; signo -1 para revertirlo"""
+	fecha = getdate(asiento.posting_date)
+	periodo = get_first_day(fecha)
+	anio_fiscal = _anio_fiscal(fecha)
+
+	saldos = {}
+	for detalle in asiento.detalle or []:
+		if detalle.cuenta:
+			_agregar(
+				saldos, TIPO_CUENTA_CONTABLE, detalle.cuenta, None, anio_fiscal, periodo,
+				debe=signo * flt(detalle.debito), haber=signo * flt(detalle.credito), movimientos=signo
+			)
+
+	return saldos
+
+
+def aplicar_saldos(saldos):
+	"""
+	Suma las filas a Saldo de Cuenta en un solo INSERT ... ON DUPLICATE KEY UPDATE.
+
+	Las filas se escriben en orden de nombre para que dos pólizas simultáneas
+	bloqueen las mismas filas en el mismo orden.
+
+	Args:
+		saldos (dict|list): Filas con name, tipo_cuenta, cuenta, compania,
+			anio_fiscal, periodo y las medidas a sumar
+	"""
+	filas = sorted(saldos.values() if isinstance(saldos, dict) else saldos, key=lambda f: f.name)
+	if not filas:
+		return
+
+	ahora = now_datetime()
+	usuario = frappe.session.user
+
+	columnas = ("name", "creation", "modified", "modified_by", "owner", "docstatus", "idx",
+		"tipo_cuenta", "cuenta", "compania", "anio_fiscal", "periodo") + MEDIDAS
+	valores = []
+	for fila in filas:
+		valores.extend([fila.name, ahora, ahora, usuario, usuario, 0, 0,
+			fila.tipo_cuenta, fila.cuenta, fila.compania, fila.anio_fiscal, fila.periodo])
+		valores.extend(fila[m] for m in MEDIDAS)
+
+	marcadores = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+	frappe.db.sql(f"""
+		INSERT INTO `tabSaldo de Cuenta` ({", ".join(f"`{c}`" for c in columnas)})
+		VALUES {", ".join([marcadores] * len(filas))}
+		ON DUPLICATE KEY UPDATE
+			modified = VALUES(modified),
+			{", ".join(f"`{m}` = `{m}` + VALUES(`{m}`)" for m in MEDIDAS)}
+	""", valores)
+
+
+# ============================================================================
+# HOOKS
+# ============================================================================
+
+def registrar_poliza(poliza_doc, method=None):
+	"""
+	Suma la póliza a los saldos de sus cuentas.
+	Llamado desde hook on_submit de Poliza.
+	"""
+	aplicar_saldos(_saldos_poliza(poliza_doc, 1))
+
+
+def revertir_poliza(poliza_doc, method=None):
+	"""
+	Resta la póliza de los saldos de sus cuentas.
+	Llamado desde hook on_cancel de Poliza.
+	"""
+	aplicar_saldos(_saldos_poliza(poliza_doc, -1))
+
+
+def registrar_polizas(polizas):
+	"""
+	Suma varias pólizas enviadas a los saldos, agregadas en memoria y escritas
+	por lotes. Para inserciones masivas que no disparan los hooks de Poliza.
+
+	Args:
+		polizas (list): Pólizas con fecha, compañia, año_fiscal y table_qbss
+	"""
+	saldos = {}
+	for poliza in polizas:
+		_saldos_poliza(poliza, 1, saldos)
+
+	filas = list(saldos.values())
+	for inicio in range(0, len(filas), 500):
+		aplicar_saldos(filas[inicio:inicio + 500])
+
+
+def registrar_asiento(asiento_doc, method=None):
+	"""
+	Suma el asiento a los saldos de sus cuentas.
+	Llamado desde hook on_submit de Asiento Contable.
+	"""
+	aplicar_saldos(_saldos_asiento(asiento_doc, 1))
+
+
+def revertir_asiento(asiento_doc, method=None):
+	"""
+	Resta el asiento de los saldos de sus cuentas.
+	Llamado desde hook on_cancel de Asiento Contable.
+	"""
+	aplicar_saldos(_saldos_asiento(asiento_doc, -1))
+
+
+# ============================================================================
+# LECTURA
+# ============================================================================
+#
+# Las lecturas de cuentas del catálogo (Cuenta) con compañía parten del último
+# Saldo de Cierre de la compañía (ver period_close_service) y solo suman los
+# meses posteriores a ese cierre, así que el costo depende del periodo abierto
+# y no de todos los ejercicios anteriores.
+
+def _ultimo_cierre(compania, hasta=None, antes_de=None):
+	"""
+	Último Cierre de Periodo completado de la compañía.
+
+	Args:
+		compania (str): Compañía
+		hasta (str): El cierre debe ser en o antes de esta fecha (opcional)
+		antes_de (str): El cierre debe ser antes de esta fecha (opcional)
+
+	Returns:
+		frappe._dict: {name, fecha_cierre, mes, anios} o None; `anios` son los
+			años fiscales cerrados hasta ese cierre
+	"""
+	if not compania:
+		return None
+
+	cierres = frappe.db.sql("""
+		SELECT name, anio_fiscal, fecha_cierre
+		FROM `tabCierre de Periodo`
+		WHERE compania = %s AND docstatus = 1 AND estado = 'Completado'
+		ORDER BY fecha_cierre
+	""", compania, as_dict=True)
+
+	if hasta:
+		cierres = [c for c in cierres if getdate(c.fecha_cierre) <= getdate(hasta)]
+	if antes_de:
+		cierres = [c for c in cierres if getdate(c.fecha_cierre) < getdate(antes_de)]
+	if not cierres:
+		return None
+
+	ultimo = cierres[-1]
+	return frappe._dict({
+		"name": ultimo.name,
+		"fecha_cierre": getdate(ultimo.fecha_cierre),
+		"mes": get_first_day(ultimo.fecha_cierre),
+		"anios": tuple(c.anio_fiscal for c in cierres)
+	})
+
+
+def _condicion_abierta(cierre, valores, alias=""):
+	"""Condición SQL de las filas de Saldo de Cuenta posteriores al cierre"""
+	if not cierre:
+		return "1 = 1"
+
+	valores.update({"cierre": cierre.name, "mes_cierre": cierre.mes, "anios_cerrados": cierre.anios})
+	prefijo = f"{alias}." if alias else ""
+	# Los meses anteriores al del cierre son todos de años cerrados; el mes del
+	# cierre puede compartirse con el año siguiente si el ejercicio no empieza en día 1
+	return f"{prefijo}periodo >= %(mes_cierre)s AND COALESCE({prefijo}anio_fiscal, '') NOT IN %(anios_cerrados)s"
+
+
+def _condiciones_saldo(tipo_cuenta, cuenta, compania=None, hasta=None):
+	condiciones = ["tipo_cuenta = %(tipo_cuenta)s", "cuenta = %(cuenta)s"]
+	valores = {"tipo_cuenta": tipo_cuenta, "cuenta": cuenta}
+
+	if compania:
+		condiciones.append("compania = %(compania)s")
+		valores["compania"] = compania
+	if hasta:
+		condiciones.append("periodo <= %(hasta)s")
+		valores["hasta"] = get_first_day(hasta)
+
+	return " AND ".join(condiciones), valores
+
+
+def get_saldos_por_periodo(tipo_cuenta, cuenta, compania=None, hasta=None):
+	"""
+	Movimiento mensual de una cuenta con su saldo acumulado al cierre de cada mes.
+	Con compañía y un ejercicio cerrado, solo se listan los meses abiertos y el
+	acumulado parte del Saldo de Cierre.
+
+	Args:
+		tipo_cuenta (str): "Cuenta" o "Cuenta Contable"
+		cuenta (str): Nombre de la cuenta
+		compania (str): Limitar a una compañía (opcional)
+		hasta (str): Último mes a incluir (opcional)
+
+	Returns:
+		list: Filas {periodo, anio_fiscal, debe, haber, saldo, saldo_acumulado}
+	"""
+	condiciones, valores = _condiciones_saldo(tipo_cuenta, cuenta, compania, hasta)
+	cierre = _ultimo_cierre(compania, hasta=hasta) if tipo_cuenta == TIPO_CUENTA else None
+	abierta = _condicion_abierta(cierre, valores)
+
+	saldo_de_cierre = ""
+	if cierre:
+		saldo_de_cierre = """(
+			SELECT COALESCE(SUM(saldo), 0) FROM `tabSaldo de Cierre`
+			WHERE cierre = %(cierre)s AND cuenta = %(cuenta)s
+		) +"""
+
+	return frappe.db.sql(f"""
+		SELECT
+			periodo,
+			anio_fiscal,
+			SUM(debe) AS debe,
+			SUM(haber) AS haber,
+			SUM(saldo) AS saldo,
+			{saldo_de_cierre} SUM(SUM(saldo)) OVER (ORDER BY periodo, anio_fiscal ROWS UNBOUNDED PRECEDING) AS saldo_acumulado
+		FROM `tabSaldo de Cuenta`
+		WHERE {condiciones} AND {abierta}
+		GROUP BY periodo, anio_fiscal
+		HAVING SUM(movimientos) != 0 OR SUM(saldo) != 0
+		ORDER BY periodo, anio_fiscal
+	""", valores, as_dict=True)
+
+
+def get_saldo(tipo_cuenta, cuenta, compania=None, hasta=None):
+	"""
+	Totales de una cuenta a una fecha: Saldo de Cierre más los meses abiertos.
+
+	Args:
+		tipo_cuenta (str): "Cuenta" o "Cuenta Contable"
+		cuenta (str): Nombre de la cuenta
+		compania (str): Limitar a una compañía (opcional)
+		hasta (str): Último mes a incluir (opcional)
+
+	Returns:
+		frappe._dict: {debe, haber, saldo}
+	"""
+	condiciones, valores = _condiciones_saldo(tipo_cuenta, cuenta, compania, hasta)
+	cierre = _ultimo_cierre(compania, hasta=hasta) if tipo_cuenta == TIPO_CUENTA else None
+	abierta = _condicion_abierta(cierre, valores)
+
+	saldo_de_cierre = ""
+	if cierre:
+		saldo_de_cierre = """
+			SELECT debe, haber, saldo FROM `tabSaldo de Cierre`
+			WHERE cierre = %(cierre)s AND cuenta = %(cuenta)s
+			UNION ALL
+		"""
+
+	total = frappe.db.sql(f"""
+		SELECT SUM(debe) AS debe, SUM(haber) AS haber, SUM(saldo) AS saldo
+		FROM (
+			{saldo_de_cierre}
+			SELECT debe, haber, saldo FROM `tabSaldo de Cuenta`
+			WHERE {condiciones} AND {abierta}
+		) t
+	""", valores, as_dict=True)[0]
+
+	return frappe._dict({m: flt(total[m]) for m in ("debe", "haber", "saldo")})
+
+
+def get_saldos_a_fecha(compania, hasta):
+	"""
+	Debe, haber y saldo acumulados de cada cuenta del catálogo de la compañía a
+	una fecha, desde el último Saldo de Cierre anterior más los meses abiertos.
+
+	Args:
+		compania (str): Compañía
+		hasta (str): Fecha de corte (se incluye su mes completo)
+
+	Returns:
+		list: Filas {cuenta, debe, haber, saldo}
+	"""
+	valores = {"tipo_cuenta": TIPO_CUENTA, "compania": compania, "hasta": get_first_day(hasta)}
+	cierre = _ultimo_cierre(compania, hasta=hasta)
+	abierta = _condicion_abierta(cierre, valores)
+
+	saldo_de_cierre = ""
+	if cierre:
+		saldo_de_cierre = """
+			SELECT cuenta, debe, haber, saldo FROM `tabSaldo de Cierre`
+			WHERE cierre = %(cierre)s
+			UNION ALL
+		"""
+
+	return frappe.db.sql(f"""
+		SELECT cuenta, SUM(debe) AS debe, SUM(haber) AS haber, SUM(saldo) AS saldo
+		FROM (
+			{saldo_de_cierre}
+			SELECT cuenta, debe, haber, saldo FROM `tabSaldo de Cuenta`
+			WHERE tipo_cuenta = %(tipo_cuenta)s AND compania = %(compania)s
+				AND periodo <= %(hasta)s AND {abierta}
+		) t
+		GROUP BY cuenta
+		ORDER BY cuenta
+	""", valores, as_dict=True)
+
+
+def get_saldos_iniciales(desde, compania=None, cuentas=None):
+	"""
+	Saldo de cada cuenta del catálogo antes de una fecha: Saldo de Cierre y
+	meses completos anteriores desde Saldo de Cuenta, más los movimientos de
+	las Pólizas del mes de `desde` anteriores a esa fecha.
+
+	Args:
+		desde (str): Fecha; sus movimientos ya no cuentan
+		compania (str): Limitar a una compañía (opcional)
+		cuentas (list): Limitar a estas cuentas (opcional)
+
+	Returns:
+		dict: cuenta -> saldo (debe − haber)
+	"""
+	desde = getdate(desde)
+	mes = get_first_day(desde)
+	valores = {"tipo_cuenta": TIPO_CUENTA, "mes": mes, "desde": desde}
+
+	condiciones = ["tipo_cuenta = %(tipo_cuenta)s", "periodo < %(mes)s"]
+	condiciones_poliza = ["p.docstatus = 1", "p.fecha >= %(mes)s", "p.fecha < %(desde)s"]
+	if compania:
+		condiciones.append("compania = %(compania)s")
+		condiciones_poliza.append("p.`compañia` = %(compania)s")
+		valores["compania"] = compania
+	if cuentas is not None:
+		if not cuentas:
+			return {}
+		condiciones.append("cuenta IN %(cuentas)s")
+		condiciones_poliza.append("m.cuenta IN %(cuentas)s")
+		valores["cuentas"] = tuple(cuentas)
+
+	cierre = _ultimo_cierre(compania, hasta=add_days(mes, -1))
+	abierta = _condicion_abierta(cierre, valores)
+
+	saldo_de_cierre = ""
+	if cierre:
+		filtro_cuentas = "AND cuenta IN %(cuentas)s" if cuentas is not None else ""
+		saldo_de_cierre = f"""
+			SELECT cuenta, saldo FROM `tabSaldo de Cierre`
+			WHERE cierre = %(cierre)s {filtro_cuentas}
+			UNION ALL
+		"""
+
+	filas = frappe.db.sql(f"""
+		SELECT cuenta, SUM(saldo) AS saldo
+		FROM (
+			{saldo_de_cierre}
+			SELECT cuenta, saldo FROM `tabSaldo de Cuenta`
+			WHERE {" AND ".join(condiciones)} AND {abierta}
+			UNION ALL
+			SELECT m.cuenta, COALESCE(m.debe, 0) - COALESCE(m.haber, 0) AS saldo
+			FROM `tabPoliza` p
+			JOIN `tabpoliza_movimiento` m
+				ON m.parent = p.name AND m.parenttype = 'Poliza' AND m.parentfield = 'table_qbss'
+			WHERE {" AND ".join(condiciones_poliza)}
+		) t
+		GROUP BY cuenta
+	""", valores, as_dict=True)
+
+	return {f.cuenta: flt(f.saldo) for f in filas}
+
+
+# ============================================================================
+# BALANZA POR ÁRBOL DE CUENTAS
+# ============================================================================
+
+def get_balanza(catalogo, compania=None, desde=None, hasta=None, cuentas=None):
+	"""
+	Balanza de comprobación del catálogo con los saldos sumados hacia arriba
+	del árbol en una sola consulta.
+
+	Primero se agregan los saldos de Saldo de Cuenta por cuenta (su `lft`) y
+	después cada nodo suma las cuentas cuyo `lft` cae en su intervalo
+	[lft, rgt). Así un grupo incluye todo su subárbol sin recorrerlo nivel por
+	nivel; las raíces (Activo, Pasivo, Capital...) dan los totales del balance.
+
+	Con compañía, el saldo inicial parte del último Saldo de Cierre anterior al
+	periodo y solo se leen los meses posteriores; en ese caso, sin `desde`, debe
+	y haber son los movimientos del periodo abierto.
+
+	Args:
+		catalogo (str): Catálogo de cuentas
+		compania (str): Limitar a una compañía (opcional)
+		desde (str): Inicio del periodo; lo anterior va al saldo inicial (opcional)
+		hasta (str): Último mes a incluir (opcional)
+		cuentas (list): Calcular solo estos nodos, p. ej. los hijos de un grupo (opcional)
+
+	Returns:
+		list: Filas {cuenta, nombre, parent_cuenta, is_group, saldo_inicial,
+			debe, haber, saldo_final} en orden de árbol
+	"""
+	valores = {"catalogo": catalogo, "tipo_cuenta": TIPO_CUENTA}
+	condiciones_cuenta = ["c.catalogo = %(catalogo)s"]
+	condiciones_saldo = ["s.tipo_cuenta = %(tipo_cuenta)s"]
+	condiciones_nodo = ["g.catalogo = %(catalogo)s"]
+
+	if compania:
+		condiciones_saldo.append("s.compania = %(compania)s")
+		valores["compania"] = compania
+	if hasta:
+		condiciones_saldo.append("s.periodo <= %(hasta)s")
+		valores["hasta"] = get_first_day(hasta)
+
+	if desde:
+		valores["desde"] = get_first_day(desde)
+		en_periodo = "s.periodo >= %(desde)s"
+	else:
+		en_periodo = "1 = 1"
+
+	if cuentas:
+		# Solo se agregan las cuentas dentro del intervalo de los nodos pedidos
+		valores["cuentas"] = tuple(cuentas)
+		condiciones_nodo.append("g.name IN %(cuentas)s")
+		condiciones_cuenta.append("""c.lft >= (SELECT MIN(lft) FROM `tabCuenta` WHERE name IN %(cuentas)s)
+			AND c.lft < (SELECT MAX(rgt) FROM `tabCuenta` WHERE name IN %(cuentas)s)""")
+
+	cierre = _ultimo_cierre(compania, antes_de=desde) if desde else _ultimo_cierre(compania, hasta=hasta)
+	condiciones_saldo.append(_condicion_abierta(cierre, valores, alias="s"))
+
+	saldo_de_cierre = ""
+	if cierre:
+		saldo_de_cierre = f"""
+				SELECT c.lft, k.saldo AS saldo_inicial, 0 AS debe, 0 AS haber
+				FROM `tabSaldo de Cierre` k
+				JOIN `tabCuenta` c ON c.name = k.cuenta
+				WHERE k.cierre = %(cierre)s AND {" AND ".join(condiciones_cuenta)}
+				UNION ALL"""
+
+	return frappe.db.sql(f"""
+		SELECT
+			g.name AS cuenta,
+			g.cuenta AS nombre,
+			g.parent_cuenta,
+			g.is_group,
+			COALESCE(SUM(h.saldo_inicial), 0) AS saldo_inicial,
+			COALESCE(SUM(h.debe), 0) AS debe,
+			COALESCE(SUM(h.haber), 0) AS haber,
+			COALESCE(SUM(h.saldo_inicial + h.debe - h.haber), 0) AS saldo_final
+		FROM `tabCuenta` g
+		LEFT JOIN (
+			SELECT lft, SUM(saldo_inicial) AS saldo_inicial, SUM(debe) AS debe, SUM(haber) AS haber
+			FROM ({saldo_de_cierre}
+				SELECT
+					c.lft,
+					CASE WHEN {en_periodo} THEN 0 ELSE s.saldo END AS saldo_inicial,
+					CASE WHEN {en_periodo} THEN s.debe ELSE 0 END AS debe,
+					CASE WHEN {en_periodo} THEN s.haber ELSE 0 END AS haber
+				FROM `tabSaldo de Cuenta` s
+				JOIN `tabCuenta` c ON c.name = s.cuenta
+				WHERE {" AND ".join(condiciones_cuenta + condiciones_saldo)}
+			) x
+			GROUP BY lft
+		) h ON h.lft >= g.lft AND h.lft < g.rgt
+		WHERE {" AND ".join(condiciones_nodo)}
+		GROUP BY g.name, g.cuenta, g.parent_cuenta, g.is_group, g.lft
+		ORDER BY g.lft
+	""", valores, as_dict=True)
+
+
+# ============================================================================
+# RECONSTRUCCIÓN
+# ============================================================================
+
+def reconstruir_saldos(fecha_inicio=None, fecha_fin=None):
+	"""
+	Vuelve a calcular los saldos desde las Pólizas y Asientos Contables
+	enviados, con consultas agrupadas en lugar de documento por documento.
+	El rango se amplía a meses completos.
+
+	Args:
+		fecha_inicio (str): Primer mes a reconstruir (opcional, desde el inicio)
+		fecha_fin (str): Último mes a reconstruir (opcional, hasta hoy)
+
+	Returns:
+		int: Filas escritas
+	"""
+	condiciones = []
+	valores = {}
+	if fecha_inicio:
+		condiciones.append("periodo >= %(desde)s")
+		valores["desde"] = get_first_day(fecha_inicio)
+	if fecha_fin:
+		condiciones.append("periodo <= %(hasta)s")
+		valores["hasta"] = get_last_day(fecha_fin)
+	where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+
+	frappe.db.sql(f"DELETE FROM `tabSaldo de Cuenta` {where}", valores)
+
+	saldos = {}
+	anio_fiscal = """(
+		SELECT f.name FROM `tabAnio Fiscal` f
+		WHERE f.desde <= DATE({0}) AND f.hasta >= DATE({0})
+		ORDER BY f.es_por_defecto DESC, f.desde DESC
+		LIMIT 1
+	)"""
+
+	for fila in _consulta(f"""
+		SELECT m.cuenta, p.`compañia` AS compania,
+			COALESCE(p.`año_fiscal`, {anio_fiscal.format("p.fecha")}) AS anio_fiscal,
+			{INICIO_DE_MES.format("p.fecha")} AS periodo,
+			SUM(m.debe) AS debe, SUM(m.haber) AS haber, COUNT(*) AS movimientos
+		FROM `tabPoliza` p
+		JOIN `tabpoliza_movimiento` m
+			ON m.parent = p.name AND m.parenttype = 'Poliza' AND m.parentfield = 'table_qbss'
+		WHERE p.docstatus = 1 AND m.cuenta IS NOT NULL {{condicion}}
+		GROUP BY 1, 2, 3, 4
+	""", "p.fecha", valores):
+		_agregar(saldos, TIPO_CUENTA, fila.cuenta, fila.compania, fila.anio_fiscal, fila.periodo,
+			debe=fila.debe, haber=fila.haber, movimientos=fila.movimientos)
+
+	for fila in _consulta(f"""
+		SELECT d.cuenta, {anio_fiscal.format("a.posting_date")} AS anio_fiscal,
+			{INICIO_DE_MES.format("a.posting_date")} AS periodo,
+			SUM(d.debito) AS debe, SUM(d.credito) AS haber, COUNT(*) AS movimientos
+		FROM `tabAsiento Contable` a
+		JOIN `tabDetalle Asiento` d
+			ON d.parent = a.name AND d.parenttype = 'Asiento Contable' AND d.parentfield = 'detalle'
+		WHERE a.docstatus = 1 AND d.cuenta IS NOT NULL {{condicion}}
+		GROUP BY 1, 2, 3
+	""", "a.posting_date", valores):
+		_agregar(saldos, TIPO_CUENTA_CONTABLE, fila.cuenta, None, fila.anio_fiscal, fila.periodo,
+			debe=fila.debe, haber=fila.haber, movimientos=fila.movimientos)
+
+	filas = list(saldos.values())
+	for inicio in range(0, len(filas), 500):
+		aplicar_saldos(filas[inicio:inicio + 500])
+
+	return len(filas)
+
+
+def _consulta(sql, fecha, valores):
+	"""Ejecuta una consulta de reconstrucción con el rango de meses aplicado a `fecha`"""
+	condicion = ""
+	if "desde" in valores:
+		condicion += f" AND {fecha} >= %(desde)s"
+	if "hasta" in valores:
+		condicion += f" AND {fecha} < %(hasta_siguiente)s"
+		valores["hasta_siguiente"] = add_days(valores["hasta"], 1)
+	return frappe.db.sql(sql.format(condicion=condicion), valores, as_dict=True)
@@ -0,0 +1,242 @@
+"""
+Servicio de cierre de ejercicio (Cierre de Periodo)
+
+Al enviar un Cierre de Periodo se bloquea el ejercicio de la compañía y se
+encola el cierre:
+
+1. Calcula el saldo de cada cuenta a la fecha de cierre (último Saldo de
+   Cierre más los meses abiertos, ver balance_service).
+2. Genera y envía la póliza de cierre, que salda las cuentas de Ingreso y
+   Gasto contra la cuenta de resultados.
+3. Guarda los saldos después de la póliza de cierre en Saldo de Cierre, que
+   es el punto de partida de los reportes de los ejercicios siguientes.
+
+Mientras el cierre está en proceso o completado no se pueden crear, enviar
+ni cancelar pólizas del ejercicio para esa compañía.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import flt, get_datetime, getdate, now_datetime
+
+from endersuite.contabilidad.services import balance_service
+
+# Estados del cierre que bloquean el ejercicio
+ESTADOS_BLOQUEO = ("En Proceso", "Completado")
+
+# Cuentas raíz del catálogo que se saldan en la póliza de cierre
+CUENTAS_DE_RESULTADOS = ("Ingreso", "Gasto")
+
+# Evento realtime con el resultado del cierre
+EVENTO_CIERRE = "cierre_de_periodo"
+
+# Filas de Saldo de Cierre por INSERT
+TAMANO_LOTE_SALDOS = 1000
+
+
+# ============================================================================
+# BLOQUEO DEL EJERCICIO
+# ============================================================================
+
+def get_cierre(compania, fecha):
+	"""
+	Cierre que bloquea la fecha para la compañía.
+
+	Args:
+		compania (str): Compañía
+		fecha (str): Fecha a revisar
+
+	Returns:
+		str: Nombre del Cierre de Periodo o None si la fecha está abierta
+	"""
+	if not compania or not fecha:
+		return None
+
+	return frappe.db.get_value("Cierre de Periodo", {
+		"compania": compania,
+		"docstatus": 1,
+		"estado": ["in", ESTADOS_BLOQUEO],
+		"fecha_inicio": ["<=", getdate(fecha)],
+		"fecha_cierre": [">=", getdate(fecha)]
+	})
+
+
+def validar_periodo_abierto(compania, fecha):
+	"""Impide registrar o cancelar movimientos en un ejercicio cerrado"""
+	cierre = get_cierre(compania, fecha)
+	if cierre:
+		frappe.throw(_(
+			"El ejercicio de {0} que contiene la fecha {1} está cerrado (Cierre de Periodo {2})"
+		).format(compania, frappe.format(getdate(fecha), {"fieldtype": "Date"}), cierre))
+
+
+# ============================================================================
+# CIERRE
+# ============================================================================
+
+def encolar_cierre(cierre_doc):
+	"""
+	Bloquea el ejercicio y encola el cierre.
+	Llamado desde on_submit de Cierre de Periodo.
+	"""
+	cierre_doc.db_set("estado", "En Proceso")
+	frappe.enqueue(
+		"endersuite.contabilidad.services.period_close_service.ejecutar_cierre",
+		queue="long",
+		timeout=60 * 60,
+		job_id=f"cierre_de_periodo::{cierre_doc.name}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		cierre=cierre_doc.name
+	)
+
+
+def ejecutar_cierre(cierre):
+	"""
+	Calcula los saldos, genera la póliza de cierre y guarda el Saldo de Cierre.
+	Si algo falla se revierte todo y el cierre queda en Error, sin bloquear el ejercicio.
+
+	Args:
+		cierre (str): Nombre del Cierre de Periodo
+	"""
+	doc = frappe.get_doc("Cierre de Periodo", cierre)
+
+	try:
+		saldos = balance_service.get_saldos_a_fecha(doc.compania, doc.fecha_cierre)
+		poliza, utilidad = _crear_poliza_de_cierre(doc, saldos)
+
+		# Saldos después de la póliza de cierre: las cuentas de resultados quedan en cero
+		if poliza:
+			saldos = balance_service.get_saldos_a_fecha(doc.compania, doc.fecha_cierre)
+		filas = _guardar_saldo_de_cierre(doc, saldos)
+
+		doc.db_set({
+			"estado": "Completado",
+			"poliza_de_cierre": poliza.name if poliza else None,
+			"utilidad": utilidad,
+			"cuentas_en_saldo": filas,
+			"error": None
+		})
+		_marcar_anio_fiscal(doc, "Cerrado")
+		frappe.db.commit()
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(title=_("Cierre de Periodo {0}").format(cierre))
+		doc.db_set({"estado": "Error", "error": str(e)})
+		frappe.db.commit()
+
+	frappe.publish_realtime(EVENTO_CIERRE, {"cierre": doc.name, "estado": doc.estado}, user=doc.owner)
+
+
+def _cuentas_de_resultados(compania):
+	"""Cuentas hoja bajo las raíces Ingreso y Gasto del catálogo de la compañía"""
+	catalogo = frappe.db.get_value("Compania", compania, "catalogo")
+	return set(frappe.db.sql("""
+		SELECT c.name
+		FROM `tabCuenta` c
+		JOIN `tabCuenta` r
+			ON r.catalogo = c.catalogo AND r.protected_root = 1
+			AND c.lft > r.lft AND c.rgt < r.rgt
+		WHERE c.catalogo = %(catalogo)s AND r.cuenta IN %(raices)s
+	""", {"catalogo": catalogo, "raices": CUENTAS_DE_RESULTADOS}, pluck=True))
+
+
+def _crear_poliza_de_cierre(doc, saldos):
+	"""
+	Póliza que lleva a cero las cuentas de Ingreso y Gasto contra la cuenta de
+	resultados.
+
+	Returns:
+		tuple: (póliza enviada o None si no hay saldos de resultados, utilidad del ejercicio)
+	"""
+	resultados = _cuentas_de_resultados(doc.compania)
+
+	movimientos = []
+	neto = 0
+	for fila in saldos:
+		saldo = flt(fila.saldo, 2)
+		if fila.cuenta not in resultados or not saldo:
+			continue
+		neto += saldo
+		movimientos.append({
+			"cuenta": fila.cuenta,
+			"debe": -saldo if saldo < 0 else 0,
+			"haber": saldo if saldo > 0 else 0
+		})
+
+	if not movimientos:
+		return None, 0
+
+	neto = flt(neto, 2)
+	if neto:
+		# Saldo deudor neto (gastos mayores que ingresos) es pérdida y se carga a resultados
+		movimientos.append({
+			"cuenta": doc.cuenta_de_resultados,
+			"debe": neto if neto > 0 else 0,
+			"haber": -neto if neto < 0 else 0
+		})
+
+	poliza = frappe.get_doc({
+		"doctype": "Poliza",
+		"fecha": get_datetime(f"{doc.fecha_cierre} 23:59:59"),
+		"tipo_de_poliza": "Diario",
+		"compañia": doc.compania,
+		"año_fiscal": doc.anio_fiscal,
+		"concepto": _("Póliza de cierre del ejercicio {0}").format(doc.anio_fiscal),
+		"documento_origen": doc.name,
+		"table_qbss": movimientos
+	})
+	# El ejercicio ya está bloqueado por este cierre
+	poliza.flags.cierre_de_periodo = doc.name
+	poliza.flags.ignore_permissions = True
+	poliza.insert()
+	poliza.submit()
+
+	return poliza, -neto
+
+
+def _guardar_saldo_de_cierre(doc, saldos):
+	"""Reemplaza el Saldo de Cierre del cierre con INSERTs de varias filas; devuelve las filas escritas"""
+	frappe.db.delete("Saldo de Cierre", {"cierre": doc.name})
+
+	ahora = now_datetime()
+	usuario = frappe.session.user
+	valores = [
+		(
+			frappe.generate_hash(length=10), ahora, ahora, usuario, usuario, 0, 0,
+			doc.name, doc.compania, doc.anio_fiscal, doc.fecha_cierre,
+			fila.cuenta, flt(fila.debe), flt(fila.haber), flt(fila.saldo)
+		)
+		for fila in saldos
+		if flt(fila.debe) or flt(fila.haber) or flt(fila.saldo)
+	]
+
+	frappe.db.bulk_insert("Saldo de Cierre", [
+		"name", "creation", "modified", "modified_by", "owner", "docstatus", "idx",
+		"cierre", "compania", "anio_fiscal", "fecha_cierre",
+		"cuenta", "debe", "haber", "saldo"
+	], valores, chunk_size=TAMANO_LOTE_SALDOS)
+
+	return len(valores)
+
+
+def reabrir_cierre(cierre_doc):
+	"""
+	Desbloquea el ejercicio: borra el Saldo de Cierre y cancela la póliza de cierre.
+	Llamado desde on_cancel de Cierre de Periodo.
+	"""
+	frappe.db.delete("Saldo de Cierre", {"cierre": cierre_doc.name})
+
+	if cierre_doc.poliza_de_cierre:
+		poliza = frappe.get_doc("Poliza", cierre_doc.poliza_de_cierre)
+		if poliza.docstatus == 1:
+			poliza.flags.ignore_permissions = True
+			poliza.cancel()
+
+	_marcar_anio_fiscal(cierre_doc, "Abierto")
+
+
+def _marcar_anio_fiscal(cierre_doc, estado):
+	"""Refleja el cierre en el Año Fiscal cuando el año es exclusivo de la compañía"""
+	if frappe.db.get_value("Anio Fiscal", cierre_doc.anio_fiscal, "empresa") == cierre_doc.compania:
+		frappe.db.set_value("Anio Fiscal", cierre_doc.anio_fiscal, "estado", estado)
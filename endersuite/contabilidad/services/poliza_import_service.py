@@ -0,0 +1,440 @@
+"""
+Servicio de importación masiva de Pólizas
+
+Carga pólizas históricas desde un archivo CSV o JSONL sin pasar por el
+insert documento por documento. Cada fila del archivo es un movimiento y
+repite los datos de su póliza; las filas de una misma póliza van seguidas:
+
+	poliza, fecha, tipo_de_poliza, compania, anio_fiscal, concepto,
+	cuenta, debe, haber, referencia
+
+El archivo se lee como flujo y se procesa por lotes de pólizas. Cada lote se
+valida contra cachés de la importación (años fiscales, catálogo de cada
+compañía y sus cuentas en conjuntos), se inserta con INSERTs de varias filas
+y se confirma en su propia transacción. Las pólizas con errores no se
+insertan y quedan en un reporte por renglón.
+"""
+
+import csv
+import io
+import json
+import os
+from bisect import bisect_right
+
+import frappe
+from frappe import _
+from frappe.utils import cint, cstr, flt, get_datetime, getdate, now_datetime
+
+from endersuite.contabilidad.services import balance_service, period_close_service
+
+# Pólizas por lote (y por transacción)
+TAMANO_LOTE = 1000
+
+FORMATOS = ("CSV", "JSONL")
+
+# Evento realtime con el avance y el resultado de la importación
+EVENTO_IMPORTACION = "importacion_polizas"
+
+MESES = [
+	"Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
+	"Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
+]
+
+CAMPOS_POLIZA = [
+	"name", "creation", "modified", "modified_by", "owner", "docstatus", "idx",
+	"fecha", "tipo_de_poliza", "compañia", "año_fiscal", "periodo", "concepto",
+	"total_debe", "total_haber", "diferencia", "cuadra", "documento_origen"
+]
+
+CAMPOS_MOVIMIENTO = [
+	"name", "creation", "modified", "modified_by", "owner", "docstatus", "idx",
+	"parent", "parenttype", "parentfield",
+	"categoria_contable", "cuenta", "nombre_cuenta", "debe", "haber", "referencia"
+]
+
+
+# ============================================================================
+# LECTURA
+# ============================================================================
+
+def _leer_filas(ruta, formato):
+	"""Renglones del archivo como (linea, dict), sin cargarlo completo en memoria"""
+	with open(ruta, newline="", encoding="utf-8-sig") as f:
+		if formato == "CSV":
+			# La línea 1 es el encabezado
+			for linea, fila in enumerate(csv.DictReader(f), start=2):
+				yield linea, fila
+			return
+
+		for linea, texto in enumerate(f, start=1):
+			if not texto.strip():
+				continue
+			try:
+				yield linea, json.loads(texto)
+			except ValueError:
+				yield linea, {"_error": _("JSON no válido")}
+
+
+def _agrupar_polizas(filas):
+	"""Junta los renglones seguidos con la misma clave de póliza"""
+	actual = None
+	for linea, fila in filas:
+		clave = cstr(fila.get("poliza")).strip()
+		if actual and clave == actual.clave and not fila.get("_error"):
+			actual.movimientos.append((linea, fila))
+			continue
+
+		if actual:
+			yield actual
+		actual = frappe._dict({"clave": clave, "linea": linea, "encabezado": fila, "movimientos": [(linea, fila)]})
+
+	if actual:
+		yield actual
+
+
+def _lotes(polizas, tamano):
+	lote = []
+	for poliza in polizas:
+		lote.append(poliza)
+		if len(lote) >= tamano:
+			yield lote
+			lote = []
+	if lote:
+		yield lote
+
+
+# ============================================================================
+# CACHÉS DE LA IMPORTACIÓN
+# ============================================================================
+
+class _Cache:
+	"""Datos maestros leídos una vez por importación"""
+
+	def __init__(self):
+		self.anios = frappe.get_all(
+			"Anio Fiscal",
+			fields=["name", "desde", "hasta", "estado", "es_por_defecto"],
+			order_by="es_por_defecto desc, desde desc"
+		)
+		self.anios_por_nombre = {a.name: a for a in self.anios}
+		self.cierres = frappe.get_all(
+			"Cierre de Periodo",
+			filters={"docstatus": 1, "estado": ["in", period_close_service.ESTADOS_BLOQUEO]},
+			fields=["name", "compania", "fecha_inicio", "fecha_cierre"]
+		)
+		self.catalogos = {}
+		self.cuentas = {}
+		self.claves = set()
+
+	def anio_fiscal(self, nombre, fecha):
+		"""Año fiscal indicado o, si no viene, el que contiene la fecha"""
+		if nombre:
+			return self.anios_por_nombre.get(nombre)
+		for anio in self.anios:
+			if getdate(anio.desde) <= fecha <= getdate(anio.hasta):
+				return anio
+
+	def cierre(self, compania, fecha):
+		"""Cierre de Periodo que bloquea la fecha para la compañía"""
+		for cierre in self.cierres:
+			if cierre.compania == compania and getdate(cierre.fecha_inicio) <= fecha <= getdate(cierre.fecha_cierre):
+				return cierre.name
+
+	def catalogo(self, compania):
+		if compania not in self.catalogos:
+			self.catalogos[compania] = frappe.db.get_value("Compania", compania, "catalogo")
+		return self.catalogos[compania]
+
+	def cuentas_de(self, catalogo):
+		"""
+		Cuentas del catálogo: {name: (nombre, categoría, es_grupo)}. La categoría
+		es la cuenta raíz cuyo intervalo lft/rgt contiene a la cuenta.
+		"""
+		if catalogo not in self.cuentas:
+			filas = frappe.db.sql("""
+				SELECT name, cuenta, lft, rgt, is_group, protected_root
+				FROM `tabCuenta`
+				WHERE catalogo = %s
+			""", catalogo, as_dict=True)
+
+			raices = sorted((f.lft, f.rgt, f.name) for f in filas if f.protected_root and f.lft)
+			inicios = [r[0] for r in raices]
+
+			cuentas = {}
+			for f in filas:
+				categoria = None
+				i = bisect_right(inicios, cint(f.lft)) - 1
+				if i >= 0 and cint(f.lft) < raices[i][1]:
+					categoria = raices[i][2]
+				cuentas[f.name] = (f.cuenta, categoria, cint(f.is_group))
+			self.cuentas[catalogo] = cuentas
+
+		return self.cuentas[catalogo]
+
+
+# ============================================================================
+# VALIDACIÓN
+# ============================================================================
+
+def _validar_poliza(poliza, cache):
+	"""
+	Valida una póliza agrupada con las mismas reglas que Poliza.validate.
+
+	Returns:
+		tuple: (poliza lista para insertar o None, errores [(linea, mensaje)])
+	"""
+	encabezado = poliza.encabezado
+	if encabezado.get("_error"):
+		return None, [(poliza.linea, encabezado["_error"])]
+
+	errores = []
+	if not poliza.clave:
+		errores.append((poliza.linea, _("Falta la clave de póliza")))
+	elif poliza.clave in cache.claves:
+		errores.append((poliza.linea, _("La póliza {0} ya fue importada o se repite en el archivo").format(poliza.clave)))
+
+	try:
+		fecha = get_datetime(encabezado.get("fecha"))
+	except Exception:
+		fecha = None
+	if not fecha:
+		errores.append((poliza.linea, _("Fecha no válida: {0}").format(encabezado.get("fecha"))))
+
+	compania = encabezado.get("compania")
+	catalogo = cache.catalogo(compania) if compania else None
+	if not catalogo:
+		errores.append((poliza.linea, _("Compañía sin catálogo de cuentas: {0}").format(compania)))
+
+	anio = None
+	if fecha:
+		anio = cache.anio_fiscal(encabezado.get("anio_fiscal"), fecha.date())
+		if not anio:
+			errores.append((poliza.linea, _("No hay año fiscal para la fecha {0}").format(fecha.date())))
+		elif not getdate(anio.desde) <= fecha.date() <= getdate(anio.hasta):
+			errores.append((poliza.linea, _("La fecha {0} está fuera del año fiscal {1}").format(fecha.date(), anio.name)))
+		elif anio.estado == "Cerrado":
+			errores.append((poliza.linea, _("El año fiscal {0} está cerrado").format(anio.name)))
+		elif cache.cierre(compania, fecha.date()):
+			errores.append((poliza.linea, _("El ejercicio está cerrado (Cierre de Periodo {0})").format(
+				cache.cierre(compania, fecha.date())
+			)))
+
+	if len(poliza.movimientos) < 2:
+		errores.append((poliza.linea, _("Debe haber al menos 2 movimientos contables")))
+
+	cuentas = cache.cuentas_de(catalogo) if catalogo else {}
+	movimientos = []
+	for linea, fila in poliza.movimientos:
+		valor = cstr(fila.get("cuenta")).strip()
+		cuenta = valor if valor in cuentas else f"{catalogo}-{valor}"
+		debe, haber = flt(fila.get("debe"), 2), flt(fila.get("haber"), 2)
+
+		if catalogo and cuenta not in cuentas:
+			errores.append((linea, _("La cuenta {0} no existe en el catálogo {1}").format(valor, catalogo)))
+		elif catalogo and cuentas[cuenta][2]:
+			errores.append((linea, _("La cuenta {0} es un grupo").format(valor)))
+		if not debe and not haber:
+			errores.append((linea, _("Debe ingresar un monto en Debe o Haber")))
+		elif debe and haber:
+			errores.append((linea, _("No puede tener monto en Debe y Haber simultáneamente")))
+
+		nombre_cuenta, categoria, _es_grupo = cuentas.get(cuenta, (None, None, 0))
+		movimientos.append(frappe._dict({
+			"cuenta": cuenta, "nombre_cuenta": nombre_cuenta, "categoria_contable": categoria,
+			"debe": debe, "haber": haber, "referencia": fila.get("referencia")
+		}))
+
+	total_debe = flt(sum(m.debe for m in movimientos), 2)
+	total_haber = flt(sum(m.haber for m in movimientos), 2)
+	if total_debe != total_haber:
+		errores.append((poliza.linea, _("La póliza no está cuadrada. Debe: {0}, Haber: {1}").format(total_debe, total_haber)))
+
+	if errores:
+		return None, errores
+
+	return frappe._dict({
+		"name": frappe.generate_hash(length=10),
+		"clave": poliza.clave,
+		"fecha": fecha,
+		"tipo_de_poliza": encabezado.get("tipo_de_poliza") or "Diario",
+		"compañia": compania,
+		"año_fiscal": anio.name,
+		"periodo": MESES[fecha.month - 1],
+		"concepto": encabezado.get("concepto") or poliza.clave,
+		"total_debe": total_debe,
+		"total_haber": total_haber,
+		"table_qbss": movimientos
+	}), []
+
+
+def _claves_existentes(lote):
+	"""Claves del lote ya importadas en una corrida anterior (guardadas en documento_origen)"""
+	claves = [p.clave for p in lote if p.clave]
+	if not claves:
+		return set()
+	return set(frappe.db.sql("""
+		SELECT documento_origen FROM `tabPoliza`
+		WHERE documento_origen IN %(claves)s AND docstatus < 2
+	""", {"claves": tuple(claves)}, pluck=True))
+
+
+# ============================================================================
+# INSERCIÓN
+# ============================================================================
+
+def _insertar_lote(polizas, enviar):
+	"""Inserta pólizas y movimientos con INSERTs de varias filas y, si se envían, suma sus saldos"""
+	ahora = now_datetime()
+	usuario = frappe.session.user
+	docstatus = 1 if enviar else 0
+
+	filas_poliza = []
+	filas_movimiento = []
+	for p in polizas:
+		filas_poliza.append((
+			p.name, ahora, ahora, usuario, usuario, docstatus, 0,
+			p.fecha, p.tipo_de_poliza, p["compañia"], p["año_fiscal"], p.periodo, p.concepto,
+			p.total_debe, p.total_haber, 0, 1, p.clave
+		))
+		for idx, m in enumerate(p.table_qbss, start=1):
+			filas_movimiento.append((
+				frappe.generate_hash(length=10), ahora, ahora, usuario, usuario, docstatus, idx,
+				p.name, "Poliza", "table_qbss",
+				m.categoria_contable, m.cuenta, m.nombre_cuenta, m.debe, m.haber, m.referencia
+			))
+
+	frappe.db.bulk_insert("Poliza", CAMPOS_POLIZA, filas_poliza, chunk_size=TAMANO_LOTE)
+	frappe.db.bulk_insert("poliza_movimiento", CAMPOS_MOVIMIENTO, filas_movimiento, chunk_size=TAMANO_LOTE)
+
+	if enviar:
+		balance_service.registrar_polizas(polizas)
+
+
+# ============================================================================
+# IMPORTACIÓN
+# ============================================================================
+
+def importar_polizas(ruta, formato=None, enviar=True, tamano_lote=TAMANO_LOTE, usuario=None):
+	"""
+	Importa pólizas desde un archivo CSV o JSONL por lotes.
+
+	Cada lote se valida e inserta en su propia transacción; si un lote falla
+	al insertar, se revierte solo ese lote y sus pólizas quedan en el reporte.
+	La clave de cada póliza se guarda en `documento_origen`, así que volver a
+	importar el mismo archivo omite las pólizas que ya entraron.
+
+	Args:
+		ruta (str): Ruta del archivo
+		formato (str): "CSV" o "JSONL" (opcional, por la extensión)
+		enviar (bool): Insertar las pólizas enviadas y actualizar los saldos
+		tamano_lote (int): Pólizas por lote
+		usuario (str): Usuario que recibe el avance por realtime (opcional)
+
+	Returns:
+		frappe._dict: {polizas, movimientos, errores, reporte}
+	"""
+	formato = (formato or os.path.splitext(ruta)[1].lstrip(".")).upper()
+	if formato not in FORMATOS:
+		frappe.throw(_("Formato no válido: {0}").format(formato))
+
+	cache = _Cache()
+	resumen = frappe._dict({"polizas": 0, "movimientos": 0, "errores": [], "reporte": None})
+
+	for lote in _lotes(_agrupar_polizas(_leer_filas(ruta, formato)), cint(tamano_lote) or TAMANO_LOTE):
+		cache.claves.update(_claves_existentes(lote))
+
+		validas = []
+		for poliza in lote:
+			valida, errores = _validar_poliza(poliza, cache)
+			if poliza.clave:
+				cache.claves.add(poliza.clave)
+			if valida:
+				validas.append(valida)
+			resumen.errores.extend((linea, poliza.clave, mensaje) for linea, mensaje in errores)
+
+		if validas:
+			try:
+				_insertar_lote(validas, enviar)
+				frappe.db.commit()
+			except Exception as e:
+				frappe.db.rollback()
+				frappe.log_error(title=_("Importación de pólizas: lote revertido"))
+				revertidas = {v.clave for v in validas}
+				mensaje = _("Lote revertido: {0}").format(e)
+				resumen.errores.extend((p.linea, p.clave, mensaje) for p in lote if p.clave in revertidas)
+				validas = []
+
+		resumen.polizas += len(validas)
+		resumen.movimientos += sum(len(v.table_qbss) for v in validas)
+
+		if usuario:
+			frappe.publish_realtime(EVENTO_IMPORTACION, {
+				"polizas": resumen.polizas, "errores": len(resumen.errores)
+			}, user=usuario)
+
+	if resumen.errores:
+		resumen.reporte = _escribir_reporte(resumen.errores, usuario)
+
+	return resumen
+
+
+def _escribir_reporte(errores, usuario=None):
+	"""Reporte CSV (linea, poliza, error) como archivo privado; devuelve su URL"""
+	contenido = io.StringIO()
+	writer = csv.writer(contenido)
+	writer.writerow([_("Línea"), _("Póliza"), _("Error")])
+	writer.writerows(sorted(errores, key=lambda e: e[0]))
+
+	archivo = frappe.get_doc({
+		"doctype": "File",
+		"file_name": "errores_importacion_polizas_{0}.csv".format(frappe.generate_hash(length=8)),
+		"content": "\ufeff" + contenido.getvalue(),
+		"is_private": 1,
+		"owner": usuario or frappe.session.user
+	})
+	archivo.insert(ignore_permissions=True)
+	frappe.db.commit()
+
+	return archivo.file_url
+
+
+@frappe.whitelist()
+def importar_archivo(file_url, enviar=1):
+	"""
+	Encola la importación de un archivo ya subido. El usuario recibe el
+	avance y el reporte de errores por realtime.
+
+	Args:
+		file_url (str): URL del archivo CSV o JSONL subido
+		enviar (int): 1 para insertar las pólizas enviadas
+
+	Returns:
+		dict: {encolada: True}
+	"""
+	frappe.has_permission("Poliza", "create", throw=True)
+
+	archivo = frappe.get_doc("File", {"file_url": file_url})
+	if not frappe.has_permission("File", "read", doc=archivo):
+		frappe.throw(_("No tiene permiso para leer el archivo {0}").format(file_url), frappe.PermissionError)
+	ruta = archivo.get_full_path()
+
+	frappe.enqueue(
+		"endersuite.contabilidad.services.poliza_import_service.importar_en_segundo_plano",
+		queue="long",
+		timeout=6 * 60 * 60,
+		ruta=ruta,
+		enviar=cint(enviar),
+		usuario=frappe.session.user
+	)
+	return {"encolada": True}
+
+
+def importar_en_segundo_plano(ruta, enviar, usuario):
+	resumen = importar_polizas(ruta, enviar=enviar, usuario=usuario)
+	frappe.publish_realtime(EVENTO_IMPORTACION, {
+		"terminada": True,
+		"polizas": resumen.polizas,
+		"movimientos": resumen.movimientos,
+		"errores": len(resumen.errores),
+		"reporte": resumen.reporte
+	}, user=usuario)
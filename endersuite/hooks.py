@@ -136,8 +136,70 @@ setup_wizard_requires = "assets/endersuite/js/setup_wizard.js"
 
 doc_events = {
 	"Nota de Venta": {
-		"on_submit": "endersuite.ventas.services.stock_service.decrement_stock",
-		"on_cancel": "endersuite.ventas.services.stock_service.revert_stock"
+		"on_submit": [
+			"endersuite.ventas.services.stock_service.decrement_stock",
+			"endersuite.ventas.services.session_service.registrar_venta",
+			"endersuite.ventas.services.sales_facts_service.registrar_nota",
+			"endersuite.ventas.page.escritorio_ventas.escritorio_ventas.invalidar_dashboard"
+		],
+		"on_cancel": [
+			"endersuite.ventas.services.stock_service.revert_stock",
+			"endersuite.ventas.services.session_service.revertir_venta",
+			"endersuite.ventas.services.sales_facts_service.revertir_nota",
+			"endersuite.ventas.page.escritorio_ventas.escritorio_ventas.invalidar_dashboard"
+		]
+	},
+	"Reembolso": {
+		"on_submit": [
+			"endersuite.ventas.services.session_service.registrar_reembolso",
+			"endersuite.ventas.services.sales_facts_service.registrar_reembolso"
+		],
+		"on_cancel": [
+			"endersuite.ventas.services.session_service.revertir_reembolso",
+			"endersuite.ventas.services.sales_facts_service.revertir_reembolso"
+		]
+	},
+	"Producto": {
+		"on_update": [
+			"endersuite.ventas.services.search_service.indexar_producto",
+			"endersuite.ventas.services.price_service.invalidar_producto"
+		],
+		"on_trash": [
+			"endersuite.ventas.services.search_service.quitar_producto",
+			"endersuite.ventas.services.price_service.invalidar_producto"
+		]
+	},
+	"Impuestos": {
+		"on_update": [
+			"endersuite.ventas.services.tax_service.invalidar_tasas",
+			"endersuite.ventas.services.price_service.invalidar_impuesto"
+		],
+		"on_trash": [
+			"endersuite.ventas.services.tax_service.invalidar_tasas",
+			"endersuite.ventas.services.price_service.invalidar_impuesto"
+		]
+	},
+	"Lista de Precios": {
+		"on_trash": "endersuite.ventas.services.price_service.invalidar_lista"
+	},
+	"Perfil de POS": {
+		"on_update": "endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket.invalidar_encabezado_perfil",
+		"on_trash": "endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket.invalidar_encabezado_perfil"
+	},
+	"Compania": {
+		"on_update": "endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket.invalidar_encabezados",
+		"on_trash": "endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket.invalidar_encabezados"
+	},
+	"Configuracion PAC": {
+		"on_update": "endersuite.ventas.services.pac_service.invalidar_configuracion"
+	},
+	"Poliza": {
+		"on_submit": "endersuite.contabilidad.services.balance_service.registrar_poliza",
+		"on_cancel": "endersuite.contabilidad.services.balance_service.revertir_poliza"
+	},
+	"Asiento Contable": {
+		"on_submit": "endersuite.contabilidad.services.balance_service.registrar_asiento",
+		"on_cancel": "endersuite.contabilidad.services.balance_service.revertir_asiento"
 	}
 }
 
@@ -147,7 +209,15 @@ doc_events = {
 scheduler_events = {
 	"daily": [
 		"endersuite.contabilidad.fiscal_utils.ensure_current_fiscal_year_daily"
-	]
+	],
+	"cron": {
+		"* * * * *": [
+			"endersuite.ventas.services.stamping_service.encolar_reintentos_vencidos"
+		],
+		"*/10 * * * *": [
+			"endersuite.ventas.services.stamping_service.recuperar_timbrados_atascados"
+		]
+	}
 }
 
 # Testing
@@ -0,0 +1,25 @@
+"""
+Patch para inicializar los acumulados en tiempo real de las sesiones POS abiertas
+"""
+
+import frappe
+
+
+def execute():
+	"""
+	Recalcula desde las notas y reembolsos los acumulados de las sesiones abiertas
+	creadas antes de que existieran los campos.
+	"""
+	from endersuite.ventas.services.session_service import conciliar_acumulados_sesion
+
+	frappe.reload_doc("ventas", "doctype", "totales_metodo_sesion_pos")
+	frappe.reload_doc("ventas", "doctype", "sesion_pos")
+
+	sesiones = frappe.get_all("Sesion POS", filters={"estado": "Abierta"}, pluck="name")
+
+	for sesion_pos in sesiones:
+		conciliar_acumulados_sesion(sesion_pos, corregir=1)
+
+	frappe.db.commit()
+
+	frappe.logger().info(f"Acumulados inicializados en {len(sesiones)} sesiones POS abiertas")
@@ -0,0 +1,20 @@
+"""
+Patch para construir el Resumen de Ventas a partir de las Notas de Venta y
+Reembolsos enviados
+"""
+
+import frappe
+
+
+def execute():
+	frappe.reload_doc("ventas", "doctype", "resumen_de_ventas")
+
+	if frappe.db.count("Resumen de Ventas"):
+		return
+
+	from endersuite.ventas.services.sales_facts_service import reconstruir_resumen
+
+	filas = reconstruir_resumen()
+	frappe.db.commit()
+
+	frappe.logger().info(f"Resumen de Ventas inicializado: {filas} filas")
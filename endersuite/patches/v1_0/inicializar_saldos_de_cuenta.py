@@ -0,0 +1,20 @@
+"""
+Patch para construir los Saldos de Cuenta a partir de las Pólizas y
+Asientos Contables enviados
+"""
+
+import frappe
+
+
+def execute():
+	frappe.reload_doc("contabilidad", "doctype", "saldo_de_cuenta")
+
+	if frappe.db.count("Saldo de Cuenta"):
+		return
+
+	from endersuite.contabilidad.services.balance_service import reconstruir_saldos
+
+	filas = reconstruir_saldos()
+	frappe.db.commit()
+
+	frappe.logger().info(f"Saldos de Cuenta inicializados: {filas} filas")
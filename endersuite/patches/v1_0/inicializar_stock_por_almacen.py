@@ -0,0 +1,90 @@
+"""
+Patch para construir las existencias por almacén (Stock por Almacen)
+a partir de los Movimientos de Stock enviados
+"""
+
+import frappe
+from frappe.utils import flt
+
+
+def execute():
+	"""
+	Suma los movimientos enviados por producto y almacén. La diferencia contra
+	Producto.cantidad_disponible (stock capturado a mano antes de existir los
+	movimientos) se asigna al almacén predeterminado del producto o, si no
+	tiene, al almacén de respaldo; sin almacén alguno se registra en el log.
+	"""
+	frappe.reload_doc("ventas", "doctype", "stock_por_almacen")
+	frappe.reload_doc("ventas", "doctype", "registro_de_stock")
+
+	if frappe.db.count("Stock por Almacen"):
+		return
+
+	saldos = {}
+	filas = frappe.db.sql("""
+		SELECT
+			m.almacen,
+			d.producto,
+			SUM(CASE
+				WHEN m.tipo_movimiento IN ('Entrada', 'Ajuste Positivo') THEN d.cantidad
+				WHEN m.tipo_movimiento IN ('Salida', 'Ajuste Negativo') THEN -d.cantidad
+				ELSE 0
+			END) AS cantidad
+		FROM `tabMovimiento de Stock` m
+		JOIN `tabDetalle Movimiento Stock` d ON d.parent = m.name AND d.parenttype = 'Movimiento de Stock'
+		WHERE m.docstatus = 1 AND m.almacen IS NOT NULL
+		GROUP BY m.almacen, d.producto
+	""", as_dict=True)
+
+	asignado = {}
+	for fila in filas:
+		saldos[(fila.producto, fila.almacen)] = flt(fila.cantidad)
+		asignado[fila.producto] = asignado.get(fila.producto, 0) + flt(fila.cantidad)
+
+	productos = frappe.get_all(
+		"Producto",
+		filters={"mantener_stock": 1},
+		fields=["name", "cantidad_disponible", "almacen_predeterminado"]
+	)
+
+	respaldo = _almacen_de_respaldo()
+	sin_almacen = []
+
+	for producto in productos:
+		residuo = flt(producto.cantidad_disponible) - asignado.get(producto.name, 0)
+		if not residuo:
+			continue
+
+		almacen = producto.almacen_predeterminado or respaldo
+		if not almacen:
+			sin_almacen.append((producto.name, residuo))
+			continue
+
+		clave = (producto.name, almacen)
+		saldos[clave] = saldos.get(clave, 0) + residuo
+
+	if sin_almacen:
+		frappe.log_error(
+			title="Stock por Almacen: existencias sin almacén",
+			message="\n".join(f"{producto}: {residuo}" for producto, residuo in sin_almacen)
+		)
+
+	for (producto, almacen), cantidad in saldos.items():
+		frappe.get_doc({
+			"doctype": "Stock por Almacen",
+			"producto": producto,
+			"almacen": almacen,
+			"cantidad_disponible": cantidad
+		}).db_insert()
+
+	frappe.db.commit()
+
+	frappe.logger().info(f"Stock por Almacen inicializado: {len(saldos)} existencias")
+
+
+def _almacen_de_respaldo():
+	"""Almacén activo de tipo Principal (o el primero activo) para productos sin almacén predeterminado"""
+	for filtros in ({"almacen_activo": 1, "tipo_de_almacen": "Principal"}, {"almacen_activo": 1}):
+		almacen = frappe.db.get_value("Almacen", filtros, "name", order_by="creation asc")
+		if almacen:
+			return almacen
@@ -0,0 +1,143 @@
+// Copyright (c) 2025, RenderCores.com and contributors
+// For license information, please see license.txt
+
+// ============================================================================
+// CATÁLOGO LOCAL DEL POS
+// ============================================================================
+// Copia completa del catálogo (productos, precio de la lista y existencia del
+// almacén) guardada en IndexedDB. Solo la primera carga descarga todo; después
+// pos_service.get_catalog_changes devuelve únicamente lo modificado desde el
+// último token.
+
+const DB_NAME = 'endersuite_pos_catalogo';
+const DB_VERSION = 1;
+const STORE_PRODUCTOS = 'productos';
+const STORE_META = 'meta';
+
+let dbPromise = null;
+
+function abrirDB() {
+  if (!dbPromise) {
+    dbPromise = new Promise((resolve, reject) => {
+      const request = indexedDB.open(DB_NAME, DB_VERSION);
+      request.onupgradeneeded = () => {
+        const db = request.result;
+        if (!db.objectStoreNames.contains(STORE_PRODUCTOS)) {
+          db.createObjectStore(STORE_PRODUCTOS, { keyPath: 'name' });
+        }
+        if (!db.objectStoreNames.contains(STORE_META)) {
+          db.createObjectStore(STORE_META, { keyPath: 'clave' });
+        }
+      };
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => {
+        dbPromise = null;
+        reject(request.error);
+      };
+    });
+  }
+  return dbPromise;
+}
+
+async function leerCatalogo(lista_de_precios, almacen) {
+  const db = await abrirDB();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction([STORE_PRODUCTOS, STORE_META], 'readonly');
+    const meta = tx.objectStore(STORE_META).get('estado');
+    const productos = tx.objectStore(STORE_PRODUCTOS).getAll();
+    tx.oncomplete = () => {
+      const estado = meta.result;
+      // Un catálogo de otra lista o almacén no sirve: se descarga completo
+      if (!estado || estado.lista_de_precios !== lista_de_precios || estado.almacen !== almacen) {
+        resolve({ token: null, productos: [] });
+      } else {
+        resolve({ token: estado.token, productos: productos.result || [] });
+      }
+    };
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+async function guardarCambios(cambios, lista_de_precios, almacen) {
+  const db = await abrirDB();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction([STORE_PRODUCTOS, STORE_META], 'readwrite');
+    const store = tx.objectStore(STORE_PRODUCTOS);
+    if (cambios.completo) {
+      store.clear();
+    }
+    cambios.productos.forEach(p => store.put(p));
+    cambios.eliminados.forEach(name => store.delete(name));
+    tx.objectStore(STORE_META).put({
+      clave: 'estado',
+      token: cambios.token,
+      lista_de_precios,
+      almacen
+    });
+    tx.oncomplete = () => resolve();
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+function ordenarPorNombre(a, b) {
+  return (a.nombre || a.name).localeCompare(b.nombre || b.name);
+}
+
+/**
+ * Catálogo en memoria respaldado por IndexedDB para una lista de precios y un
+ * almacén. `sincronizar()` aplica los cambios del servidor y devuelve los
+ * productos que cambiaron para actualizar la vista sin recorrer todo.
+ */
+export class CatalogoPOS {
+  constructor(lista_de_precios, almacen) {
+    this.lista_de_precios = lista_de_precios;
+    this.almacen = almacen;
+    this.token = null;
+    this.productos = new Map();
+  }
+
+  async cargar() {
+    try {
+      const guardado = await leerCatalogo(this.lista_de_precios, this.almacen);
+      this.token = guardado.token;
+      guardado.productos.forEach(p => this.productos.set(p.name, p));
+    } catch (error) {
+      // Sin IndexedDB el catálogo vive solo en memoria
+      console.warn('No se pudo leer el catálogo local:', error);
+    }
+    await this.sincronizar();
+    return this.lista();
+  }
+
+  async sincronizar() {
+    const res = await window.frappe.call({
+      method: 'endersuite.ventas.services.pos_service.get_catalog_changes',
+      args: {
+        since_token: this.token,
+        lista_de_precios: this.lista_de_precios,
+        almacen: this.almacen
+      },
+      freeze: false
+    });
+    const cambios = res.message;
+
+    if (cambios.completo) {
+      this.productos.clear();
+    }
+    cambios.productos.forEach(p => this.productos.set(p.name, p));
+    cambios.eliminados.forEach(name => this.productos.delete(name));
+    this.token = cambios.token;
+
+    try {
+      await guardarCambios(cambios, this.lista_de_precios, this.almacen);
+    } catch (error) {
+      console.warn('No se pudo guardar el catálogo local:', error);
+    }
+
+    return cambios;
+  }
+
+  lista() {
+    return Array.from(this.productos.values()).sort(ordenarPorNombre);
+  }
+}
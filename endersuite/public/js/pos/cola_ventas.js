@@ -0,0 +1,131 @@
+// Copyright (c) 2025, RenderCores.com and contributors
+// For license information, please see license.txt
+
+// ============================================================================
+// COLA DE VENTAS OFFLINE
+// ============================================================================
+// Las ventas cobradas se guardan primero en IndexedDB con una clave de
+// idempotencia generada en el navegador y se envían por lotes a
+// pos_service.sync_sales. Reenviar un lote es seguro: el servidor descarta
+// las claves que ya registró.
+
+const DB_NAME = 'endersuite_pos';
+const DB_VERSION = 1;
+const STORE = 'ventas_pendientes';
+const TAMANO_LOTE = 50;
+
+let dbPromise = null;
+
+function abrirDB() {
+  if (!dbPromise) {
+    dbPromise = new Promise((resolve, reject) => {
+      const request = indexedDB.open(DB_NAME, DB_VERSION);
+      request.onupgradeneeded = () => {
+        const db = request.result;
+        if (!db.objectStoreNames.contains(STORE)) {
+          const store = db.createObjectStore(STORE, { keyPath: 'clave' });
+          store.createIndex('creada', 'creada');
+        }
+      };
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => {
+        dbPromise = null;
+        reject(request.error);
+      };
+    });
+  }
+  return dbPromise;
+}
+
+async function transaccion(modo, operacion) {
+  const db = await abrirDB();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(STORE, modo);
+    const resultado = operacion(tx.objectStore(STORE));
+    tx.oncomplete = () => resolve(resultado && 'result' in resultado ? resultado.result : undefined);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+export function generarClave() {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+export async function encolarVenta(venta) {
+  const registro = {
+    ...venta,
+    clave: venta.clave || generarClave(),
+    creada: Date.now(),
+    intentos: 0,
+    ultimo_error: null
+  };
+  await transaccion('readwrite', store => store.put(registro));
+  return registro;
+}
+
+export async function ventasPendientes() {
+  const ventas = await transaccion('readonly', store => store.index('creada').getAll());
+  return ventas || [];
+}
+
+export async function contarPendientes() {
+  return (await transaccion('readonly', store => store.count())) || 0;
+}
+
+let sincronizando = null;
+
+/**
+ * Envía las ventas pendientes en lotes. Las creadas o duplicadas se quitan de
+ * la cola; las que fallan se conservan con su último error para reintentarlas.
+ * Devuelve los resultados del servidor indexados por clave.
+ */
+export function sincronizarVentas() {
+  // Una sola sincronización a la vez para no enviar la misma venta dos veces
+  if (!sincronizando) {
+    sincronizando = enviarPendientes().finally(() => {
+      sincronizando = null;
+    });
+  }
+  return sincronizando;
+}
+
+async function enviarPendientes() {
+  const resultados = {};
+  const pendientes = await ventasPendientes();
+
+  for (let i = 0; i < pendientes.length; i += TAMANO_LOTE) {
+    const lote = pendientes.slice(i, i + TAMANO_LOTE);
+
+    let res;
+    try {
+      res = await window.frappe.call({
+        method: 'endersuite.ventas.services.pos_service.sync_sales',
+        args: { batch: JSON.stringify(lote) },
+        freeze: false
+      });
+    } catch (error) {
+      // Sin conexión: las ventas se quedan en la cola
+      console.warn('No se pudo sincronizar la cola de ventas:', error);
+      break;
+    }
+
+    await transaccion('readwrite', store => {
+      for (const r of res.message || []) {
+        resultados[r.clave] = r;
+        if (r.estado === 'creada' || r.estado === 'duplicada') {
+          store.delete(r.clave);
+        } else {
+          const venta = lote.find(v => v.clave === r.clave);
+          if (venta) {
+            store.put({ ...venta, intentos: venta.intentos + 1, ultimo_error: r.mensaje });
+          }
+        }
+      }
+    });
+  }
+
+  return resultados;
+}
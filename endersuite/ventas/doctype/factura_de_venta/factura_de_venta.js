@@ -2,12 +2,33 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on("Factura de Venta", {
+    setup(frm) {
+        // El timbrado corre en segundo plano; el resultado llega por realtime
+        frappe.realtime.on('timbrado_factura', (data) => {
+            if (data.name !== frm.doc.name) {
+                return;
+            }
+            frm.reload_doc().then(() => {
+                if (data.estado === 'Timbrada') {
+                    mostrar_dialogo_exito_timbrado(frm, data.uuid);
+                } else if (data.estado === 'Error') {
+                    mostrar_error_timbrado(data.error, 'pac', frm);
+                }
+            });
+        });
+    },
+
     refresh(frm) {
         // Calcula totales al cargar el formulario
         calcular_totales(frm);
 
-        // Agrega botón de timbrado si está submitted y no tiene UUID
-        if (frm.doc.docstatus === 1 && !frm.doc.uuid) {
+        const timbrando = ['Pendiente', 'Timbrando'].includes(frm.doc.estado_timbrado);
+        if (timbrando && !frm.doc.uuid) {
+            frm.dashboard.add_indicator(__('Timbrado en proceso'), 'orange');
+        }
+
+        // Agrega botón de timbrado si está submitted, no tiene UUID y no se está timbrando
+        if (frm.doc.docstatus === 1 && !frm.doc.uuid && !timbrando) {
             frm.add_custom_button(__('Timbrar en SAT'), function () {
                 mostrar_modal_timbrado(frm);
             }, __('Acciones'));
@@ -24,6 +45,13 @@ frappe.ui.form.on("Factura de Venta", {
                 mostrar_dialogo_seleccion_notas(frm);
             }, __('Acciones'));
         }
+
+        // Factura Global de todas las notas pendientes de un periodo
+        if (frm.is_new()) {
+            frm.add_custom_button(__('Crear Factura Global'), function () {
+                mostrar_dialogo_factura_global(frm);
+            }, __('Acciones'));
+        }
     },
 
     tabla_con_los_productos_o_servicios_add(frm, cdt, cdn) {
@@ -350,7 +378,7 @@ function confirmar_y_timbrar(frm, archivo_cer, archivo_key, password_key, guarda
                 method: 'endersuite.ventas.doctype.factura_de_venta.factura_de_venta.timbrar_con_credenciales',
                 args: args,
                 freeze: true,
-                freeze_message: __('Timbrando factura en el SAT...'),
+                freeze_message: __('Enviando factura a timbrar...'),
                 callback: function (r) {
                     manejar_respuesta_timbrado(frm, r);
                 }
@@ -368,7 +396,14 @@ function confirmar_y_timbrar(frm, archivo_cer, archivo_key, password_key, guarda
 
 // Maneja la respuesta del servidor después del timbrado
 function manejar_respuesta_timbrado(frm, r) {
-    if (r.message && r.message.success) {
+    if (r.message && r.message.encolada) {
+        // El resultado llega por el evento realtime timbrado_factura
+        frappe.show_alert({
+            message: r.message.message || __('Factura enviada a timbrar'),
+            indicator: 'blue'
+        }, 5);
+        frm.reload_doc();
+    } else if (r.message && r.message.success) {
         // Recargar documento primero para obtener datos actualizados
         frm.reload_doc().then(() => {
             mostrar_dialogo_exito_timbrado(frm, r.message.uuid);
@@ -708,6 +743,74 @@ function mostrar_dialogo_seleccion_notas(frm) {
     d.fields_dict.cliente.$input.on('change', buscar_notas);
 }
 
+function mostrar_dialogo_factura_global(frm) {
+    if (!frm.doc.compañia || !frm.doc.cliente) {
+        frappe.msgprint(__('Selecciona la compañía y el cliente (Público en General) antes de crear la Factura Global'));
+        return;
+    }
+
+    let d = new frappe.ui.Dialog({
+        title: __('Crear Factura Global'),
+        fields: [
+            {
+                fieldtype: 'Date',
+                fieldname: 'fecha_inicio',
+                label: __('Fecha Inicio'),
+                reqd: 1,
+                default: frappe.datetime.nowdate()
+            },
+            {
+                fieldtype: 'Date',
+                fieldname: 'fecha_fin',
+                label: __('Fecha Fin'),
+                reqd: 1,
+                default: frappe.datetime.nowdate()
+            },
+            {
+                fieldtype: 'Link',
+                fieldname: 'perfil_pos',
+                label: __('Perfil de POS'),
+                options: 'Perfil de POS'
+            },
+            {
+                fieldtype: 'Select',
+                fieldname: 'agrupar',
+                label: __('Un concepto por'),
+                options: 'Producto\nNota',
+                default: 'Producto'
+            }
+        ],
+        primary_action_label: __('Crear'),
+        primary_action: function (values) {
+            frappe.call({
+                method: 'endersuite.ventas.doctype.factura_de_venta.factura_de_venta.crear_factura_global',
+                args: {
+                    compania: frm.doc.compañia,
+                    cliente: frm.doc.cliente,
+                    fecha_inicio: values.fecha_inicio,
+                    fecha_fin: values.fecha_fin,
+                    perfil_pos: values.perfil_pos,
+                    agrupar: values.agrupar
+                },
+                freeze: true,
+                freeze_message: __('Agrupando notas...'),
+                callback: function (r) {
+                    if (r.message) {
+                        d.hide();
+                        frappe.show_alert({
+                            message: __('Factura Global con {0} notas y {1} conceptos', [r.message.notas, r.message.conceptos]),
+                            indicator: 'green'
+                        });
+                        frappe.set_route('Form', 'Factura de Venta', r.message.factura);
+                    }
+                }
+            });
+        }
+    });
+
+    d.show();
+}
+
 function importar_notas_seleccionadas(frm, notas_list, dialog) {
     frappe.call({
         method: 'endersuite.ventas.doctype.factura_de_venta.factura_de_venta.importar_notas',
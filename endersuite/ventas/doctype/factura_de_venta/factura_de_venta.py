@@ -6,6 +6,9 @@ from frappe.model.document import Document
 from frappe import _
 from frappe.utils import getdate, nowdate
 
+from endersuite.ventas.services.global_invoice_service import actualizar_estado_notas, liberar_notas_reservadas
+from endersuite.ventas.services.totals_service import calcular_totales_factura
+
 
 class FacturadeVenta(Document):
 	def autoname(self):
@@ -52,65 +55,22 @@ class FacturadeVenta(Document):
 				frappe.throw(_("El precio del producto {0} debe ser mayor a cero").format(item.producto__servicio))
 	
 	def calcular_totales(self):
-		"""Calcula subtotal, descuentos, impuestos y total"""
-		subtotal = 0
-		impuestos_trasladados = 0
-		descuento_total = 0
-		
-		# Primero calcula subtotal e impuestos (antes de descuentos)
-		for item in self.tabla_con_los_productos_o_servicios:
-			cantidad = item.cantidad or 0
-			valor = item.valor or 0
-			
-			# Subtotal del producto (precio base sin impuestos)
-			importe_producto = cantidad * valor
-			subtotal += importe_producto
-			
-			# Calcula impuestos del producto
-			if item.producto__servicio:
-				producto = frappe.get_doc("Producto", item.producto__servicio)
-				
-				if producto.tipo_de_impuesto:
-					impuesto = frappe.get_doc("Impuestos", producto.tipo_de_impuesto)
-					
-					if impuesto.porciento_impuesto:
-						tasa = impuesto.porciento_impuesto / 100
-						impuesto_producto = importe_producto * tasa
-						impuestos_trasladados += impuesto_producto
-		
-		# Subtotal con impuestos incluidos
-		subtotal_con_impuestos = subtotal + impuestos_trasladados
-		
-		# Ahora calcula descuentos sobre el subtotal con impuestos
-		for item in self.tabla_con_los_productos_o_servicios:
-			cantidad = item.cantidad or 0
-			valor = item.valor or 0
-			descuento_pct = item.descuento or 0
-			
-			if descuento_pct > 0 and item.producto__servicio:
-				# Obtiene el precio con impuestos del producto
-				producto = frappe.get_doc("Producto", item.producto__servicio)
-				precio_con_impuestos = valor  # precio base
-				
-				if producto.tipo_de_impuesto:
-					impuesto = frappe.get_doc("Impuestos", producto.tipo_de_impuesto)
-					if impuesto.porciento_impuesto:
-						tasa = impuesto.porciento_impuesto / 100
-						precio_con_impuestos = valor * (1 + tasa)
-				
-				# Calcula descuento sobre precio con impuestos
-				importe_con_impuestos = cantidad * precio_con_impuestos
-				descuento_producto = importe_con_impuestos * (descuento_pct / 100)
-				descuento_total += descuento_producto
+		"""Calcula subtotal, descuentos, impuestos y total con el motor de totales"""
+		# Impuesto de todos los productos de la factura en una sola consulta; el
+		# CFDI usa los mismos importes por línea
+		resultado = calcular_totales_factura(
+			self.tabla_con_los_productos_o_servicios,
+			precision=self.precision("total") or 2
+		)
 		
 		# Establece los valores
-		self.subtotal = subtotal
-		self.total_de_impuestos_trasladados = impuestos_trasladados
-		self.descuento_total = descuento_total
+		self.subtotal = resultado["subtotal"]
+		self.total_de_impuestos_trasladados = resultado["impuestos"]
+		self.descuento_total = resultado["descuento_lineas"]
 		self.total_de_impuestos_retenidos = 0
 		
 		# Total final: subtotal + impuestos - descuentos
-		self.total = subtotal + impuestos_trasladados - descuento_total
+		self.total = resultado["total"]
 	
 	def before_submit(self):
 		"""Validaciones antes de enviar"""
@@ -141,24 +101,19 @@ class FacturadeVenta(Document):
 		frappe.msgprint(_("Factura de Venta {0} cancelada").format(self.name))
 
 	def actualizar_estado_notas(self, estado):
-		"""Actualiza el estado de las notas de venta relacionadas"""
-		if not self.notas_relacionadas:
-			return
-			
-		factura_link = self.name if estado == "Facturado" else None
-		
-		for item in self.notas_relacionadas:
-			if item.nota_de_venta:
-				frappe.db.set_value("Nota de Venta", item.nota_de_venta, {
-					"estado_facturacion": estado,
-					"factura_de_venta": factura_link
-				})
+		"""Actualiza el estado de las notas de venta relacionadas con un solo UPDATE"""
+		actualizar_estado_notas(self, estado)
+
+	def on_trash(self):
+		"""Libera las notas reservadas por la Factura Global en borrador"""
+		liberar_notas_reservadas(self)
 
 @frappe.whitelist()
 def get_notas_pendientes(cliente=None, fecha_inicio=None, fecha_fin=None):
 	"""Obtiene notas de venta pendientes de facturar"""
 	filters = {
 		"estado_facturacion": "Pendiente",
+		"factura_de_venta": ["is", "not set"],  # Sin reservar por una Factura Global en borrador
 		"docstatus": 1  # Solo notas enviadas
 	}
 	
@@ -224,11 +179,23 @@ def importar_notas(factura_name, notas_list):
 	return factura.tabla_con_los_productos_o_servicios
 
 
+@frappe.whitelist()
+def crear_factura_global(compania, cliente, fecha_inicio, fecha_fin, perfil_pos=None, agrupar="Producto"):
+	"""
+	Crea la Factura Global de las notas pendientes de un periodo, con los conceptos
+	agregados en SQL (ver global_invoice_service.crear_factura_global)
+	"""
+	from endersuite.ventas.services.global_invoice_service import crear_factura_global as crear
+	
+	return crear(compania, cliente, fecha_inicio, fecha_fin, perfil_pos=perfil_pos, agrupar=agrupar)
+
+
 @frappe.whitelist()
 def timbrar_en_sat(factura_name):
 	"""
-	Timbra una factura en el SAT a través del PAC
-	Método público llamado desde el frontend
+	Encola el timbrado de una factura en el SAT a través del PAC
+	Método público llamado desde el frontend; el resultado llega al formulario
+	por realtime (evento timbrado_factura)
 	"""
 	from endersuite.ventas.services.pac_service import ServicioPAC
 	
@@ -244,40 +211,10 @@ def timbrar_en_sat(factura_name):
 		if factura.uuid:
 			frappe.throw(_("Esta factura ya ha sido timbrada con UUID: {0}").format(factura.uuid))
 		
-		# Crea el servicio PAC y timbra
-		servicio = ServicioPAC()
-		resultado = servicio.timbrar_factura(factura)
+		# Valida la configuración del PAC antes de encolar
+		ServicioPAC()
 		
-		if resultado.get("success"):
-			# Actualizar campos permitidos después de submit (allow_on_submit=1)
-			factura.uuid = resultado.get("uuid")
-			
-			# Guardar XML y PDF en formato JSON para facilitar extracción
-			import json
-			datos_timbrado = {
-				"XML": resultado.get("xml"),
-				"PDF": resultado.get("pdf"),
-				"UUID": resultado.get("uuid"),
-				"fecha_timbrado": str(resultado.get("fecha_timbrado"))
-			}
-			factura.xml_timbrado = json.dumps(datos_timbrado)
-			factura.fecha_de_timbrado = resultado.get("fecha_timbrado")
-			
-			# Flags para permitir actualización de documento submitted
-			factura.flags.ignore_validate_update_after_submit = True
-			factura.save()
-			frappe.db.commit()
-			
-			return {
-				"success": True,
-				"message": _("Factura timbrada exitosamente"),
-				"uuid": resultado.get("uuid")
-			}
-		else:
-			return {
-				"success": False,
-				"error": resultado.get("error")
-			}
+		return _encolar(factura)
 	
 	except Exception as e:
 		frappe.log_error(f"Error al timbrar factura {factura_name}: {str(e)}")
@@ -372,21 +309,18 @@ def timbrar_con_credenciales(
 		guardar_credenciales (int): 1 para guardar, 0 para no guardar
 
 	Returns:
-		dict con success/error/uuid
+		dict con success/error; el UUID llega al formulario por realtime
 	"""
-	from endersuite.ventas.services.pac_service import ServicioPAC
-	import frappe
+	from endersuite.ventas.services.certificate_service import validar_vigencia
+	from endersuite.ventas.services.pac_service import ServicioPAC, trazar
 	
-	# Log de debugging para ver qué parámetros recibimos
-	frappe.log_error(
-		title="DEBUG: Parámetros recibidos en timbrar_con_credenciales",
-		message=f"""
-		factura_name: {factura_name}
-		archivo_cer: {archivo_cer}
-		archivo_key: {archivo_key}
-		password_key presente: {bool(password_key)}
-		guardar_credenciales: {guardar_credenciales}
-		"""
+	trazar(
+		"timbrar_con_credenciales",
+		factura=factura_name,
+		archivo_cer=archivo_cer,
+		archivo_key=archivo_key,
+		password_key=bool(password_key),
+		guardar_credenciales=guardar_credenciales
 	)
 
 	try:
@@ -404,14 +338,13 @@ def timbrar_con_credenciales(
 		# Determinar si usar credenciales configuradas o proporcionadas
 		usar_credenciales_config = not (archivo_cer and archivo_key)
 		
-		frappe.log_error(
-			title="DEBUG: Decisión de credenciales",
-			message=f"""
-			usar_credenciales_config: {usar_credenciales_config}
-			config existe: {bool(config)}
-			config.csd_key_pem presente: {bool(config and config.csd_key_pem)}
-			config.csd_cer_pem presente: {bool(config and config.csd_cer_pem)}
-			"""
+		trazar(
+			"credenciales_timbrado",
+			factura=factura_name,
+			usar_credenciales_config=usar_credenciales_config,
+			config=bool(config),
+			csd_key_pem=bool(config and config.csd_key_pem),
+			csd_cer_pem=bool(config and config.csd_cer_pem)
 		)
 
 		if usar_credenciales_config:
@@ -425,24 +358,19 @@ def timbrar_con_credenciales(
 					"error_type": "credentials"
 				}
 			
-			frappe.log_error(
-				title="DEBUG: Usando credenciales de configuración",
-				message=f"Longitud csd_key_pem: {len(config.csd_key_pem or '')}, Longitud csd_cer_pem: {len(config.csd_cer_pem or '')}"
-			)
-			servicio = ServicioPAC()
+			# Certificado vencido: se avisa antes de encolar
+			validar_vigencia(config.csd_cer_pem)
+			ServicioPAC()
 		else:
 			# Usar credenciales proporcionadas (archivos subidos)
 			key_contenido = _leer_contenido_archivo(archivo_key)
 			cer_contenido = _leer_contenido_archivo(archivo_cer)
 			
-			frappe.log_error(
-				title="DEBUG: Leyendo archivos proporcionados",
-				message=f"""
-				archivo_key: {archivo_key}
-				archivo_cer: {archivo_cer}
-				key_contenido longitud: {len(key_contenido) if key_contenido else 0}
-				cer_contenido longitud: {len(cer_contenido) if cer_contenido else 0}
-				"""
+			trazar(
+				"archivos_credenciales",
+				factura=factura_name,
+				key_longitud=len(key_contenido) if key_contenido else 0,
+				cer_longitud=len(cer_contenido) if cer_contenido else 0
 			)
 			
 			if not key_contenido or not cer_contenido:
@@ -454,13 +382,12 @@ def timbrar_con_credenciales(
 					"error_type": "credentials"
 				}
 			
-			# Crear servicio y usar credenciales temporales
+			# Valida la configuración base; las credenciales temporales se aplican en el job
 			if not config:
 				return {"success": False, "error": _("No existe Configuración PAC base"), "error_type": "credentials"}
-				
-			servicio = ServicioPAC()
-			servicio.config.csd_key_pem = key_contenido
-			servicio.config.csd_cer_pem = cer_contenido
+			
+			validar_vigencia(cer_contenido)
+			ServicioPAC()
 			
 			# Guardar si se solicita
 			if guardar_credenciales == 1 or guardar_credenciales == "1":
@@ -468,66 +395,15 @@ def timbrar_con_credenciales(
 				config.csd_cer_pem = cer_contenido
 				config.save(ignore_permissions=True)
 				frappe.db.commit()
-				frappe.log_error(
-					title="DEBUG: Credenciales guardadas",
-					message="Las nuevas credenciales se han guardado en Configuración PAC"
-				)
+				trazar("credenciales_guardadas", "Info", factura=factura_name)
 
-		# Intentar timbrar
-		frappe.log_error(
-			title="DEBUG: Iniciando timbrado",
-			message=f"Timbrando factura {factura_name}"
-		)
-		
-		resultado = servicio.timbrar_factura(factura)
-		
-		frappe.log_error(
-			title="DEBUG: Resultado de timbrado",
-			message=f"Success: {resultado.get('success')}, Error: {resultado.get('error')}"
-		)
-		
-		if resultado.get("success"):
-			# Actualizar campos permitidos después de submit (allow_on_submit=1)
-			factura.uuid = resultado.get("uuid")
-			
-			# Guardar XML y PDF en formato JSON para facilitar extracción
-			import json
-			datos_timbrado = {
-				"XML": resultado.get("xml"),
-				"PDF": resultado.get("pdf"),
-				"UUID": resultado.get("uuid"),
-				"fecha_timbrado": str(resultado.get("fecha_timbrado"))
-			}
-			factura.xml_timbrado = json.dumps(datos_timbrado)
-			factura.fecha_de_timbrado = resultado.get("fecha_timbrado")
-			
-			# Flags para permitir actualización de documento submitted
-			factura.flags.ignore_validate_update_after_submit = True
-			factura.save()
-			frappe.db.commit()
-			
-			frappe.log_error(
-				title="DEBUG: Factura actualizada correctamente",
-				message=f"UUID: {resultado.get('uuid')}"
-			)
-			
-			return {"success": True, "uuid": resultado.get("uuid"), "message": _("Factura timbrada exitosamente")}
-		else:
-			error_msg = resultado.get("error", "Error desconocido")
-			error_type = "unknown"
-			
-			if "credencial" in error_msg.lower() or "certificado" in error_msg.lower():
-				error_type = "credentials"
-			elif "pac" in error_msg.lower() or "api" in error_msg.lower():
-				error_type = "pac"
-				
-			return {"success": False, "error": error_msg, "error_type": error_type}
+		# Los certificados subidos sin guardar viajan al job como URL de archivo
+		if usar_credenciales_config or guardar_credenciales in (1, "1"):
+			return _encolar(factura)
+		return _encolar(factura, archivo_cer, archivo_key)
 
 	except Exception as e:
-		frappe.log_error(
-			title="ERROR: Exception en timbrar_con_credenciales",
-			message=f"Exception: {str(e)}\nType: {type(e)}"
-		)
+		trazar("timbrar_con_credenciales", "Error", factura=factura_name, error=str(e), tipo=type(e).__name__)
 		error_msg = str(e)
 		error_type = "unknown"
 		
@@ -541,6 +417,15 @@ def timbrar_con_credenciales(
 		
 		return {"success": False, "error": error_msg, "error_type": error_type}
 
+def _encolar(factura, archivo_cer=None, archivo_key=None):
+	"""Encola el timbrado y arma la respuesta para el formulario"""
+	from endersuite.ventas.services.stamping_service import encolar_timbrado
+	
+	if not encolar_timbrado(factura, archivo_cer, archivo_key):
+		return {"success": True, "encolada": True, "message": _("La factura ya está en proceso de timbrado")}
+	
+	return {"success": True, "encolada": True, "message": _("Factura enviada a timbrar")}
+
 @frappe.whitelist()
 def descargar_xml(factura_name):
 	"""
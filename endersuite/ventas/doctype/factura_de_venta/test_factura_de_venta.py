@@ -1,8 +1,18 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+import frappe
 from frappe.tests import IntegrationTestCase
+from frappe.utils import add_to_date, flt, now_datetime
+
+from endersuite.ventas.services import global_invoice_service, pac_service, stamping_service
+from endersuite.ventas.services.tax_service import invalidar_tasas
+from endersuite.ventas.services.totals_service import aplicar_totales_venta
 
 
 # On IntegrationTestCase, the doctype test records and all
@@ -12,6 +22,37 @@ EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
 
+class PACSimulado(BaseHTTPRequestHandler):
+	"""PAC local: responde con los códigos HTTP de `respuestas` y después timbra"""
+
+	# Keep-alive, para comprobar que el cliente reutiliza la conexión
+	protocol_version = "HTTP/1.1"
+
+	respuestas = []
+	peticiones = 0
+	conexiones = set()
+
+	def do_POST(self):
+		self.rfile.read(int(self.headers.get("Content-Length") or 0))
+		PACSimulado.peticiones += 1
+		PACSimulado.conexiones.add(self.client_address)
+
+		codigo = PACSimulado.respuestas.pop(0) if PACSimulado.respuestas else 200
+		cuerpo = {"code": "200", "data": {"UUID": frappe.generate_hash(length=32), "XML": "<cfdi/>"}}
+		if codigo != 200:
+			cuerpo = {"message": "Error simulado"}
+
+		datos = json.dumps(cuerpo).encode()
+		self.send_response(codigo)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(datos)))
+		self.end_headers()
+		self.wfile.write(datos)
+
+	def log_message(self, *args):
+		pass
+
+
 
 class IntegrationTestFacturadeVenta(IntegrationTestCase):
 	"""
@@ -19,4 +60,322 @@ class IntegrationTestFacturadeVenta(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def test_totales_con_dos_consultas(self):
+		"""Una factura de 200 líneas calcula impuestos con una consulta de productos y una de impuestos"""
+		impuesto = frappe.get_doc({
+			"doctype": "Impuestos",
+			"name": frappe.generate_hash(length=10),
+			"porciento_impuesto": 16
+		})
+		impuesto.db_insert()
+
+		factura = frappe.new_doc("Factura de Venta")
+		for i in range(200):
+			producto = frappe.get_doc({
+				"doctype": "Producto",
+				"name": frappe.generate_hash(length=10),
+				"nombre_del_producto": f"Producto Factura {i}",
+				"tipo_de_impuesto": impuesto.name
+			})
+			producto.db_insert()
+			factura.append("tabla_con_los_productos_o_servicios", {
+				"producto__servicio": producto.name,
+				"cantidad": 1,
+				"valor": 100,
+				"descuento": 10 if i % 2 else 0
+			})
+
+		# Tabla de impuestos fría: se recarga una vez
+		invalidar_tasas()
+
+		with self.assertQueryCount(2):
+			factura.calcular_totales()
+
+		self.assertEqual(factura.subtotal, 20000)
+		self.assertAlmostEqual(factura.total_de_impuestos_trasladados, 3200)
+		self.assertAlmostEqual(factura.descuento_total, 100 * 116 * 0.10)
+
+	def test_cfdi_cuadra_con_conceptos(self):
+		"""SubTotal, descuento e impuestos del CFDI son las sumas de sus conceptos, también con impuesto incluido"""
+		config = frappe.get_single("Configuracion PAC")
+		config.update({"activo": 1, "modo": "Pruebas", "api_key": "prueba"})
+		config.flags.ignore_mandatory = True
+		config.save(ignore_permissions=True)
+
+		impuestos = []
+		for incluido in (1, 0):
+			impuesto = frappe.get_doc({
+				"doctype": "Impuestos",
+				"name": frappe.generate_hash(length=10),
+				"porciento_impuesto": 16,
+				"incluido_en_el_precio": incluido
+			})
+			impuesto.db_insert()
+			impuestos.append(impuesto.name)
+
+		factura = frappe.new_doc("Factura de Venta")
+		for impuesto, cantidad, valor, descuento in ((impuestos[0], 1, 116, 10), (impuestos[1], 3, 33.33, 0), (None, 1, 15.5, 0)):
+			producto = frappe.get_doc({
+				"doctype": "Producto",
+				"name": frappe.generate_hash(length=10),
+				"nombre_del_producto": "Producto CFDI",
+				"tipo_de_impuesto": impuesto
+			})
+			producto.db_insert()
+			factura.append("tabla_con_los_productos_o_servicios", {
+				"producto__servicio": producto.name, "cantidad": cantidad, "valor": valor, "descuento": descuento
+			})
+		invalidar_tasas()
+		factura.calcular_totales()
+
+		servicio = pac_service.ServicioPAC()
+		conceptos = servicio._build_conceptos(factura)
+		impuestos_cfdi = servicio._build_impuestos(conceptos)
+		importes = servicio._sumar_conceptos(conceptos)
+
+		# El precio con impuesto incluido se reporta sin el impuesto
+		self.assertEqual([c["Importe"] for c in conceptos], ["100.00", "99.99", "15.50"])
+		self.assertEqual(conceptos[0]["Impuestos"]["Traslados"][0]["Base"], "100.00")
+		self.assertEqual(conceptos[0]["Descuento"], "11.60")
+
+		traslados = [t for c in conceptos for t in (c.get("Impuestos") or {}).get("Traslados", [])]
+		self.assertEqual(factura.subtotal, flt(sum(flt(c["Importe"]) for c in conceptos), 2))
+		self.assertEqual(factura.descuento_total, sum(flt(c.get("Descuento")) for c in conceptos))
+		self.assertEqual(factura.total_de_impuestos_trasladados, flt(sum(flt(t["Importe"]) for t in traslados), 2))
+		self.assertEqual(impuestos_cfdi["TotalImpuestosTrasladados"], "32.00")
+		self.assertEqual(impuestos_cfdi["Traslados"][0]["Base"], "199.99")
+		self.assertEqual((importes["subtotal"], importes["impuestos"], importes["total"]), (215.49, 32.0, 235.89))
+		self.assertEqual(importes["total"], factura.total)
+
+	def crear_factura_enviada(self, url_pac):
+		"""Factura enviada y Configuración PAC en modo pruebas apuntando al PAC local"""
+		config = frappe.get_single("Configuracion PAC")
+		config.update({
+			"activo": 1,
+			"modo": "Pruebas",
+			"api_key": "prueba",
+			"url_timbrado_json": url_pac,
+			"rfc_pruebas": "EKU9003173C9",
+			"nombre_pruebas": "ESCUELA KEMPER URGATE",
+			"regimen_fiscal_pruebas": "601"
+		})
+		config.flags.ignore_mandatory = True
+		config.save(ignore_permissions=True)
+
+		compania = frappe.get_doc({"doctype": "Compania", "name": frappe.generate_hash(length=10)})
+		compania.db_insert()
+
+		factura = frappe.get_doc({
+			"doctype": "Factura de Venta",
+			"name": frappe.generate_hash(length=10),
+			"folio": "FV-99999",
+			"compañia": compania.name,
+			"fecha_de_emision": frappe.utils.nowdate(),
+			"rfc_del_receptor": "XAXX010101000",
+			"nombre_o_razon_social": "PUBLICO EN GENERAL",
+			"subtotal": 100,
+			"total": 100,
+			"total_de_impuestos_trasladados": 0,
+			"tabla_con_los_productos_o_servicios": [{"cantidad": 1, "valor": 100, "descripcion": "Servicio"}]
+		})
+		factura.docstatus = 1
+		factura.db_insert()
+		for fila in factura.get_all_children():
+			fila.db_insert()
+
+		return factura
+
+	def iniciar_pac_simulado(self, respuestas):
+		PACSimulado.respuestas = list(respuestas)
+		PACSimulado.peticiones = 0
+		PACSimulado.conexiones = set()
+		servidor = HTTPServer(("127.0.0.1", 0), PACSimulado)
+		threading.Thread(target=servidor.serve_forever, daemon=True).start()
+		self.addCleanup(servidor.shutdown)
+		return f"http://127.0.0.1:{servidor.server_port}/timbrar"
+
+	@patch.object(stamping_service, "ESPERA_BASE_SEGUNDOS", 0)
+	def test_timbrado_reintenta_errores_transitorios(self):
+		"""Un PAC que responde 503 dos veces se reprograma, sin esperar dentro del job, hasta timbrar"""
+		factura = self.crear_factura_enviada(self.iniciar_pac_simulado([503, 503]))
+
+		stamping_service.procesar_timbrado(factura.name)
+		self.assertEqual(PACSimulado.peticiones, 1)
+		self.assertEqual(frappe.db.get_value("Factura de Venta", factura.name, "estado_timbrado"), "Pendiente")
+
+		# Lo que haría encolar_reintentos_vencidos en cada minuto del scheduler
+		for intento in (2, 3):
+			reintentos = [
+				r for r in stamping_service._tomar_reintentos_vencidos()
+				if r["factura_name"] == factura.name
+			]
+			self.assertEqual([r["intento"] for r in reintentos], [intento])
+			stamping_service.procesar_timbrado(**reintentos[0])
+
+		factura.reload()
+		self.assertEqual(PACSimulado.peticiones, 3)
+		self.assertEqual(factura.estado_timbrado, "Timbrada")
+		self.assertTrue(factura.uuid)
+
+	def test_timbrado_no_reintenta_rechazos(self):
+		"""Un rechazo del PAC (HTTP 400) deja la factura en Error sin reintentar"""
+		factura = self.crear_factura_enviada(self.iniciar_pac_simulado([400]))
+
+		stamping_service.procesar_timbrado(factura.name)
+
+		factura.reload()
+		self.assertEqual(PACSimulado.peticiones, 1)
+		self.assertEqual(factura.estado_timbrado, "Error")
+		self.assertFalse(factura.uuid)
+
+	@patch.object(stamping_service, "ESPERA_LUGAR_SEGUNDOS", 0)
+	def test_timbrado_sin_lugar_se_reprograma(self):
+		"""Con el semáforo lleno el job no espera: reprograma el mismo intento y la factura sigue Pendiente"""
+		factura = self.crear_factura_enviada(self.iniciar_pac_simulado([]))
+
+		with patch.object(stamping_service, "_tomar_lugar", return_value=None):
+			stamping_service.procesar_timbrado(factura.name, intento=2)
+
+		self.assertEqual(PACSimulado.peticiones, 0)
+		self.assertEqual(frappe.db.get_value("Factura de Venta", factura.name, "estado_timbrado"), "Pendiente")
+		reintentos = [
+			r for r in stamping_service._tomar_reintentos_vencidos()
+			if r["factura_name"] == factura.name
+		]
+		self.assertEqual([r["intento"] for r in reintentos], [2])
+
+	def test_liberar_lugar_solo_borra_el_propio(self):
+		clave = stamping_service._clave("lugar", "0")
+		self.addCleanup(frappe.cache.delete, clave)
+
+		pipe = stamping_service._pipeline()
+		pipe.set(clave, "otra-factura")
+		pipe.execute()
+		stamping_service._liberar_lugar(0, "esta-factura")
+		self.assertEqual(frappe.cache.get(clave), b"otra-factura")
+
+		stamping_service._liberar_lugar(0, "otra-factura")
+		self.assertIsNone(frappe.cache.get(clave))
+
+	def test_recupera_timbrados_atascados(self):
+		"""Una factura en Timbrando cuyo worker murió vuelve a la cola; una reciente no"""
+		url_pac = self.iniciar_pac_simulado([])
+		atascada = self.crear_factura_enviada(url_pac)
+		reciente = self.crear_factura_enviada(url_pac)
+		atascada.db_set({"estado_timbrado": "Timbrando", "inicio_timbrado": add_to_date(now_datetime(), hours=-1)})
+		reciente.db_set({"estado_timbrado": "Timbrando", "inicio_timbrado": now_datetime()})
+
+		with patch.object(stamping_service.frappe, "enqueue") as enqueue:
+			stamping_service.recuperar_timbrados_atascados()
+
+		encoladas = [llamada.kwargs["factura_name"] for llamada in enqueue.call_args_list]
+		self.assertIn(atascada.name, encoladas)
+		self.assertNotIn(reciente.name, encoladas)
+		self.assertEqual(frappe.db.get_value("Factura de Venta", atascada.name, "estado_timbrado"), "Pendiente")
+		self.assertFalse(stamping_service.encolar_timbrado(frappe.get_doc("Factura de Venta", reciente.name)))
+
+	def test_pac_reutiliza_conexion_y_registra_latencia(self):
+		"""Dos timbrados seguidos usan la misma conexión keep-alive y dejan su latencia"""
+		url_pac = self.iniciar_pac_simulado([])
+		primera = self.crear_factura_enviada(url_pac)
+		segunda = self.crear_factura_enviada(url_pac)
+		frappe.cache.delete_value(pac_service.CLAVE_METRICAS_PAC)
+
+		stamping_service.procesar_timbrado(primera.name)
+		stamping_service.procesar_timbrado(segunda.name)
+
+		self.assertEqual(PACSimulado.peticiones, 2)
+		self.assertEqual(len(PACSimulado.conexiones), 1)
+
+		metricas = pac_service.get_metricas_pac()
+		self.assertEqual(metricas["total"], 2)
+		self.assertEqual({l["resultado"] for l in metricas["llamadas"]}, {"200"})
+
+	def test_factura_global_agrupa_conceptos(self):
+		"""Las líneas de muchas notas se agrupan por producto y la factura suma exactamente los total_final"""
+		impuestos = []
+		for incluido in (0, 1):
+			impuesto = frappe.get_doc({
+				"doctype": "Impuestos",
+				"name": frappe.generate_hash(length=10),
+				"porciento_impuesto": 16,
+				"incluido_en_el_precio": incluido
+			})
+			impuesto.db_insert()
+			impuestos.append(impuesto.name)
+		productos = []
+		for i in range(3):
+			producto = frappe.get_doc({
+				"doctype": "Producto",
+				"name": frappe.generate_hash(length=10),
+				"nombre_del_producto": f"Producto Global {i}",
+				# El producto 2 trae el impuesto incluido en el precio
+				"tipo_de_impuesto": impuestos[1 if i == 2 else 0],
+				"clave_sat": "50202306"
+			})
+			producto.db_insert()
+			productos.append(producto)
+		invalidar_tasas()
+
+		# Perfil propio para aislar las notas de este test
+		perfil_pos = frappe.generate_hash(length=10)
+		total_notas = 0
+		for i in range(60):
+			nota = frappe.get_doc({
+				"doctype": "Nota de Venta",
+				"name": frappe.generate_hash(length=10),
+				"perfil_pos": perfil_pos,
+				"fecha_y_hora_de_venta": "2020-01-15 12:00:00",
+				"estado_facturacion": "Pendiente",
+				"descuento_global_porcentaje": 10 if i % 4 == 0 else 0,
+				"tabla_de_productos": [
+					{
+						"producto": productos[i % 3].name, "impuesto": productos[i % 3].tipo_de_impuesto,
+						"cantidad": 2, "precio_unitario": 10.33 * (i % 3 + 1), "descuento_porcentaje": 0
+					},
+					{
+						"producto": productos[0].name, "impuesto": productos[0].tipo_de_impuesto,
+						"cantidad": 1, "precio_unitario": 10, "descuento_porcentaje": 5 if i % 2 else 0
+					}
+				]
+			})
+			aplicar_totales_venta(nota, nota.tabla_de_productos)
+			total_notas += nota.total_final
+			nota.docstatus = 1
+			nota.db_insert()
+			for fila in nota.get_all_children():
+				fila.db_insert()
+
+		notas = global_invoice_service._notas_pendientes("2020-01-15", "2020-01-15", perfil_pos)
+		self.assertEqual(len(notas), 60)
+
+		conceptos = global_invoice_service._conceptos_agregados([n.name for n in notas], "Producto")
+		# Un concepto por producto, ya sin descuentos de línea ni global
+		self.assertEqual(len(conceptos), 3)
+		self.assertEqual(sum(c.cantidad for c in conceptos), 180)
+
+		factura = frappe.new_doc("Factura de Venta")
+		for c, valor in zip(conceptos, global_invoice_service._valores_unitarios(conceptos), strict=True):
+			factura.append("tabla_con_los_productos_o_servicios", {
+				"producto__servicio": c.producto, "cantidad": c.cantidad, "valor": valor, "descuento": 0
+			})
+		factura.calcular_totales()
+		self.assertEqual(factura.total, flt(total_notas, 2))
+
+		# Reservadas para el borrador: otra ejecución ya no las toma hasta liberarlas
+		borrador = frappe._dict({"name": frappe.generate_hash(length=10)})
+		global_invoice_service._reservar_notas(borrador, notas)
+		self.assertFalse(global_invoice_service._notas_pendientes("2020-01-15", "2020-01-15", perfil_pos))
+		global_invoice_service.liberar_notas_reservadas(borrador)
+		self.assertEqual(len(global_invoice_service._notas_pendientes("2020-01-15", "2020-01-15", perfil_pos)), 60)
+
+		# Marcar las 60 notas es un solo UPDATE
+		factura = frappe._dict({
+			"name": frappe.generate_hash(length=10),
+			"notas_relacionadas": [frappe._dict({"nota_de_venta": n.name}) for n in notas]
+		})
+		with self.assertQueryCount(1):
+			global_invoice_service.actualizar_estado_notas(factura, "Facturado")
+		self.assertEqual(
+			frappe.db.count("Nota de Venta", {"perfil_pos": perfil_pos, "estado_facturacion": "Facturado"}), 60
+		)
@@ -2,9 +2,18 @@
 # For license information, please see license.txt
 
 import frappe
+from frappe import _
 from frappe.model.document import Document
 
 
+# Clave en Redis con el contexto de encabezado de cada Perfil de POS
+CLAVE_ENCABEZADOS = "endersuite:ticket_encabezado"
+
+# Plantillas compiladas del proceso: (sitio, formato) -> plantilla (ver get_formato_compilado).
+# Con fixtures dos sitios pueden tener el mismo formato con el mismo `modified`
+_plantillas = {}
+
+
 class FormatodeTicket(Document):
 	def validate(self):
 		"""Validar que solo haya un formato predeterminado"""
@@ -202,51 +211,91 @@ def generar_ticket_html(nota_venta_name, formato_name=None):
 		nota_venta_name: Nombre de la nota de venta
 		formato_name: Nombre del formato (opcional, usa predeterminado si no se especifica)
 	"""
-	from jinja2 import Template
-	
-	# Obtener nota de venta
 	nota = frappe.get_doc("Nota de Venta", nota_venta_name)
+	html = renderizar_ticket(nota, formato_name)
+	if html is None:
+		frappe.throw(_("No hay formatos de ticket configurados"))
+	
+	return html
+
+
+def renderizar_ticket(nota, formato_name=None):
+	"""
+	Renderiza el ticket de una Nota de Venta ya cargada, sin volver a leerla.
 	
-	# Obtener formato
-	if not formato_name:
-		formato = frappe.get_doc("Formato de Ticket", {"predeterminado": 1})
-		if not formato:
-			formato = frappe.get_all("Formato de Ticket", limit=1)
-			if formato:
-				formato = frappe.get_doc("Formato de Ticket", formato[0].name)
-			else:
-				frappe.throw("No hay formatos de ticket configurados")
-	else:
-		formato = frappe.get_doc("Formato de Ticket", formato_name)
+	Las plantillas del formato se compilan una sola vez por proceso y se reutilizan
+	mientras no cambie su `modified`; el contexto de compañía y perfil se guarda en
+	Redis por Perfil de POS.
 	
-	# Obtener datos adicionales
-	compania = None
-	perfil_pos = None
+	Args:
+		nota: Documento de Nota de Venta o dict con los mismos campos y tablas
+		formato_name (str): Formato a usar (opcional, usa el del perfil o el predeterminado)
 	
-	if nota.perfil_pos:
-		perfil = frappe.get_doc("Perfil de POS", nota.perfil_pos)
-		perfil_pos = perfil.name
-		if perfil.compania:
-			compania = frappe.get_doc("Compania", perfil.compania)
+	Returns:
+		str|None: HTML del ticket; None si no hay formatos configurados
+	"""
+	encabezado = get_contexto_encabezado(nota.get("perfil_pos"))
+	
+	plantilla = get_formato_compilado(formato_name or encabezado["formato_ticket"])
+	if not plantilla:
+		return None
 	
-	# Contexto para renderizar
 	context = {
 		"doc": nota,
-		"compania": compania,
-		"perfil_pos": perfil_pos,
+		"compania": encabezado["compania"],
+		"perfil_pos": encabezado["perfil_pos"],
 		"frappe": frappe
 	}
 	
-	# Renderizar plantillas
-	header_template = Template(formato.header_html or "")
-	items_template = Template(formato.items_html or "")
-	footer_template = Template(formato.footer_html or "")
+	return f"""{plantilla.inicio}
+    {plantilla.header.render(context)}
+    {plantilla.items.render(context)}
+    {plantilla.footer.render(context)}
+</body>
+</html>"""
+
+
+def get_formato_compilado(formato_name=None):
+	"""
+	Plantilla compilada de un formato de ticket.
+	
+	Solo se consulta el `modified` del formato; si coincide con el de la versión
+	compilada se reutiliza, si no se recompila.
+	
+	Args:
+		formato_name (str): Formato (opcional); si no existe se usa el predeterminado
+			o el primero disponible
 	
-	header_html = header_template.render(context)
-	items_html = items_template.render(context)
-	footer_html = footer_template.render(context)
+	Returns:
+		frappe._dict|None: {modified, header, items, footer, inicio, ancho_ticket,
+			tamano_fuente, alinear_header}
+	"""
+	campos = ["name", "modified"]
+	fila = None
+	if formato_name:
+		fila = frappe.db.get_value("Formato de Ticket", formato_name, campos, as_dict=True)
+	if not fila:
+		fila = (
+			frappe.db.get_value("Formato de Ticket", {"predeterminado": 1}, campos, as_dict=True)
+			or frappe.db.get_value("Formato de Ticket", {}, campos, as_dict=True)
+		)
+	
+	if not fila:
+		return None
+	
+	clave = (frappe.local.site, fila.name)
+	plantilla = _plantillas.get(clave)
+	if not plantilla or plantilla.modified != fila.modified:
+		plantilla = _compilar_formato(frappe.get_doc("Formato de Ticket", fila.name))
+		_plantillas[clave] = plantilla
+	
+	return plantilla
+
+
+def _compilar_formato(formato):
+	"""Compila las plantillas de un formato y arma una sola vez el inicio del HTML con sus estilos"""
+	from jinja2 import Template
 	
-	# Construir HTML completo
 	ancho_map = {
 		"58mm": "58mm",
 		"80mm": "80mm",
@@ -255,7 +304,7 @@ def generar_ticket_html(nota_venta_name, formato_name=None):
 	
 	ancho = ancho_map.get(formato.ancho_ticket, "80mm")
 	
-	html = f"""<!DOCTYPE html>
+	inicio = f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
@@ -296,11 +345,70 @@ def generar_ticket_html(nota_venta_name, formato_name=None):
         {formato.estilos_css or ""}
     </style>
 </head>
-<body>
-    {header_html}
-    {items_html}
-    {footer_html}
-</body>
-</html>"""
+<body>"""
 	
-	return html
+	return frappe._dict({
+		"modified": formato.modified,
+		"header": Template(formato.header_html or ""),
+		"items": Template(formato.items_html or ""),
+		"footer": Template(formato.footer_html or ""),
+		"inicio": inicio,
+		"ancho_ticket": formato.ancho_ticket,
+		"tamano_fuente": formato.tamano_fuente,
+		"alinear_header": formato.alinear_header
+	})
+
+
+# ============================================================================
+# CONTEXTO DE ENCABEZADO
+# ============================================================================
+
+def get_contexto_encabezado(perfil_pos):
+	"""
+	Compañía, perfil y formato del ticket para el encabezado, guardados en Redis por perfil.
+	
+	Args:
+		perfil_pos (str): Perfil de POS de la nota
+	
+	Returns:
+		dict: {compania, perfil_pos, formato_ticket}
+	"""
+	if not perfil_pos:
+		return {"compania": None, "perfil_pos": None, "formato_ticket": None}
+	
+	contexto = frappe.cache.hget(CLAVE_ENCABEZADOS, perfil_pos)
+	if contexto is None:
+		contexto = {"compania": None, "perfil_pos": None, "formato_ticket": None}
+		if frappe.db.exists("Perfil de POS", perfil_pos):
+			perfil = frappe.get_doc("Perfil de POS", perfil_pos)
+			contexto["perfil_pos"] = perfil.name
+			contexto["formato_ticket"] = perfil.formato_ticket
+			if perfil.get("compania"):
+				contexto["compania"] = frappe.get_doc("Compania", perfil.get("compania")).as_dict()
+		frappe.cache.hset(CLAVE_ENCABEZADOS, perfil_pos, contexto)
+	
+	return contexto
+
+
+def invalidar_encabezado_perfil(doc, method=None):
+	"""
+	Descarta el contexto de encabezado de un Perfil de POS.
+	Llamado desde hooks on_update y on_trash de Perfil de POS.
+	
+	Args:
+		doc: Documento de Perfil de POS
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	frappe.cache.hdel(CLAVE_ENCABEZADOS, doc.name)
+
+
+def invalidar_encabezados(doc=None, method=None):
+	"""
+	Descarta el contexto de encabezado de todos los perfiles.
+	Llamado desde hooks on_update y on_trash de Compania.
+	
+	Args:
+		doc: Documento de Compania
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	frappe.cache.delete_key(CLAVE_ENCABEZADOS)
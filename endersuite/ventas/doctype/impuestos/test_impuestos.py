@@ -1,9 +1,14 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests import IntegrationTestCase
 
+from endersuite.ventas.services import tax_service
+from endersuite.ventas.services.totals_service import aplicar_totales_venta
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
@@ -19,4 +24,41 @@ class IntegrationTestImpuestos(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def test_tabla_de_tasas_por_sitio(self):
+		"""Un worker con varios sitios no sirve la tabla de un sitio a otro aunque compartan versión"""
+		otro_sitio = f"{frappe.generate_hash(length=8)}.test"
+		self.addCleanup(tax_service._tasas.pop, otro_sitio, None)
+
+		version = tax_service._version_actual()
+		tax_service.get_tabla_tasas()
+
+		with patch.object(frappe.local, "site", otro_sitio):
+			tax_service._tasas[otro_sitio] = (version, {
+				"Solo en el otro sitio": frappe._dict({"porciento_impuesto": 99, "incluido_en_el_precio": 0})
+			})
+			self.assertEqual(tax_service.get_porcentaje("Solo en el otro sitio"), 99)
+
+		self.assertIsNone(tax_service.get_tasa("Solo en el otro sitio"))
+
+	def test_invalidaciones_incrementan_la_version(self):
+		"""Cada invalidación suma uno al contador aunque ocurran seguidas"""
+		version = tax_service._version_actual()
+		tax_service._incrementar_version()
+		tax_service._incrementar_version()
+		self.assertEqual(tax_service._version_actual(), version + 2)
+
+	def test_totales_leen_la_version_una_vez(self):
+		"""Un documento de 200 líneas consulta la versión de la tabla en Redis una sola vez"""
+		impuesto = frappe.get_doc({"doctype": "Impuestos", "name": frappe.generate_hash(length=10), "porciento_impuesto": 16})
+		impuesto.db_insert()
+		tax_service.invalidar_tasas()
+
+		nota = frappe.new_doc("Nota de Venta")
+		for _ in range(200):
+			nota.append("tabla_de_productos", {"cantidad": 1, "precio_unitario": 10, "impuesto": impuesto.name})
+
+		with patch.object(tax_service, "_version_actual", wraps=tax_service._version_actual) as version:
+			aplicar_totales_venta(nota, nota.tabla_de_productos)
+
+		self.assertEqual(version.call_count, 1)
+		self.assertEqual(nota.total_impuestos, 320)
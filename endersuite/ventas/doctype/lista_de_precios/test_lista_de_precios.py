@@ -1,9 +1,11 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests import IntegrationTestCase
 
+from endersuite.ventas.services.price_service import resolve_prices
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
@@ -19,4 +21,24 @@ class IntegrationTestListadePrecios(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def test_precios_en_cache_e_invalidacion(self):
+		lista = frappe.generate_hash(length=10)
+		producto = frappe.get_doc({
+			"doctype": "Producto",
+			"nombre_del_producto": f"Producto Precio {frappe.generate_hash(length=8)}",
+			"table_rzld": [{"lista_de_precios": lista, "precio_unitario": 10}]
+		})
+		producto.flags.ignore_mandatory = True
+		producto.flags.ignore_links = True
+		producto.insert(ignore_permissions=True)
+
+		self.assertEqual(resolve_prices(lista, [producto.name])[producto.name]["precio_unitario"], 10)
+
+		# La segunda resolución sale de Redis sin tocar la base de datos
+		with self.assertQueryCount(0):
+			resolve_prices(lista, [producto.name])
+
+		producto.table_rzld[0].precio_unitario = 12
+		producto.save(ignore_permissions=True)
+
+		self.assertEqual(resolve_prices(lista, [producto.name])[producto.name]["precio_unitario"], 12)
@@ -6,6 +6,8 @@ from __future__ import unicode_literals
 import frappe
 from frappe.model.document import Document
 from frappe import _
+from frappe.utils import flt
+from endersuite.ventas.services.stock_service import aplicar_deltas_stock, validar_disponibilidad
 
 class MovimientodeStock(Document):
 	def before_save(self):
@@ -16,7 +18,9 @@ class MovimientodeStock(Document):
 	def validate(self):
 		"""Validaciones del documento"""
 		self.validar_cantidades()
-		self.validar_stock_disponible()
+		# Las salidas generadas por una venta ya validaron el carrito completo
+		if not self.flags.get("omitir_validacion_stock"):
+			self.validar_stock_disponible()
 	
 	def validar_cantidades(self):
 		"""Validar que las cantidades sean positivas"""
@@ -27,18 +31,10 @@ class MovimientodeStock(Document):
 	def validar_stock_disponible(self):
 		"""Validar stock disponible para salidas y ajustes negativos"""
 		if self.tipo_movimiento in ["Salida", "Ajuste Negativo"]:
-			for detalle in self.detalles:
-				producto = frappe.get_doc("Producto", detalle.producto)
-				
-				if not producto.mantener_stock:
-					continue
-				
-				if producto.cantidad_disponible < detalle.cantidad:
-					frappe.throw(_("Stock insuficiente para {0}. Disponible: {1}, Requerido: {2}").format(
-						producto.nombre_del_producto,
-						producto.cantidad_disponible,
-						detalle.cantidad
-					))
+			resultado = validar_disponibilidad(self.detalles, self.almacen, validar_lotes_series=False)
+
+			if not resultado["valido"]:
+				frappe.throw("<br>".join(e["mensaje"] for e in resultado["errores"]))
 	
 	def on_submit(self):
 		"""Actualizar stock al enviar el documento"""
@@ -52,46 +48,33 @@ class MovimientodeStock(Document):
 		# Actualizar estado sin disparar validaciones
 		frappe.db.set_value(self.doctype, self.name, "estado", "Cancelado")
 	
-	def actualizar_stock(self):
-		"""Actualizar el stock de los productos según el tipo de movimiento"""
+	def get_deltas_stock(self, revertir=False):
+		"""Cantidades a sumar por producto según el tipo de movimiento"""
+		signo = 0
+		if self.tipo_movimiento in ["Entrada", "Ajuste Positivo"]:
+			signo = 1
+		elif self.tipo_movimiento in ["Salida", "Ajuste Negativo"]:
+			signo = -1
+
+		if revertir:
+			signo = -signo
+
+		deltas = {}
 		for detalle in self.detalles:
-			producto = frappe.get_doc("Producto", detalle.producto)
-			
-			if not producto.mantener_stock:
-				continue
-			
-			cantidad_anterior = producto.cantidad_disponible
-			
-			if self.tipo_movimiento in ["Entrada", "Ajuste Positivo"]:
-				producto.cantidad_disponible += detalle.cantidad
-			elif self.tipo_movimiento in ["Salida", "Ajuste Negativo"]:
-				producto.cantidad_disponible -= detalle.cantidad
-			
-			producto.save(ignore_permissions=True)
+			deltas[detalle.producto] = deltas.get(detalle.producto, 0) + signo * flt(detalle.cantidad)
 
-			# Emitir evento de actualización de stock en tiempo real
-			frappe.publish_realtime(
-				event='stock_updated',
-				message={
-					'producto': detalle.producto,
-					'almacen': self.almacen,
-					'cantidad_disponible': producto.cantidad_disponible,
-					'tipo_movimiento': self.tipo_movimiento
-				},
-				doctype='Producto',
-				docname=detalle.producto
-			)
+		return deltas
 
-			# Registrar log del cambio
-			frappe.logger().info(
-				f"Movimiento de Stock: {self.name} | "
-				f"Producto: {producto.nombre_del_producto} | "
-				f"Tipo: {self.tipo_movimiento} | "
-				f"Cantidad: {detalle.cantidad} | "
-				f"Stock Anterior: {cantidad_anterior} | "
-				f"Stock Nuevo: {producto.cantidad_disponible}"
-			)
-			
+	def actualizar_stock(self):
+		"""Actualizar el stock de los productos según el tipo de movimiento"""
+		aplicar_deltas_stock(
+			self.get_deltas_stock(),
+			almacen=self.almacen,
+			tipo_movimiento=self.tipo_movimiento,
+			referencia=self.name
+		)
+
+		for detalle in self.detalles:
 			# Actualizar lotes si aplica
 			if detalle.lote:
 				self.actualizar_lote(detalle)
@@ -102,20 +85,15 @@ class MovimientodeStock(Document):
 	
 	def revertir_stock(self):
 		"""Revertir los cambios en el stock"""
+		aplicar_deltas_stock(
+			self.get_deltas_stock(revertir=True),
+			almacen=self.almacen,
+			tipo_movimiento=self.tipo_movimiento,
+			referencia=self.name,
+			es_cancelacion=True
+		)
+
 		for detalle in self.detalles:
-			producto = frappe.get_doc("Producto", detalle.producto)
-			
-			if not producto.mantener_stock:
-				continue
-			
-			# Invertir el movimiento
-			if self.tipo_movimiento in ["Entrada", "Ajuste Positivo"]:
-				producto.cantidad_disponible -= detalle.cantidad
-			elif self.tipo_movimiento in ["Salida", "Ajuste Negativo"]:
-				producto.cantidad_disponible += detalle.cantidad
-			
-			producto.save(ignore_permissions=True)
-			
 			# Revertir lotes
 			if detalle.lote:
 				self.revertir_lote(detalle)
@@ -1,9 +1,13 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+import threading
+
+import frappe
 from frappe.tests import IntegrationTestCase
 
+from endersuite.ventas.services.stock_service import aplicar_deltas_stock, validar_disponibilidad
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
@@ -19,4 +23,101 @@ class IntegrationTestMovimientodeStock(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def crear_producto(self, cantidad):
+		producto = frappe.get_doc({
+			"doctype": "Producto",
+			"nombre_del_producto": f"Producto Stock {frappe.generate_hash(length=8)}",
+			"mantener_stock": 1,
+			"cantidad_disponible": cantidad
+		})
+		producto.flags.ignore_mandatory = True
+		producto.insert(ignore_permissions=True)
+		return producto.name
+
+	def test_deltas_agrupados_en_una_actualizacion(self):
+		producto = self.crear_producto(10)
+
+		cambios = aplicar_deltas_stock({producto: -3})
+		self.assertEqual(cambios[producto], {"anterior": 10, "nuevo": 7})
+		self.assertEqual(frappe.db.get_value("Producto", producto, "cantidad_disponible"), 7)
+
+	def test_no_permite_stock_negativo(self):
+		producto = self.crear_producto(2)
+
+		with self.assertRaises(frappe.ValidationError):
+			aplicar_deltas_stock({producto: -3})
+
+		self.assertEqual(frappe.db.get_value("Producto", producto, "cantidad_disponible"), 2)
+
+	def test_cancelar_entrada_consumida_permite_negativo(self):
+		"""Revertir una entrada cuyo stock ya se vendió deja la existencia en negativo"""
+		producto = self.crear_producto(2)
+
+		cambios = aplicar_deltas_stock({producto: -5}, es_cancelacion=True)
+		self.assertEqual(cambios[producto], {"anterior": 2, "nuevo": -3})
+		self.assertEqual(frappe.db.get_value("Producto", producto, "cantidad_disponible"), -3)
+
+	def test_disponibilidad_suma_lineas_del_mismo_producto(self):
+		producto = self.crear_producto(5)
+		items = [
+			{"producto": producto, "cantidad": 3},
+			{"producto": producto, "cantidad": 3},
+			{"producto": "producto-inexistente", "cantidad": 1}
+		]
+
+		with self.assertQueryCount(1):
+			resultado = validar_disponibilidad(items)
+
+		self.assertFalse(resultado["valido"])
+		errores = {e["tipo"]: e for e in resultado["errores"]}
+		self.assertEqual(errores["stock"]["requerido"], 6)
+		self.assertEqual(errores["stock"]["lineas"], [1, 2])
+		self.assertEqual(errores["no_existe"]["idx"], 3)
+
+	def test_concurrencia_mismo_producto(self):
+		"""Varias cajas vendiendo el mismo SKU no pierden actualizaciones ni sobrevenden"""
+		stock_inicial = 50
+		workers = 8
+		ventas_por_worker = 10
+
+		producto = self.crear_producto(stock_inicial)
+		frappe.db.commit()
+
+		site = frappe.local.site
+		resultados = {"exitos": 0, "rechazos": 0}
+		lock = threading.Lock()
+
+		def vender():
+			frappe.init(site=site)
+			frappe.connect()
+			try:
+				for _ in range(ventas_por_worker):
+					try:
+						aplicar_deltas_stock({producto: -1})
+						frappe.db.commit()
+						with lock:
+							resultados["exitos"] += 1
+					except frappe.ValidationError:
+						frappe.db.rollback()
+						with lock:
+							resultados["rechazos"] += 1
+			finally:
+				frappe.destroy()
+
+		hilos = [threading.Thread(target=vender) for _ in range(workers)]
+		for hilo in hilos:
+			hilo.start()
+		for hilo in hilos:
+			hilo.join()
+
+		try:
+			final = frappe.db.sql(
+				"SELECT cantidad_disponible FROM `tabProducto` WHERE name = %s", producto
+			)[0][0]
+
+			self.assertEqual(resultados["exitos"], stock_inicial)
+			self.assertEqual(resultados["rechazos"], workers * ventas_por_worker - stock_inicial)
+			self.assertEqual(final, 0)
+		finally:
+			frappe.delete_doc("Producto", producto, force=True, ignore_permissions=True)
+			frappe.db.commit()
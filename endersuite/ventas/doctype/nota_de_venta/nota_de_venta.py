@@ -5,13 +5,14 @@ import frappe
 from frappe.model.document import Document
 from frappe import _
 
+from endersuite.ventas.services.totals_service import aplicar_totales_venta
+
 
 class NotadeVenta(Document):
 	def validate(self):
 		"""Validaciones generales"""
 		self.ensure_cliente()
 		self.validate_sesion_pos()
-		self.calculate_taxes()
 		self.calculate_totals()
 		self.validate_payment_methods()
 		self.validar_metodos_de_pago_duplicados()
@@ -37,74 +38,22 @@ class NotadeVenta(Document):
 	def validate_sesion_pos(self):
 		"""Validar que la sesión POS está abierta si se especifica"""
 		if self.sesion_pos:
-			sesion = frappe.get_value("Sesion POS", self.sesion_pos, ["estado", "usuario"], as_dict=True)
+			contexto = self.flags.get("contexto_venta")
+			if contexto and contexto.sesion.name == self.sesion_pos:
+				sesion = contexto.sesion
+			else:
+				sesion = frappe.get_value("Sesion POS", self.sesion_pos, ["estado", "usuario"], as_dict=True)
 			if not sesion:
 				frappe.throw(_("La sesión POS {0} no existe").format(self.sesion_pos))
 			if sesion.estado != "Abierta":
 				frappe.throw(_("La sesión POS {0} no está abierta").format(self.sesion_pos))
 
-	def calculate_taxes(self):
-		"""Calcular impuestos línea por línea desde producto.tipo_de_impuesto"""
-		from frappe.utils import flt
-		
-		for item in self.tabla_de_productos:
-			# Convertir a float para evitar errores de tipo
-			cantidad = flt(item.cantidad)
-			precio_unitario = flt(item.precio_unitario)
-			descuento_porcentaje = flt(item.descuento_porcentaje)
-			
-			# Calcular subtotal sin impuesto
-			item.subtotal_sin_impuesto = cantidad * precio_unitario
-
-			# Calcular descuento
-			if descuento_porcentaje:
-				item.descuento_monto = item.subtotal_sin_impuesto * (descuento_porcentaje / 100)
-			else:
-				item.descuento_monto = 0
-
-			# Base imponible = subtotal - descuento
-			item.base_imponible = item.subtotal_sin_impuesto - item.descuento_monto
-
-			# Obtener porcentaje de impuesto
-			if item.impuesto:
-				porcentaje = flt(frappe.get_value("Impuestos", item.impuesto, "porciento_impuesto") or 0)
-				item.porcentaje_impuesto = porcentaje
-				item.impuesto_monto = item.base_imponible * (porcentaje / 100)
-			else:
-				item.porcentaje_impuesto = 0
-				item.impuesto_monto = 0
-
-			# Total línea = base imponible + impuesto
-			item.total_linea = item.base_imponible + item.impuesto_monto
-
 	def calculate_totals(self):
-		"""Calcular subtotal, descuentos, base imponible, total"""
+		"""Calcular importes por línea, descuentos, impuestos, total y cambio"""
 		from frappe.utils import flt
-		
-		# Sumar todos los items
-		self.subtotal = sum([flt(item.subtotal_sin_impuesto) for item in self.tabla_de_productos])
-
-		# Calcular descuento global
-		descuento_global_porcentaje = flt(self.descuento_global_porcentaje)
-		if descuento_global_porcentaje:
-			self.descuento_global_monto = self.subtotal * (descuento_global_porcentaje / 100)
-		else:
-			self.descuento_global_monto = 0
-
-		# Base imponible total
-		subtotal_con_descuento = sum([flt(item.base_imponible) for item in self.tabla_de_productos])
-		self.base_imponible_total = subtotal_con_descuento - self.descuento_global_monto
 
-		# Total impuestos
-		self.total_impuestos = sum([flt(item.impuesto_monto) for item in self.tabla_de_productos])
-
-		# Ajustar impuestos si hay descuento global
-		if self.descuento_global_monto > 0 and subtotal_con_descuento > 0:
-			factor = self.base_imponible_total / subtotal_con_descuento
-			self.total_impuestos = self.total_impuestos * factor
-
-		# Total final
-		self.total_final = self.base_imponible_total + self.total_impuestos
+		# Porcentaje e impuesto incluido de cada línea desde la tabla de impuestos en memoria
+		aplicar_totales_venta(self, self.tabla_de_productos)
 
 		# Calcular total pagado y cambio
 		self.total_pagado = sum([flt(metodo.monto) for metodo in self.metodos_pago_nota])
@@ -112,10 +61,13 @@ class NotadeVenta(Document):
 
 	def validate_payment_methods(self):
 		"""Validar que suma de métodos de pago >= total"""
+		from frappe.utils import flt
+
 		if not self.metodos_pago_nota:
 			frappe.throw(_("Debe especificar al menos un método de pago"))
 
-		total_pagado = sum([m.monto or 0 for m in self.metodos_pago_nota])
+		# Comparar al centavo: el total final ya viene redondeado a la precisión del campo
+		total_pagado = flt(sum([m.monto or 0 for m in self.metodos_pago_nota]), self.precision("total_final"))
 
 		if total_pagado < self.total_final:
 			frappe.throw(_("El total pagado ({0}) es menor que el total final ({1})").format(
@@ -125,25 +77,27 @@ class NotadeVenta(Document):
 
 	def validate_stock_availability(self):
 		"""Validar que hay stock disponible para productos que lo requieren"""
-		for item in self.tabla_de_productos:
-			producto = frappe.get_doc("Producto", item.producto)
-			if producto.mantener_stock:
-				# Obtener stock actual del almacén
-				if not self.almacen:
-					frappe.throw(_("Debe especificar un almacén para productos con control de stock"))
-
-				stock_actual = frappe.db.get_value(
-					"Producto",
-					item.producto,
-					"cantidad_disponible"
-				) or 0
-
-				if stock_actual < item.cantidad:
-					frappe.throw(_("Stock insuficiente para {0}. Disponible: {1}, Requerido: {2}").format(
-						item.producto,
-						stock_actual,
-						item.cantidad
-					))
+		from endersuite.ventas.services.stock_service import validar_disponibilidad
+
+		if not self.tabla_de_productos:
+			return
+
+		# Una sola consulta para todo el carrito; cantidades sumadas por producto
+		contexto = self.flags.get("contexto_venta")
+		resultado = validar_disponibilidad(
+			self.tabla_de_productos,
+			self.almacen,
+			validar_lotes_series=False,
+			datos=contexto.datos_stock if contexto and contexto.perfil.almacen == self.almacen else None
+		)
+
+		if resultado["valido"]:
+			return
+
+		if not self.almacen and any(e["tipo"] == "stock" for e in resultado["errores"]):
+			frappe.throw(_("Debe especificar un almacén para productos con control de stock"))
+
+		frappe.throw("<br>".join(e["mensaje"] for e in resultado["errores"]))
 
 	def on_cancel(self):
 		"""Remover de la sesión POS cuando se cancela la nota"""
@@ -202,27 +156,13 @@ class NotadeVenta(Document):
 
 	def remover_de_sesion_pos(self):
 		"""Remover esta nota de venta de la sesión POS"""
+		from endersuite.ventas.services.session_service import remover_venta_de_sesion
+
 		try:
-			sesion = frappe.get_doc("Sesion POS", self.sesion_pos)
-
-			# Filtrar las ventas para remover esta nota
-			ventas_validas = []
-			for venta in sesion.ventas:
-				if venta.nota_de_venta != self.name:
-					ventas_validas.append(venta)
-
-			# Limpiar y reagregar solo las ventas válidas
-			sesion.ventas = []
-			for venta in ventas_validas:
-				sesion.append('ventas', {
-					'nota_de_venta': venta.nota_de_venta,
-					'total': venta.total,
-					'metodo_pago': venta.metodo_pago
-				})
-
-			# Guardar sin disparar validaciones
-			sesion.flags.ignore_validate = True
-			sesion.save(ignore_permissions=True)
+			# Solo se borra el renglón: guardar la sesión completa sobrescribiría los
+			# acumulados, que revertir_venta actualiza con bloqueo desde el hook
+			# on_cancel de doc_events, después de este método
+			remover_venta_de_sesion(self.sesion_pos, self.name)
 
 			frappe.msgprint(_("La nota de venta ha sido removida de la sesión POS"))
 		except Exception as e:
@@ -1,9 +1,20 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+import os
+import random
+import time
+import unittest
+
+import frappe
 from frappe.tests import IntegrationTestCase
 
+from endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket import renderizar_ticket
+from endersuite.ventas.services.escpos_service import generar_ticket_escpos, generar_ticket_texto
+from endersuite.ventas.services.pos_service import create_sale, sync_sales
+from endersuite.ventas.services.tax_service import invalidar_tasas
+from endersuite.ventas.services.totals_service import aplicar_totales_venta, calcular_totales
+
 
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
@@ -11,6 +22,42 @@ from frappe.tests import IntegrationTestCase
 EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
+# Máximo de sentencias SQL para registrar una venta de 20 líneas con create_sale
+PRESUPUESTO_CONSULTAS_VENTA = 200
+
+# Líneas del documento del benchmark del motor de totales
+LINEAS_BENCHMARK_TOTALES = 1000
+
+# Tickets renderizados en el benchmark de impresión
+TICKETS_BENCHMARK = 500
+
+# Las mediciones de tiempo solo corren con ENDERSUITE_BENCHMARKS=1: en CI el reloj no es confiable
+BENCHMARKS = bool(os.environ.get("ENDERSUITE_BENCHMARKS"))
+
+
+def totales_referencia(lineas, descuento_global):
+	"""Cálculo línea por línea en float que usaban Nota, Orden y Cotización antes del motor"""
+	subtotal = base = impuestos = 0
+	for cantidad, precio, descuento, tasa in lineas:
+		subtotal_linea = cantidad * precio
+		base_linea = subtotal_linea - subtotal_linea * (descuento / 100)
+		subtotal += subtotal_linea
+		base += base_linea
+		impuestos += base_linea * (tasa / 100)
+
+	descuento_global_monto = subtotal * (descuento_global / 100)
+	base_total = base - descuento_global_monto
+	if descuento_global_monto > 0 and base > 0:
+		impuestos = impuestos * base_total / base
+
+	return {
+		"subtotal": subtotal,
+		"descuento_global": descuento_global_monto,
+		"base_imponible": base_total,
+		"impuestos": impuestos,
+		"total": base_total + impuestos
+	}
+
 
 
 class IntegrationTestNotadeVenta(IntegrationTestCase):
@@ -19,4 +66,264 @@ class IntegrationTestNotadeVenta(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def crear_fixtures_venta(self, num_lineas):
+		"""Sesión abierta del usuario actual y un carrito de productos con stock e impuesto"""
+		almacen = frappe.get_doc({"doctype": "Almacen", "name": frappe.generate_hash(length=10)})
+		almacen.db_insert()
+
+		perfil = frappe.get_doc({
+			"doctype": "Perfil de POS",
+			"name": frappe.generate_hash(length=10),
+			"almacen": almacen.name
+		})
+		perfil.db_insert()
+
+		sesion = frappe.get_doc({
+			"doctype": "Sesion POS",
+			"name": frappe.generate_hash(length=10),
+			"estado": "Abierta",
+			"usuario": frappe.session.user,
+			"perfil_pos": perfil.name,
+			"monto_apertura": 500
+		})
+		sesion.db_insert()
+
+		impuesto = frappe.get_doc({
+			"doctype": "Impuestos",
+			"name": frappe.generate_hash(length=10),
+			"porciento_impuesto": 16
+		})
+		impuesto.db_insert()
+
+		if not frappe.db.exists("Metodos de Pago", "Efectivo"):
+			frappe.get_doc({"doctype": "Metodos de Pago", "name": "Efectivo"}).db_insert()
+
+		productos = []
+		for i in range(num_lineas):
+			producto = frappe.get_doc({
+				"doctype": "Producto",
+				"name": frappe.generate_hash(length=10),
+				"nombre_del_producto": f"Producto Venta {i}",
+				"mantener_stock": 1,
+				"cantidad_disponible": 100
+			})
+			producto.db_insert()
+			frappe.get_doc({
+				"doctype": "Stock por Almacen",
+				"name": frappe.generate_hash(length=10),
+				"producto": producto.name,
+				"almacen": almacen.name,
+				"cantidad_disponible": 100
+			}).db_insert()
+			productos.append({
+				"producto": producto.name,
+				"cantidad": 2,
+				"precio_unitario": 10,
+				"descuento_porcentaje": 0,
+				"impuesto": impuesto.name
+			})
+
+		return sesion, productos
+
+	def test_presupuesto_consultas_venta(self):
+		"""Una venta de 20 líneas no supera el presupuesto de sentencias SQL"""
+		sesion, productos = self.crear_fixtures_venta(20)
+		total = sum(p["cantidad"] * p["precio_unitario"] for p in productos) * 1.16
+
+		with self.assertQueryCount(PRESUPUESTO_CONSULTAS_VENTA):
+			venta = create_sale(
+				sesion.name,
+				productos,
+				[{"metodo_de_pago": "Efectivo", "monto": total}],
+				total
+			)
+
+		self.assertEqual(len(venta["productos"]), 20)
+		self.assertAlmostEqual(venta["total_final"], total)
+		self.assertEqual(
+			frappe.db.get_value("Producto", productos[0]["producto"], "cantidad_disponible"),
+			98
+		)
+
+	def test_sync_sales_es_idempotente(self):
+		"""Reenviar un lote no duplica ventas y un error no descarta las demás"""
+		sesion, productos = self.crear_fixtures_venta(2)
+		total = sum(p["cantidad"] * p["precio_unitario"] for p in productos) * 1.16
+		clave = frappe.generate_hash(length=20)
+		lote = [
+			{
+				"clave": clave,
+				"sesion_pos": sesion.name,
+				"productos": productos,
+				"metodos_pago": [{"metodo_de_pago": "Efectivo", "monto": total}]
+			},
+			{
+				"clave": frappe.generate_hash(length=20),
+				"sesion_pos": "sesion-inexistente",
+				"productos": productos,
+				"metodos_pago": []
+			}
+		]
+
+		primero = sync_sales(lote)
+		self.assertEqual([r["estado"] for r in primero], ["creada", "error"])
+
+		segundo = sync_sales(lote[:1])
+		self.assertEqual(segundo[0]["estado"], "duplicada")
+		self.assertEqual(segundo[0]["nota"], primero[0]["nota"])
+		self.assertEqual(frappe.db.count("Nota de Venta", {"clave_idempotencia": clave}), 1)
+
+	def test_totales_golden(self):
+		"""El motor de totales reproduce los importes conocidos de un documento"""
+		resultado = calcular_totales(
+			[2, 3, 1],
+			[100, 33.33, 15.5],
+			[10, 0, 5],
+			[16, 16, 0],
+			descuento_global=5
+		)
+
+		self.assertEqual(resultado["lineas"]["base"], [180.0, 99.99, 14.73])
+		self.assertEqual(resultado["lineas"]["impuesto"], [28.8, 16.0, 0.0])
+		self.assertEqual(resultado["subtotal"], 315.49)
+		self.assertEqual(resultado["descuento_global"], 15.77)
+		self.assertEqual(resultado["base_imponible"], 278.94)
+		self.assertEqual(resultado["impuestos"], 42.4)
+		self.assertEqual(resultado["total"], 321.34)
+
+		# Impuesto incluido en el precio de la primera línea, con ambas semánticas de descuento
+		incluido = calcular_totales([1, 2], [116, 50], [0, 10], [16, 16], [1, 0])
+		self.assertEqual(incluido["lineas"]["base"], [100.0, 90.0])
+		self.assertEqual(incluido["lineas"]["total"], [116.0, 104.4])
+		self.assertEqual((incluido["subtotal"], incluido["impuestos"], incluido["total"]), (200.0, 30.4, 220.4))
+
+		factura = calcular_totales([1, 2], [116, 50], [0, 10], [16, 16], [1, 0], descuento_con_impuesto=True)
+		self.assertEqual(factura["lineas"]["impuesto"], [16.0, 16.0])
+		self.assertEqual(factura["lineas"]["descuento"], [0.0, 11.6])
+		self.assertEqual((factura["subtotal"], factura["impuestos"], factura["total"]), (200.0, 32.0, 220.4))
+
+	def test_totales_con_impuesto_incluido_en_el_precio(self):
+		"""Las líneas cuyo impuesto está incluido en el precio separan el impuesto en lugar de sumarlo"""
+		incluido, trasladado = frappe.generate_hash(length=10), frappe.generate_hash(length=10)
+		for nombre, es_incluido in ((incluido, 1), (trasladado, 0)):
+			frappe.get_doc({
+				"doctype": "Impuestos",
+				"name": nombre,
+				"porciento_impuesto": 16,
+				"incluido_en_el_precio": es_incluido
+			}).db_insert()
+		invalidar_tasas()
+
+		nota = frappe.new_doc("Nota de Venta")
+		nota.append("tabla_de_productos", {"cantidad": 1, "precio_unitario": 116, "impuesto": incluido})
+		nota.append("tabla_de_productos", {"cantidad": 1, "precio_unitario": 100, "impuesto": trasladado})
+		aplicar_totales_venta(nota, nota.tabla_de_productos)
+
+		self.assertEqual([l.base_imponible for l in nota.tabla_de_productos], [100, 100])
+		self.assertEqual([l.total_linea for l in nota.tabla_de_productos], [116, 116])
+		self.assertEqual(nota.total_impuestos, 32)
+		self.assertEqual(nota.total_final, 232)
+
+	def test_totales_identicos_al_calculo_anterior(self):
+		"""En documentos aleatorios el motor coincide al centavo con el cálculo anterior"""
+		aleatorio = random.Random(20251018)
+		for _ in range(200):
+			lineas = [
+				(
+					aleatorio.randint(1, 50),
+					round(aleatorio.uniform(0.5, 5000), 2),
+					aleatorio.choice([0, 0, 5, 10, 12.5]),
+					aleatorio.choice([0, 8, 16])
+				)
+				for _ in range(aleatorio.randint(1, 40))
+			]
+			descuento_global = aleatorio.choice([0, 0, 3, 10])
+
+			referencia = totales_referencia(lineas, descuento_global)
+			resultado = calcular_totales(*zip(*lineas, strict=True), descuento_global=descuento_global)
+
+			for campo, valor in referencia.items():
+				self.assertAlmostEqual(resultado[campo], valor, delta=0.01, msg=campo)
+
+	@unittest.skipUnless(BENCHMARKS, "Benchmark opcional: definir ENDERSUITE_BENCHMARKS=1")
+	def test_benchmark_totales_documento_grande(self):
+		"""Reporta el tiempo del motor de totales para un documento de 1,000 líneas"""
+		aleatorio = random.Random(1000)
+		columnas = list(zip(*[
+			(aleatorio.randint(1, 20), round(aleatorio.uniform(1, 999), 2), aleatorio.choice([0, 10]), 16)
+			for _ in range(LINEAS_BENCHMARK_TOTALES)
+		], strict=True))
+
+		duraciones = []
+		for _ in range(20):
+			inicio = time.perf_counter()
+			calcular_totales(*columnas, descuento_global=5)
+			duraciones.append(time.perf_counter() - inicio)
+
+		mediana = sorted(duraciones)[len(duraciones) // 2] * 1000
+		print(f"Totales de {LINEAS_BENCHMARK_TOTALES} líneas: mediana {mediana:.1f} ms")
+		self.assertLess(mediana, 1000)
+
+	def test_render_ticket_con_plantilla_compilada(self):
+		"""El ticket se renderiza con la plantilla en caché; con ENDERSUITE_BENCHMARKS reporta tickets por segundo"""
+		sesion, productos = self.crear_fixtures_venta(10)
+		total = sum(p["cantidad"] * p["precio_unitario"] for p in productos) * 1.16
+		venta = create_sale(
+			sesion.name,
+			productos,
+			[{"metodo_de_pago": "Efectivo", "monto": total}],
+			total
+		)
+		nota = frappe.get_doc("Nota de Venta", venta["name"])
+
+		formato = frappe.get_doc({
+			"doctype": "Formato de Ticket",
+			"nombre_formato": frappe.generate_hash(length=10)
+		}).insert()
+
+		primero = renderizar_ticket(nota, formato.name)
+		self.assertIn(nota.name, primero)
+
+		# Con la plantilla compilada y el encabezado en caché solo se consulta `modified`
+		with self.assertQueryCount(1):
+			self.assertEqual(renderizar_ticket(nota, formato.name), primero)
+
+		if BENCHMARKS:
+			inicio = time.perf_counter()
+			for _ in range(TICKETS_BENCHMARK):
+				renderizar_ticket(nota, formato.name)
+			por_segundo = TICKETS_BENCHMARK / (time.perf_counter() - inicio)
+			print(f"Render de tickets: {por_segundo:.0f} tickets/s")
+
+		# Guardar el formato cambia `modified` y obliga a recompilar
+		formato.footer_html = "<p>Formato actualizado</p>"
+		formato.save()
+		self.assertIn("Formato actualizado", renderizar_ticket(nota, formato.name))
+
+	def test_ticket_escpos_y_texto(self):
+		"""El ticket ESC/POS y el de texto respetan el ancho del formato"""
+		sesion, productos = self.crear_fixtures_venta(3)
+		total = sum(p["cantidad"] * p["precio_unitario"] for p in productos) * 1.16
+		venta = create_sale(
+			sesion.name,
+			productos,
+			[{"metodo_de_pago": "Efectivo", "monto": total}],
+			total
+		)
+		nota = frappe.get_doc("Nota de Venta", venta["name"])
+
+		formato = frappe.get_doc({
+			"doctype": "Formato de Ticket",
+			"nombre_formato": frappe.generate_hash(length=10),
+			"ancho_ticket": "58mm",
+			"tamano_fuente": "10"
+		}).insert()
+
+		texto = generar_ticket_texto(nota, formato.name)
+		self.assertIn(nota.name, texto)
+		self.assertTrue(all(len(linea) <= 32 for linea in texto.splitlines()))
+
+		escpos = generar_ticket_escpos(nota, formato.name)
+		self.assertTrue(escpos.startswith(b"\x1b@"))
+		self.assertTrue(escpos.endswith(b"\x1dV\x42\x03"))
+		self.assertIn(nota.name.encode(), escpos)
@@ -6,6 +6,8 @@ from frappe.model.document import Document
 from frappe import _
 from frappe.utils import add_days, getdate
 
+from endersuite.ventas.services.totals_service import aplicar_totales_venta
+
 
 class Ordendeventa(Document):
 	def validate(self):
@@ -14,7 +16,6 @@ class Ordendeventa(Document):
 		self.ensure_fecha_entrega()
 		self.validar_productos()
 		self.validar_fechas()
-		self.calculate_taxes()
 		self.calculate_totals()
 
 	def before_insert(self):
@@ -61,58 +62,9 @@ class Ordendeventa(Document):
 			if self.fecha_entrega_estimada < self.fecha:
 				frappe.throw(_("La fecha de entrega estimada no puede ser anterior a la fecha de la orden"))
 
-	def calculate_taxes(self):
-		"""Calcular impuestos línea por línea desde producto.tipo_de_impuesto"""
-		for item in self.productos:
-			# Calcular subtotal sin impuesto
-			item.subtotal_sin_impuesto = item.cantidad * item.precio_unitario
-
-			# Calcular descuento
-			if item.descuento_porcentaje:
-				item.descuento_monto = item.subtotal_sin_impuesto * (item.descuento_porcentaje / 100)
-			else:
-				item.descuento_monto = 0
-
-			# Base imponible = subtotal - descuento
-			item.base_imponible = item.subtotal_sin_impuesto - item.descuento_monto
-
-			# Obtener porcentaje de impuesto
-			if item.impuesto:
-				porcentaje = frappe.get_value("Impuestos", item.impuesto, "porciento_impuesto") or 0
-				item.porcentaje_impuesto = porcentaje
-				item.impuesto_monto = item.base_imponible * (porcentaje / 100)
-			else:
-				item.porcentaje_impuesto = 0
-				item.impuesto_monto = 0
-
-			# Total línea = base imponible + impuesto
-			item.total_linea = item.base_imponible + item.impuesto_monto
-
 	def calculate_totals(self):
-		"""Calcular subtotal, descuentos, base imponible, total"""
-		# Sumar todos los items
-		self.subtotal = sum([item.subtotal_sin_impuesto or 0 for item in self.productos])
-
-		# Calcular descuento global
-		if self.descuento_global_porcentaje:
-			self.descuento_global_monto = self.subtotal * (self.descuento_global_porcentaje / 100)
-		else:
-			self.descuento_global_monto = 0
-
-		# Base imponible total
-		subtotal_con_descuento = sum([item.base_imponible or 0 for item in self.productos])
-		self.base_imponible_total = subtotal_con_descuento - self.descuento_global_monto
-
-		# Total impuestos
-		self.total_impuestos = sum([item.impuesto_monto or 0 for item in self.productos])
-
-		# Ajustar impuestos si hay descuento global
-		if self.descuento_global_monto > 0 and subtotal_con_descuento > 0:
-			factor = self.base_imponible_total / subtotal_con_descuento
-			self.total_impuestos = self.total_impuestos * factor
-
-		# Total final
-		self.total_final = self.base_imponible_total + self.total_impuestos
+		"""Calcular importes por línea, descuentos, impuestos y totales con el motor de totales"""
+		aplicar_totales_venta(self, self.productos)
 
 	@frappe.whitelist()
 	def cambiar_estado(self, nuevo_estado):
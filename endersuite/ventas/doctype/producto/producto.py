@@ -1,9 +1,10 @@
 # Copyright (c) 2025, RenderCores.com and contributors
 # For license information, please see license.txt
 
-import frappe
 from frappe.model.document import Document
 
+from endersuite.ventas.services.tax_service import get_tasa
+
 
 class Producto(Document):
 	def validate(self):
@@ -19,8 +20,8 @@ class Producto(Document):
 		tasa_impuesto = 0
 		incluido_en_precio = False
 		
-		if self.tipo_de_impuesto:
-			impuesto = frappe.get_doc("Impuestos", self.tipo_de_impuesto)
+		impuesto = get_tasa(self.tipo_de_impuesto)
+		if impuesto:
 			tasa_impuesto = impuesto.porciento_impuesto or 0
 			incluido_en_precio = impuesto.incluido_en_el_precio or False
 		
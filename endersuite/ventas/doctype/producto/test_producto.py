@@ -1,8 +1,20 @@
 # Copyright (c) 2025, RenderCores.com and Contributors
 # See license.txt
 
-# import frappe
+import os
+import random
+import time
+import unittest
+from unittest.mock import patch
+
+import frappe
 from frappe.tests import IntegrationTestCase
+from frappe.utils import add_to_date, get_datetime_str, now_datetime
+
+from endersuite.ventas.services.pos_service import get_catalog_changes
+from endersuite.ventas.services.stock_service import aplicar_deltas_stock
+from endersuite.ventas.services import search_service
+from endersuite.ventas.services.search_service import borrar_indice, buscar_productos, reconstruir_indice
 
 
 # On IntegrationTestCase, the doctype test records and all
@@ -11,6 +23,12 @@ from frappe.tests import IntegrationTestCase
 EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
 
+# Tamaño del catálogo del benchmark de búsqueda
+PRODUCTOS_BENCHMARK = 100_000
+
+# El benchmark de búsqueda solo corre con ENDERSUITE_BENCHMARKS=1
+BENCHMARKS = bool(os.environ.get("ENDERSUITE_BENCHMARKS"))
+
 
 
 class IntegrationTestProducto(IntegrationTestCase):
@@ -19,4 +37,147 @@ class IntegrationTestProducto(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def crear_producto_con_precio(self, lista, precio):
+		producto = frappe.get_doc({
+			"doctype": "Producto",
+			"nombre_del_producto": f"Producto Catálogo {frappe.generate_hash(length=8)}",
+			"table_rzld": [{"lista_de_precios": lista, "precio_unitario": precio}]
+		})
+		producto.flags.ignore_mandatory = True
+		producto.flags.ignore_links = True
+		producto.insert(ignore_permissions=True)
+		return producto
+
+	def test_catalogo_solo_devuelve_cambios(self):
+		lista = frappe.generate_hash(length=10)
+		sin_cambios = self.crear_producto_con_precio(lista, 10)
+		modificado = self.crear_producto_con_precio(lista, 20)
+
+		completo = get_catalog_changes(None, lista)
+		self.assertTrue(completo["completo"])
+		self.assertIn(sin_cambios.name, [p["name"] for p in completo["productos"]])
+
+		# Un token posterior a la ventana de solape no ve los productos ya enviados
+		token = get_datetime_str(add_to_date(now_datetime(), seconds=60))
+		self.assertEqual(get_catalog_changes(token, lista)["productos"], [])
+
+		modificado.table_rzld[0].precio_unitario = 25
+		modificado.save(ignore_permissions=True)
+
+		cambios = get_catalog_changes(completo["token"], lista)
+		self.assertFalse(cambios["completo"])
+		precios = {p["name"]: p["precio"] for p in cambios["productos"]}
+		self.assertEqual(precios.get(modificado.name), 25)
+
+	def test_catalogo_detecta_cambio_de_stock_sin_almacen(self):
+		lista = frappe.generate_hash(length=10)
+		producto = self.crear_producto_con_precio(lista, 10)
+		# Fuera de la ventana de solape: solo el cambio de stock puede volver a incluirlo
+		frappe.db.set_value("Producto", producto.name, {
+			"mantener_stock": 1,
+			"cantidad_disponible": 10,
+			"modified": add_to_date(now_datetime(), hours=-1)
+		}, update_modified=False)
+		frappe.db.set_value("Precios productos", producto.table_rzld[0].name, "modified",
+			add_to_date(now_datetime(), hours=-1), update_modified=False)
+
+		completo = get_catalog_changes(None, lista)
+		aplicar_deltas_stock({producto.name: -3})
+
+		cambios = get_catalog_changes(completo["token"], lista)
+		existencias = {p["name"]: p["cantidad_disponible"] for p in cambios["productos"]}
+		self.assertEqual(existencias.get(producto.name), 7)
+
+	def test_busqueda_ordenada_por_relevancia(self):
+		sufijo = frappe.generate_hash(length=6)
+		for nombre, sku, codigo in (
+			(f"Refresco Cola {sufijo}", f"SKU-A-{sufijo}", f"750{sufijo}1"),
+			(f"Cola {sufijo} Light", f"SKU-B-{sufijo}", f"750{sufijo}2"),
+			(f"Cocacola {sufijo}", f"SKU-C-{sufijo}", f"750{sufijo}3"),
+		):
+			producto = frappe.get_doc({
+				"doctype": "Producto",
+				"nombre_del_producto": nombre,
+				"sku": sku,
+				"codigo_barras": codigo
+			})
+			producto.flags.ignore_mandatory = True
+			producto.insert(ignore_permissions=True)
+
+		reconstruir_indice()
+
+		# Prefijo del nombre, luego inicio de palabra, luego coincidencia parcial
+		nombres = [
+			frappe.db.get_value("Producto", n, "nombre_del_producto")
+			for n in buscar_productos(f"cola {sufijo}")
+		]
+		self.assertEqual(nombres[:2], [f"Cola {sufijo} Light", f"Refresco Cola {sufijo}"])
+
+		escaneado = buscar_productos(f"750{sufijo}3")
+		self.assertEqual(
+			frappe.db.get_value("Producto", escaneado[0], "sku"),
+			f"SKU-C-{sufijo}"
+		)
+
+	def test_prefijo_no_se_pierde_con_muchos_candidatos(self):
+		"""Con más candidatos que MAX_CANDIDATOS el nombre que empieza con la consulta sigue primero"""
+		sufijo = frappe.generate_hash(length=6)
+		nombres = [f"{sufijo} Exacto"] + [f"Caja {sufijo} {i}" for i in range(6)]
+		for nombre in nombres:
+			producto = frappe.get_doc({"doctype": "Producto", "nombre_del_producto": nombre})
+			producto.flags.ignore_mandatory = True
+			producto.insert(ignore_permissions=True)
+
+		reconstruir_indice()
+
+		with patch.object(search_service, "MAX_CANDIDATOS", 2):
+			resultados = buscar_productos(sufijo, limit=3)
+
+		self.assertEqual(frappe.db.get_value("Producto", resultados[0], "nombre_del_producto"), nombres[0])
+		self.assertEqual(len(resultados), 3)
+
+	@unittest.skipUnless(BENCHMARKS, "Benchmark opcional: definir ENDERSUITE_BENCHMARKS=1")
+	def test_benchmark_busqueda_catalogo_grande(self):
+		"""Reporta la latencia p95 de búsqueda sobre un catálogo de 100k productos"""
+		palabras = ["agua", "leche", "pan", "jabon", "cafe", "arroz", "frijol", "aceite",
+					"galleta", "refresco", "queso", "azucar", "harina", "atun", "sopa"]
+		marcas = ["norte", "sol", "valle", "rio", "monte", "lago", "sierra", "costa"]
+		lote = frappe.generate_hash(length=6)
+		ahora = now_datetime()
+
+		# Sin estos productos el índice queda desfasado: se borra y se reconstruye en la siguiente búsqueda
+		self.addCleanup(borrar_indice)
+		self.addCleanup(frappe.db.delete, "Producto", {"name": ["like", f"BENCH-{lote}-%"]})
+
+		valores = []
+		for i in range(PRODUCTOS_BENCHMARK):
+			nombre = f"{random.choice(palabras)} {random.choice(marcas)} {i} {lote}"
+			valores.append((
+				f"BENCH-{lote}-{i}", nombre, f"SKU-{lote}-{i}", f"{lote}{i:08d}",
+				ahora, ahora, "Administrator", "Administrator"
+			))
+		frappe.db.bulk_insert(
+			"Producto",
+			["name", "nombre_del_producto", "sku", "codigo_barras",
+			 "creation", "modified", "owner", "modified_by"],
+			valores,
+			chunk_size=5000
+		)
+
+		reconstruir_indice()
+
+		consultas = [random.choice(palabras)[:random.randint(2, 5)] for _ in range(150)]
+		consultas += [f"{random.choice(palabras)} {random.choice(marcas)}" for _ in range(150)]
+		consultas += [f"{lote}{random.randrange(PRODUCTOS_BENCHMARK):08d}" for _ in range(100)]
+
+		duraciones = []
+		for consulta in consultas:
+			inicio = time.monotonic()
+			resultados = buscar_productos(consulta, limit=20)
+			duraciones.append(time.monotonic() - inicio)
+			self.assertTrue(resultados, consulta)
+
+		duraciones.sort()
+		p95 = duraciones[int(len(duraciones) * 0.95) - 1] * 1000
+		print(f"Búsqueda en {PRODUCTOS_BENCHMARK} productos: p95 {p95:.1f} ms, "
+			f"mediana {duraciones[len(duraciones) // 2] * 1000:.1f} ms")
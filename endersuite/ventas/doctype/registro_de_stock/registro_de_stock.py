@@ -0,0 +1,24 @@
+# Copyright (c) 2025, RenderCores.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+
+class RegistrodeStock(Document):
+	"""
+	Bitácora de solo inserción de cada cambio de existencia por almacén.
+	Las cancelaciones se registran como nuevas entradas con es_cancelacion = 1.
+	"""
+
+	def validate(self):
+		if not self.is_new():
+			frappe.throw(_("El Registro de Stock no se puede modificar"))
+
+	def on_trash(self):
+		frappe.throw(_("El Registro de Stock no se puede eliminar"))
+
+
+def on_doctype_update():
+	frappe.db.add_index("Registro de Stock", ["producto", "almacen", "fecha"])
@@ -0,0 +1,17 @@
+# Copyright (c) 2025, RenderCores.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class ResumendeVentas(Document):
+	"""
+	Ventas agregadas por día, hora, perfil de POS y producto o método de pago.
+	Mantenido por Nota de Venta y Reembolso (ver sales_facts_service).
+	"""
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Resumen de Ventas", ["tipo", "fecha"])
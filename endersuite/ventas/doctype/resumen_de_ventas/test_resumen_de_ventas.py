@@ -0,0 +1,106 @@
+# Copyright (c) 2025, RenderCores.com and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from endersuite.ventas.page.escritorio_ventas import escritorio_ventas
+from endersuite.ventas.services import sales_facts_service
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+
+
+class IntegrationTestResumendeVentas(IntegrationTestCase):
+	"""
+	Integration tests for ResumendeVentas.
+	Use this class for testing interactions between multiple components.
+	"""
+
+	def crear_nota(self, perfil_pos):
+		return frappe.get_doc({
+			"doctype": "Nota de Venta",
+			"name": frappe.generate_hash(length=10),
+			"perfil_pos": perfil_pos,
+			"fecha_y_hora_de_venta": "2020-02-03 10:15:00",
+			"total_final": 150,
+			"tabla_de_productos": [
+				{"producto": "Producto Resumen A", "cantidad": 2, "total_linea": 100},
+				{"producto": "Producto Resumen B", "cantidad": 1, "total_linea": 50}
+			],
+			"metodos_pago_nota": [
+				{"metodo": "Efectivo", "monto": 100},
+				{"metodo": "Tarjeta", "monto": 50}
+			]
+		})
+
+	def resumen(self, perfil_pos):
+		filas = frappe.get_all(
+			"Resumen de Ventas",
+			filters={"perfil_pos": perfil_pos},
+			fields=["tipo", "fecha", "hora", "producto", "metodo", "notas", "cantidad", "importe"]
+		)
+		return {(f.tipo, f.producto or f.metodo): (f.notas, f.cantidad, f.importe) for f in filas}
+
+	def test_resumen_incremental_igual_a_reconstruido(self):
+		"""Enviar y cancelar notas deja el mismo resumen que reconstruirlo desde las notas"""
+		perfil_pos = frappe.generate_hash(length=10)
+		primera = self.crear_nota(perfil_pos)
+		segunda = self.crear_nota(perfil_pos)
+
+		with self.assertQueryCount(1):
+			sales_facts_service.registrar_nota(primera)
+		sales_facts_service.registrar_nota(segunda)
+		sales_facts_service.revertir_nota(segunda)
+
+		incremental = self.resumen(perfil_pos)
+		self.assertEqual(incremental[("Nota", None)], (1, 0, 150))
+		self.assertEqual(incremental[("Producto", "Producto Resumen A")], (0, 2, 100))
+		self.assertEqual(incremental[("Metodo", "Tarjeta")], (0, 0, 50))
+
+		# Solo la primera nota queda enviada
+		primera.docstatus = 1
+		primera.db_insert()
+		for fila in primera.get_all_children():
+			fila.db_insert()
+		sales_facts_service.reconstruir_resumen("2020-02-03", "2020-02-03")
+
+		self.assertEqual(self.resumen(perfil_pos), incremental)
+
+	def test_efectivo_descuenta_cambio(self):
+		"""El efectivo del resumen es lo recibido menos el cambio, igual que en la sesión POS"""
+		perfil_pos = frappe.generate_hash(length=10)
+		nota = self.crear_nota(perfil_pos)
+		nota.metodos_pago_nota[0].monto = 200
+		nota.cambio = 100
+
+		sales_facts_service.registrar_nota(nota)
+		incremental = self.resumen(perfil_pos)
+		self.assertEqual(incremental[("Metodo", "Efectivo")], (0, 0, 100))
+		self.assertEqual(incremental[("Metodo", "Tarjeta")], (0, 0, 50))
+
+		nota.docstatus = 1
+		nota.db_insert()
+		for fila in nota.get_all_children():
+			fila.db_insert()
+		sales_facts_service.reconstruir_resumen("2020-02-03", "2020-02-03")
+
+		self.assertEqual(self.resumen(perfil_pos), incremental)
+
+	def test_dashboard_en_cache(self):
+		"""El payload del escritorio se calcula una vez y se sirve desde Redis hasta invalidarlo"""
+		escritorio_ventas._borrar_dashboard()
+
+		data = escritorio_ventas.get_dashboard_data()
+		with self.assertQueryCount(0):
+			self.assertEqual(escritorio_ventas.get_dashboard_data(), data)
+
+		escritorio_ventas._borrar_dashboard()
+		with self.assertRaises(AssertionError):
+			with self.assertQueryCount(0):
+				escritorio_ventas.get_dashboard_data()
@@ -38,58 +38,16 @@ class SesionPOS(Document):
 		if self.estado != "Cerrada":
 			frappe.throw(_("Solo puede enviar sesiones cerradas"))
 		
-		# Calcular diferencia de arqueo
-		self.diferencia = (self.efectivo_contado or 0) - ((self.total_efectivo_sistema or 0) + (self.monto_apertura or 0))
+		# Calcular diferencia de arqueo contra el efectivo esperado (ventas - cambio - reembolsos)
+		self.diferencia = (self.efectivo_contado or 0) - ((self.monto_apertura or 0) + (self.efectivo_acumulado or 0))
 	
 	def calcular_totales_sistema(self):
-		"""Calcular totales por método de pago desde las ventas válidas (no canceladas)"""
-		if not self.ventas:
-			# Resetear totales si no hay ventas
-			self.total_efectivo_sistema = 0
-			self.total_tarjeta_sistema = 0
-			self.total_transferencia_sistema = 0
-			self.total_cheque_sistema = 0
-			self.total_general_sistema = 0
-			return
+		"""Calcular totales por método de pago desde los acumulados (ventas enviadas menos reembolsos)"""
+		from endersuite.ventas.services.session_service import get_acumulados_sesion
 
-		# Obtener todas las notas de venta válidas (solo enviadas, no canceladas)
-		notas_venta = []
-		for v in self.ventas:
-			if v.nota_de_venta:
-				# Verificar que la nota existe y no está cancelada
-				docstatus = frappe.db.get_value("Nota de Venta", v.nota_de_venta, "docstatus")
-				if docstatus == 1:  # Solo notas enviadas (no borradores ni canceladas)
-					notas_venta.append(v.nota_de_venta)
-
-		if not notas_venta:
-			# Si no hay ventas válidas, resetear totales
-			self.total_efectivo_sistema = 0
-			self.total_tarjeta_sistema = 0
-			self.total_transferencia_sistema = 0
-			self.total_cheque_sistema = 0
-			self.total_general_sistema = 0
-			return
-
-		# Calcular totales reales desde las notas de venta
-		totales_por_metodo = {}
-		total_general = 0
-
-		for nota_name in notas_venta:
-			# Obtener métodos de pago de cada nota
-			metodos = frappe.get_all(
-				"Metodos de Pago Nota",
-				filters={"parent": nota_name, "parenttype": "Nota de Venta"},
-				fields=["metodo", "monto"]
-			)
-
-			for metodo_pago in metodos:
-				metodo = metodo_pago.metodo
-				monto = metodo_pago.monto or 0
-
-				if metodo not in totales_por_metodo:
-					totales_por_metodo[metodo] = 0
-				totales_por_metodo[metodo] += monto
-				total_general += monto
+		# Los mismos acumulados que el POS usa para el efectivo disponible
+		totales = get_acumulados_sesion(None if self.is_new() else self.name)
+		totales_por_metodo = totales.metodos
 
 		# Asignar totales a los campos correspondientes
 		# Mapear métodos de pago conocidos a los campos del doctype
@@ -97,4 +55,4 @@ class SesionPOS(Document):
 		self.total_tarjeta_sistema = totales_por_metodo.get("Tarjeta", 0) + totales_por_metodo.get("Tarjeta de Crédito", 0) + totales_por_metodo.get("Tarjeta de Débito", 0)
 		self.total_transferencia_sistema = totales_por_metodo.get("Transferencia", 0) + totales_por_metodo.get("Transferencia Bancaria", 0)
 		self.total_cheque_sistema = totales_por_metodo.get("Cheque", 0)
-		self.total_general_sistema = total_general
+		self.total_general_sistema = totales.total_pagado
@@ -1,9 +1,199 @@
 # Copyright (c) 2025, RenderCores.com and contributors
 # For license information, please see license.txt
 
-# import frappe
+import os
+import time
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from endersuite.ventas.services.session_service import (
+	calcular_efectivo_esperado,
+	conciliar_acumulados_sesion,
+	get_acumulados_sesion,
+	get_efectivo_acumulado,
+	get_totales_sesion,
+	get_totales_sesiones,
+	registrar_reembolso,
+	registrar_venta,
+	remover_venta_de_sesion,
+	revertir_venta,
+)
+from endersuite.ventas.services.pos_service import get_efectivo_disponible, get_session_summary
+
+# Las mediciones de tiempo solo corren con ENDERSUITE_BENCHMARKS=1: en CI el reloj no es confiable
+BENCHMARKS = bool(os.environ.get("ENDERSUITE_BENCHMARKS"))
+
+
+def crear_sesion_con_ventas(num_ventas, monto_apertura=500):
+	"""Inserta una sesión y sus notas directamente, sin validaciones, para medir agregaciones"""
+	sesion = frappe.get_doc({
+		"doctype": "Sesion POS",
+		"name": frappe.generate_hash(length=10),
+		"estado": "Abierta",
+		"monto_apertura": monto_apertura
+	})
+	sesion.db_insert()
+
+	for i in range(num_ventas):
+		nota = frappe.get_doc({
+			"doctype": "Nota de Venta",
+			"name": frappe.generate_hash(length=12),
+			"sesion_pos": sesion.name,
+			"docstatus": 1,
+			"total_final": 90,
+			"total_pagado": 100,
+			"cambio": 10
+		})
+		nota.db_insert()
+
+		# Mitad de las notas con pago mixto para verificar que el cambio no se duplica
+		pagos = [("Efectivo", 100)] if i % 2 == 0 else [("Efectivo", 60), ("Tarjeta", 40)]
+		for idx, (metodo, monto) in enumerate(pagos, start=1):
+			frappe.get_doc({
+				"doctype": "Metodos de Pago Nota",
+				"name": frappe.generate_hash(length=12),
+				"parent": nota.name,
+				"parenttype": "Nota de Venta",
+				"parentfield": "metodos_pago_nota",
+				"idx": idx,
+				"metodo": metodo,
+				"monto": monto
+			}).db_insert()
+
+	return sesion
+
 
 class TestSesionPOS(FrappeTestCase):
-	pass
+	def test_totales_sesion(self):
+		sesion = crear_sesion_con_ventas(4)
+		totales = get_totales_sesion(sesion.name)
+
+		self.assertEqual(totales.num_ventas, 4)
+		self.assertEqual(totales.total_ventas, 360)
+		self.assertEqual(totales.cambio, 40)
+		self.assertEqual(totales.metodos["Efectivo"], 320)
+		self.assertEqual(totales.metodos["Tarjeta"], 80)
+		self.assertEqual(calcular_efectivo_esperado(totales, sesion.monto_apertura), 500 + 320 - 40)
+
+	def test_totales_varias_sesiones(self):
+		sesiones = [crear_sesion_con_ventas(n) for n in (1, 3)]
+		totales = get_totales_sesiones([s.name for s in sesiones] + ["sesion-inexistente"])
+
+		self.assertEqual(totales[sesiones[0].name].num_ventas, 1)
+		self.assertEqual(totales[sesiones[1].name].num_ventas, 3)
+		self.assertEqual(totales["sesion-inexistente"].num_ventas, 0)
+
+	def test_benchmark_consultas_constantes(self):
+		"""El número de consultas no depende del número de ventas de la sesión"""
+		for num_ventas in (1, 50, 800):
+			sesion = crear_sesion_con_ventas(num_ventas)
+
+			with self.assertQueryCount(1):
+				totales = get_totales_sesion(sesion.name)
+			self.assertEqual(totales.num_ventas, num_ventas)
+
+			if BENCHMARKS:
+				inicio = time.monotonic()
+				get_totales_sesion(sesion.name)
+				duracion = time.monotonic() - inicio
+				print(f"Sesión con {num_ventas} ventas: 1 consulta, {duracion * 1000:.1f} ms")
+
+	def test_acumulados_incrementales(self):
+		sesion = crear_sesion_con_ventas(0)
+		nota = frappe._dict({
+			"sesion_pos": sesion.name,
+			"total_final": 90,
+			"cambio": 10,
+			"metodos_pago_nota": [frappe._dict({"metodo": "Efectivo", "monto": 100})]
+		})
+
+		registrar_venta(nota)
+		registrar_venta(nota)
+		self.assertEqual(get_efectivo_acumulado(sesion.name), 500 + 2 * 90)
+		self.assertEqual(frappe.db.get_value("Sesion POS", sesion.name, "num_tickets"), 2)
+
+		revertir_venta(nota)
+		self.assertEqual(get_efectivo_acumulado(sesion.name), 500 + 90)
+
+		with self.assertQueryCount(1):
+			get_efectivo_acumulado(sesion.name)
+
+	def test_conciliacion_reporta_y_corrige_deriva(self):
+		# Las notas insertadas sin hooks dejan los acumulados desfasados
+		sesion = crear_sesion_con_ventas(4)
+
+		resultado = conciliar_acumulados_sesion(sesion.name)
+		self.assertFalse(resultado["consistente"])
+		self.assertEqual(resultado["deriva"]["num_tickets"], 4)
+		self.assertFalse(resultado["corregido"])
+
+		conciliar_acumulados_sesion(sesion.name, corregir=1)
+		self.assertTrue(conciliar_acumulados_sesion(sesion.name)["consistente"])
+		self.assertEqual(get_efectivo_acumulado(sesion.name), 500 + 320 - 40)
+
+	def test_reembolsos_en_efectivo_disponible_y_cierre(self):
+		"""El efectivo durante la venta y el esperado al cierre salen de los mismos acumulados"""
+		sesion = crear_sesion_con_ventas(0)
+		registrar_venta(frappe._dict({
+			"sesion_pos": sesion.name,
+			"total_final": 90,
+			"cambio": 10,
+			"metodos_pago_nota": [frappe._dict({"metodo": "Efectivo", "monto": 100})]
+		}))
+		registrar_reembolso(frappe._dict({
+			"sesion_pos": sesion.name,
+			"total_reembolso": 30,
+			"metodo_devolucion": "Efectivo"
+		}))
+
+		esperado = 500 + 100 - 10 - 30
+		self.assertEqual(get_efectivo_disponible(sesion.name)["efectivo_disponible"], esperado)
+		self.assertEqual(get_session_summary(sesion.name)["monto_esperado"], esperado)
+
+		totales = get_acumulados_sesion(sesion.name)
+		self.assertEqual(totales.reembolsos, 30)
+		self.assertEqual(calcular_efectivo_esperado(totales, 500), esperado)
+
+	def test_remover_venta_no_toca_acumulados(self):
+		sesion = crear_sesion_con_ventas(0)
+		nota = frappe._dict({
+			"name": frappe.generate_hash(length=12),
+			"sesion_pos": sesion.name,
+			"total_final": 90,
+			"cambio": 10,
+			"metodos_pago_nota": [frappe._dict({"metodo": "Efectivo", "monto": 100})]
+		})
+		frappe.get_doc({
+			"doctype": "Ventas Sesion POS",
+			"name": frappe.generate_hash(length=12),
+			"parent": sesion.name,
+			"parenttype": "Sesion POS",
+			"parentfield": "ventas",
+			"nota_de_venta": nota.name,
+			"total": 90
+		}).db_insert()
+		registrar_venta(nota)
+		registrar_venta(nota)
+
+		revertir_venta(nota)
+		remover_venta_de_sesion(sesion.name, nota.name)
+
+		self.assertFalse(frappe.db.exists("Ventas Sesion POS", {"parent": sesion.name}))
+		self.assertEqual(get_efectivo_acumulado(sesion.name), 500 + 90)
+
+	def test_formulario_viejo_no_sobrescribe_acumulados(self):
+		"""Guardar una sesión cargada antes de una venta falla en lugar de pisar los acumulados"""
+		sesion = crear_sesion_con_ventas(0)
+		formulario = frappe.get_doc("Sesion POS", sesion.name)
+
+		registrar_venta(frappe._dict({
+			"sesion_pos": sesion.name,
+			"total_final": 90,
+			"cambio": 10,
+			"metodos_pago_nota": [frappe._dict({"metodo": "Efectivo", "monto": 100})]
+		}))
+
+		with self.assertRaises(frappe.TimestampMismatchError):
+			formulario.save(ignore_permissions=True)
+		self.assertEqual(frappe.db.get_value("Sesion POS", sesion.name, "num_tickets"), 1)
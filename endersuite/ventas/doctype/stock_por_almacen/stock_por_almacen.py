@@ -0,0 +1,17 @@
+# Copyright (c) 2025, RenderCores.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StockporAlmacen(Document):
+	"""
+	Existencia de un producto en un almacén.
+	Mantenido por Movimiento de Stock (ver stock_service.aplicar_deltas_stock).
+	"""
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique("Stock por Almacen", ["producto", "almacen"], constraint_name="unique_producto_almacen")
@@ -8,6 +8,13 @@ frappe.pages['escritorio_ventas'].on_page_load = function (wrapper) {
     // Guardar referencia
     wrapper.page = page;
     wrapper.escritorio_initialized = false;
+
+    // El servidor avisa tras cada venta; solo se piden los datos si la página está visible
+    frappe.realtime.on('escritorio_ventas_actualizado', function () {
+        if (frappe.get_route_str() === 'escritorio_ventas') {
+            reload_dashboard_data(page);
+        }
+    });
 }
 
 frappe.pages['escritorio_ventas'].on_page_show = function (wrapper) {
@@ -23,6 +30,7 @@ function refresh_dashboard(page) {
     frappe.call({
         method: "endersuite.ventas.services.pos_service.get_active_session",
         callback: function (session_r) {
+            page.active_session = session_r.message;
             frappe.call({
                 method: "endersuite.ventas.page.escritorio_ventas.escritorio_ventas.get_dashboard_data",
                 callback: function (r) {
@@ -35,6 +43,19 @@ function refresh_dashboard(page) {
     });
 }
 
+function reload_dashboard_data(page) {
+    // Ya recalculado en caché por el servidor; se redibuja con la sesión conocida
+    frappe.call({
+        method: "endersuite.ventas.page.escritorio_ventas.escritorio_ventas.get_dashboard_data",
+        callback: function (r) {
+            if (r.message) {
+                page.main.empty();
+                render_dashboard(page, r.message, page.active_session);
+            }
+        }
+    });
+}
+
 function render_dashboard(page, data, active_session) {
     let $container = $(`<div class="dashboard-container"></div>`).appendTo(page.main);
 
@@ -2,74 +2,125 @@ import frappe
 from frappe import _
 from frappe.utils import add_days, getdate, nowdate, formatdate, get_first_day, get_last_day
 
+# Payload del escritorio en Redis, por día; el TTL acota lo desactualizado si se pierde un evento
+CLAVE_DASHBOARD = "endersuite:escritorio_ventas"
+TTL_DASHBOARD = 60
+
+# Evento realtime que avisa a los escritorios abiertos que hay datos nuevos; no lleva
+# el payload, cada cliente lo vuelve a pedir con get_dashboard_data y sus permisos
+EVENTO_DASHBOARD = "escritorio_ventas_actualizado"
+
+# Roles de la página escritorio_ventas
+ROLES_DASHBOARD = ("System Manager", "Sales Manager", "Sales User")
+
+
+def _clave_dashboard(fecha=None):
+    return f"{CLAVE_DASHBOARD}:{getdate(fecha or nowdate())}"
+
+
 @frappe.whitelist()
 def get_dashboard_data():
+    """
+    Payload del Escritorio de Ventas (métricas, productos top y tendencia de 30 días).
+    Se calcula una vez por sitio y día y se comparte entre todos los usuarios
+    hasta que una venta lo invalida o vence el TTL.
+    """
+    frappe.only_for(ROLES_DASHBOARD)
+
+    data = frappe.cache.get_value(_clave_dashboard())
+    if data is None:
+        data = _calcular_dashboard()
+        frappe.cache.set_value(_clave_dashboard(), data, expires_in_sec=TTL_DASHBOARD)
+    return data
+
+
+def _calcular_dashboard():
     data = {}
-    
+
     # Date ranges
-    today = nowdate()
+    today = getdate(nowdate())
     first_day_month = get_first_day(today)
     last_day_month = get_last_day(today)
-    
-    # Metrics: Today
-    data['sales_today'] = frappe.db.sql("""
-        SELECT SUM(total_final) FROM `tabNota de Venta`
-        WHERE DATE(fecha_y_hora_de_venta) = %s AND docstatus = 1
-    """, (today,))[0][0] or 0
-    
-    data['orders_today'] = frappe.db.sql("""
-        SELECT COUNT(*) FROM `tabNota de Venta`
-        WHERE DATE(fecha_y_hora_de_venta) = %s AND docstatus = 1
-    """, (today,))[0][0] or 0
-
-    # Metrics: This Month
-    data['sales_month'] = frappe.db.sql("""
-        SELECT SUM(total_final) FROM `tabNota de Venta`
-        WHERE DATE(fecha_y_hora_de_venta) BETWEEN %s AND %s AND docstatus = 1
-    """, (first_day_month, last_day_month))[0][0] or 0
-    
-    data['orders_month'] = frappe.db.sql("""
-        SELECT COUNT(*) FROM `tabNota de Venta`
-        WHERE DATE(fecha_y_hora_de_venta) BETWEEN %s AND %s AND docstatus = 1
-    """, (first_day_month, last_day_month))[0][0] or 0
-    
-    # Top Selling Products (This Month)
-    top_products_raw = frappe.db.sql("""
-        SELECT t.producto, SUM(t.cantidad) as qty, SUM(t.total_linea) as amount
-        FROM `tabTabla de Productos` t
-        JOIN `tabNota de Venta` n ON t.parent = n.name
-        WHERE DATE(n.fecha_y_hora_de_venta) BETWEEN %s AND %s
-        AND n.docstatus = 1
-        GROUP BY t.producto
+
+    # Todo se lee de Resumen de Ventas (sales_facts_service) con rangos sobre `fecha`
+    # Metrics: Today and This Month (filas tipo Nota)
+    totals = frappe.db.sql("""
+        SELECT
+            SUM(CASE WHEN fecha = %(today)s THEN importe ELSE 0 END) AS sales_today,
+            SUM(CASE WHEN fecha = %(today)s THEN notas ELSE 0 END) AS orders_today,
+            SUM(importe) AS sales_month,
+            SUM(notas) AS orders_month
+        FROM `tabResumen de Ventas`
+        WHERE tipo = 'Nota' AND fecha BETWEEN %(first)s AND %(last)s
+    """, {"today": today, "first": first_day_month, "last": last_day_month}, as_dict=True)[0]
+
+    data['sales_today'] = totals.sales_today or 0
+    data['orders_today'] = int(totals.orders_today or 0)
+    data['sales_month'] = totals.sales_month or 0
+    data['orders_month'] = int(totals.orders_month or 0)
+
+    # Top Selling Products (This Month), con la imagen en la misma consulta
+    data['top_products'] = frappe.db.sql("""
+        SELECT r.producto, SUM(r.cantidad) as qty, SUM(r.importe) as amount, p.imagen
+        FROM `tabResumen de Ventas` r
+        LEFT JOIN `tabProducto` p ON p.name = r.producto
+        WHERE r.tipo = 'Producto' AND r.fecha BETWEEN %s AND %s
+        GROUP BY r.producto, p.imagen
         ORDER BY amount DESC
         LIMIT 5
     """, (first_day_month, last_day_month), as_dict=True)
-    
-    # Enrich with product images
-    data['top_products'] = []
-    for product in top_products_raw:
-        product_doc = frappe.get_doc("Producto", product.producto)
-        data['top_products'].append({
-            'producto': product.producto,
-            'qty': product.qty,
-            'amount': product.amount,
-            'imagen': product_doc.imagen if hasattr(product_doc, 'imagen') else None
-        })
-    
-    
+
     # Sales Trend (Last 30 Days)
     thirty_days_ago = add_days(today, -30)
     sales_trend = frappe.db.sql("""
-        SELECT DATE(fecha_y_hora_de_venta) as date, SUM(total_final) as total
-        FROM `tabNota de Venta`
-        WHERE DATE(fecha_y_hora_de_venta) >= %s AND docstatus = 1
-        GROUP BY DATE(fecha_y_hora_de_venta)
-        ORDER BY DATE(fecha_y_hora_de_venta) ASC
+        SELECT fecha as date, SUM(importe) as total
+        FROM `tabResumen de Ventas`
+        WHERE tipo = 'Nota' AND fecha >= %s
+        GROUP BY fecha
+        HAVING SUM(notas) > 0
+        ORDER BY fecha ASC
     """, (thirty_days_ago,), as_dict=True)
-    
+
     data['sales_trend'] = {
         'labels': [formatdate(d.date) for d in sales_trend],
         'values': [d.total for d in sales_trend]
     }
 
     return data
+
+
+# ============================================================================
+# INVALIDACIÓN
+# ============================================================================
+
+def invalidar_dashboard(doc=None, method=None):
+    """
+    Descarta el payload en caché y programa su recálculo al confirmar la venta.
+    Llamado desde hooks on_submit y on_cancel de Nota de Venta.
+
+    El recálculo es un job deduplicado: en horas pico muchas ventas seguidas
+    generan un solo recálculo y un solo evento para todos los escritorios.
+    """
+    frappe.db.after_commit.add(_borrar_dashboard)
+    frappe.enqueue(
+        "endersuite.ventas.page.escritorio_ventas.escritorio_ventas.publicar_dashboard",
+        queue="short",
+        job_id=f"escritorio_ventas::{frappe.local.site}",
+        deduplicate=True,
+        enqueue_after_commit=True
+    )
+
+
+def _borrar_dashboard():
+    frappe.cache.delete_value(_clave_dashboard())
+
+
+def publicar_dashboard():
+    """
+    Recalcula el payload, lo guarda en caché y avisa a los escritorios abiertos.
+    El evento va a todo el sitio, así que solo lleva la fecha: los datos se leen
+    con get_dashboard_data, que valida los roles de la página.
+    """
+    data = _calcular_dashboard()
+    frappe.cache.set_value(_clave_dashboard(), data, expires_in_sec=TTL_DASHBOARD)
+    frappe.publish_realtime(EVENTO_DASHBOARD, {"fecha": str(getdate(nowdate()))})
@@ -28,6 +28,7 @@ class POSApp {
 		this.page_content = $(this.page.body);
 		this.sesion = null;
 		this.etapa = 'apertura'; // apertura | productos | cierre
+		this.cola = new POSColaVentas();
 
 		this.init();
 	}
@@ -133,6 +134,10 @@ class POSApp {
 	setup_realtime() {
 		// Suscribirse a actualizaciones de stock
 		frappe.realtime.on('stock_updated', (data) => {
+			// Ignorar movimientos de otros almacenes
+			if (data.almacen && this.sesion && data.almacen !== this.sesion.almacen) {
+				return;
+			}
 			if (this.productos) {
 				this.productos.update_stock(data.producto, data.cantidad_disponible);
 			}
@@ -147,7 +152,15 @@ class POSApp {
 			if (this.productos && this.etapa === 'productos') {
 				this.productos.sync_stock();
 			}
+			this.cola.sincronizar();
 		}, 30000);
+
+		// Enviar ventas encoladas en cuanto regrese la conexión
+		if (!this.on_online) {
+			this.on_online = () => this.cola.sincronizar();
+			window.addEventListener('online', this.on_online);
+		}
+		this.cola.sincronizar();
 	}
 
 	set_sesion(sesion) {
@@ -459,18 +472,10 @@ class POSProductos {
 				return;
 			}
 
-			const r = await frappe.call({
-				method: 'endersuite.ventas.services.pos_service.get_productos_pos',
-				args: {
-					almacen: this.parent.sesion.almacen,
-					lista_de_precios: this.parent.sesion.lista_de_precios
-				}
-			});
-
-			if (r.message) {
-				this.productos = r.message;
-				this.render_productos();
-			}
+			// Catálogo local: tras la primera carga solo se descargan los cambios
+			this.catalogo = new POSCatalogo(this.parent.sesion.lista_de_precios, this.parent.sesion.almacen);
+			this.productos = await this.catalogo.cargar();
+			this.render_productos();
 		} catch (error) {
 			console.error('Error loading products:', error);
 			frappe.msgprint(__('Error al cargar productos: ') + (error.message || error));
@@ -488,7 +493,8 @@ class POSProductos {
 		if (search) {
 			productos_filtrados = productos_filtrados.filter(p =>
 				p.nombre.toLowerCase().includes(search) ||
-				(p.sku || '').toLowerCase().includes(search)
+				(p.sku || '').toLowerCase().includes(search) ||
+				(p.codigo_barras || '').toLowerCase() === search
 			);
 		}
 
@@ -497,6 +503,9 @@ class POSProductos {
 			productos_filtrados = productos_filtrados.filter(p => p.categoria === categoria);
 		}
 
+		// El catálogo local puede tener miles de productos; solo se pintan los primeros
+		productos_filtrados = productos_filtrados.slice(0, 200);
+
 		grid.empty();
 		productos_filtrados.forEach(producto => {
 			const sin_stock = producto.mantener_stock && producto.cantidad_disponible <= 0;
@@ -812,25 +821,18 @@ class POSProductos {
 	}
 
 	async sync_stock() {
-		// Sincronizar stock de productos en carrito
-		if (this.carrito.length === 0) return;
-
-		const productos = this.carrito.map(item => item.producto);
+		// Aplicar solo los productos, precios y existencias que cambiaron
+		if (!this.catalogo) return;
 
 		try {
-			const r = await frappe.call({
-				method: 'endersuite.ventas.services.pos_service.get_stock_actual',
-				args: {
-					productos: productos,
-					almacen: this.parent.sesion.almacen
-				}
-			});
-
-			if (r.message) {
-				Object.entries(r.message).forEach(([producto, stock]) => {
-					this.update_stock(producto, stock);
-				});
+			const cambios = await this.catalogo.sincronizar();
+			if (!cambios.completo && !cambios.productos.length && !cambios.eliminados.length) {
+				return;
 			}
+
+			this.productos = this.catalogo.lista();
+			cambios.productos.forEach(p => this.update_stock(p.name, p.cantidad_disponible));
+			this.render_productos();
 		} catch (error) {
 			console.error('Error syncing stock:', error);
 		}
@@ -1230,43 +1232,57 @@ class POSPago {
 		const imprimir_ticket = this.dialog.get_value('imprimir_ticket');
 
 		try {
-			const r = await frappe.call({
-				method: 'endersuite.ventas.services.pos_service.create_sale',
-				args: {
-					sesion_pos: this.parent.sesion.name,
-					productos: this.carrito_data.carrito,
-					metodos_pago: this.metodos_pago,
-					total: this.carrito_data.totales.total,
-					cliente: this.cliente,
-					imprimir_ticket: imprimir_ticket ? 1 : 0
-				},
-				freeze: true,
-				freeze_message: __('Procesando venta...')
+			// La venta se guarda localmente antes de enviarla; si no hay conexión
+			// se queda en la cola y se sincroniza después sin duplicarse
+			const venta = await this.parent.cola.encolar({
+				sesion_pos: this.parent.sesion.name,
+				productos: this.carrito_data.carrito,
+				metodos_pago: this.metodos_pago,
+				cliente: this.cliente,
+				imprimir_ticket: imprimir_ticket ? 1 : 0,
+				fecha_y_hora_de_venta: frappe.datetime.now_datetime()
 			});
 
-			if (r.message) {
-				// Cerrar diálogo
-				this.dialog.hide();
+			const resultado = (await this.parent.cola.sincronizar())[venta.clave];
 
-				// Limpiar carrito pero mantener cliente
-				this.parent.productos.carrito = [];
-				this.parent.productos.render_carrito();
-				this.parent.productos.save_state();
+			if (resultado && resultado.estado === 'error') {
+				frappe.msgprint({
+					title: __('Venta no registrada'),
+					message: resultado.mensaje,
+					indicator: 'red'
+				});
+				return;
+			}
 
-				// Si marcó imprimir, mostrar ticket para impresión
-				if (imprimir_ticket) {
-					this.parent.show_ticket(r.message);
-				} else {
-					// Solo mostrar mensaje de éxito
-					frappe.show_alert({
-						message: __('Venta registrada exitosamente: {0}', [r.message.name]),
-						indicator: 'green'
-					}, 5);
-				}
+			// Cerrar diálogo
+			this.dialog.hide();
 
-				// Actualizar sesión
-				this.parent.check_session();
+			// Limpiar carrito pero mantener cliente
+			this.parent.productos.carrito = [];
+			this.parent.productos.render_carrito();
+			this.parent.productos.save_state();
+
+			if (!resultado) {
+				frappe.show_alert({
+					message: __('Sin conexión: la venta se guardó y se enviará al reconectar'),
+					indicator: 'orange'
+				}, 5);
+				return;
 			}
+
+			// Si marcó imprimir, mostrar ticket para impresión
+			if (imprimir_ticket && resultado.venta) {
+				this.parent.show_ticket(resultado.venta);
+			} else {
+				// Solo mostrar mensaje de éxito
+				frappe.show_alert({
+					message: __('Venta registrada exitosamente: {0}', [resultado.nota]),
+					indicator: 'green'
+				}, 5);
+			}
+
+			// Actualizar sesión
+			this.parent.check_session();
 		} catch (error) {
 			console.error('Error creating sale:', error);
 			frappe.msgprint(__('Error al procesar la venta'));
@@ -1398,6 +1414,259 @@ class POSTicket {
 	}
 }
 
+// ============================================================================
+// COMPONENTE: CATÁLOGO LOCAL
+// ============================================================================
+
+class POSCatalogo {
+	// Copia completa del catálogo en IndexedDB; get_catalog_changes devuelve
+	// solo lo modificado desde el último token.
+	constructor(lista_de_precios, almacen) {
+		this.lista_de_precios = lista_de_precios;
+		this.almacen = almacen;
+		this.db_name = 'endersuite_pos_catalogo';
+		this.token = null;
+		this.productos = new Map();
+		this.db = null;
+	}
+
+	abrir() {
+		if (!this.db) {
+			this.db = new Promise((resolve, reject) => {
+				const request = indexedDB.open(this.db_name, 1);
+				request.onupgradeneeded = () => {
+					const db = request.result;
+					if (!db.objectStoreNames.contains('productos')) {
+						db.createObjectStore('productos', { keyPath: 'name' });
+					}
+					if (!db.objectStoreNames.contains('meta')) {
+						db.createObjectStore('meta', { keyPath: 'clave' });
+					}
+				};
+				request.onsuccess = () => resolve(request.result);
+				request.onerror = () => {
+					this.db = null;
+					reject(request.error);
+				};
+			});
+		}
+		return this.db;
+	}
+
+	async leer() {
+		const db = await this.abrir();
+		return new Promise((resolve, reject) => {
+			const tx = db.transaction(['productos', 'meta'], 'readonly');
+			const meta = tx.objectStore('meta').get('estado');
+			const productos = tx.objectStore('productos').getAll();
+			tx.oncomplete = () => {
+				const estado = meta.result;
+				// Un catálogo de otra lista o almacén no sirve: se descarga completo
+				if (!estado || estado.lista_de_precios !== this.lista_de_precios || estado.almacen !== this.almacen) {
+					resolve({ token: null, productos: [] });
+				} else {
+					resolve({ token: estado.token, productos: productos.result || [] });
+				}
+			};
+			tx.onerror = () => reject(tx.error);
+		});
+	}
+
+	async guardar(cambios) {
+		const db = await this.abrir();
+		return new Promise((resolve, reject) => {
+			const tx = db.transaction(['productos', 'meta'], 'readwrite');
+			const store = tx.objectStore('productos');
+			if (cambios.completo) {
+				store.clear();
+			}
+			cambios.productos.forEach(p => store.put(p));
+			cambios.eliminados.forEach(name => store.delete(name));
+			tx.objectStore('meta').put({
+				clave: 'estado',
+				token: cambios.token,
+				lista_de_precios: this.lista_de_precios,
+				almacen: this.almacen
+			});
+			tx.oncomplete = () => resolve();
+			tx.onerror = () => reject(tx.error);
+		});
+	}
+
+	async cargar() {
+		try {
+			const guardado = await this.leer();
+			this.token = guardado.token;
+			guardado.productos.forEach(p => this.productos.set(p.name, p));
+		} catch (error) {
+			// Sin IndexedDB el catálogo vive solo en memoria
+			console.warn('No se pudo leer el catálogo local:', error);
+		}
+		await this.sincronizar();
+		return this.lista();
+	}
+
+	async sincronizar() {
+		const r = await frappe.call({
+			method: 'endersuite.ventas.services.pos_service.get_catalog_changes',
+			args: {
+				since_token: this.token,
+				lista_de_precios: this.lista_de_precios,
+				almacen: this.almacen
+			}
+		});
+		const cambios = r.message;
+
+		if (cambios.completo) {
+			this.productos.clear();
+		}
+		cambios.productos.forEach(p => this.productos.set(p.name, p));
+		cambios.eliminados.forEach(name => this.productos.delete(name));
+		this.token = cambios.token;
+
+		try {
+			await this.guardar(cambios);
+		} catch (error) {
+			console.warn('No se pudo guardar el catálogo local:', error);
+		}
+
+		return cambios;
+	}
+
+	lista() {
+		return Array.from(this.productos.values())
+			.sort((a, b) => (a.nombre || a.name).localeCompare(b.nombre || b.name));
+	}
+}
+
+// ============================================================================
+// COMPONENTE: COLA DE VENTAS OFFLINE
+// ============================================================================
+
+class POSColaVentas {
+	// Ventas cobradas guardadas en IndexedDB con una clave de idempotencia
+	// generada aquí; sync_sales descarta las claves que ya registró.
+	constructor() {
+		this.db_name = 'endersuite_pos';
+		this.store = 'ventas_pendientes';
+		this.tamano_lote = 50;
+		this.db = null;
+		this.en_curso = null;
+	}
+
+	abrir() {
+		if (!this.db) {
+			this.db = new Promise((resolve, reject) => {
+				const request = indexedDB.open(this.db_name, 1);
+				request.onupgradeneeded = () => {
+					const db = request.result;
+					if (!db.objectStoreNames.contains(this.store)) {
+						const store = db.createObjectStore(this.store, { keyPath: 'clave' });
+						store.createIndex('creada', 'creada');
+					}
+				};
+				request.onsuccess = () => resolve(request.result);
+				request.onerror = () => {
+					this.db = null;
+					reject(request.error);
+				};
+			});
+		}
+		return this.db;
+	}
+
+	async transaccion(modo, operacion) {
+		const db = await this.abrir();
+		return new Promise((resolve, reject) => {
+			const tx = db.transaction(this.store, modo);
+			const resultado = operacion(tx.objectStore(this.store));
+			tx.oncomplete = () => resolve(resultado && 'result' in resultado ? resultado.result : undefined);
+			tx.onerror = () => reject(tx.error);
+		});
+	}
+
+	generar_clave() {
+		if (window.crypto && window.crypto.randomUUID) {
+			return window.crypto.randomUUID();
+		}
+		return `${Date.now().toString(36)}-${frappe.utils.get_random(10)}`;
+	}
+
+	async encolar(venta) {
+		const registro = Object.assign({}, venta, {
+			clave: venta.clave || this.generar_clave(),
+			creada: Date.now(),
+			intentos: 0,
+			ultimo_error: null
+		});
+		await this.transaccion('readwrite', store => store.put(registro));
+		return registro;
+	}
+
+	async pendientes() {
+		return (await this.transaccion('readonly', store => store.index('creada').getAll())) || [];
+	}
+
+	async contar() {
+		return (await this.transaccion('readonly', store => store.count())) || 0;
+	}
+
+	sincronizar() {
+		// Una sola sincronización a la vez para no enviar la misma venta dos veces
+		if (!this.en_curso) {
+			this.en_curso = this.enviar_pendientes()
+				.catch(error => {
+					console.error('Error sincronizando cola de ventas:', error);
+					return {};
+				})
+				.finally(() => {
+					this.en_curso = null;
+				});
+		}
+		return this.en_curso;
+	}
+
+	async enviar_pendientes() {
+		const resultados = {};
+		const pendientes = await this.pendientes();
+
+		for (let i = 0; i < pendientes.length; i += this.tamano_lote) {
+			const lote = pendientes.slice(i, i + this.tamano_lote);
+
+			let r;
+			try {
+				r = await frappe.call({
+					method: 'endersuite.ventas.services.pos_service.sync_sales',
+					args: { batch: JSON.stringify(lote) }
+				});
+			} catch (error) {
+				// Sin conexión: las ventas se quedan en la cola
+				console.warn('No se pudo sincronizar la cola de ventas:', error);
+				break;
+			}
+
+			await this.transaccion('readwrite', store => {
+				(r.message || []).forEach(res => {
+					resultados[res.clave] = res;
+					if (res.estado === 'creada' || res.estado === 'duplicada') {
+						store.delete(res.clave);
+					} else {
+						const venta = lote.find(v => v.clave === res.clave);
+						if (venta) {
+							store.put(Object.assign({}, venta, {
+								intentos: venta.intentos + 1,
+								ultimo_error: res.mensaje
+							}));
+						}
+					}
+				});
+			});
+		}
+
+		return resultados;
+	}
+}
+
 // ============================================================================
 // COMPONENTE: CIERRE DE SESIÓN
 // ============================================================================
@@ -1541,6 +1810,18 @@ class POSCierre {
 	}
 
 	async cerrar_sesion(values) {
+		// El corte debe incluir todas las ventas cobradas en esta caja
+		await this.parent.cola.sincronizar();
+		const pendientes = await this.parent.cola.contar();
+		if (pendientes > 0) {
+			frappe.msgprint({
+				title: __('Ventas sin sincronizar'),
+				message: __('Hay {0} ventas guardadas sin conexión. Verifique la conexión antes de cerrar la sesión.', [pendientes]),
+				indicator: 'red'
+			});
+			return;
+		}
+
 		try {
 			const r = await frappe.call({
 				method: 'endersuite.ventas.services.pos_service.close_pos_session',
@@ -0,0 +1,138 @@
+import base64
+import hashlib
+import re
+from datetime import datetime, timezone
+
+import frappe
+from frappe import _
+
+
+# OID x500UniqueIdentifier: el SAT guarda ahí "RFC / RFC del representante"
+OID_RFC = "2.5.4.45"
+
+# Certificados CSD ya leídos en el proceso, por huella SHA-256 del DER
+_certificados = {}
+
+
+# ============================================================================
+# REGISTRO DE CERTIFICADOS
+# ============================================================================
+
+def _der(cer_pem):
+	"""Bytes DER de un certificado PEM, sin interpretar el ASN.1"""
+	if isinstance(cer_pem, bytes):
+		cer_pem = cer_pem.decode("latin-1")
+	cuerpo = re.sub(r"-----[^-]+-----|\s", "", cer_pem or "")
+	try:
+		return base64.b64decode(cuerpo, validate=True)
+	except Exception:
+		frappe.throw(_("El certificado CSD no tiene formato PEM válido"))
+
+
+def huella(cer_pem):
+	"""
+	Huella SHA-256 de un certificado.
+
+	Args:
+		cer_pem (str): Certificado en formato PEM
+
+	Returns:
+		str: Huella en hexadecimal
+	"""
+	return hashlib.sha256(_der(cer_pem)).hexdigest()
+
+
+def get_certificado(cer_pem):
+	"""
+	Datos de un certificado CSD. El certificado se interpreta una sola vez por
+	proceso; las siguientes llamadas solo calculan la huella.
+
+	Args:
+		cer_pem (str): Certificado en formato PEM
+
+	Returns:
+		frappe._dict: {huella, numero, rfc, valido_desde, valido_hasta}
+	"""
+	der = _der(cer_pem)
+	clave = hashlib.sha256(der).hexdigest()
+
+	if clave not in _certificados:
+		_certificados[clave] = _leer_certificado(der, clave)
+
+	return _certificados[clave]
+
+
+def _leer_certificado(der, clave):
+	from cryptography import x509
+
+	try:
+		cert = x509.load_der_x509_certificate(der)
+	except ValueError:
+		frappe.throw(_("El certificado CSD no es válido"))
+
+	# cryptography >= 42 expone las fechas en UTC; antes, naive en UTC
+	valido_desde = getattr(cert, "not_valid_before_utc", None) or cert.not_valid_before
+	valido_hasta = getattr(cert, "not_valid_after_utc", None) or cert.not_valid_after
+
+	return frappe._dict({
+		"huella": clave,
+		"numero": _numero_certificado(cert.serial_number),
+		"rfc": _rfc(cert),
+		"valido_desde": valido_desde.replace(tzinfo=None),
+		"valido_hasta": valido_hasta.replace(tzinfo=None)
+	})
+
+
+def _numero_certificado(serial_number):
+	"""Número de certificado de 20 dígitos: cada byte del serial en decimal, concatenados"""
+	serial_hex = format(serial_number, "x")
+
+	# Asegurar que tenga longitud par para convertir a bytes
+	if len(serial_hex) % 2:
+		serial_hex = "0" + serial_hex
+
+	numero = "".join(str(byte) for byte in bytes.fromhex(serial_hex))
+	return numero.zfill(20)[:20]
+
+
+def _rfc(cert):
+	"""RFC del titular desde x500UniqueIdentifier; None si el certificado no lo trae"""
+	from cryptography.x509.oid import ObjectIdentifier
+
+	atributos = cert.subject.get_attributes_for_oid(ObjectIdentifier(OID_RFC))
+	if not atributos:
+		return None
+	valor = atributos[0].value
+	if isinstance(valor, bytes):
+		valor = valor.decode("latin-1")
+	return valor.split("/")[0].strip() or None
+
+
+# ============================================================================
+# VALIDACIÓN
+# ============================================================================
+
+def validar_vigencia(cer_pem, fecha=None):
+	"""
+	Verifica que el certificado esté vigente antes de enviarlo al PAC.
+
+	Args:
+		cer_pem (str): Certificado en formato PEM
+		fecha (datetime): Fecha de referencia en UTC (opcional, ahora)
+
+	Returns:
+		frappe._dict: Datos del certificado (ver get_certificado)
+	"""
+	certificado = get_certificado(cer_pem)
+	fecha = fecha or datetime.now(timezone.utc).replace(tzinfo=None)
+
+	if fecha < certificado.valido_desde:
+		frappe.throw(_("El certificado CSD {0} aún no es vigente; es válido desde {1}").format(
+			certificado.numero, certificado.valido_desde
+		))
+	if fecha > certificado.valido_hasta:
+		frappe.throw(_("El certificado CSD {0} venció el {1}").format(
+			certificado.numero, certificado.valido_hasta
+		))
+
+	return certificado
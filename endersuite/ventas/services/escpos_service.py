@@ -0,0 +1,212 @@
+import frappe
+from frappe.utils import cint, flt, fmt_money, format_datetime
+
+
+# ============================================================================
+# COMANDOS ESC/POS
+# ============================================================================
+
+ESC = b"\x1b"
+GS = b"\x1d"
+
+INICIALIZAR = ESC + b"@"
+# Tabla de caracteres WPC1252 para acentos y ñ
+TABLA_CARACTERES = ESC + b"t\x10"
+FUENTE_A = ESC + b"M\x00"
+FUENTE_B = ESC + b"M\x01"
+NEGRITA_ON = ESC + b"E\x01"
+NEGRITA_OFF = ESC + b"E\x00"
+DOBLE_ALTO_ON = GS + b"!\x01"
+DOBLE_ALTO_OFF = GS + b"!\x00"
+ALINEAR = {"left": ESC + b"a\x00", "center": ESC + b"a\x01", "right": ESC + b"a\x02"}
+# Avanzar papel y corte parcial
+CORTE = GS + b"V\x42\x03"
+
+CODIFICACION = "cp1252"
+
+# Columnas por ancho de papel con la fuente A (12x24) y la fuente B (9x17).
+# "Carta" no aplica a impresoras térmicas; se imprime como 80mm.
+COLUMNAS = {
+	"58mm": {"A": 32, "B": 42},
+	"80mm": {"A": 48, "B": 64}
+}
+
+# Los tamaños de fuente menores a este usan la fuente B, más compacta
+TAMANO_MINIMO_FUENTE_A = 10
+
+
+# ============================================================================
+# CONTENIDO DEL TICKET
+# ============================================================================
+
+def _configuracion(nota, formato_name=None):
+	"""
+	Ancho, fuente y encabezado del ticket desde el mismo Formato de Ticket que usa
+	el HTML. Las impresoras térmicas solo tienen fuentes monoespaciadas: `fuente`
+	no aplica y `tamano_fuente` elige entre la fuente A y la B.
+
+	Returns:
+		frappe._dict: {columnas, fuente, alinear, compania, perfil_pos}
+	"""
+	from endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket import (
+		get_contexto_encabezado,
+		get_formato_compilado
+	)
+
+	encabezado = get_contexto_encabezado(nota.get("perfil_pos"))
+	formato = get_formato_compilado(formato_name or encabezado["formato_ticket"]) or frappe._dict()
+
+	fuente = "B" if cint(formato.tamano_fuente or TAMANO_MINIMO_FUENTE_A) < TAMANO_MINIMO_FUENTE_A else "A"
+	columnas = COLUMNAS.get(formato.ancho_ticket, COLUMNAS["80mm"])[fuente]
+
+	return frappe._dict({
+		"columnas": columnas,
+		"fuente": fuente,
+		"alinear": formato.alinear_header if formato.alinear_header in ALINEAR else "center",
+		"compania": encabezado["compania"],
+		"perfil_pos": encabezado["perfil_pos"]
+	})
+
+
+def _monto(valor):
+	return fmt_money(flt(valor))
+
+
+def _dos_columnas(izquierda, derecha, columnas):
+	"""Texto a la izquierda y a la derecha en una línea; recorta la izquierda si no cabe"""
+	espacio = columnas - len(derecha) - 1
+	if espacio < 1:
+		return derecha[-columnas:]
+	return izquierda[:espacio].ljust(espacio) + " " + derecha
+
+
+def _lineas_ticket(nota, config):
+	"""
+	Líneas del ticket con su estilo, comunes a ESC/POS y texto plano.
+
+	Args:
+		nota: Documento de Nota de Venta o dict con los mismos campos y tablas
+		config (frappe._dict): Resultado de _configuracion
+
+	Returns:
+		list: Tuplas (texto, alineación, estilo) con estilo "normal", "negrita" o
+			"total"; texto None indica un separador
+	"""
+	columnas = config.columnas
+	alinear = config.alinear
+	lineas = []
+
+	# Encabezado
+	compania = config.compania
+	if compania:
+		lineas.append((compania.get("name"), alinear, "negrita"))
+		if compania.get("razon_social"):
+			lineas.append((compania.get("razon_social"), alinear, "normal"))
+	else:
+		lineas.append((config.perfil_pos or "Punto de Venta", alinear, "negrita"))
+
+	lineas.append(("TICKET DE VENTA", alinear, "normal"))
+	lineas.append((nota.get("name"), alinear, "normal"))
+	if nota.get("fecha_y_hora_de_venta"):
+		lineas.append((format_datetime(nota.get("fecha_y_hora_de_venta"), "dd/MM/yyyy HH:mm"), alinear, "normal"))
+	if nota.get("cliente"):
+		lineas.append(("Cliente: {0}".format(nota.get("cliente")), alinear, "normal"))
+	lineas.append((None, "left", "normal"))
+
+	# Productos: nombre en una línea, cantidad x precio y total en la siguiente
+	for item in nota.get("tabla_de_productos") or []:
+		lineas.append((str(item.get("producto"))[:columnas], "left", "normal"))
+		detalle = "  {0} x {1}".format(flt(item.get("cantidad")), _monto(item.get("precio_unitario")))
+		lineas.append((_dos_columnas(detalle, _monto(item.get("total_linea")), columnas), "left", "normal"))
+	lineas.append((None, "left", "normal"))
+
+	# Totales
+	lineas.append((_dos_columnas("Subtotal:", _monto(nota.get("subtotal")), columnas), "left", "normal"))
+	lineas.append((_dos_columnas("Impuestos:", _monto(nota.get("total_impuestos")), columnas), "left", "normal"))
+	lineas.append((_dos_columnas("TOTAL:", _monto(nota.get("total_final")), columnas), "left", "total"))
+	lineas.append((None, "left", "normal"))
+
+	# Métodos de pago y cambio
+	for mp in nota.get("metodos_pago_nota") or []:
+		lineas.append((_dos_columnas("{0}:".format(mp.get("metodo")), _monto(mp.get("monto")), columnas), "left", "normal"))
+	if flt(nota.get("cambio")) > 0:
+		lineas.append((_dos_columnas("Cambio:", _monto(nota.get("cambio")), columnas), "left", "negrita"))
+
+	lineas.append(("", "center", "normal"))
+	lineas.append(("¡Gracias por su compra!", "center", "normal"))
+	lineas.append(("{0} | {1}".format(frappe.session.user, nota.get("sesion_pos") or ""), "center", "normal"))
+
+	return lineas
+
+
+# ============================================================================
+# RENDERIZADO
+# ============================================================================
+
+def generar_ticket_texto(nota, formato_name=None):
+	"""
+	Ticket en texto plano con el ancho en columnas del formato, para impresoras
+	sin ESC/POS o para mostrarlo en pantalla.
+
+	Args:
+		nota: Documento de Nota de Venta o dict con los mismos campos y tablas
+		formato_name (str): Formato de Ticket (opcional, usa el del perfil o el predeterminado)
+
+	Returns:
+		str: Ticket en texto plano
+	"""
+	config = _configuracion(nota, formato_name)
+	columnas = config.columnas
+
+	salida = []
+	for texto, alineacion, _estilo in _lineas_ticket(nota, config):
+		if texto is None:
+			salida.append("-" * columnas)
+		elif alineacion == "center":
+			salida.append(texto[:columnas].center(columnas).rstrip())
+		elif alineacion == "right":
+			salida.append(texto[:columnas].rjust(columnas))
+		else:
+			salida.append(texto[:columnas])
+
+	return "\n".join(salida) + "\n"
+
+
+def generar_ticket_escpos(nota, formato_name=None):
+	"""
+	Ticket como secuencia de comandos ESC/POS lista para enviar a la impresora:
+	la impresora compone el texto, así que no hay maquetación HTML ni diálogo
+	de impresión.
+
+	Args:
+		nota: Documento de Nota de Venta o dict con los mismos campos y tablas
+		formato_name (str): Formato de Ticket (opcional, usa el del perfil o el predeterminado)
+
+	Returns:
+		bytes: Comandos ESC/POS
+	"""
+	config = _configuracion(nota, formato_name)
+	columnas = config.columnas
+
+	salida = bytearray(INICIALIZAR + TABLA_CARACTERES)
+	salida += FUENTE_B if config.fuente == "B" else FUENTE_A
+
+	alineacion_actual = None
+	for texto, alineacion, estilo in _lineas_ticket(nota, config):
+		if texto is None:
+			texto, alineacion = "-" * columnas, "left"
+
+		if alineacion != alineacion_actual:
+			salida += ALINEAR[alineacion]
+			alineacion_actual = alineacion
+
+		contenido = texto[:columnas].encode(CODIFICACION, errors="replace") + b"\n"
+		if estilo == "negrita":
+			salida += NEGRITA_ON + contenido + NEGRITA_OFF
+		elif estilo == "total":
+			salida += NEGRITA_ON + DOBLE_ALTO_ON + contenido + DOBLE_ALTO_OFF + NEGRITA_OFF
+		else:
+			salida += contenido
+
+	salida += CORTE
+	return bytes(salida)
@@ -0,0 +1,277 @@
+import frappe
+from frappe import _
+from frappe.utils import add_days, flt, getdate, now_datetime, nowdate
+
+from endersuite.ventas.services.tax_service import get_impuestos_productos
+
+
+# Agrupación de conceptos de la Factura Global
+AGRUPAR_POR_PRODUCTO = "Producto"
+AGRUPAR_POR_NOTA = "Nota"
+
+# Notas de Venta Relacionada por INSERT
+TAMANO_LOTE_REFERENCIAS = 1000
+
+
+# ============================================================================
+# NOTAS PENDIENTES
+# ============================================================================
+
+def _condiciones_notas(fecha_inicio, fecha_fin, perfil_pos=None):
+	"""
+	Condiciones SQL y parámetros de las notas enviadas y pendientes de facturar
+	de un periodo que no están reservadas por otra factura en borrador.
+	La fecha fin incluye todo el día.
+	"""
+	condiciones = [
+		"n.docstatus = 1",
+		"n.estado_facturacion = 'Pendiente'",
+		"IFNULL(n.factura_de_venta, '') = ''",
+		"n.fecha_y_hora_de_venta >= %(desde)s",
+		"n.fecha_y_hora_de_venta < %(hasta)s"
+	]
+	valores = {
+		"desde": getdate(fecha_inicio),
+		"hasta": add_days(getdate(fecha_fin), 1)
+	}
+
+	if perfil_pos:
+		condiciones.append("n.perfil_pos = %(perfil_pos)s")
+		valores["perfil_pos"] = perfil_pos
+
+	return " AND ".join(condiciones), valores
+
+
+def _notas_pendientes(fecha_inicio, fecha_fin, perfil_pos=None):
+	"""Nombre, fecha y total de las notas pendientes del periodo, bloqueadas hasta el commit"""
+	condiciones, valores = _condiciones_notas(fecha_inicio, fecha_fin, perfil_pos)
+	return frappe.db.sql(f"""
+		SELECT n.name, n.fecha_y_hora_de_venta, n.total_final
+		FROM `tabNota de Venta` n
+		WHERE {condiciones}
+		ORDER BY n.fecha_y_hora_de_venta, n.name
+		FOR UPDATE
+	""", valores, as_dict=True)
+
+
+def _conceptos_agregados(notas, agrupar):
+	"""
+	Importe final de las líneas de las notas sumado por producto en una consulta.
+
+	El importe de cada línea es su total con impuestos ya con el descuento de la
+	línea, más su parte del descuento global de la nota: el total de la línea se
+	escala por total_final / suma de totales de línea de su nota, así la suma de
+	los importes es exactamente la suma de los total_final.
+
+	Args:
+		notas (list): Nombres de las notas a facturar
+		agrupar (str): AGRUPAR_POR_PRODUCTO o AGRUPAR_POR_NOTA
+
+	Returns:
+		list: Filas {nota, producto, cantidad, importe, clave_sat, clave_unidad_sat,
+			unidad_de_medida}; `nota` solo por nota
+	"""
+	por_nota = agrupar == AGRUPAR_POR_NOTA
+	columna_nota = "t.parent AS nota," if por_nota else ""
+	grupo_nota = "t.parent," if por_nota else ""
+
+	return frappe.db.sql(f"""
+		SELECT
+			{columna_nota}
+			t.producto,
+			SUM(t.cantidad) AS cantidad,
+			SUM(t.total_linea * n.total_final / NULLIF(s.suma_lineas, 0)) AS importe,
+			p.clave_sat,
+			p.clave_unidad_sat,
+			p.unidad_de_medida_uom AS unidad_de_medida
+		FROM `tabTabla de Productos` t
+		INNER JOIN `tabNota de Venta` n ON n.name = t.parent
+		INNER JOIN (
+			SELECT parent, SUM(total_linea) AS suma_lineas
+			FROM `tabTabla de Productos`
+			WHERE parenttype = 'Nota de Venta'
+				AND parentfield = 'tabla_de_productos'
+				AND parent IN %(notas)s
+			GROUP BY parent
+		) s ON s.parent = t.parent
+		LEFT JOIN `tabProducto` p ON p.name = t.producto
+		WHERE t.parenttype = 'Nota de Venta'
+			AND t.parentfield = 'tabla_de_productos'
+			AND t.parent IN %(notas)s
+		GROUP BY {grupo_nota} t.producto, p.clave_sat, p.clave_unidad_sat, p.unidad_de_medida_uom
+		HAVING SUM(t.cantidad) > 0
+			AND SUM(t.total_linea * n.total_final / NULLIF(s.suma_lineas, 0)) > 0
+		ORDER BY {grupo_nota} t.producto
+	""", {"notas": tuple(notas)}, as_dict=True)
+
+
+def _valores_unitarios(conceptos):
+	"""
+	Valor unitario de cada concepto para que la Factura, que recalcula el
+	impuesto con el de cada producto, llegue al mismo importe con impuestos.
+	Sin descuento: el importe ya lo trae aplicado.
+
+	Args:
+		conceptos (list): Filas de _conceptos_agregados
+
+	Returns:
+		list: Valor unitario por concepto, sin redondear
+	"""
+	impuestos = get_impuestos_productos([c.producto for c in conceptos])
+	valores = []
+	for c in conceptos:
+		impuesto = impuestos.get(c.producto)
+		valor = flt(c.importe) / flt(c.cantidad)
+		if impuesto and not impuesto.incluido_en_el_precio:
+			valor = valor / (1 + flt(impuesto.porciento_impuesto) / 100)
+		valores.append(valor)
+	return valores
+
+
+# ============================================================================
+# FACTURA GLOBAL
+# ============================================================================
+
+def crear_factura_global(compania, cliente, fecha_inicio, fecha_fin, perfil_pos=None,
+						 agrupar=AGRUPAR_POR_PRODUCTO, forma_de_pago="Efectivo"):
+	"""
+	Crea en borrador la Factura Global de las notas pendientes de un periodo.
+
+	Los conceptos se agregan directamente en SQL desde los importes finales de
+	las notas, así que la factura tiene una línea por producto (o por producto
+	de cada nota) en lugar de una por línea de ticket, su total es la suma de
+	los total_final y se guarda una sola vez. Las referencias a las notas se
+	insertan por lotes y las notas quedan reservadas para este borrador, así
+	otra ejecución no las vuelve a tomar; se marcan como facturadas al enviar
+	la factura y se liberan si el borrador se elimina.
+
+	Args:
+		compania (str): Compañía emisora
+		cliente (str): Cliente receptor, normalmente Público en General
+		fecha_inicio (str): Primer día del periodo
+		fecha_fin (str): Último día del periodo
+		perfil_pos (str): Limitar a las notas de un Perfil de POS (opcional)
+		agrupar (str): "Producto" (un concepto por producto, precio y descuento)
+			o "Nota" (además separado por nota, con su folio en la descripción)
+		forma_de_pago (str): Forma de pago de la factura
+
+	Returns:
+		frappe._dict: {factura, notas, conceptos, total}
+	"""
+	if agrupar not in (AGRUPAR_POR_PRODUCTO, AGRUPAR_POR_NOTA):
+		frappe.throw(_("Agrupación no válida: {0}").format(agrupar))
+
+	if getdate(fecha_inicio) > getdate(fecha_fin):
+		frappe.throw(_("La fecha de inicio no puede ser posterior a la fecha fin"))
+
+	notas = _notas_pendientes(fecha_inicio, fecha_fin, perfil_pos)
+	if not notas:
+		frappe.throw(_("No hay notas de venta pendientes de facturar en el periodo"))
+
+	conceptos = _conceptos_agregados([n.name for n in notas], agrupar)
+	if not conceptos:
+		frappe.throw(_("Las notas pendientes del periodo no tienen productos"))
+
+	valores = _valores_unitarios(conceptos)
+
+	factura = frappe.get_doc({
+		"doctype": "Factura de Venta",
+		"compañia": compania,
+		"cliente": cliente,
+		"fecha_de_emision": nowdate(),
+		"forma_de_pago": forma_de_pago,
+		"tabla_con_los_productos_o_servicios": [
+			{
+				"producto__servicio": c.producto,
+				"clave_sat": c.clave_sat,
+				"clave_unidad_sat": c.clave_unidad_sat,
+				"unidad_de_medida": c.unidad_de_medida,
+				"cantidad": flt(c.cantidad),
+				"valor": valor,
+				"descuento": 0,
+				"descripcion": f"Nota: {c.nota} - {c.producto}" if c.get("nota") else c.producto
+			}
+			for c, valor in zip(conceptos, valores, strict=True)
+		]
+	})
+	factura.insert()
+
+	_insertar_referencias(factura, notas)
+	_reservar_notas(factura, notas)
+
+	return frappe._dict({
+		"factura": factura.name,
+		"notas": len(notas),
+		"conceptos": len(conceptos),
+		"total": factura.total
+	})
+
+
+def _insertar_referencias(factura, notas):
+	"""Agrega las notas a `notas_relacionadas` con INSERTs por lotes, sin guardar la factura otra vez"""
+	ahora = now_datetime()
+	usuario = frappe.session.user
+
+	campos = [
+		"name", "parent", "parenttype", "parentfield", "idx", "docstatus",
+		"owner", "modified_by", "creation", "modified",
+		"nota_de_venta", "fecha", "total"
+	]
+	valores = [
+		(
+			frappe.generate_hash(length=10), factura.name, "Factura de Venta", "notas_relacionadas", idx, 0,
+			usuario, usuario, ahora, ahora,
+			nota.name, nota.fecha_y_hora_de_venta, nota.total_final
+		)
+		for idx, nota in enumerate(notas, start=1)
+	]
+
+	frappe.db.bulk_insert(
+		"Nota de Venta Relacionada", campos, valores, chunk_size=TAMANO_LOTE_REFERENCIAS
+	)
+
+
+# ============================================================================
+# ESTADO DE FACTURACIÓN DE NOTAS
+# ============================================================================
+
+def _reservar_notas(factura, notas):
+	"""Liga las notas al borrador con un solo UPDATE; siguen Pendiente hasta enviarlo"""
+	frappe.db.set_value(
+		"Nota de Venta", {"name": ["in", [n.name for n in notas]]}, "factura_de_venta", factura.name
+	)
+
+
+def liberar_notas_reservadas(factura):
+	"""
+	Quita la reserva de las notas pendientes ligadas a una factura en borrador.
+	Llamado al eliminar la factura.
+
+	Args:
+		factura: Documento de Factura de Venta
+	"""
+	frappe.db.set_value(
+		"Nota de Venta",
+		{"factura_de_venta": factura.name, "estado_facturacion": "Pendiente"},
+		"factura_de_venta",
+		None
+	)
+
+
+def actualizar_estado_notas(factura, estado):
+	"""
+	Marca como facturadas (o libera) las notas relacionadas de una factura con
+	un solo UPDATE.
+
+	Args:
+		factura: Documento de Factura de Venta
+		estado (str): "Facturado" o "Pendiente"
+	"""
+	notas = list({item.nota_de_venta for item in factura.notas_relacionadas or [] if item.nota_de_venta})
+	if not notas:
+		return
+
+	frappe.db.set_value("Nota de Venta", {"name": ["in", notas]}, {
+		"estado_facturacion": estado,
+		"factura_de_venta": factura.name if estado == "Facturado" else None
+	})
@@ -5,23 +5,58 @@ import frappe
 import requests
 import json
 import base64
+import copy
+import os
+import time
+from decimal import Decimal
 from frappe import _
-from frappe.utils import now_datetime
+from frappe.utils import cint, flt, now_datetime
 from frappe.utils.password import get_decrypted_password
+from requests.adapters import HTTPAdapter
+
+from endersuite.ventas.services.certificate_service import get_certificado, validar_vigencia
+from endersuite.ventas.services.totals_service import calcular_totales_factura
+
+
+# Contador en Redis (por sitio) con la versión de Configuracion PAC
+CLAVE_VERSION_CONFIG_PAC = "endersuite:pac:contador"
+
+# Lista en Redis con la latencia de las últimas llamadas al PAC
+CLAVE_METRICAS_PAC = "endersuite:pac:metricas"
+MAX_METRICAS_PAC = 500
+
+# Valores si Configuracion PAC no define pool ni timeouts
+TAMANO_POOL_PREDETERMINADO = 10
+TIMEOUT_CONEXION_PREDETERMINADO = 5
+TIMEOUT_LECTURA_PREDETERMINADO = 30
+
+# Configuración decodificada del proceso por sitio: sitio -> {version, config, api_key}.
+# Un worker atiende varios sitios del bench; nunca se usan credenciales de otro sitio
+_configuracion = {}
+
+# Sesión HTTP del proceso: conexiones keep-alive reutilizadas entre facturas
+_sesion = None
+
+# Niveles de traza del PAC (campo nivel_traza de Configuracion PAC)
+NIVELES_TRAZA = {"Error": 40, "Info": 20, "Debug": 10}
+NIVEL_TRAZA_PREDETERMINADO = "Error"
+
+# Número de certificado si no se puede leer el certificado (el de pruebas del SAT)
+NUMERO_CERTIFICADO_PRUEBAS = "30001000000500003416"
 
 
 class ServicioPAC:
 	"""Servicio para integración con PAC (FacturAPI)"""
 	
 	def __init__(self):
-		self.config = self.get_config()
+		configuracion = _configuracion_pac()
+		# Copia propia: timbrar_con_credenciales reemplaza los CSD solo para esta instancia
+		self.config = copy.copy(configuracion.config)
+		self.api_key = configuracion.api_key
 	
 	def get_config(self):
 		"""Obtiene la configuración del PAC"""
-		if not frappe.db.exists("Configuracion PAC", "Configuracion PAC"):
-			frappe.throw(_("No se ha configurado el PAC. Por favor configure en Configuración PAC"))
-		
-		return frappe.get_doc("Configuracion PAC", "Configuracion PAC")
+		return copy.copy(_configuracion_pac().config)
 	
 	def timbrar_factura(self, factura_doc):
 		"""
@@ -31,11 +66,16 @@ class ServicioPAC:
 			factura_doc: Documento de Factura de Venta
 		
 		Returns:
-			dict: Respuesta del PAC con UUID, XML, etc.
+			dict: Respuesta del PAC con UUID, XML, etc. Si falla, `transitorio`
+				indica si el error es de conexión o del PAC y se puede reintentar
 		"""
 		if not self.config.activo:
 			frappe.throw(_("El servicio PAC no está activo"))
 		
+		# Un certificado vencido se rechaza aquí, sin ir al PAC
+		if self.config.get("csd_cer_pem"):
+			validar_vigencia(self.config.csd_cer_pem)
+		
 		# Construye el JSON para el PAC
 		cfdi_json = self._build_cfdi_json(factura_doc)
 		
@@ -56,12 +96,12 @@ class ServicioPAC:
 			nombre_emisor = self.config.nombre_pruebas
 			regimen_emisor = self._extract_regimen_code(self.config.regimen_fiscal_pruebas)
 			# Usar número proporcionado por el PAC - el certificado actual no corresponde
-			no_certificado = "30001000000500003416"
+			no_certificado = NUMERO_CERTIFICADO_PRUEBAS
 		else:
 			rfc_emisor = compania.rfc
 			nombre_emisor = compania.nombre_de_la_empresa
 			regimen_emisor = self._extract_regimen_code(compania.regimen_fiscal)
-			no_certificado = self._extract_certificate_serial_v2(compania.certificado_cer if hasattr(compania, 'certificado_cer') else self.config.csd_cer_pem)
+			no_certificado = self._serial_certificado(compania.certificado_cer if hasattr(compania, 'certificado_cer') else self.config.csd_cer_pem)
 		
 		# Formato de fecha: YYYY-MM-DDTHH:MM:SS
 		# Usar la fecha actual según la zona horaria configurada en System Settings
@@ -87,6 +127,10 @@ class ServicioPAC:
 		else:
 			cp_receptor = cp_expedicion
 		
+		# Importes del comprobante sumados de los conceptos ya redondeados, como los valida el SAT
+		conceptos = self._build_conceptos(factura)
+		importes = self._sumar_conceptos(conceptos)
+		
 		# Estructura según formato FacturaloPlus
 		comprobante = {
 			"Version": "4.0",
@@ -95,9 +139,9 @@ class ServicioPAC:
 			"Fecha": fecha_cfdi,
 			"FormaPago": self._get_forma_pago_code(factura.forma_de_pago),
 			"NoCertificado": no_certificado,
-			"SubTotal": format(float(factura.subtotal), '.2f'),
+			"SubTotal": format(importes["subtotal"], '.2f'),
 			"Moneda": factura.divisa__moneda or "MXN",
-			"Total": format(float(factura.total), '.2f'),
+			"Total": format(importes["total"], '.2f'),
 			"TipoDeComprobante": "I",
 			"Exportacion": "01",
 			"MetodoPago": "PUE" if factura.metodo_de_pago == "Pago en una sola exhibición" else "PPD",
@@ -114,13 +158,13 @@ class ServicioPAC:
 				"RegimenFiscalReceptor": factura.regimen_fiscal_receptor or "616",
 				"UsoCFDI": "S01" if factura.rfc_del_receptor == "XAXX010101000" else (factura.uso_cfdi if hasattr(factura, 'uso_cfdi') and factura.uso_cfdi else "G03")
 			},
-			"Conceptos": self._build_conceptos(factura),
-			"Impuestos": self._build_impuestos(factura)
+			"Conceptos": conceptos,
+			"Impuestos": self._build_impuestos(conceptos)
 		}
 		
 		# Agregar descuento solo si existe
-		if factura.descuento_total and float(factura.descuento_total) > 0:
-			comprobante["Descuento"] = format(float(factura.descuento_total), '.2f')
+		if importes["descuento"] > 0:
+			comprobante["Descuento"] = format(importes["descuento"], '.2f')
 		
 		# TipoCambio como string
 		if factura.divisa__moneda and factura.divisa__moneda != "MXN":
@@ -154,26 +198,22 @@ class ServicioPAC:
 		return cfdi
 	
 	def _build_conceptos(self, factura):
-		"""Construye la lista de conceptos (productos)"""
+		"""
+		Construye la lista de conceptos (productos) con los importes por línea del
+		motor de totales de la factura: importe sin el impuesto incluido en el
+		precio, descuento, base e impuesto trasladado.
+		"""
 		conceptos = []
+		items = factura.tabla_con_los_productos_o_servicios
 		
-		for item in factura.tabla_con_los_productos_o_servicios:
-			# Calcula valores
-			importe = float(item.cantidad * item.valor)
-			descuento = 0
-			
-			if item.descuento:
-				# Obtener producto para calcular precio con impuestos
-				producto = frappe.get_doc("Producto", item.producto__servicio)
-				precio_con_impuestos = item.valor
-				
-				if producto.tipo_de_impuesto:
-					impuesto = frappe.get_doc("Impuestos", producto.tipo_de_impuesto)
-					if impuesto.porciento_impuesto:
-						precio_con_impuestos = item.valor * (1 + impuesto.porciento_impuesto / 100)
-				
-				importe_con_impuestos = item.cantidad * precio_con_impuestos
-				descuento = float(importe_con_impuestos * (item.descuento / 100))
+		# Impuesto de todos los conceptos en una sola consulta
+		totales = calcular_totales_factura(items, precision=factura.precision("total") or 2)
+		lineas = totales["lineas"]
+		
+		for i, item in enumerate(items):
+			importe = lineas["subtotal"][i]
+			descuento = lineas["descuento"][i]
+			impuesto = totales["impuestos_lineas"][i]
 			
 			concepto = {
 				"ClaveProdServ": item.clave_sat or "01010101",
@@ -182,7 +222,7 @@ class ServicioPAC:
 				"ClaveUnidad": item.clave_unidad_sat or "E48",
 				"Unidad": item.unidad_de_medida or "Pieza",
 				"Descripcion": (item.descripcion or item.producto__servicio)[:1000],
-				"ValorUnitario": format(float(item.valor), '.6f'),
+				"ValorUnitario": format(importe / float(item.cantidad), '.6f'),
 				"Importe": format(importe, '.2f'),
 				"ObjetoImp": "02"  # 02 = Sí objeto de impuesto
 			}
@@ -191,29 +231,25 @@ class ServicioPAC:
 				concepto["Descuento"] = format(descuento, '.2f')
 			
 			# Agrega impuestos del concepto
-			if item.producto__servicio:
-				producto = frappe.get_doc("Producto", item.producto__servicio)
-				if producto.tipo_de_impuesto:
-					concepto["Impuestos"] = self._build_impuestos_concepto(item, producto)
+			if impuesto and impuesto.tipo_de_impuesto:
+				concepto["Impuestos"] = self._build_impuestos_concepto(
+					impuesto, lineas["base"][i], lineas["impuesto"][i]
+				)
 			
 			conceptos.append(concepto)
 		
 		return conceptos
 	
-	def _build_impuestos_concepto(self, item, producto):
-		"""Construye los impuestos de un concepto"""
+	def _build_impuestos_concepto(self, impuesto, base, importe_impuesto):
+		"""Construye los impuestos de un concepto con la base y el impuesto de su línea"""
 		impuestos = {
 			"Traslados": []
 		}
 		
-		if producto.tipo_de_impuesto:
-			impuesto = frappe.get_doc("Impuestos", producto.tipo_de_impuesto)
+		if impuesto.tipo_de_impuesto:
 			if impuesto.porciento_impuesto:
-				importe_base = float(item.cantidad * item.valor)
-				importe_impuesto = importe_base * (impuesto.porciento_impuesto / 100)
-				
 				traslado = {
-					"Base": format(importe_base, '.2f'),
+					"Base": format(base, '.2f'),
 					"Impuesto": "002",
 					"TipoFactor": "Tasa",
 					"TasaOCuota": format(impuesto.porciento_impuesto / 100, '.6f'),
@@ -224,25 +260,57 @@ class ServicioPAC:
 		
 		return impuestos
 	
-	def _build_impuestos(self, factura):
-		"""Construye la sección de impuestos totales"""
-		if factura.total_de_impuestos_trasladados == 0:
+	def _sumar_conceptos(self, conceptos):
+		"""
+		Subtotal, descuento, impuestos trasladados y total del comprobante desde
+		los importes de los conceptos ya formateados.
+		
+		Returns:
+			dict: {subtotal, descuento, impuestos, total} como float
+		"""
+		subtotal = descuento = trasladados = Decimal(0)
+		for concepto in conceptos:
+			subtotal += Decimal(concepto["Importe"])
+			descuento += Decimal(concepto.get("Descuento", "0"))
+			for traslado in (concepto.get("Impuestos") or {}).get("Traslados", []):
+				trasladados += Decimal(traslado["Importe"])
+		
+		return {
+			"subtotal": float(subtotal),
+			"descuento": float(descuento),
+			"impuestos": float(trasladados),
+			"total": float(subtotal - descuento + trasladados)
+		}
+	
+	def _build_impuestos(self, conceptos):
+		"""Construye la sección de impuestos totales sumando los traslados de los conceptos por tasa"""
+		por_tasa = {}
+		for concepto in conceptos:
+			for traslado in (concepto.get("Impuestos") or {}).get("Traslados", []):
+				llave = (traslado["Impuesto"], traslado["TipoFactor"], traslado["TasaOCuota"])
+				base, importe = por_tasa.get(llave, (Decimal(0), Decimal(0)))
+				por_tasa[llave] = (base + Decimal(traslado["Base"]), importe + Decimal(traslado["Importe"]))
+		
+		if not por_tasa:
 			return None
 		
-		impuestos = {
-			"TotalImpuestosTrasladados": format(float(factura.total_de_impuestos_trasladados), '.2f'),
+		return {
+			"TotalImpuestosTrasladados": format(sum(importe for base, importe in por_tasa.values()), '.2f'),
 			"Traslados": [
 				{
-					"Base": format(float(factura.subtotal), '.2f'),
-					"Impuesto": "002",
-					"TipoFactor": "Tasa",
-					"TasaOCuota": "0.160000",
-					"Importe": format(float(factura.total_de_impuestos_trasladados), '.2f')
+					"Base": format(base, '.2f'),
+					"Impuesto": impuesto,
+					"TipoFactor": tipo_factor,
+					"TasaOCuota": tasa,
+					"Importe": format(importe, '.2f')
 				}
+				for (impuesto, tipo_factor, tasa), (base, importe) in sorted(por_tasa.items())
 			]
 		}
-		
-		return impuestos
+	
+	def _serial_certificado(self, cer_pem):
+		"""Número de certificado SAT desde el registro de certificados del proceso"""
+		return self._extract_certificate_serial_v2(cer_pem)
 	
 	def _extract_certificate_serial(self, cer_pem):
 		"""Extrae el número de serie del certificado PEM"""
@@ -270,49 +338,19 @@ class ServicioPAC:
 			
 			return serial
 		except Exception as e:
-			frappe.log_error(f"Error extrayendo serial del certificado: {str(e)}", "PAC Certificate Error")
-			return "30001000000500003416"  # Fallback al número de prueba
+			trazar("serial_certificado", "Error", error=str(e))
+			return NUMERO_CERTIFICADO_PRUEBAS  # Fallback al número de prueba
 	
 	def _extract_certificate_serial_v2(self, cer_pem):
 		"""Extrae el número de serie del certificado en formato SAT (20 dígitos)"""
 		try:
-			from cryptography import x509
-			from cryptography.hazmat.backends import default_backend
-			
-			# Cargar el certificado
-			cert = x509.load_pem_x509_certificate(cer_pem.encode(), default_backend())
-			
-			# Obtener el serial en hexadecimal (sin '0x')
-			serial_hex = format(cert.serial_number, 'x')
-			
-			# Asegurar que tenga longitud par para convertir a bytes
-			if len(serial_hex) % 2:
-				serial_hex = '0' + serial_hex
-			
-			# Convertir hex a bytes
-			serial_bytes = bytes.fromhex(serial_hex)
-			
-			# El SAT representa cada byte como un número de 2 o 3 dígitos concatenados
-			# Convertir cada byte a su valor decimal y concatenar
-			serial_parts = []
-			for byte in serial_bytes:
-				serial_parts.append(str(byte))
-			
-			# Unir todos los números
-			serial_str = ''.join(serial_parts)
-			
-			# Tomar exactamente 20 dígitos (rellenar o truncar)
-			if len(serial_str) < 20:
-				serial_str = serial_str.zfill(20)
-			elif len(serial_str) > 20:
-				serial_str = serial_str[:20]
-			
-			frappe.log_error(f"Serial extraído: {serial_str} | Hex: {serial_hex} | Bytes: {[b for b in serial_bytes]}", "Certificate Serial Debug")
-			
-			return serial_str
+			certificado = get_certificado(cer_pem)
 		except Exception as e:
-			frappe.log_error(f"Error extrayendo serial: {str(e)}", "PAC Certificate Error")
-			return "30001000000500003416"
+			trazar("serial_certificado", "Error", error=str(e))
+			return NUMERO_CERTIFICADO_PRUEBAS
+		
+		trazar("serial_certificado", "Debug", numero=certificado.numero, huella=certificado.huella)
+		return certificado.numero
 	
 	def _extract_regimen_code(self, regimen_fiscal):
 		"""Extrae solo el código numérico del régimen fiscal (ej: '601 REGIMEN...' -> '601')"""
@@ -342,22 +380,15 @@ class ServicioPAC:
 		Desencripta una credencial codificada en base64
 		Si el valor no está codificado, lo devuelve tal cual
 		"""
-		try:
-			# Intenta decodificar de base64
-			decoded = base64.b64decode(encoded_value).decode('utf-8')
-			return decoded
-		except Exception:
-			# Si falla, devuelve el valor original (puede ser que ya esté desencriptado)
-			return encoded_value
+		return _decodificar_credencial(encoded_value)
 	
 	def _send_to_pac(self, cfdi_json):
 		"""Envía el CFDI al PAC para timbrado"""
 		try:
 			url = self.config.get_url_timbrado()
 			
-			# Desencripta la API Key desde base64
-			api_key_raw = self.config.get_api_key()
-			api_key = self._decode_credential(api_key_raw)
+			# API Key ya decodificada al cargar la configuración
+			api_key = self.api_key
 			
 			# Convertir el JSON del CFDI a string y luego a base64
 			cfdi_json_str = json.dumps(cfdi_json, ensure_ascii=False)
@@ -380,7 +411,7 @@ class ServicioPAC:
 				"cerPEM": csd_cer_pem
 			}
 			
-			response = requests.post(url, data=payload, headers=headers, timeout=30)
+			response = _post_pac(self.config, url, payload, headers)
 
 			if response.status_code == 200:
 				result = response.json()
@@ -413,17 +444,20 @@ class ServicioPAC:
 			else:
 				return {
 					"success": False,
-					"error": f"Error HTTP {response.status_code}: {response.text}"
+					"error": f"Error HTTP {response.status_code}: {response.text}",
+					# Saturación o falla del PAC: se puede reintentar
+					"transitorio": response.status_code == 429 or response.status_code >= 500
 				}
 		
 		except requests.exceptions.RequestException as e:
-			frappe.logger().error(f"Error de conexión con PAC: {str(e)}")
+			trazar("conexion_pac", "Error", error=str(e))
 			return {
 				"success": False,
-				"error": f"Error de conexión: {str(e)}"
+				"error": f"Error de conexión: {str(e)}",
+				"transitorio": True
 			}
 		except Exception as e:
-			frappe.logger().error(f"Error al timbrar: {str(e)}")
+			trazar("timbrado", "Error", error=str(e))
 			return {
 				"success": False,
 				"error": f"Error inesperado: {str(e)}"
@@ -444,6 +478,189 @@ class ServicioPAC:
 		frappe.throw(_("Función de cancelación aún no implementada"))
 
 
+
+# ============================================================================
+# CONFIGURACIÓN Y SESIÓN HTTP
+# ============================================================================
+
+def _decodificar_credencial(encoded_value):
+	try:
+		# Intenta decodificar de base64
+		return base64.b64decode(encoded_value).decode('utf-8')
+	except Exception:
+		# Si falla, devuelve el valor original (puede ser que ya esté desencriptado)
+		return encoded_value
+
+
+def _version_configuracion():
+	# Contador entero sin el prefijado automático de RedisWrapper; make_key ya lo limita al sitio
+	pipe = frappe.cache.pipeline(transaction=False)
+	pipe.get(frappe.cache.make_key(CLAVE_VERSION_CONFIG_PAC))
+	return int(pipe.execute()[0] or 0)
+
+
+def _configuracion_pac():
+	"""
+	Configuracion PAC del sitio con la API Key ya decodificada.
+	Se recarga cuando otro proceso incrementa la versión en Redis al guardarla.
+	
+	Returns:
+		frappe._dict: {version, config, api_key}
+	"""
+	version = _version_configuracion()
+	configuracion = _configuracion.get(frappe.local.site)
+	if configuracion is None or configuracion.version != version:
+		if not frappe.db.exists("Configuracion PAC", "Configuracion PAC"):
+			frappe.throw(_("No se ha configurado el PAC. Por favor configure en Configuración PAC"))
+		
+		config = frappe.get_doc("Configuracion PAC", "Configuracion PAC")
+		configuracion = _configuracion[frappe.local.site] = frappe._dict({
+			"version": version,
+			"config": config,
+			"api_key": _decodificar_credencial(config.get_api_key())
+		})
+	
+	return configuracion
+
+
+def _get_sesion(tamano_pool):
+	"""
+	Sesión HTTP del proceso con un pool de conexiones keep-alive, para no pagar
+	el handshake TCP y TLS en cada factura. Se crea de nuevo tras un fork o si
+	cambia el tamaño del pool.
+	"""
+	global _sesion
+	
+	pid = os.getpid()
+	if _sesion is None or _sesion.pid != pid or _sesion.tamano_pool != tamano_pool:
+		sesion = requests.Session()
+		# Sin reintentos automáticos: los reintentos los decide la cola de timbrado
+		adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamano_pool, max_retries=0)
+		sesion.mount("https://", adaptador)
+		sesion.mount("http://", adaptador)
+		_sesion = frappe._dict({"pid": pid, "tamano_pool": tamano_pool, "sesion": sesion})
+	
+	return _sesion.sesion
+
+
+def _post_pac(config, url, payload, headers):
+	"""POST al PAC con la sesión compartida y los timeouts configurados; registra la latencia"""
+	sesion = _get_sesion(cint(config.get("tamano_pool_conexiones")) or TAMANO_POOL_PREDETERMINADO)
+	timeout = (
+		flt(config.get("timeout_conexion")) or TIMEOUT_CONEXION_PREDETERMINADO,
+		flt(config.get("timeout_lectura")) or TIMEOUT_LECTURA_PREDETERMINADO
+	)
+	
+	inicio = time.perf_counter()
+	try:
+		response = sesion.post(url, data=payload, headers=headers, timeout=timeout)
+	except requests.exceptions.RequestException as e:
+		_registrar_metrica(inicio, type(e).__name__)
+		raise
+	
+	_registrar_metrica(inicio, response.status_code)
+	return response
+
+
+def _registrar_metrica(inicio, resultado):
+	"""Guarda la latencia de una llamada al PAC en Redis y en el log"""
+	duracion_ms = round((time.perf_counter() - inicio) * 1000, 1)
+	trazar("llamada_pac", "Info", resultado=resultado, duracion_ms=duracion_ms)
+	
+	try:
+		pipe = frappe.cache.pipeline(transaction=False)
+		clave = frappe.cache.make_key(CLAVE_METRICAS_PAC)
+		pipe.lpush(clave, json.dumps({
+			"fecha": str(now_datetime()),
+			"duracion_ms": duracion_ms,
+			"resultado": str(resultado)
+		}))
+		pipe.ltrim(clave, 0, MAX_METRICAS_PAC - 1)
+		pipe.execute()
+	except Exception:
+		# Las métricas no deben interrumpir el timbrado
+		pass
+
+
+def _nivel_traza():
+	"""Nivel de traza configurado; no falla si aún no existe Configuracion PAC"""
+	if frappe.local.site not in _configuracion and not frappe.db.exists("Configuracion PAC", "Configuracion PAC"):
+		return NIVELES_TRAZA[NIVEL_TRAZA_PREDETERMINADO]
+	nivel = _configuracion_pac().config.get("nivel_traza")
+	return NIVELES_TRAZA.get(nivel, NIVELES_TRAZA[NIVEL_TRAZA_PREDETERMINADO])
+
+
+def trazar(evento, nivel="Debug", **datos):
+	"""
+	Traza estructurada del PAC en el log `endersuite.pac`, filtrada por el nivel
+	de Configuracion PAC. Sustituye los Error Log de diagnóstico: escribir al
+	log no toca la base de datos.
+	
+	Args:
+		evento (str): Nombre corto del evento (ej. "llamada_pac")
+		nivel (str): "Error", "Info" o "Debug"
+		**datos: Campos del evento; no incluir credenciales ni certificados
+	"""
+	valor = NIVELES_TRAZA.get(nivel, NIVELES_TRAZA["Debug"])
+	if valor < _nivel_traza():
+		return
+	
+	frappe.logger("endersuite.pac").log(
+		# Debug se escribe como INFO: el filtro es nivel_traza, no el nivel del logger
+		max(valor, NIVELES_TRAZA["Info"]),
+		json.dumps({"evento": evento, "nivel": nivel, "usuario": frappe.session.user, **datos}, default=str)
+	)
+
+
+def invalidar_configuracion(doc=None, method=None):
+	"""
+	Invalida la configuración del PAC del sitio en todos los procesos.
+	Llamado desde hook on_update de Configuracion PAC.
+	
+	Args:
+		doc: Documento de Configuracion PAC
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	_configuracion.pop(frappe.local.site, None)
+	
+	_incrementar_version()
+	# Otra vez al confirmar, por si otro proceso recargó la configuración antes del commit
+	frappe.db.after_commit.add(_incrementar_version)
+
+
+def _incrementar_version():
+	# INCRBY es atómico: dos guardados simultáneos dan dos versiones distintas
+	pipe = frappe.cache.pipeline(transaction=False)
+	pipe.incrby(frappe.cache.make_key(CLAVE_VERSION_CONFIG_PAC), 1)
+	pipe.execute()
+
+
+@frappe.whitelist()
+def get_metricas_pac():
+	"""
+	Latencia de las últimas llamadas al PAC.
+	
+	Returns:
+		dict: {llamadas: [{fecha, duracion_ms, resultado}], total, promedio_ms, p50_ms, p95_ms}
+	"""
+	frappe.only_for("System Manager")
+	
+	pipe = frappe.cache.pipeline(transaction=False)
+	pipe.lrange(frappe.cache.make_key(CLAVE_METRICAS_PAC), 0, MAX_METRICAS_PAC - 1)
+	llamadas = [json.loads(l) for l in pipe.execute()[0]]
+	
+	duraciones = sorted(l["duracion_ms"] for l in llamadas)
+	if not duraciones:
+		return {"llamadas": [], "total": 0, "promedio_ms": 0, "p50_ms": 0, "p95_ms": 0}
+	
+	return {
+		"llamadas": llamadas,
+		"total": len(duraciones),
+		"promedio_ms": round(sum(duraciones) / len(duraciones), 1),
+		"p50_ms": duraciones[len(duraciones) // 2],
+		"p95_ms": duraciones[max(0, int(len(duraciones) * 0.95) - 1)]
+	}
+
 @frappe.whitelist()
 def test_connection():
 	"""Método público para probar la conexión con el PAC"""
@@ -4,6 +4,7 @@ Servicio centralizado para el manejo de métodos de pago y cálculos de totales
 
 import frappe
 from frappe import _
+from endersuite.ventas.services.session_service import get_totales_notas
 
 
 @frappe.whitelist()
@@ -21,25 +22,7 @@ def calcular_totales_por_metodo(notas_de_venta):
 		import json
 		notas_de_venta = json.loads(notas_de_venta)
 
-	totales = {}
-
-	for nota_name in notas_de_venta:
-		# Obtener métodos de pago de esta nota
-		metodos = frappe.get_all(
-			"Metodos de Pago Nota",
-			filters={"parent": nota_name, "parenttype": "Nota de Venta"},
-			fields=["metodo", "monto"]
-		)
-
-		for metodo_pago in metodos:
-			metodo = metodo_pago.metodo
-			monto = metodo_pago.monto or 0
-
-			if metodo not in totales:
-				totales[metodo] = 0
-			totales[metodo] += monto
-
-	return totales
+	return dict(get_totales_notas(notas_de_venta).metodos)
 
 
 def validar_metodo_pago_existe(metodo):
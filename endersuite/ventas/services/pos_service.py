@@ -1,9 +1,23 @@
 import frappe
 from frappe import _
-from frappe.utils import now_datetime
+from frappe.utils import add_to_date, get_datetime, get_datetime_str, now_datetime
 import json
-from endersuite.ventas.services.stock_service import check_availability
+from endersuite.ventas.services.stock_service import check_availability, get_datos_stock, get_existencias, STOCK_SIN_CONTROL
 from endersuite.ventas.services.payment_service import validar_metodo_pago_existe, obtener_metodo_predeterminado
+from endersuite.ventas.services.session_service import get_acumulados_sesion, calcular_efectivo_esperado, get_efectivo_acumulado
+from endersuite.ventas.services.search_service import buscar_productos
+from endersuite.ventas.services.price_service import resolve_prices
+
+# Máximo de ventas que acepta sync_sales en una sola petición
+MAX_VENTAS_POR_LOTE = 200
+
+# Campos de Producto que usa el catálogo del POS
+CAMPOS_PRODUCTO_POS = ['name as name', 'nombre_del_producto as nombre', 'sku', 'imagen',
+                       'mantener_stock', 'cantidad_disponible', 'tipo_de_impuesto', 'categoria',
+                       'requiere_lote', 'requiere_serie', 'codigo_barras']
+
+# Segundos que get_catalog_changes mira hacia atrás desde el token recibido
+SOLAPE_TOKEN_CATALOGO = 10
 
 # ============================================================================
 # FUNCIONES AUXILIARES
@@ -15,6 +29,7 @@ def calcular_efectivo_disponible(sesion):
     - Monto de apertura
     - Ventas en efectivo
     - Cambios dados
+    - Reembolsos en efectivo
     
     Args:
         sesion: Documento de Sesion POS
@@ -22,31 +37,8 @@ def calcular_efectivo_disponible(sesion):
     Returns:
         float: Efectivo disponible en caja
     """
-    efectivo_disponible = sesion.monto_apertura
-    
-    # Obtener todas las ventas de la sesión
-    ventas = frappe.get_all(
-        "Nota de Venta",
-        filters={"sesion_pos": sesion.name, "docstatus": 1},
-        fields=["name"]
-    )
-    
-    for venta in ventas:
-        # Sumar pagos en efectivo
-        pagos_efectivo = frappe.get_all(
-            "Metodos de Pago Nota",
-            filters={"parent": venta.name, "metodo": "Efectivo"},
-            fields=["monto"]
-        )
-        
-        for pago in pagos_efectivo:
-            efectivo_disponible += pago.monto
-        
-        # Restar cambio dado
-        cambio = frappe.db.get_value("Nota de Venta", venta.name, "cambio") or 0
-        efectivo_disponible -= cambio
-    
-    return efectivo_disponible
+    totales = get_acumulados_sesion(sesion.name)
+    return calcular_efectivo_esperado(totales, sesion.monto_apertura)
 
 @frappe.whitelist()
 def get_efectivo_disponible(sesion_name):
@@ -59,8 +51,10 @@ def get_efectivo_disponible(sesion_name):
     Returns:
         dict: {efectivo_disponible: float}
     """
-    sesion = frappe.get_doc("Sesion POS", sesion_name)
-    efectivo = calcular_efectivo_disponible(sesion)
+    # Lectura O(1) de los acumulados mantenidos por los hooks de Nota de Venta y Reembolso
+    efectivo = get_efectivo_acumulado(sesion_name)
+    if efectivo is None:
+        frappe.throw(_("La sesión POS {0} no existe").format(sesion_name))
     
     return {
         "efectivo_disponible": efectivo
@@ -255,7 +249,7 @@ def get_session_summary(sesion_pos):
     Returns:
         dict: Resumen con ventas, totales y monto esperado
     """
-    sesion = frappe.get_doc("Sesion POS", sesion_pos)
+    monto_apertura = frappe.db.get_value("Sesion POS", sesion_pos, "monto_apertura") or 0
 
     # Obtener todas las notas de venta de la sesión (solo enviadas)
     ventas = frappe.get_all(
@@ -265,34 +259,19 @@ def get_session_summary(sesion_pos):
         order_by="fecha_y_hora_de_venta desc"
     )
 
-    # Calcular totales
-    total_ventas = sum([v.total_final for v in ventas])
-    num_ventas = len(ventas)
-
-    # Calcular monto esperado en efectivo
-    # Monto apertura + ventas en efectivo - cambios dados
-    monto_efectivo = sesion.monto_apertura
-
-    for venta in ventas:
-        # Obtener métodos de pago de cada venta
-        metodos = frappe.get_all(
-            "Metodos de Pago Nota",
-            filters={"parent": venta.name},
-            fields=["metodo", "monto"]
-        )
-
-        for metodo in metodos:
-            if metodo.metodo == "Efectivo":
-                monto_efectivo += metodo.monto
+    # Acumulados de la sesión: la misma fuente que get_efectivo_disponible
+    totales = get_acumulados_sesion(sesion_pos)
+    total_ventas = totales.total_ventas
+    num_ventas = totales.num_ventas
 
-        # Restar el cambio dado (solo se da en efectivo)
-        cambio = frappe.db.get_value("Nota de Venta", venta.name, "cambio") or 0
-        monto_efectivo -= cambio
+    # Monto apertura + ventas en efectivo - cambios dados - reembolsos en efectivo
+    monto_efectivo = calcular_efectivo_esperado(totales, monto_apertura)
 
     return {
         "total_ventas": total_ventas,
         "num_ventas": num_ventas,
         "monto_esperado": monto_efectivo,
+        "total_reembolsos": totales.reembolsos,
         "ventas": ventas
     }
 
@@ -310,6 +289,9 @@ def close_pos_session(sesion_pos, monto_real, observaciones=None):
     Returns:
         dict: Resumen del cierre
     """
+    # Misma fila que bloquea _aplicar_delta_sesion: ninguna venta concurrente
+    # cambia los acumulados entre la lectura y el guardado del cierre
+    frappe.db.sql("SELECT name FROM `tabSesion POS` WHERE name = %s FOR UPDATE", sesion_pos)
     sesion = frappe.get_doc("Sesion POS", sesion_pos)
 
     # Validar que sea del usuario actual
@@ -322,11 +304,15 @@ def close_pos_session(sesion_pos, monto_real, observaciones=None):
     # Limpiar ventas que no existen o están canceladas
     ventas_validas = []
     if hasattr(sesion, 'ventas') and sesion.ventas:
-        for venta in sesion.ventas:
-            if venta.nota_de_venta and frappe.db.exists("Nota de Venta", venta.nota_de_venta):
-                docstatus = frappe.db.get_value("Nota de Venta", venta.nota_de_venta, "docstatus")
-                if docstatus == 1:  # Solo ventas enviadas
-                    ventas_validas.append(venta)
+        notas_enviadas = set(frappe.get_all(
+            "Nota de Venta",
+            filters={
+                "name": ["in", [v.nota_de_venta for v in sesion.ventas if v.nota_de_venta]],
+                "docstatus": 1  # Solo ventas enviadas
+            },
+            pluck="name"
+        ))
+        ventas_validas = [v for v in sesion.ventas if v.nota_de_venta in notas_enviadas]
 
     # Actualizar la tabla con solo ventas válidas
     sesion.ventas = []
@@ -344,18 +330,11 @@ def close_pos_session(sesion_pos, monto_real, observaciones=None):
         'Transferencia': 0,
         'Cheque': 0
     }
-    
-    # Obtener todos los métodos de pago de las ventas válidas
-    for venta in ventas_validas:
-        metodos = frappe.get_all(
-            "Metodos de Pago Nota",
-            filters={"parent": venta.nota_de_venta},
-            fields=["metodo", "monto"]
-        )
-        
-        for metodo in metodos:
-            if metodo.metodo in totales_metodos:
-                totales_metodos[metodo.metodo] += metodo.monto
+
+    totales_sesion = get_acumulados_sesion(sesion.name)
+    for metodo, monto in totales_sesion.metodos.items():
+        if metodo in totales_metodos:
+            totales_metodos[metodo] += monto
 
     # Actualizar datos de cierre
     sesion.fecha_hora_cierre = now_datetime()
@@ -375,9 +354,6 @@ def close_pos_session(sesion_pos, monto_real, observaciones=None):
     if hasattr(sesion, 'monto_cierre'):
         sesion.monto_cierre = monto_real_float
     
-    # Calcular diferencia (efectivo contado - efectivo sistema)
-    sesion.diferencia = monto_real_float - totales_metodos['Efectivo']
-
     if observaciones:
         if hasattr(sesion, 'observaciones'):
             sesion.observaciones = observaciones
@@ -389,17 +365,17 @@ def close_pos_session(sesion_pos, monto_real, observaciones=None):
     sesion.submit()
     frappe.db.commit()
 
-    # Calcular diferencia para retornar
-    resumen = get_session_summary(sesion_pos)
-    diferencia = monto_real_float - resumen.get('monto_esperado', 0)
+    # Calcular diferencia para retornar (los totales no cambian al cerrar)
+    monto_esperado = calcular_efectivo_esperado(totales_sesion, sesion.monto_apertura)
+    diferencia = monto_real_float - monto_esperado
 
     return {
         "name": sesion.name,
         "total_ventas": len(sesion.ventas),
-        "monto_esperado": resumen.get('monto_esperado', 0),
+        "monto_esperado": monto_esperado,
         "monto_real": monto_real_float,
         "diferencia": diferencia,
-        "total_general": resumen.get('total_ventas', 0)
+        "total_general": totales_sesion.total_ventas
     }
 
 
@@ -426,67 +402,156 @@ def get_productos_pos(almacen, lista_de_precios, limit=100):
     # Obtener productos activos
     productos = frappe.get_all(
         'Producto',
-        fields=['name as name', 'nombre_del_producto as nombre', 'sku', 'imagen',
-                'mantener_stock', 'cantidad_disponible', 'tipo_de_impuesto', 'categoria'],
+        fields=CAMPOS_PRODUCTO_POS,
         limit_page_length=limit,
         order_by='nombre_del_producto asc'
     )
 
+    return _construir_productos_pos(productos, almacen, lista_de_precios)
+
+
+def _construir_productos_pos(productos, almacen, lista_de_precios):
+    """
+    Completa filas de Producto con precio, existencia e impuesto para el POS.
+
+    Args:
+        productos (list): Filas de Producto con los campos de CAMPOS_PRODUCTO_POS
+        almacen (str): Almacén para consultar stock
+        lista_de_precios (str): Lista de precios a usar
+
+    Returns:
+        list: Productos con precio, stock e impuesto
+    """
     if not productos:
         return []
 
     nombres = [p['name'] for p in productos]
 
-    # Obtener precios de la lista especificada
-    precios = frappe.get_all(
-        'Precios productos',
-        filters={
-            'parenttype': 'Producto',
-            'lista_de_precios': lista_de_precios,
-            'parent': ['in', nombres],
-        },
-        fields=['parent', 'precio_unitario'],
-        limit_page_length=len(nombres)
-    )
-
-    precio_map = {pp['parent']: pp.get('precio_unitario', 0) for pp in precios}
+    # Precio e impuesto desde la caché de la lista de precios
+    precios = resolve_prices(lista_de_precios, nombres)
 
-    # Obtener porcentajes de impuesto
-    impuestos_map = {}
-    impuestos_unicos = list(set([p.get('tipo_de_impuesto') for p in productos if p.get('tipo_de_impuesto')]))
-
-    if impuestos_unicos:
-        impuestos_data = frappe.get_all(
-            'Impuestos',
-            filters={'name': ['in', impuestos_unicos]},
-            fields=['name', 'porciento_impuesto', 'incluido_en_el_precio']
-        )
-        impuestos_map = {imp['name']: {
-            'porcentaje': imp.get('porciento_impuesto', 0),
-            'incluido': imp.get('incluido_en_el_precio', 0)
-        } for imp in impuestos_data}
+    # Existencias del almacén en una sola consulta
+    existencias = get_existencias(nombres, almacen)
 
     # Construir resultado
     resultado = []
     for p in productos:
-        impuesto_info = impuestos_map.get(p.get('tipo_de_impuesto'), {'porcentaje': 0, 'incluido': 0})
+        precio = precios.get(p['name']) or {}
         resultado.append({
             'name': p['name'],
             'nombre': p.get('nombre', p['name']),
             'sku': p.get('sku', ''),
             'imagen': p.get('imagen'),
-            'precio': precio_map.get(p['name'], 0),
-            'cantidad_disponible': p.get('cantidad_disponible', 0) if p.get('mantener_stock') else 999999,
+            'categoria': p.get('categoria'),
+            'precio': precio.get('precio_unitario', 0),
+            'cantidad_disponible': existencias.get(p['name'], 0) if p.get('mantener_stock') else STOCK_SIN_CONTROL,
             'mantener_stock': p.get('mantener_stock', 0),
+            'requiere_lote': p.get('requiere_lote', 0),
+            'requiere_serie': p.get('requiere_serie', 0),
             'tipo_de_impuesto': p.get('tipo_de_impuesto'),
-            'porcentaje_impuesto': impuesto_info['porcentaje'],
-            'incluido_en_el_precio': impuesto_info['incluido'],
+            'porcentaje_impuesto': precio.get('porcentaje_impuesto', 0),
+            'incluido_en_el_precio': precio.get('incluido_en_el_precio', 0),
             'codigo_barras': p.get('codigo_barras', '')
         })
 
     return resultado
 
 
+@frappe.whitelist()
+def get_catalog_changes(since_token=None, lista_de_precios=None, almacen=None):
+    """
+    Devuelve solo los productos del catálogo POS que cambiaron desde un token.
+
+    Un producto se considera modificado si cambió su registro, su precio en la
+    lista, su existencia en el almacén o el impuesto que usa. Sin token se
+    devuelve el catálogo completo. El cliente guarda el token recibido y lo
+    envía en la siguiente llamada.
+
+    Args:
+        since_token (str, optional): Token devuelto por la llamada anterior
+        lista_de_precios (str): Lista de precios a usar
+        almacen (str): Almacén para consultar stock
+
+    Returns:
+        dict: {token, completo, productos, eliminados}
+    """
+    if not lista_de_precios:
+        frappe.throw(_('Se requiere Lista de Precios'))
+
+    # El token se toma antes de consultar para no perder cambios concurrentes
+    token = now_datetime()
+    desde = _leer_token_catalogo(since_token)
+
+    if not desde:
+        productos = frappe.get_all(
+            'Producto',
+            fields=CAMPOS_PRODUCTO_POS,
+            order_by='nombre_del_producto asc',
+            limit_page_length=0
+        )
+        return {
+            'token': _emitir_token_catalogo(token),
+            'completo': True,
+            'productos': _construir_productos_pos(productos, almacen, lista_de_precios),
+            'eliminados': []
+        }
+
+    # Ventana de solape: un cambio confirmado tarde con marca de tiempo anterior
+    # al token no se pierde; el cliente aplica los cambios de forma idempotente
+    desde = add_to_date(desde, seconds=-SOLAPE_TOKEN_CATALOGO)
+
+    modificados = frappe.db.sql("""
+        SELECT name FROM `tabProducto` WHERE modified >= %(desde)s
+        UNION
+        SELECT parent FROM `tabPrecios productos`
+        WHERE parenttype = 'Producto' AND lista_de_precios = %(lista)s AND modified >= %(desde)s
+        UNION
+        SELECT producto FROM `tabStock por Almacen`
+        WHERE almacen = %(almacen)s AND modified >= %(desde)s
+        UNION
+        SELECT p.name FROM `tabProducto` p
+        INNER JOIN `tabImpuestos` i ON i.name = p.tipo_de_impuesto
+        WHERE i.modified >= %(desde)s
+    """, {'desde': desde, 'lista': lista_de_precios, 'almacen': almacen or ''}, pluck=True)
+
+    productos = []
+    if modificados:
+        productos = frappe.get_all(
+            'Producto',
+            filters={'name': ['in', modificados]},
+            fields=CAMPOS_PRODUCTO_POS,
+            limit_page_length=0
+        )
+
+    eliminados = frappe.get_all(
+        'Deleted Document',
+        filters={'deleted_doctype': 'Producto', 'creation': ['>=', desde]},
+        pluck='deleted_name'
+    )
+
+    return {
+        'token': _emitir_token_catalogo(token),
+        'completo': False,
+        'productos': _construir_productos_pos(productos, almacen, lista_de_precios),
+        'eliminados': eliminados
+    }
+
+
+def _emitir_token_catalogo(momento):
+    """Token opaco para el cliente: marca de tiempo del servidor"""
+    return get_datetime_str(momento)
+
+
+def _leer_token_catalogo(since_token):
+    """Convierte un token en fecha; un token inválido obliga a recargar el catálogo"""
+    if not since_token:
+        return None
+    try:
+        return get_datetime(since_token)
+    except Exception:
+        return None
+
+
 @frappe.whitelist()
 def get_stock_actual(productos, almacen):
     """
@@ -505,12 +570,7 @@ def get_stock_actual(productos, almacen):
     if not productos:
         return {}
 
-    stock_map = {}
-    for producto in productos:
-        cantidad = frappe.db.get_value('Producto', producto, 'cantidad_disponible') or 0
-        stock_map[producto] = cantidad
-
-    return stock_map
+    return get_existencias(productos, almacen)
 
 
 @frappe.whitelist()
@@ -525,18 +585,10 @@ def get_product_price(producto, lista_de_precios):
     Returns:
         dict: Precio y datos del producto
     """
-    precio = frappe.db.get_value(
-        'Precios productos',
-        {
-            'parent': producto,
-            'parenttype': 'Producto',
-            'lista_de_precios': lista_de_precios
-        },
-        'precio_unitario'
-    )
+    precio = resolve_prices(lista_de_precios, [producto]).get(producto) or {}
 
     return {
-        'precio': precio or 0,
+        'precio': precio.get('precio_unitario', 0),
         'producto': producto
     }
 
@@ -544,7 +596,7 @@ def get_product_price(producto, lista_de_precios):
 @frappe.whitelist()
 def search_products(query, lista_de_precios, almacen=None, limit=20):
     """
-    Busca productos por nombre o SKU con precio y stock.
+    Busca productos por nombre, SKU o código de barras con precio y stock.
     
     Args:
         query (str): Término de búsqueda
@@ -558,47 +610,39 @@ def search_products(query, lista_de_precios, almacen=None, limit=20):
     if not query or len(query) < 2:
         return []
     
-    # Buscar por nombre o SKU
-    productos = frappe.db.sql("""
-        SELECT 
-            name, sku, imagen, mantener_stock, cantidad_disponible,
-            requiere_lote, requiere_serie, tipo_de_impuesto
-        FROM `tabProducto`
-        WHERE (nombre_del_producto LIKE %(query)s OR sku LIKE %(query)s)
-        LIMIT %(limit)s
-    """, {
-        "query": f"%{query}%",
-        "limit": limit
-    }, as_dict=True)
-    
-    if not productos:
+    # Código exacto (SKU o código de barras) primero, luego nombres ordenados por relevancia
+    nombres = buscar_productos(query, limit)
+    if not nombres:
         return []
     
-    nombres = [p['name'] for p in productos]
-    
-    # Obtener precios
-    precios = frappe.get_all(
-        'Precios productos',
-        filters={
-            'parenttype': 'Producto',
-            'lista_de_precios': lista_de_precios,
-            'parent': ['in', nombres],
-        },
-        fields=['parent', 'precio_unitario'],
-        limit_page_length=len(nombres)
-    )
+    filas = {
+        p['name']: p
+        for p in frappe.get_all(
+            'Producto',
+            filters={'name': ['in', nombres]},
+            fields=['name', 'nombre_del_producto as nombre', 'sku', 'codigo_barras', 'imagen',
+                    'mantener_stock', 'cantidad_disponible', 'requiere_lote', 'requiere_serie',
+                    'tipo_de_impuesto'],
+            limit_page_length=0
+        )
+    }
+    productos = [filas[n] for n in nombres if n in filas]
     
-    precio_map = {pp['parent']: pp.get('precio_unitario', 0) for pp in precios}
+    # Obtener precios desde la caché de la lista
+    precios = resolve_prices(lista_de_precios, nombres)
+    existencias = get_existencias(nombres, almacen)
     
     # Construir resultado
     resultado = []
     for p in productos:
         resultado.append({
             'name': p['name'],
+            'nombre': p.get('nombre'),
             'sku': p.get('sku'),
+            'codigo_barras': p.get('codigo_barras'),
             'imagen': p.get('imagen'),
-            'precio': precio_map.get(p['name'], 0),
-            'cantidad_disponible': p.get('cantidad_disponible', 0) if p.get('mantener_stock') else 999999,
+            'precio': (precios.get(p['name']) or {}).get('precio_unitario', 0),
+            'cantidad_disponible': existencias.get(p['name'], 0) if p.get('mantener_stock') else STOCK_SIN_CONTROL,
             'mantener_stock': p.get('mantener_stock', 0),
             'requiere_lote': p.get('requiere_lote', 0),
             'requiere_serie': p.get('requiere_serie', 0),
@@ -628,18 +672,8 @@ def get_products_with_price(lista_de_precios: str, almacen=None, limit: int = 50
 
     nombres = [p['name'] for p in productos]
 
-    precios = frappe.get_all(
-        'Precios productos',
-        filters={
-            'parenttype': 'Producto',
-            'lista_de_precios': lista_de_precios,
-            'parent': ['in', nombres],
-        },
-        fields=['parent', 'precio_unitario'],
-        limit_page_length=limit * 3,
-    )
-
-    precio_map = {pp['parent']: pp.get('precio_unitario') for pp in precios}
+    precios = resolve_prices(lista_de_precios, nombres)
+    existencias = get_existencias(nombres, almacen)
 
     resultado = []
     for p in productos:
@@ -647,8 +681,8 @@ def get_products_with_price(lista_de_precios: str, almacen=None, limit: int = 50
             'name': p['name'],
             'sku': p.get('sku'),
             'imagen': p.get('imagen'),
-            'precio': precio_map.get(p['name'], 0),
-            'cantidad_disponible': p.get('cantidad_disponible', 0) if p.get('mantener_stock') else 999999,
+            'precio': (precios.get(p['name']) or {}).get('precio_unitario', 0),
+            'cantidad_disponible': existencias.get(p['name'], 0) if p.get('mantener_stock') else STOCK_SIN_CONTROL,
             'mantener_stock': p.get('mantener_stock', 0),
             'requiere_lote': p.get('requiere_lote', 0),
             'requiere_serie': p.get('requiere_serie', 0),
@@ -715,6 +749,47 @@ def get_pos_payment_methods(profile_name):
 # CREACIÓN DE NOTAS DE VENTA
 # ============================================================================
 
+def preparar_contexto_venta(sesion_pos, productos):
+    """
+    Precarga los datos maestros de una venta para reutilizarlos durante
+    validate, submit y los hooks de stock de la Nota de Venta.
+
+    El contexto se adjunta a la nota en `nota.flags.contexto_venta`; los
+    métodos que lo encuentran no vuelven a consultar la base de datos.
+
+    Args:
+        sesion_pos (str): Sesión POS activa
+        productos (list): Líneas del carrito
+
+    Returns:
+        frappe._dict: {sesion, perfil, datos_stock}
+    """
+    sesion = frappe.db.get_value(
+        "Sesion POS",
+        sesion_pos,
+        ["name", "estado", "usuario", "perfil_pos"],
+        as_dict=True
+    )
+    if not sesion:
+        frappe.throw(_("La sesión POS {0} no existe").format(sesion_pos))
+
+    perfil = frappe.db.get_value(
+        "Perfil de POS",
+        sesion.perfil_pos,
+        ["almacen", "lista_de_precios"],
+        as_dict=True
+    ) or frappe._dict()
+
+    nombres = [item.get('producto') for item in productos]
+
+    # Las tasas de impuesto salen de la tabla en memoria de tax_service
+    return frappe._dict({
+        "sesion": sesion,
+        "perfil": perfil,
+        "datos_stock": get_datos_stock(nombres, perfil.almacen)
+    })
+
+
 @frappe.whitelist()
 def create_sale(sesion_pos, productos, metodos_pago, total, cliente=None, imprimir_ticket=False):
     """
@@ -737,22 +812,44 @@ def create_sale(sesion_pos, productos, metodos_pago, total, cliente=None, imprim
     if isinstance(metodos_pago, str):
         metodos_pago = json.loads(metodos_pago)
 
-    # Obtener sesión y perfil
-    sesion = frappe.get_doc("Sesion POS", sesion_pos)
-    perfil_pos = sesion.perfil_pos
+    venta = _registrar_venta(sesion_pos, productos, metodos_pago, cliente, imprimir_ticket)
+    frappe.db.commit()
+
+    return venta
+
+
+def _registrar_venta(sesion_pos, productos, metodos_pago, cliente=None, imprimir_ticket=False,
+                     clave_idempotencia=None, fecha_y_hora_de_venta=None):
+    """
+    Inserta y envía una Nota de Venta sin confirmar la transacción.
+
+    Args:
+        sesion_pos (str): Sesión POS activa
+        productos (list): Lista de productos del carrito
+        metodos_pago (list): Lista de métodos de pago
+        cliente (str, optional): Cliente para la venta
+        imprimir_ticket (bool): Si se debe marcar como impreso o no
+        clave_idempotencia (str, optional): Clave generada por el POS para evitar duplicados
+        fecha_y_hora_de_venta (str, optional): Momento en que se cobró la venta en caja
 
-    # Obtener perfil para almacén y lista de precios
-    profile = frappe.get_doc("Perfil de POS", perfil_pos)
-    almacen = profile.almacen
-    lista_de_precios = profile.lista_de_precios
+    Returns:
+        dict: Datos de la nota de venta creada con productos y métodos de pago
+    """
+    # Precargar una sola vez los datos maestros que usan validate, submit y los hooks de stock
+    contexto = preparar_contexto_venta(sesion_pos, productos)
+    perfil_pos = contexto.sesion.perfil_pos
+    almacen = contexto.perfil.almacen
+    lista_de_precios = contexto.perfil.lista_de_precios
 
     # Crear nota de venta
     nota = frappe.new_doc("Nota de Venta")
+    nota.flags.contexto_venta = contexto
     nota.sesion_pos = sesion_pos
     nota.perfil_pos = perfil_pos
     nota.almacen = almacen
     nota.lista_de_precios = lista_de_precios
-    nota.fecha_y_hora_de_venta = now_datetime()
+    nota.fecha_y_hora_de_venta = fecha_y_hora_de_venta or now_datetime()
+    nota.clave_idempotencia = clave_idempotencia
 
     # Usar cliente proporcionado o cliente genérico
     if cliente:
@@ -793,17 +890,28 @@ def create_sale(sesion_pos, productos, metodos_pago, total, cliente=None, imprim
     # Guardar y enviar
     nota.insert(ignore_permissions=True)
     nota.submit()
-    frappe.db.commit()
 
-    # Recargar para obtener todos los datos calculados
-    nota.reload()
+    # Retornar datos completos para el ticket (ya calculados en memoria por validate)
+    datos = _datos_ticket_venta(nota)
+
+    # El ticket se renderiza desde la nota en memoria; un error aquí no anula la venta
+    if imprimir_ticket:
+        try:
+            datos['ticket_html'] = _html_ticket(nota)
+        except Exception:
+            frappe.log_error(title=_("Error generando ticket"), message=frappe.get_traceback())
 
-    # Retornar datos completos para el ticket
+    return datos
+
+
+def _datos_ticket_venta(nota):
+    """Datos de una Nota de Venta que el POS necesita para mostrar el ticket"""
     return {
         'name': nota.name,
         'subtotal': nota.subtotal,
         'total_impuestos': nota.total_impuestos,
         'total_final': nota.total_final,
+        'cambio': nota.cambio,
         'productos': [{
             'nombre': item.producto,
             'cantidad': item.cantidad,
@@ -816,6 +924,88 @@ def create_sale(sesion_pos, productos, metodos_pago, total, cliente=None, imprim
     }
 
 
+@frappe.whitelist()
+def sync_sales(batch):
+    """
+    Registra en una sola petición las ventas que el POS encoló sin conexión.
+
+    Cada venta trae una clave de idempotencia generada en el cliente. Las claves
+    ya registradas no se vuelven a procesar, así que reenviar un lote es seguro.
+    Cada venta se confirma por separado: un error en una no descarta las demás.
+
+    Args:
+        batch (list|str): Ventas con clave, sesion_pos, productos, metodos_pago,
+            cliente, imprimir_ticket y fecha_y_hora_de_venta
+
+    Returns:
+        list: Un resultado por venta {clave, estado, nota, mensaje, venta}
+            donde estado es "creada", "duplicada" o "error"
+    """
+    if isinstance(batch, str):
+        batch = json.loads(batch)
+
+    if len(batch) > MAX_VENTAS_POR_LOTE:
+        frappe.throw(_("El lote excede el máximo de {0} ventas").format(MAX_VENTAS_POR_LOTE))
+
+    claves = [venta.get('clave') for venta in batch if venta.get('clave')]
+    registradas = {}
+    if claves:
+        registradas = {
+            row.clave_idempotencia: row.name
+            for row in frappe.get_all(
+                'Nota de Venta',
+                filters={'clave_idempotencia': ['in', claves]},
+                fields=['name', 'clave_idempotencia']
+            )
+        }
+
+    resultados = []
+    for venta in batch:
+        clave = venta.get('clave')
+
+        if not clave:
+            resultados.append({
+                'clave': None,
+                'estado': 'error',
+                'mensaje': _('La venta no tiene clave de idempotencia')
+            })
+            continue
+
+        if clave in registradas:
+            resultados.append({'clave': clave, 'estado': 'duplicada', 'nota': registradas[clave]})
+            continue
+
+        try:
+            frappe.db.savepoint('sync_sale')
+            datos = _registrar_venta(
+                venta.get('sesion_pos'),
+                venta.get('productos') or [],
+                venta.get('metodos_pago') or [],
+                cliente=venta.get('cliente'),
+                imprimir_ticket=venta.get('imprimir_ticket'),
+                clave_idempotencia=clave,
+                fecha_y_hora_de_venta=venta.get('fecha_y_hora_de_venta')
+            )
+            frappe.db.commit()
+        except frappe.DuplicateEntryError:
+            # Otra petición registró la misma clave mientras procesábamos el lote
+            frappe.db.rollback(save_point='sync_sale')
+            nota = frappe.db.get_value('Nota de Venta', {'clave_idempotencia': clave}, 'name')
+            resultados.append({'clave': clave, 'estado': 'duplicada', 'nota': nota})
+            registradas[clave] = nota
+            continue
+        except Exception as e:
+            frappe.db.rollback(save_point='sync_sale')
+            frappe.clear_messages()
+            resultados.append({'clave': clave, 'estado': 'error', 'mensaje': str(e)})
+            continue
+
+        registradas[clave] = datos['name']
+        resultados.append({'clave': clave, 'estado': 'creada', 'nota': datos['name'], 'venta': datos})
+
+    return resultados
+
+
 # ============================================================================
 # IMPRESIÓN DE TICKET
 # ============================================================================
@@ -833,31 +1023,76 @@ def generate_ticket_html(nota_venta_name, formato_name=None):
         str: HTML del ticket
     """
     try:
-        # Si no se especifica formato, intentar obtenerlo del perfil POS
-        if not formato_name:
-            nota = frappe.get_doc("Nota de Venta", nota_venta_name)
-            if nota.perfil_pos:
-                formato_name = frappe.get_value("Perfil de POS", nota.perfil_pos, "formato_ticket")
-        
-        # Si hay formato personalizado, usarlo
-        if formato_name and frappe.db.exists("Formato de Ticket", formato_name):
-            from endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket import generar_ticket_html
-            return generar_ticket_html(nota_venta_name, formato_name)
-        
-        # Buscar formato predeterminado
-        formato_pred = frappe.get_value("Formato de Ticket", {"predeterminado": 1}, "name")
-        if formato_pred:
-            from endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket import generar_ticket_html
-            return generar_ticket_html(nota_venta_name, formato_pred)
-        
-        # Fallback al formato de impresión estándar
-        html = frappe.get_print(
-            doctype="Nota de Venta",
-            name=nota_venta_name,
-            print_format="Ticket Nota de Venta",
-            no_letterhead=1
-        )
-        return html
+        nota = frappe.get_doc("Nota de Venta", nota_venta_name)
+        return _html_ticket(nota, formato_name)
     except Exception as e:
         frappe.log_error(f"Error generando ticket: {str(e)}")
         frappe.throw(_("Error al generar el ticket: {0}").format(str(e)))
+
+
+
+@frappe.whitelist()
+def generate_ticket_escpos(nota_venta_name, formato_name=None):
+    """
+    Descarga el ticket como comandos ESC/POS para enviarlo directo a una
+    impresora térmica, sin maquetación HTML.
+
+    Args:
+        nota_venta_name (str): Nombre de la Nota de Venta
+        formato_name (str): Nombre del formato de ticket (opcional)
+    """
+    from endersuite.ventas.services.escpos_service import generar_ticket_escpos
+
+    nota = frappe.get_doc("Nota de Venta", nota_venta_name)
+
+    frappe.response["type"] = "binary"
+    frappe.response["filename"] = f"{nota.name}.bin"
+    frappe.response["filecontent"] = generar_ticket_escpos(nota, formato_name)
+
+
+@frappe.whitelist()
+def generate_ticket_text(nota_venta_name, formato_name=None):
+    """
+    Genera el ticket en texto plano con el ancho del formato, para impresoras
+    sin ESC/POS.
+
+    Args:
+        nota_venta_name (str): Nombre de la Nota de Venta
+        formato_name (str): Nombre del formato de ticket (opcional)
+
+    Returns:
+        str: Ticket en texto plano
+    """
+    from endersuite.ventas.services.escpos_service import generar_ticket_texto
+
+    nota = frappe.get_doc("Nota de Venta", nota_venta_name)
+    return generar_ticket_texto(nota, formato_name)
+
+def _html_ticket(nota, formato_name=None):
+    """
+    HTML del ticket de una Nota de Venta ya cargada.
+
+    Usa el formato indicado, el del Perfil de POS o el predeterminado con las
+    plantillas compiladas en caché; si no hay formatos configurados usa el
+    formato de impresión estándar.
+
+    Args:
+        nota: Documento de Nota de Venta
+        formato_name (str): Nombre del formato de ticket (opcional)
+
+    Returns:
+        str: HTML del ticket
+    """
+    from endersuite.ventas.doctype.formato_de_ticket.formato_de_ticket import renderizar_ticket
+
+    html = renderizar_ticket(nota, formato_name)
+    if html is not None:
+        return html
+
+    # Fallback al formato de impresión estándar
+    return frappe.get_print(
+        doctype="Nota de Venta",
+        name=nota.name,
+        print_format="Ticket Nota de Venta",
+        no_letterhead=1
+    )
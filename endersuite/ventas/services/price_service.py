@@ -0,0 +1,215 @@
+import json
+
+import frappe
+from frappe.utils import flt
+
+
+# Prefijo de las claves de precios en Redis
+PREFIJO_PRECIOS = "endersuite:precios"
+
+
+# ============================================================================
+# CLAVES EN REDIS
+# ============================================================================
+
+def _clave(*partes):
+	return frappe.cache.make_key(":".join((PREFIJO_PRECIOS,) + partes))
+
+
+def _pipeline():
+	"""Pipeline de Redis sin el prefijado automático de RedisWrapper; las claves ya vienen de _clave"""
+	return frappe.cache.pipeline(transaction=False)
+
+
+# ============================================================================
+# RESOLUCIÓN DE PRECIOS
+# ============================================================================
+
+def _cargar_precios_db(lista_de_precios, productos):
+	"""
+	Precio y datos de impuesto de varios productos en una sola consulta.
+
+	Args:
+		lista_de_precios (str): Lista de precios
+		productos (list): Nombres de producto
+
+	Returns:
+		dict: producto -> precio (ver resolve_prices); incluye los productos sin precio
+	"""
+	filas = frappe.db.sql("""
+		SELECT
+			p.name AS producto,
+			pp.precio_unitario,
+			pp.precio_total,
+			p.tipo_de_impuesto,
+			i.porciento_impuesto,
+			i.incluido_en_el_precio,
+			pp.name IS NOT NULL AS tiene_precio
+		FROM `tabProducto` p
+		LEFT JOIN `tabPrecios productos` pp
+			ON pp.parent = p.name
+			AND pp.parenttype = 'Producto'
+			AND pp.lista_de_precios = %(lista)s
+		LEFT JOIN `tabImpuestos` i ON i.name = p.tipo_de_impuesto
+		WHERE p.name IN %(productos)s
+	""", {"lista": lista_de_precios, "productos": tuple(productos)}, as_dict=True)
+
+	precios = {}
+	for fila in filas:
+		# Si la lista repite un producto se respeta la primera fila, como get_value
+		if fila.producto in precios:
+			continue
+		precios[fila.producto] = {
+			"precio_unitario": flt(fila.precio_unitario),
+			"precio_total": flt(fila.precio_total),
+			"tipo_de_impuesto": fila.tipo_de_impuesto,
+			"porcentaje_impuesto": flt(fila.porciento_impuesto),
+			"incluido_en_el_precio": fila.incluido_en_el_precio or 0,
+			"tiene_precio": 1 if fila.tiene_precio else 0
+		}
+	return precios
+
+
+def resolve_prices(lista_de_precios, productos):
+	"""
+	Resuelve el precio de varios productos en una lista de precios.
+
+	Los precios viven en un hash de Redis por lista. Solo los productos que no
+	están en caché se leen de la base de datos, todos en una consulta, y se
+	guardan para las siguientes llamadas; también se guardan los productos sin
+	precio en la lista para no volver a consultarlos.
+
+	Args:
+		lista_de_precios (str): Lista de precios
+		productos (list): Nombres de producto
+
+	Returns:
+		dict: producto -> {precio_unitario, precio_total, tipo_de_impuesto,
+			porcentaje_impuesto, incluido_en_el_precio, tiene_precio}.
+			Los productos inexistentes no aparecen.
+	"""
+	productos = list(dict.fromkeys(p for p in productos or [] if p))
+	if not lista_de_precios or not productos:
+		return {}
+
+	pipe = _pipeline()
+	pipe.hmget(_clave("lista", lista_de_precios), productos)
+	en_cache = pipe.execute()[0]
+
+	precios = {}
+	faltantes = []
+	for producto, valor in zip(productos, en_cache, strict=True):
+		if valor is None:
+			faltantes.append(producto)
+		else:
+			precios[producto] = json.loads(valor)
+
+	if faltantes:
+		cargados = _cargar_precios_db(lista_de_precios, faltantes)
+		if cargados:
+			pipe = _pipeline()
+			pipe.hset(
+				_clave("lista", lista_de_precios),
+				mapping={p: json.dumps(v) for p, v in cargados.items()}
+			)
+			pipe.sadd(_clave("listas"), lista_de_precios)
+			pipe.execute()
+		precios.update(cargados)
+
+	return precios
+
+
+@frappe.whitelist()
+def get_precios(lista_de_precios, productos):
+	"""
+	Versión whitelisted de resolve_prices para el POS.
+
+	Args:
+		lista_de_precios (str): Lista de precios
+		productos (list|str): Nombres de producto
+
+	Returns:
+		dict: producto -> precio (ver resolve_prices)
+	"""
+	if isinstance(productos, str):
+		productos = json.loads(productos)
+	return resolve_prices(lista_de_precios, productos)
+
+
+# ============================================================================
+# INVALIDACIÓN
+# ============================================================================
+
+def _listas_en_cache():
+	pipe = _pipeline()
+	pipe.smembers(_clave("listas"))
+	return [l.decode() if isinstance(l, bytes) else l for l in pipe.execute()[0]]
+
+
+def invalidar_productos(productos):
+	"""
+	Quita de todas las listas en caché los precios de los productos indicados.
+
+	Se invalida de inmediato y otra vez al confirmar la transacción, para que
+	una lectura concurrente no vuelva a guardar el precio anterior.
+
+	Args:
+		productos (list): Nombres de producto
+	"""
+	productos = list(productos or [])
+	if not productos:
+		return
+
+	_quitar_de_listas(productos)
+	frappe.db.after_commit.add(lambda: _quitar_de_listas(productos))
+
+
+def _quitar_de_listas(productos):
+	pipe = _pipeline()
+	for lista in _listas_en_cache():
+		pipe.hdel(_clave("lista", lista), *productos)
+	pipe.execute()
+
+
+def invalidar_producto(doc, method=None):
+	"""
+	Invalida los precios de un Producto al guardarlo o eliminarlo, lo que cubre
+	cambios en sus filas de precios (table_rzld) y en su impuesto.
+	Llamado desde hooks on_update y on_trash de Producto.
+
+	Args:
+		doc: Documento de Producto
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	invalidar_productos([doc.name])
+
+
+def invalidar_impuesto(doc, method=None):
+	"""
+	Invalida los precios de los productos que usan un impuesto modificado.
+	Llamado desde hooks on_update y on_trash de Impuestos.
+
+	Args:
+		doc: Documento de Impuestos
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	invalidar_productos(frappe.get_all(
+		"Producto",
+		filters={"tipo_de_impuesto": doc.name},
+		pluck="name"
+	))
+
+
+def invalidar_lista(doc, method=None):
+	"""
+	Elimina de la caché una lista de precios borrada.
+	Llamado desde hook on_trash de Lista de Precios.
+
+	Args:
+		doc: Documento de Lista de Precios
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	pipe = _pipeline()
+	pipe.delete(_clave("lista", doc.name))
+	pipe.srem(_clave("listas"), doc.name)
+	pipe.execute()
@@ -0,0 +1,296 @@
+"""
+Servicio del resumen de ventas (Resumen de Ventas)
+
+Mantiene una tabla de hechos con las ventas agregadas por día, hora y perfil
+de POS, en tres tipos de fila: Nota (tickets e importe), Producto (cantidad e
+importe por producto) y Metodo (importe por método de pago). Cada nota o
+reembolso suma o resta su aporte con un solo INSERT ... ON DUPLICATE KEY UPDATE,
+así que los tableros leen pocas filas con rangos sobre `fecha`.
+
+Como en la sesión POS, el importe de Efectivo es lo que quedó en caja: lo
+recibido menos el cambio entregado.
+"""
+
+import hashlib
+
+import frappe
+from frappe.utils import flt, get_datetime, getdate, now_datetime
+
+from endersuite.ventas.services.session_service import METODO_EFECTIVO
+
+TIPO_NOTA = "Nota"
+TIPO_PRODUCTO = "Producto"
+TIPO_METODO = "Metodo"
+
+MEDIDAS = ("notas", "cantidad", "importe", "cantidad_reembolsada", "reembolsos")
+
+
+# ============================================================================
+# HECHOS
+# ============================================================================
+
+def _nombre(tipo, fecha, hora, perfil_pos, producto, metodo):
+	"""Nombre determinista de la fila: la llave primaria hace de índice único de las dimensiones"""
+	llave = "|".join(str(v or "") for v in (tipo, fecha, hora, perfil_pos, producto, metodo))
+	return hashlib.md5(llave.encode()).hexdigest()[:20]
+
+
+def _agregar(hechos, tipo, fecha, hora, perfil_pos, producto=None, metodo=None, **medidas):
+	"""Acumula medidas en `hechos` bajo las dimensiones de la fila"""
+	nombre = _nombre(tipo, fecha, hora, perfil_pos, producto, metodo)
+	fila = hechos.get(nombre)
+	if not fila:
+		fila = hechos[nombre] = frappe._dict({
+			"name": nombre,
+			"tipo": tipo,
+			"fecha": fecha,
+			"hora": hora,
+			"perfil_pos": perfil_pos or None,
+			"producto": producto or None,
+			"metodo": metodo or None,
+			**{m: 0 for m in MEDIDAS}
+		})
+
+	for medida, valor in medidas.items():
+		fila[medida] += flt(valor)
+
+
+def _hechos_nota(nota, signo):
+	"""Filas de hechos de una Nota de Venta; signo -1 para revertirla"""
+	momento = get_datetime(nota.fecha_y_hora_de_venta or nota.creation)
+	fecha, hora = momento.date(), momento.hour
+	perfil_pos = nota.perfil_pos
+
+	hechos = {}
+	_agregar(hechos, TIPO_NOTA, fecha, hora, perfil_pos, notas=signo, importe=signo * flt(nota.total_final))
+
+	for item in nota.tabla_de_productos or []:
+		if item.producto:
+			_agregar(
+				hechos, TIPO_PRODUCTO, fecha, hora, perfil_pos, producto=item.producto,
+				cantidad=signo * flt(item.cantidad), importe=signo * flt(item.total_linea)
+			)
+
+	for pago in nota.metodos_pago_nota or []:
+		if pago.metodo:
+			_agregar(hechos, TIPO_METODO, fecha, hora, perfil_pos, metodo=pago.metodo, importe=signo * flt(pago.monto))
+
+	# El cambio sale del efectivo recibido
+	if flt(nota.cambio):
+		_agregar(hechos, TIPO_METODO, fecha, hora, perfil_pos, metodo=METODO_EFECTIVO, importe=-signo * flt(nota.cambio))
+
+	return hechos
+
+
+def _hechos_reembolso(reembolso, signo):
+	"""Filas de hechos de un Reembolso, en el día en que se hizo; signo -1 para revertirlo"""
+	momento = get_datetime(reembolso.fecha_reembolso or reembolso.creation)
+	fecha, hora = momento.date(), momento.hour
+	perfil_pos = None
+	if reembolso.nota_de_venta_original:
+		perfil_pos = frappe.db.get_value("Nota de Venta", reembolso.nota_de_venta_original, "perfil_pos")
+
+	total = signo * flt(reembolso.total_reembolso)
+
+	hechos = {}
+	_agregar(hechos, TIPO_NOTA, fecha, hora, perfil_pos, reembolsos=total)
+
+	for item in reembolso.productos_reembolso or []:
+		if item.producto and flt(item.cantidad_reembolso):
+			_agregar(
+				hechos, TIPO_PRODUCTO, fecha, hora, perfil_pos, producto=item.producto,
+				cantidad_reembolsada=signo * flt(item.cantidad_reembolso),
+				reembolsos=signo * flt(item.total_reembolso)
+			)
+
+	if reembolso.metodo_devolucion:
+		_agregar(hechos, TIPO_METODO, fecha, hora, perfil_pos, metodo=reembolso.metodo_devolucion, reembolsos=total)
+
+	return hechos
+
+
+def aplicar_hechos(hechos):
+	"""
+	Suma las filas de hechos a Resumen de Ventas en un solo INSERT ... ON DUPLICATE KEY UPDATE.
+
+	Las filas se escriben en orden de nombre para que dos ventas simultáneas
+	bloqueen las mismas filas en el mismo orden.
+
+	Args:
+		hechos (dict|list): Filas con name, tipo, fecha, hora, perfil_pos,
+			producto, metodo y las medidas a sumar
+	"""
+	filas = sorted(hechos.values() if isinstance(hechos, dict) else hechos, key=lambda f: f.name)
+	if not filas:
+		return
+
+	ahora = now_datetime()
+	usuario = frappe.session.user
+
+	columnas = ("name", "creation", "modified", "modified_by", "owner", "docstatus", "idx",
+		"tipo", "fecha", "hora", "perfil_pos", "producto", "metodo") + MEDIDAS
+	valores = []
+	for fila in filas:
+		valores.extend([fila.name, ahora, ahora, usuario, usuario, 0, 0,
+			fila.tipo, fila.fecha, fila.hora, fila.perfil_pos, fila.producto, fila.metodo])
+		valores.extend(fila[m] for m in MEDIDAS)
+
+	marcadores = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+	frappe.db.sql(f"""
+		INSERT INTO `tabResumen de Ventas` ({", ".join(f"`{c}`" for c in columnas)})
+		VALUES {", ".join([marcadores] * len(filas))}
+		ON DUPLICATE KEY UPDATE
+			modified = VALUES(modified),
+			{", ".join(f"`{m}` = `{m}` + VALUES(`{m}`)" for m in MEDIDAS)}
+	""", valores)
+
+
+# ============================================================================
+# HOOKS
+# ============================================================================
+
+def registrar_nota(nota_venta_doc, method=None):
+	"""
+	Suma la nota al resumen de ventas.
+	Llamado desde hook on_submit de Nota de Venta.
+	"""
+	aplicar_hechos(_hechos_nota(nota_venta_doc, 1))
+
+
+def revertir_nota(nota_venta_doc, method=None):
+	"""
+	Resta la nota del resumen de ventas.
+	Llamado desde hook on_cancel de Nota de Venta.
+	"""
+	aplicar_hechos(_hechos_nota(nota_venta_doc, -1))
+
+
+def registrar_reembolso(reembolso_doc, method=None):
+	"""
+	Suma el reembolso al resumen de ventas.
+	Llamado desde hook on_submit de Reembolso.
+	"""
+	aplicar_hechos(_hechos_reembolso(reembolso_doc, 1))
+
+
+def revertir_reembolso(reembolso_doc, method=None):
+	"""
+	Resta el reembolso del resumen de ventas.
+	Llamado desde hook on_cancel de Reembolso.
+	"""
+	aplicar_hechos(_hechos_reembolso(reembolso_doc, -1))
+
+
+# ============================================================================
+# RECONSTRUCCIÓN
+# ============================================================================
+
+def reconstruir_resumen(fecha_inicio=None, fecha_fin=None):
+	"""
+	Vuelve a calcular el resumen desde Notas de Venta y Reembolsos enviados,
+	con consultas agrupadas en lugar de documento por documento.
+
+	Args:
+		fecha_inicio (str): Primer día a reconstruir (opcional, desde el inicio)
+		fecha_fin (str): Último día a reconstruir (opcional, hasta hoy)
+
+	Returns:
+		int: Filas escritas
+	"""
+	condiciones = []
+	valores = {}
+	if fecha_inicio:
+		condiciones.append("fecha >= %(desde)s")
+		valores["desde"] = getdate(fecha_inicio)
+	if fecha_fin:
+		condiciones.append("fecha <= %(hasta)s")
+		valores["hasta"] = getdate(fecha_fin)
+	where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+
+	frappe.db.sql(f"DELETE FROM `tabResumen de Ventas` {where}", valores)
+
+	hechos = {}
+	momento_nota = "COALESCE(n.fecha_y_hora_de_venta, n.creation)"
+	momento_reembolso = "COALESCE(r.fecha_reembolso, r.creation)"
+
+	for fila in _consulta(f"""
+		SELECT DATE({momento_nota}) AS fecha, HOUR({momento_nota}) AS hora, n.perfil_pos,
+			COUNT(*) AS notas, SUM(n.total_final) AS importe
+		FROM `tabNota de Venta` n
+		WHERE n.docstatus = 1 {{condicion}}
+		GROUP BY 1, 2, 3
+	""", momento_nota, valores):
+		_agregar(hechos, TIPO_NOTA, fila.fecha, fila.hora, fila.perfil_pos, notas=fila.notas, importe=fila.importe)
+
+	for fila in _consulta(f"""
+		SELECT DATE({momento_nota}) AS fecha, HOUR({momento_nota}) AS hora, n.perfil_pos, t.producto,
+			SUM(t.cantidad) AS cantidad, SUM(t.total_linea) AS importe
+		FROM `tabNota de Venta` n
+		JOIN `tabTabla de Productos` t
+			ON t.parent = n.name AND t.parenttype = 'Nota de Venta' AND t.parentfield = 'tabla_de_productos'
+		WHERE n.docstatus = 1 AND t.producto IS NOT NULL {{condicion}}
+		GROUP BY 1, 2, 3, 4
+	""", momento_nota, valores):
+		_agregar(hechos, TIPO_PRODUCTO, fila.fecha, fila.hora, fila.perfil_pos, producto=fila.producto,
+			cantidad=fila.cantidad, importe=fila.importe)
+
+	for fila in _consulta(f"""
+		SELECT DATE({momento_nota}) AS fecha, HOUR({momento_nota}) AS hora, n.perfil_pos, mp.metodo,
+			SUM(mp.monto) AS importe
+		FROM `tabNota de Venta` n
+		JOIN `tabMetodos de Pago Nota` mp ON mp.parent = n.name AND mp.parenttype = 'Nota de Venta'
+		WHERE n.docstatus = 1 AND mp.metodo IS NOT NULL {{condicion}}
+		GROUP BY 1, 2, 3, 4
+	""", momento_nota, valores):
+		_agregar(hechos, TIPO_METODO, fila.fecha, fila.hora, fila.perfil_pos, metodo=fila.metodo, importe=fila.importe)
+
+	for fila in _consulta(f"""
+		SELECT DATE({momento_nota}) AS fecha, HOUR({momento_nota}) AS hora, n.perfil_pos,
+			SUM(n.cambio) AS cambio
+		FROM `tabNota de Venta` n
+		WHERE n.docstatus = 1 AND n.cambio != 0 {{condicion}}
+		GROUP BY 1, 2, 3
+	""", momento_nota, valores):
+		_agregar(hechos, TIPO_METODO, fila.fecha, fila.hora, fila.perfil_pos, metodo=METODO_EFECTIVO,
+			importe=-flt(fila.cambio))
+
+	for fila in _consulta(f"""
+		SELECT DATE({momento_reembolso}) AS fecha, HOUR({momento_reembolso}) AS hora, n.perfil_pos,
+			r.metodo_devolucion AS metodo, SUM(r.total_reembolso) AS reembolsos
+		FROM `tabReembolso` r
+		LEFT JOIN `tabNota de Venta` n ON n.name = r.nota_de_venta_original
+		WHERE r.docstatus = 1 {{condicion}}
+		GROUP BY 1, 2, 3, 4
+	""", momento_reembolso, valores):
+		_agregar(hechos, TIPO_NOTA, fila.fecha, fila.hora, fila.perfil_pos, reembolsos=fila.reembolsos)
+		if fila.metodo:
+			_agregar(hechos, TIPO_METODO, fila.fecha, fila.hora, fila.perfil_pos, metodo=fila.metodo,
+				reembolsos=fila.reembolsos)
+
+	for fila in _consulta(f"""
+		SELECT DATE({momento_reembolso}) AS fecha, HOUR({momento_reembolso}) AS hora, n.perfil_pos, pr.producto,
+			SUM(pr.cantidad_reembolso) AS cantidad_reembolsada, SUM(pr.total_reembolso) AS reembolsos
+		FROM `tabReembolso` r
+		JOIN `tabProductos Reembolso` pr ON pr.parent = r.name AND pr.parenttype = 'Reembolso'
+		LEFT JOIN `tabNota de Venta` n ON n.name = r.nota_de_venta_original
+		WHERE r.docstatus = 1 AND pr.producto IS NOT NULL AND pr.cantidad_reembolso != 0 {{condicion}}
+		GROUP BY 1, 2, 3, 4
+	""", momento_reembolso, valores):
+		_agregar(hechos, TIPO_PRODUCTO, fila.fecha, fila.hora, fila.perfil_pos, producto=fila.producto,
+			cantidad_reembolsada=fila.cantidad_reembolsada, reembolsos=fila.reembolsos)
+
+	filas = list(hechos.values())
+	for inicio in range(0, len(filas), 500):
+		aplicar_hechos(filas[inicio:inicio + 500])
+
+	return len(filas)
+
+
+def _consulta(sql, momento, valores):
+	"""Ejecuta una consulta de reconstrucción con el rango de fechas aplicado a `momento`"""
+	condicion = ""
+	if "desde" in valores:
+		condicion += f" AND {momento} >= %(desde)s"
+	if "hasta" in valores:
+		condicion += f" AND {momento} < DATE_ADD(%(hasta)s, INTERVAL 1 DAY)"
+	return frappe.db.sql(sql.format(condicion=condicion), valores, as_dict=True)
@@ -0,0 +1,340 @@
+import unicodedata
+
+import frappe
+
+
+# Prefijo de las claves del índice en Redis
+PREFIJO_INDICE = "endersuite:busqueda_producto"
+
+# Productos por lote al reconstruir el índice completo
+TAMANO_LOTE_INDICE = 5000
+
+# Candidatos del índice de trigramas que se ordenan como máximo; si hay más,
+# los nombres que empiezan con la consulta se leen antes de la base de datos
+MAX_CANDIDATOS = 2000
+
+
+# ============================================================================
+# NORMALIZACIÓN Y TRIGRAMAS
+# ============================================================================
+
+def normalizar(texto):
+	"""
+	Convierte un texto a minúsculas sin acentos ni espacios repetidos.
+
+	Args:
+		texto (str): Texto a normalizar
+
+	Returns:
+		str: Texto normalizado
+	"""
+	texto = unicodedata.normalize("NFKD", texto or "")
+	texto = "".join(c for c in texto if not unicodedata.combining(c))
+	return " ".join(texto.lower().split())
+
+
+def trigramas(texto):
+	"""
+	Trigramas de cada palabra de un texto normalizado.
+
+	Cada palabra se rellena con dos espacios al inicio, así " ab" y "  a"
+	identifican palabras que empiezan con "ab" o "a" y las búsquedas de
+	una o dos letras se resuelven como prefijo.
+
+	Args:
+		texto (str): Texto ya normalizado
+
+	Returns:
+		set: Trigramas del texto
+	"""
+	resultado = set()
+	for palabra in texto.split():
+		palabra = "  " + palabra
+		for i in range(len(palabra) - 2):
+			resultado.add(palabra[i:i + 3])
+	return resultado
+
+
+def _trigramas_consulta(texto):
+	"""
+	Trigramas a intersectar para una consulta.
+
+	Las palabras de tres letras o más usan sus trigramas sin relleno, así que
+	coinciden en cualquier parte del nombre ("ola" encuentra "Coca Cola").
+	Las de una o dos letras solo pueden coincidir como inicio de palabra.
+	"""
+	resultado = set()
+	for palabra in texto.split():
+		if len(palabra) >= 3:
+			resultado.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+		else:
+			resultado.add(("  " + palabra)[-3:])
+	return resultado
+
+
+# ============================================================================
+# ÍNDICE EN REDIS
+# ============================================================================
+
+def _clave(*partes):
+	return frappe.cache.make_key(":".join((PREFIJO_INDICE,) + partes))
+
+
+def _pipeline():
+	"""Pipeline de Redis sin el prefijado automático de RedisWrapper; las claves ya vienen de _clave"""
+	return frappe.cache.pipeline(transaction=False)
+
+
+def indice_listo():
+	"""Indica si el índice de nombres está construido en Redis"""
+	pipe = _pipeline()
+	pipe.exists(_clave("listo"))
+	return bool(pipe.execute()[0])
+
+
+def _indexar(pipe, nombre, nombre_normalizado, anterior=None):
+	"""Agrega al pipeline los comandos para (re)indexar un producto"""
+	nuevos = trigramas(nombre_normalizado)
+	viejos = trigramas(anterior) if anterior else set()
+
+	for tri in viejos - nuevos:
+		pipe.srem(_clave("tri", tri), nombre)
+	for tri in nuevos - viejos:
+		pipe.sadd(_clave("tri", tri), nombre)
+	pipe.hset(_clave("nombres"), nombre, nombre_normalizado)
+
+
+def indexar_producto(doc, method=None):
+	"""
+	Actualiza el índice de búsqueda al guardar un Producto.
+	Solo toca los trigramas que cambiaron respecto al nombre anterior.
+	Llamado desde hook on_update de Producto.
+
+	Args:
+		doc: Documento de Producto
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	if not indice_listo():
+		return
+
+	anterior = _leer_nombres([doc.name]).get(doc.name)
+	nuevo = normalizar(doc.nombre_del_producto or doc.name)
+
+	if anterior == nuevo:
+		return
+
+	pipe = _pipeline()
+	_indexar(pipe, doc.name, nuevo, anterior)
+	pipe.execute()
+
+
+def quitar_producto(doc, method=None):
+	"""
+	Elimina un Producto del índice de búsqueda.
+	Llamado desde hook on_trash de Producto.
+
+	Args:
+		doc: Documento de Producto
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	if not indice_listo():
+		return
+
+	anterior = _leer_nombres([doc.name]).get(doc.name)
+	if anterior is None:
+		return
+
+	pipe = _pipeline()
+	for tri in trigramas(anterior):
+		pipe.srem(_clave("tri", tri), doc.name)
+	pipe.hdel(_clave("nombres"), doc.name)
+	pipe.execute()
+
+
+def reconstruir_indice():
+	"""
+	Construye el índice completo de nombres de producto en Redis por lotes.
+	Se ejecuta en segundo plano cuando el índice no existe (por ejemplo, tras
+	reiniciar Redis).
+	"""
+	borrar_indice()
+
+	inicio = 0
+	while True:
+		productos = frappe.get_all(
+			"Producto",
+			fields=["name", "nombre_del_producto"],
+			order_by="name asc",
+			limit_start=inicio,
+			limit_page_length=TAMANO_LOTE_INDICE
+		)
+		if not productos:
+			break
+
+		pipe = _pipeline()
+		for p in productos:
+			_indexar(pipe, p.name, normalizar(p.nombre_del_producto or p.name))
+		pipe.execute()
+
+		inicio += TAMANO_LOTE_INDICE
+
+	pipe = _pipeline()
+	pipe.set(_clave("listo"), 1)
+	pipe.execute()
+
+
+def borrar_indice():
+	"""Elimina todas las claves del índice; la siguiente búsqueda programa su reconstrucción"""
+	pipe = _pipeline()
+	for clave in frappe.cache.scan_iter(_clave("*")):
+		pipe.delete(clave)
+	pipe.execute()
+
+
+def _programar_reconstruccion():
+	"""Encola la reconstrucción del índice una sola vez"""
+	frappe.enqueue(
+		"endersuite.ventas.services.search_service.reconstruir_indice",
+		queue="long",
+		job_id="endersuite_reconstruir_indice_productos",
+		deduplicate=True
+	)
+
+
+def _leer_nombres(nombres):
+	"""Nombre normalizado de cada producto indexado"""
+	if not nombres:
+		return {}
+	pipe = _pipeline()
+	pipe.hmget(_clave("nombres"), list(nombres))
+	valores = pipe.execute()[0]
+	return {
+		nombre: valor.decode() if isinstance(valor, bytes) else valor
+		for nombre, valor in zip(nombres, valores, strict=True)
+		if valor is not None
+	}
+
+
+# ============================================================================
+# BÚSQUEDA
+# ============================================================================
+
+def buscar_por_codigo(codigo):
+	"""
+	Busca un producto por coincidencia exacta de SKU o código de barras.
+	Ambas columnas tienen índice único, así que es una búsqueda puntual.
+
+	Args:
+		codigo (str): SKU o código de barras escaneado
+
+	Returns:
+		str|None: Nombre del producto encontrado
+	"""
+	if not codigo:
+		return None
+
+	resultado = frappe.db.sql("""
+		SELECT name FROM `tabProducto` WHERE sku = %(codigo)s
+		UNION
+		SELECT name FROM `tabProducto` WHERE codigo_barras = %(codigo)s
+		LIMIT 1
+	""", {"codigo": codigo.strip()})
+
+	return resultado[0][0] if resultado else None
+
+
+def _puntaje(nombre_normalizado, consulta):
+	"""Menor es mejor: prefijo del nombre, luego prefijo de palabra, luego subcadena"""
+	if nombre_normalizado.startswith(consulta):
+		nivel = 0
+	elif (" " + consulta) in (" " + nombre_normalizado):
+		nivel = 1
+	elif consulta in nombre_normalizado:
+		nivel = 2
+	else:
+		nivel = 3
+	return (nivel, len(nombre_normalizado), nombre_normalizado)
+
+
+def buscar_productos(consulta, limit=20):
+	"""
+	Busca productos por SKU, código de barras o nombre y los devuelve ordenados
+	por relevancia.
+
+	Primero intenta una coincidencia exacta de SKU/código de barras. Después
+	intersecta en Redis los trigramas de la consulta y ordena los candidatos:
+	nombre que empieza con la consulta, palabra que empieza con la consulta y
+	finalmente coincidencia parcial. Cuando la intersección pasa de
+	MAX_CANDIDATOS, los productos cuyo nombre o SKU empieza con la consulta se
+	leen primero de la base de datos y el resto se completa con una parte de
+	la intersección, así los mejores resultados nunca quedan fuera. Si el
+	índice aún no existe se programa su construcción y se usa una búsqueda por
+	prefijo en la base de datos.
+
+	Args:
+		consulta (str): Texto escrito o código escaneado
+		limit (int): Máximo de resultados
+
+	Returns:
+		list: Nombres de producto ordenados por relevancia
+	"""
+	limit = int(limit)
+	resultados = []
+
+	exacto = buscar_por_codigo(consulta)
+	if exacto:
+		resultados.append(exacto)
+
+	texto = normalizar(consulta)
+	if not texto:
+		return resultados
+
+	if not indice_listo():
+		_programar_reconstruccion()
+		return _buscar_por_prefijo_db(consulta, limit, resultados)
+
+	pipe = _pipeline()
+	pipe.sinter([_clave("tri", tri) for tri in _trigramas_consulta(texto)])
+	candidatos = [
+		c.decode() if isinstance(c, bytes) else c
+		for c in pipe.execute()[0]
+	]
+
+	if len(candidatos) > MAX_CANDIDATOS:
+		prefijos = _buscar_por_prefijo_db(consulta, MAX_CANDIDATOS, [])
+		vistos = set(prefijos)
+		candidatos = prefijos + [c for c in candidatos[:MAX_CANDIDATOS] if c not in vistos]
+
+	nombres = _leer_nombres(candidatos)
+	ordenados = sorted(nombres, key=lambda n: _puntaje(nombres[n], texto))
+
+	for nombre in ordenados:
+		if len(resultados) >= limit:
+			break
+		if nombre not in resultados:
+			resultados.append(nombre)
+
+	return resultados
+
+
+def _buscar_por_prefijo_db(consulta, limit, resultados):
+	"""Respaldo mientras se construye el índice: prefijo de nombre o SKU, que sí usa índices"""
+	productos = frappe.db.sql("""
+		SELECT name FROM `tabProducto` WHERE nombre_del_producto LIKE %(prefijo)s
+		UNION
+		SELECT name FROM `tabProducto` WHERE sku LIKE %(prefijo)s
+		LIMIT %(limit)s
+	""", {"prefijo": _escapar_like(consulta.strip()) + "%", "limit": limit}, pluck=True)
+
+	for nombre in productos:
+		if len(resultados) >= limit:
+			break
+		if nombre not in resultados:
+			resultados.append(nombre)
+
+	return resultados
+
+
+def _escapar_like(texto):
+	"""Escapa los comodines de LIKE para buscar el texto literal"""
+	return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
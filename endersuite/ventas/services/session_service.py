@@ -0,0 +1,505 @@
+"""
+Servicio de agregación de totales de caja para Sesiones POS
+
+Calcula totales por método de pago, cambio entregado, número de tickets y
+efectivo esperado con una sola consulta agrupada sobre
+`tabNota de Venta` × `tabMetodos de Pago Nota`, sin importar cuántas
+ventas tenga la sesión.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now_datetime
+
+METODO_EFECTIVO = "Efectivo"
+
+
+def _totales_vacios():
+	return frappe._dict({
+		"metodos": {},
+		"cambio": 0,
+		"num_ventas": 0,
+		"total_ventas": 0,
+		"total_pagado": 0
+	})
+
+
+def _agregar_totales(condicion, valores, por_sesion=False):
+	"""
+	Ejecuta la consulta agrupada y arma los totales.
+
+	El cambio, el total de la nota y el conteo de tickets se toman solo de la
+	primera fila de pago de cada nota (idx = 1) para no duplicarlos cuando una
+	nota se pagó con varios métodos.
+
+	Args:
+		condicion (str): Condición SQL sobre el alias `nv`
+		valores (dict): Parámetros de la condición
+		por_sesion (bool): Agrupar además por `sesion_pos`
+
+	Returns:
+		dict: Totales, o mapa sesion -> totales si por_sesion
+	"""
+	filas = frappe.db.sql(f"""
+		SELECT
+			{"nv.sesion_pos" if por_sesion else "NULL"} AS sesion_pos,
+			mp.metodo AS metodo,
+			COALESCE(SUM(mp.monto), 0) AS monto,
+			SUM(CASE WHEN COALESCE(mp.idx, 1) = 1 THEN COALESCE(nv.cambio, 0) ELSE 0 END) AS cambio,
+			SUM(CASE WHEN COALESCE(mp.idx, 1) = 1 THEN COALESCE(nv.total_final, 0) ELSE 0 END) AS total_ventas,
+			SUM(CASE WHEN COALESCE(mp.idx, 1) = 1 THEN 1 ELSE 0 END) AS num_ventas
+		FROM `tabNota de Venta` nv
+		LEFT JOIN `tabMetodos de Pago Nota` mp
+			ON mp.parent = nv.name
+			AND mp.parenttype = 'Nota de Venta'
+		WHERE nv.docstatus = 1
+			AND {condicion}
+		GROUP BY {"nv.sesion_pos, " if por_sesion else ""}mp.metodo
+	""", valores, as_dict=True)
+
+	resultado = {}
+	for fila in filas:
+		totales = resultado.setdefault(fila.sesion_pos, _totales_vacios())
+
+		if fila.metodo:
+			totales.metodos[fila.metodo] = totales.metodos.get(fila.metodo, 0) + flt(fila.monto)
+			totales.total_pagado += flt(fila.monto)
+
+		totales.cambio += flt(fila.cambio)
+		totales.total_ventas += flt(fila.total_ventas)
+		totales.num_ventas += int(fila.num_ventas or 0)
+
+	if por_sesion:
+		return resultado
+
+	return resultado.get(None) or _totales_vacios()
+
+
+def get_totales_sesiones(sesiones):
+	"""
+	Obtiene los totales de varias sesiones POS en una sola consulta.
+
+	Args:
+		sesiones (list): Nombres de Sesion POS
+
+	Returns:
+		dict: Mapa sesion -> {metodos, cambio, num_ventas, total_ventas, total_pagado}
+	"""
+	sesiones = [s for s in (sesiones or []) if s]
+	if not sesiones:
+		return {}
+
+	totales = _agregar_totales(
+		"nv.sesion_pos IN %(sesiones)s",
+		{"sesiones": tuple(sesiones)},
+		por_sesion=True
+	)
+
+	for sesion in sesiones:
+		totales.setdefault(sesion, _totales_vacios())
+
+	return totales
+
+
+def get_totales_sesion(sesion):
+	"""
+	Obtiene los totales de una sesión POS.
+
+	Args:
+		sesion (str): Nombre de la Sesion POS
+
+	Returns:
+		dict: {metodos, cambio, num_ventas, total_ventas, total_pagado}
+	"""
+	if not sesion:
+		return _totales_vacios()
+
+	return _agregar_totales("nv.sesion_pos = %(sesion)s", {"sesion": sesion})
+
+
+def get_totales_notas(notas_de_venta):
+	"""
+	Obtiene los totales de una lista explícita de Notas de Venta enviadas.
+
+	Args:
+		notas_de_venta (list): Nombres de Notas de Venta
+
+	Returns:
+		dict: {metodos, cambio, num_ventas, total_ventas, total_pagado}
+	"""
+	notas_de_venta = [n for n in (notas_de_venta or []) if n]
+	if not notas_de_venta:
+		return _totales_vacios()
+
+	return _agregar_totales("nv.name IN %(notas)s", {"notas": tuple(notas_de_venta)})
+
+
+def calcular_efectivo_esperado(totales, monto_apertura=0):
+	"""
+	Efectivo esperado en caja: apertura + ventas en efectivo - cambio dado.
+
+	Args:
+		totales (dict): Resultado de get_totales_sesion / get_totales_sesiones
+		monto_apertura (float): Monto de apertura de la sesión
+
+	Returns:
+		float: Efectivo esperado
+	"""
+	return flt(monto_apertura) + flt(totales.metodos.get(METODO_EFECTIVO, 0)) - flt(totales.cambio)
+
+
+# ============================================================================
+# ACUMULADOS EN TIEMPO REAL
+# ============================================================================
+
+CAMPOS_ACUMULADOS = (
+	"efectivo_acumulado",
+	"total_ventas_acumulado",
+	"total_cambio_acumulado",
+	"num_tickets",
+	"total_reembolsos_acumulado"
+)
+
+
+def _aplicar_delta_sesion(sesion_pos, metodos, ventas=0, cambio=0, tickets=0, reembolsos=0):
+	"""
+	Aplica un delta a los acumulados de la sesión dentro de la transacción actual.
+
+	La fila de la sesión se bloquea con FOR UPDATE para serializar las cajas que
+	venden en paralelo sobre la misma sesión. También se actualiza `modified`,
+	así un formulario de la sesión abierto antes de la venta no puede guardarse
+	encima de los acumulados (TimestampMismatchError).
+
+	Args:
+		sesion_pos (str): Nombre de la Sesion POS
+		metodos (dict): metodo -> monto a sumar (negativo para revertir)
+		ventas (float): Delta del total vendido
+		cambio (float): Delta del cambio entregado
+		tickets (int): Delta del número de tickets
+		reembolsos (float): Delta del total reembolsado
+	"""
+	if not frappe.db.sql("SELECT name FROM `tabSesion POS` WHERE name = %s FOR UPDATE", sesion_pos):
+		return
+
+	efectivo = flt(metodos.get(METODO_EFECTIVO, 0)) - flt(cambio)
+
+	frappe.db.sql("""
+		UPDATE `tabSesion POS`
+		SET
+			efectivo_acumulado = COALESCE(efectivo_acumulado, 0) + %(efectivo)s,
+			total_ventas_acumulado = COALESCE(total_ventas_acumulado, 0) + %(ventas)s,
+			total_cambio_acumulado = COALESCE(total_cambio_acumulado, 0) + %(cambio)s,
+			num_tickets = COALESCE(num_tickets, 0) + %(tickets)s,
+			total_reembolsos_acumulado = COALESCE(total_reembolsos_acumulado, 0) + %(reembolsos)s,
+			modified = %(ahora)s
+		WHERE name = %(sesion)s
+	""", {
+		"ahora": now_datetime(),
+		"efectivo": efectivo,
+		"ventas": flt(ventas),
+		"cambio": flt(cambio),
+		"tickets": int(tickets),
+		"reembolsos": flt(reembolsos),
+		"sesion": sesion_pos
+	})
+
+	metodos = {m: flt(monto) for m, monto in metodos.items() if m and flt(monto)}
+	if not metodos:
+		return
+
+	existentes = frappe.get_all(
+		"Totales Metodo Sesion POS",
+		filters={"parent": sesion_pos, "parenttype": "Sesion POS"},
+		fields=["metodo", "idx"]
+	)
+	metodos_existentes = {r.metodo for r in existentes}
+	siguiente_idx = max([r.idx or 0 for r in existentes] or [0]) + 1
+
+	for metodo, monto in metodos.items():
+		if metodo in metodos_existentes:
+			frappe.db.sql("""
+				UPDATE `tabTotales Metodo Sesion POS`
+				SET monto = COALESCE(monto, 0) + %(monto)s
+				WHERE parent = %(sesion)s AND parenttype = 'Sesion POS' AND metodo = %(metodo)s
+			""", {"monto": monto, "sesion": sesion_pos, "metodo": metodo})
+		else:
+			frappe.get_doc({
+				"doctype": "Totales Metodo Sesion POS",
+				"parent": sesion_pos,
+				"parenttype": "Sesion POS",
+				"parentfield": "totales_metodos",
+				"idx": siguiente_idx,
+				"metodo": metodo,
+				"monto": monto
+			}).db_insert()
+			siguiente_idx += 1
+
+
+def _delta_nota(nota_venta_doc, signo):
+	metodos = {}
+	for row in nota_venta_doc.metodos_pago_nota:
+		metodos[row.metodo] = metodos.get(row.metodo, 0) + signo * flt(row.monto)
+
+	_aplicar_delta_sesion(
+		nota_venta_doc.sesion_pos,
+		metodos,
+		ventas=signo * flt(nota_venta_doc.total_final),
+		cambio=signo * flt(nota_venta_doc.cambio),
+		tickets=signo
+	)
+
+
+def _delta_reembolso(reembolso_doc, signo):
+	monto = flt(reembolso_doc.total_reembolso)
+	metodo = reembolso_doc.metodo_devolucion
+
+	_aplicar_delta_sesion(
+		reembolso_doc.sesion_pos,
+		{metodo: -signo * monto} if metodo else {},
+		reembolsos=signo * monto
+	)
+
+
+def registrar_venta(nota_venta_doc, method=None):
+	"""
+	Suma la nota a los acumulados de su sesión.
+	Llamado desde hook on_submit de Nota de Venta.
+	"""
+	if nota_venta_doc.sesion_pos:
+		_delta_nota(nota_venta_doc, 1)
+
+
+def revertir_venta(nota_venta_doc, method=None):
+	"""
+	Resta la nota de los acumulados de su sesión.
+	Llamado desde hook on_cancel de Nota de Venta.
+	"""
+	if nota_venta_doc.sesion_pos:
+		_delta_nota(nota_venta_doc, -1)
+
+
+def registrar_reembolso(reembolso_doc, method=None):
+	"""
+	Descuenta el reembolso aprobado de los acumulados de su sesión.
+	Llamado desde hook on_submit de Reembolso.
+	"""
+	if reembolso_doc.sesion_pos:
+		_delta_reembolso(reembolso_doc, 1)
+
+
+def revertir_reembolso(reembolso_doc, method=None):
+	"""
+	Devuelve a los acumulados un reembolso cancelado.
+	Llamado desde hook on_cancel de Reembolso.
+	"""
+	if reembolso_doc.sesion_pos:
+		_delta_reembolso(reembolso_doc, -1)
+
+
+def get_efectivo_acumulado(sesion_pos):
+	"""
+	Efectivo en caja leído de los acumulados: una sola fila de Sesion POS.
+
+	Args:
+		sesion_pos (str): Nombre de la Sesion POS
+
+	Returns:
+		float: Monto de apertura + efectivo neto acumulado, o None si no existe
+	"""
+	sesion = frappe.db.get_value(
+		"Sesion POS",
+		sesion_pos,
+		["monto_apertura", "efectivo_acumulado"],
+		as_dict=True
+	)
+
+	if not sesion:
+		return None
+
+	return flt(sesion.monto_apertura) + flt(sesion.efectivo_acumulado)
+
+
+def get_acumulados_sesion(sesion_pos):
+	"""
+	Totales de la sesión leídos de los acumulados, ya netos de reembolsos.
+
+	Es la misma fuente que get_efectivo_acumulado, así que el efectivo que se
+	ve durante la venta y el esperado al cierre coinciden.
+
+	Args:
+		sesion_pos (str): Nombre de la Sesion POS
+
+	Returns:
+		dict: {metodos, cambio, num_ventas, total_ventas, total_pagado, reembolsos}
+	"""
+	totales = _totales_vacios()
+	totales.reembolsos = 0
+	if not sesion_pos:
+		return totales
+
+	sesion = frappe.db.get_value("Sesion POS", sesion_pos, list(CAMPOS_ACUMULADOS), as_dict=True)
+	if not sesion:
+		return totales
+
+	for fila in frappe.get_all(
+		"Totales Metodo Sesion POS",
+		filters={"parent": sesion_pos, "parenttype": "Sesion POS"},
+		fields=["metodo", "monto"]
+	):
+		totales.metodos[fila.metodo] = totales.metodos.get(fila.metodo, 0) + flt(fila.monto)
+		totales.total_pagado += flt(fila.monto)
+
+	totales.cambio = flt(sesion.total_cambio_acumulado)
+	totales.total_ventas = flt(sesion.total_ventas_acumulado)
+	totales.num_ventas = cint(sesion.num_tickets)
+	totales.reembolsos = flt(sesion.total_reembolsos_acumulado)
+
+	return totales
+
+
+def remover_venta_de_sesion(sesion_pos, nota_de_venta):
+	"""
+	Quita la nota de la tabla de ventas de la sesión sin guardar la sesión
+	completa, para no sobrescribir los acumulados que otras cajas actualizan.
+	`modified` cambia para que un formulario viejo no vuelva a insertar el renglón.
+	"""
+	frappe.db.delete("Ventas Sesion POS", {
+		"parent": sesion_pos,
+		"parenttype": "Sesion POS",
+		"parentfield": "ventas",
+		"nota_de_venta": nota_de_venta
+	})
+	frappe.db.set_value("Sesion POS", sesion_pos, "modified", now_datetime(), update_modified=False)
+
+
+def _calcular_acumulados_desde_fuente(sesion_pos):
+	"""Recalcula los acumulados de una sesión desde Notas de Venta y Reembolsos"""
+	totales = get_totales_sesion(sesion_pos)
+	metodos = dict(totales.metodos)
+
+	reembolsos = frappe.db.sql("""
+		SELECT metodo_devolucion AS metodo, COALESCE(SUM(total_reembolso), 0) AS monto
+		FROM `tabReembolso`
+		WHERE docstatus = 1 AND sesion_pos = %s
+		GROUP BY metodo_devolucion
+	""", sesion_pos, as_dict=True)
+
+	total_reembolsos = 0
+	for r in reembolsos:
+		total_reembolsos += flt(r.monto)
+		if r.metodo:
+			metodos[r.metodo] = metodos.get(r.metodo, 0) - flt(r.monto)
+
+	return {
+		"efectivo_acumulado": flt(metodos.get(METODO_EFECTIVO, 0)) - flt(totales.cambio),
+		"total_ventas_acumulado": flt(totales.total_ventas),
+		"total_cambio_acumulado": flt(totales.cambio),
+		"num_tickets": totales.num_ventas,
+		"total_reembolsos_acumulado": total_reembolsos,
+		"metodos": metodos
+	}
+
+
+@frappe.whitelist()
+def conciliar_acumulados_sesion(sesion_pos, corregir=0):
+	"""
+	Recalcula los acumulados de una sesión desde las notas y reembolsos
+	y reporta la diferencia contra lo guardado.
+
+	Uso desde consola:
+		bench --site <sitio> execute endersuite.ventas.services.session_service.conciliar_acumulados_sesion --kwargs "{'sesion_pos': 'xxxx', 'corregir': 1}"
+
+	Args:
+		sesion_pos (str): Nombre de la Sesion POS
+		corregir (bool): Si se deben sobrescribir los acumulados con los recalculados
+
+	Returns:
+		dict: {sesion_pos, consistente, deriva, corregido}
+	"""
+	frappe.has_permission("Sesion POS", "write", sesion_pos, throw=True)
+
+	actual = frappe.db.get_value("Sesion POS", sesion_pos, list(CAMPOS_ACUMULADOS), as_dict=True)
+	if actual is None:
+		frappe.throw(_("La sesión POS {0} no existe").format(sesion_pos))
+
+	fuente = _calcular_acumulados_desde_fuente(sesion_pos)
+
+	deriva = {}
+	for campo in CAMPOS_ACUMULADOS:
+		diferencia = flt(fuente[campo]) - flt(actual.get(campo))
+		if abs(diferencia) >= 0.01:
+			deriva[campo] = diferencia
+
+	metodos_actuales = {
+		r.metodo: flt(r.monto)
+		for r in frappe.get_all(
+			"Totales Metodo Sesion POS",
+			filters={"parent": sesion_pos, "parenttype": "Sesion POS"},
+			fields=["metodo", "monto"]
+		)
+	}
+	for metodo in set(metodos_actuales) | set(fuente["metodos"]):
+		diferencia = flt(fuente["metodos"].get(metodo, 0)) - metodos_actuales.get(metodo, 0)
+		if abs(diferencia) >= 0.01:
+			deriva.setdefault("metodos", {})[metodo] = diferencia
+
+	corregido = False
+	if deriva and cint(corregir):
+		_escribir_acumulados(sesion_pos, fuente)
+		corregido = True
+
+	if deriva:
+		frappe.logger().info(f"Deriva de acumulados en sesión {sesion_pos}: {deriva}")
+
+	return {
+		"sesion_pos": sesion_pos,
+		"consistente": not deriva,
+		"deriva": deriva,
+		"corregido": corregido
+	}
+
+
+def _escribir_acumulados(sesion_pos, acumulados):
+	"""Sobrescribe los acumulados de la sesión con valores recalculados"""
+	frappe.db.sql("SELECT name FROM `tabSesion POS` WHERE name = %s FOR UPDATE", sesion_pos)
+	frappe.db.set_value(
+		"Sesion POS",
+		sesion_pos,
+		{campo: acumulados[campo] for campo in CAMPOS_ACUMULADOS}
+	)
+
+	frappe.db.delete("Totales Metodo Sesion POS", {"parent": sesion_pos, "parenttype": "Sesion POS"})
+	for idx, (metodo, monto) in enumerate(sorted(acumulados["metodos"].items()), start=1):
+		if not metodo:
+			continue
+		frappe.get_doc({
+			"doctype": "Totales Metodo Sesion POS",
+			"parent": sesion_pos,
+			"parenttype": "Sesion POS",
+			"parentfield": "totales_metodos",
+			"idx": idx,
+			"metodo": metodo,
+			"monto": monto
+		}).db_insert()
+
+
+@frappe.whitelist()
+def conciliar_sesiones_abiertas(corregir=0):
+	"""
+	Concilia todas las sesiones POS abiertas.
+
+	Returns:
+		list: Reporte de las sesiones con deriva
+	"""
+	frappe.only_for("System Manager")
+
+	reporte = []
+	for sesion_pos in frappe.get_all("Sesion POS", filters={"estado": "Abierta"}, pluck="name"):
+		resultado = conciliar_acumulados_sesion(sesion_pos, corregir=corregir)
+		if not resultado["consistente"]:
+			reporte.append(resultado)
+
+	if cint(corregir):
+		frappe.db.commit()
+
+	return reporte
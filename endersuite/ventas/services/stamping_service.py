@@ -0,0 +1,336 @@
+import json
+import random
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+
+# Estados de estado_timbrado en Factura de Venta
+ESTADO_PENDIENTE = "Pendiente"
+ESTADO_TIMBRANDO = "Timbrando"
+ESTADO_TIMBRADA = "Timbrada"
+ESTADO_ERROR = "Error"
+
+# Timbrados simultáneos contra el PAC entre todos los workers
+MAX_TIMBRADOS_CONCURRENTES = 4
+
+# Intentos por factura ante errores transitorios (conexión, timeout, HTTP 5xx o 429)
+MAX_INTENTOS_TIMBRADO = 5
+
+# Espera antes del primer reintento; se duplica en cada intento hasta el máximo.
+# El reintento lo encola el scheduler cada minuto, así que la espera real se redondea hacia arriba
+ESPERA_BASE_SEGUNDOS = 30
+ESPERA_MAXIMA_SEGUNDOS = 600
+
+# Vigencia de un lugar del semáforo; cubre el timeout de 30 s de la petición al PAC
+DURACION_LUGAR_SEGUNDOS = 120
+
+# Espera antes de volver a intentar cuando todos los lugares están ocupados
+ESPERA_LUGAR_SEGUNDOS = 15
+
+# Una factura en Pendiente o Timbrando sin cambios por más de este tiempo perdió
+# su job (worker caído, cola vaciada); cubre la espera máxima entre reintentos
+TIMBRADO_ATASCADO_SEGUNDOS = 900
+
+# Prefijo de las claves del semáforo en Redis
+PREFIJO_TIMBRADO = "endersuite:timbrado"
+
+# Evento realtime que recibe el formulario de la factura
+EVENTO_TIMBRADO = "timbrado_factura"
+
+# Borra el lugar solo si sigue siendo de la factura, en una sola operación de Redis
+LIBERAR_LUGAR_LUA = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+	return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+# ============================================================================
+# COLA DE TIMBRADO
+# ============================================================================
+
+def encolar_timbrado(factura, archivo_cer=None, archivo_key=None):
+	"""
+	Marca una factura como pendiente y encola su timbrado en segundo plano, para
+	que la petición web no espere la respuesta del PAC.
+
+	Args:
+		factura: Documento de Factura de Venta enviado y sin UUID
+		archivo_cer (str): URL de un .cer subido para este timbrado (opcional)
+		archivo_key (str): URL de un .key subido para este timbrado (opcional)
+
+	Returns:
+		bool: False si la factura ya estaba en cola o timbrándose (y no está atascada)
+	"""
+	if factura.get("estado_timbrado") in (ESTADO_PENDIENTE, ESTADO_TIMBRANDO) and not _timbrado_atascado(factura):
+		return False
+
+	factura.db_set({"estado_timbrado": ESTADO_PENDIENTE, "error_timbrado": None, "inicio_timbrado": now_datetime()})
+
+	frappe.enqueue(
+		"endersuite.ventas.services.stamping_service.procesar_timbrado",
+		queue="long",
+		job_id=f"timbrado_factura::{factura.name}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		factura_name=factura.name,
+		archivo_cer=archivo_cer,
+		archivo_key=archivo_key
+	)
+	return True
+
+
+def procesar_timbrado(factura_name, archivo_cer=None, archivo_key=None, intento=1):
+	"""
+	Hace un intento de timbrado en segundo plano y avisa al formulario por realtime.
+
+	Un error transitorio no se espera dentro del job: la factura vuelve a
+	Pendiente y el reintento se programa con espera exponencial (ver
+	encolar_reintentos_vencidos), así el worker y el lugar del semáforo quedan
+	libres mientras tanto. Si todos los lugares del semáforo están ocupados, el
+	mismo intento se reprograma unos segundos después en lugar de esperar. Los
+	rechazos del PAC (datos fiscales inválidos, certificados) no se reintentan.
+
+	Args:
+		factura_name (str): Nombre de la Factura de Venta
+		archivo_cer (str): URL de un .cer subido para este timbrado (opcional)
+		archivo_key (str): URL de un .key subido para este timbrado (opcional)
+		intento (int): Número de intento, desde 1
+	"""
+	factura = frappe.get_doc("Factura de Venta", factura_name)
+
+	if factura.uuid:
+		# Otro proceso ya la timbró
+		factura.db_set({"estado_timbrado": ESTADO_TIMBRADA, "error_timbrado": None})
+		frappe.db.commit()
+		_notificar(factura)
+		return
+
+	lugar = _tomar_lugar(factura_name)
+	if lugar is None:
+		# Sigue en cola: se renueva inicio_timbrado para que no cuente como atascada
+		factura.db_set("inicio_timbrado", now_datetime())
+		frappe.db.commit()
+		_agendar(factura_name, archivo_cer, archivo_key, intento, ESPERA_LUGAR_SEGUNDOS)
+		return
+
+	factura.db_set({"estado_timbrado": ESTADO_TIMBRANDO, "inicio_timbrado": now_datetime()})
+	frappe.db.commit()
+
+	try:
+		servicio = _crear_servicio(archivo_cer, archivo_key)
+		resultado = servicio.timbrar_factura(factura)
+	except Exception as e:
+		frappe.log_error(title=_("Error al timbrar factura {0}").format(factura_name), message=frappe.get_traceback())
+		resultado = {"success": False, "error": str(e)}
+	finally:
+		_liberar_lugar(lugar, factura_name)
+
+	if resultado.get("success"):
+		_guardar_timbrado(factura, resultado)
+	elif resultado.get("transitorio") and intento < MAX_INTENTOS_TIMBRADO:
+		_programar_reintento(factura, intento, archivo_cer, archivo_key, resultado.get("error"))
+	else:
+		factura.db_set({
+			"estado_timbrado": ESTADO_ERROR,
+			"error_timbrado": resultado.get("error") or _("Error desconocido")
+		})
+
+	frappe.db.commit()
+	_notificar(factura)
+
+
+def _crear_servicio(archivo_cer=None, archivo_key=None):
+	"""Servicio PAC con la configuración guardada o con los certificados subidos"""
+	from endersuite.ventas.services.pac_service import ServicioPAC
+
+	servicio = ServicioPAC()
+
+	if archivo_cer and archivo_key:
+		from endersuite.ventas.doctype.factura_de_venta.factura_de_venta import _leer_contenido_archivo
+
+		cer_contenido = _leer_contenido_archivo(archivo_cer)
+		key_contenido = _leer_contenido_archivo(archivo_key)
+		if not cer_contenido or not key_contenido:
+			frappe.throw(_("No se pudieron leer los archivos de certificados"))
+
+		servicio.config.csd_cer_pem = cer_contenido
+		servicio.config.csd_key_pem = key_contenido
+
+	return servicio
+
+
+def _espera_reintento(intento):
+	"""Espera exponencial con variación aleatoria para no reintentar todos a la vez"""
+	espera = min(ESPERA_MAXIMA_SEGUNDOS, ESPERA_BASE_SEGUNDOS * 2 ** (intento - 1))
+	return espera * random.uniform(0.5, 1)
+
+
+def _guardar_timbrado(factura, resultado):
+	"""Guarda UUID, XML/PDF y fecha de timbrado en la factura enviada"""
+	fecha_timbrado = resultado.get("fecha_timbrado")
+	datos_timbrado = {
+		"XML": resultado.get("xml"),
+		"PDF": resultado.get("pdf"),
+		"UUID": resultado.get("uuid"),
+		"fecha_timbrado": str(fecha_timbrado)
+	}
+
+	factura.db_set({
+		"uuid": resultado.get("uuid"),
+		"xml_timbrado": json.dumps(datos_timbrado),
+		"fecha_de_timbrado": fecha_timbrado.date() if fecha_timbrado else frappe.utils.nowdate(),
+		"estado_timbrado": ESTADO_TIMBRADA,
+		"error_timbrado": None
+	})
+
+
+def _notificar(factura):
+	"""Avisa al formulario abierto de la factura que terminó el timbrado"""
+	frappe.publish_realtime(
+		EVENTO_TIMBRADO,
+		{
+			"name": factura.name,
+			"estado": factura.estado_timbrado,
+			"uuid": factura.uuid,
+			"error": factura.error_timbrado
+		},
+		doctype="Factura de Venta",
+		docname=factura.name
+	)
+
+
+# ============================================================================
+# REINTENTOS
+# ============================================================================
+
+def _programar_reintento(factura, intento, archivo_cer, archivo_key, error):
+	"""Deja la factura en Pendiente y agenda su siguiente intento en Redis"""
+	espera = _espera_reintento(intento)
+	factura.db_set({
+		"estado_timbrado": ESTADO_PENDIENTE,
+		"error_timbrado": _("Error temporal del PAC, intento {0} de {1} en {2} s: {3}").format(
+			intento + 1, MAX_INTENTOS_TIMBRADO, int(espera), error or ""
+		),
+		"inicio_timbrado": now_datetime()
+	})
+	_agendar(factura.name, archivo_cer, archivo_key, intento + 1, espera)
+
+
+def _agendar(factura_name, archivo_cer, archivo_key, intento, espera):
+	"""Agrega un intento a la cola de reintentos de Redis para dentro de `espera` segundos"""
+	pipe = _pipeline()
+	pipe.zadd(_clave("reintentos"), {
+		json.dumps({
+			"factura_name": factura_name,
+			"archivo_cer": archivo_cer,
+			"archivo_key": archivo_key,
+			"intento": intento
+		}): time.time() + espera
+	})
+	pipe.execute()
+
+
+def _tomar_reintentos_vencidos():
+	"""
+	Saca de Redis los reintentos cuya espera ya terminó. Solo el proceso que
+	logra el ZREM de un reintento lo devuelve, así no se encola dos veces.
+
+	Returns:
+		list: kwargs de procesar_timbrado por reintento
+	"""
+	clave = _clave("reintentos")
+	pipe = _pipeline()
+	pipe.zrangebyscore(clave, "-inf", time.time())
+	vencidos = pipe.execute()[0]
+	if not vencidos:
+		return []
+
+	pipe = _pipeline()
+	for miembro in vencidos:
+		pipe.zrem(clave, miembro)
+	tomados = pipe.execute()
+
+	return [json.loads(miembro) for miembro, tomado in zip(vencidos, tomados, strict=True) if tomado]
+
+
+def encolar_reintentos_vencidos():
+	"""
+	Encola los timbrados cuya espera de reintento terminó.
+	Llamado cada minuto desde scheduler_events.
+	"""
+	for reintento in _tomar_reintentos_vencidos():
+		frappe.enqueue(
+			"endersuite.ventas.services.stamping_service.procesar_timbrado",
+			queue="long",
+			job_id=f"timbrado_factura::{reintento['factura_name']}",
+			deduplicate=True,
+			**reintento
+		)
+
+
+def _timbrado_atascado(factura):
+	"""Si la factura lleva en Pendiente o Timbrando más de TIMBRADO_ATASCADO_SEGUNDOS"""
+	inicio = factura.get("inicio_timbrado") or factura.get("modified")
+	return get_datetime(inicio) < add_to_date(now_datetime(), seconds=-TIMBRADO_ATASCADO_SEGUNDOS)
+
+
+def recuperar_timbrados_atascados():
+	"""
+	Vuelve a encolar las facturas que quedaron en Pendiente o Timbrando porque su
+	job se perdió (worker caído a mitad del timbrado, cola de Redis vaciada).
+	El nuevo job empieza en el intento 1 con los certificados de Configuracion PAC.
+	Llamado cada 10 minutos desde scheduler_events.
+	"""
+	limite = add_to_date(now_datetime(), seconds=-TIMBRADO_ATASCADO_SEGUNDOS)
+	atascadas = frappe.db.sql("""
+		SELECT name FROM `tabFactura de Venta`
+		WHERE docstatus = 1
+			AND estado_timbrado IN %(estados)s
+			AND IFNULL(uuid, '') = ''
+			AND COALESCE(inicio_timbrado, modified) < %(limite)s
+	""", {"estados": (ESTADO_PENDIENTE, ESTADO_TIMBRANDO), "limite": limite}, pluck=True)
+
+	for factura_name in atascadas:
+		encolar_timbrado(frappe.get_doc("Factura de Venta", factura_name))
+		frappe.db.commit()
+
+
+# ============================================================================
+# LÍMITE DE CONCURRENCIA
+# ============================================================================
+
+def _clave(*partes):
+	return frappe.cache.make_key(":".join((PREFIJO_TIMBRADO,) + partes))
+
+
+def _pipeline():
+	"""Pipeline de Redis sin el prefijado automático de RedisWrapper; las claves ya vienen de _clave"""
+	return frappe.cache.pipeline(transaction=False)
+
+
+def _tomar_lugar(factura_name):
+	"""
+	Intenta ocupar uno de los MAX_TIMBRADOS_CONCURRENTES lugares del semáforo.
+	Cada lugar expira solo, así que un worker caído no lo retiene.
+
+	Returns:
+		int|None: Lugar ocupado o None si todos están ocupados
+	"""
+	for lugar in range(MAX_TIMBRADOS_CONCURRENTES):
+		pipe = _pipeline()
+		pipe.set(_clave("lugar", str(lugar)), factura_name, nx=True, ex=DURACION_LUGAR_SEGUNDOS)
+		if pipe.execute()[0]:
+			return lugar
+	return None
+
+
+def _liberar_lugar(lugar, factura_name):
+	"""Libera el lugar si todavía es de esta factura (pudo expirar y tomarlo otra)"""
+	pipe = _pipeline()
+	pipe.eval(LIBERAR_LUGAR_LUA, 1, _clave("lugar", str(lugar)), factura_name)
+	pipe.execute()
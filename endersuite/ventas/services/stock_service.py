@@ -4,9 +4,174 @@ Servicios de gestión de inventario y stock para POS
 
 import frappe
 from frappe import _
+from frappe.utils import flt, now_datetime
 import json
 
 
+STOCK_SIN_CONTROL = 999999
+
+
+def get_datos_stock(productos, almacen=None):
+	"""
+	Obtiene los datos de control de stock de varios productos en una sola consulta.
+
+	Con almacén la existencia se lee de Stock por Almacen (índice único
+	producto+almacén); sin almacén se usa Producto.cantidad_disponible.
+
+	Args:
+		productos (list): Nombres de productos
+		almacen (str, optional): Nombre del almacén
+
+	Returns:
+		dict: producto -> {nombre_del_producto, mantener_stock, requiere_lote,
+			requiere_serie, cantidad_disponible}. Los productos inexistentes no aparecen.
+	"""
+	productos = [p for p in set(productos or []) if p]
+	if not productos:
+		return {}
+
+	if almacen:
+		filas = frappe.db.sql("""
+			SELECT
+				p.name, p.nombre_del_producto, p.mantener_stock, p.requiere_lote, p.requiere_serie,
+				s.cantidad_disponible
+			FROM `tabProducto` p
+			LEFT JOIN `tabStock por Almacen` s
+				ON s.producto = p.name AND s.almacen = %(almacen)s
+			WHERE p.name IN %(productos)s
+		""", {"almacen": almacen, "productos": tuple(productos)}, as_dict=True)
+	else:
+		filas = frappe.db.sql("""
+			SELECT
+				name, nombre_del_producto, mantener_stock, requiere_lote, requiere_serie,
+				cantidad_disponible
+			FROM `tabProducto`
+			WHERE name IN %(productos)s
+		""", {"productos": tuple(productos)}, as_dict=True)
+
+	for fila in filas:
+		fila.cantidad_disponible = flt(fila.cantidad_disponible)
+
+	return {fila.name: fila for fila in filas}
+
+
+def get_existencias(productos, almacen=None):
+	"""
+	Obtiene la existencia de varios productos en una sola consulta.
+	Los productos sin control de stock devuelven STOCK_SIN_CONTROL.
+
+	Args:
+		productos (list): Nombres de productos
+		almacen (str, optional): Nombre del almacén
+
+	Returns:
+		dict: producto -> cantidad disponible
+	"""
+	datos = get_datos_stock(productos, almacen)
+
+	existencias = {p: 0 for p in productos or [] if p}
+	for producto, dato in datos.items():
+		existencias[producto] = dato.cantidad_disponible if dato.mantener_stock else STOCK_SIN_CONTROL
+
+	return existencias
+
+
+def validar_disponibilidad(items, almacen=None, validar_lotes_series=True, datos=None):
+	"""
+	Valida la disponibilidad de todo un carrito o movimiento con una sola consulta.
+
+	Las cantidades se suman por producto antes de comparar contra la existencia,
+	así que varias líneas del mismo SKU no pueden sobrevender.
+
+	Args:
+		items (list): Diccionarios o filas hijas con producto, cantidad y detalle_lote_serie
+		almacen (str, optional): Almacén contra el que se valida
+		validar_lotes_series (bool): Exigir lotes/series en productos que los requieren
+		datos (dict, optional): Resultado previo de get_datos_stock para no repetir la consulta
+
+	Returns:
+		dict: {"valido": bool, "errores": [{idx, producto, tipo, mensaje, disponible, requerido}]}
+			donde tipo es "no_existe", "stock", "lote" o "serie"
+	"""
+	items = list(items or [])
+	if datos is None:
+		datos = get_datos_stock([item.get("producto") for item in items], almacen)
+
+	requerido = {}
+	lineas = {}
+	for idx, item in enumerate(items, start=1):
+		producto = item.get("producto")
+		requerido[producto] = requerido.get(producto, 0) + flt(item.get("cantidad"))
+		lineas.setdefault(producto, []).append(item.get("idx") or idx)
+
+	errores = []
+	reportados = set()
+
+	for idx, item in enumerate(items, start=1):
+		idx = item.get("idx") or idx
+		producto = item.get("producto")
+		cantidad = flt(item.get("cantidad"))
+		dato = datos.get(producto)
+
+		if not dato:
+			errores.append({
+				"idx": idx,
+				"producto": producto,
+				"tipo": "no_existe",
+				"mensaje": _("Fila #{0}: el producto {1} no existe").format(idx, producto)
+			})
+			continue
+
+		# El stock se valida una vez por producto, con la cantidad total del documento
+		if dato.mantener_stock and producto not in reportados and requerido[producto] > dato.cantidad_disponible:
+			reportados.add(producto)
+			errores.append({
+				"idx": idx,
+				"lineas": lineas[producto],
+				"producto": producto,
+				"tipo": "stock",
+				"disponible": dato.cantidad_disponible,
+				"requerido": requerido[producto],
+				"mensaje": _("Stock insuficiente para {0}. Disponible: {1}, Requerido: {2}").format(
+					dato.nombre_del_producto or producto, dato.cantidad_disponible, requerido[producto]
+				)
+			})
+
+		if not validar_lotes_series:
+			continue
+
+		detalle = item.get("detalle_lote_serie") or []
+
+		# Validar lotes si es requerido
+		if dato.requiere_lote:
+			total_lotes = sum(flt(d.get("cantidad")) for d in detalle if d.get("lote"))
+			if total_lotes < cantidad:
+				errores.append({
+					"idx": idx,
+					"producto": producto,
+					"tipo": "lote",
+					"requerido": cantidad,
+					"mensaje": _("Debe especificar lotes para {0}").format(producto)
+				})
+
+		# Validar series si es requerido
+		if dato.requiere_serie:
+			series_count = len([d for d in detalle if d.get("serie")])
+			if series_count < cantidad:
+				errores.append({
+					"idx": idx,
+					"producto": producto,
+					"tipo": "serie",
+					"requerido": cantidad,
+					"mensaje": _("Debe especificar {0} series para {1}").format(int(cantidad), producto)
+				})
+
+	return {
+		"valido": not errores,
+		"errores": errores
+	}
+
+
 @frappe.whitelist()
 def get_stock(producto, almacen):
 	"""
@@ -19,13 +184,8 @@ def get_stock(producto, almacen):
 	Returns:
 		float: Cantidad disponible
 	"""
-	producto_doc = frappe.get_doc("Producto", producto)
-
-	if not producto_doc.mantener_stock:
-		return 999999  # Stock infinito para productos sin control
-
-	# TODO: Implementar agregación por almacén cuando tengamos movimientos
-	return producto_doc.cantidad_disponible or 0
+	# Productos sin control de stock devuelven STOCK_SIN_CONTROL (stock infinito)
+	return get_existencias([producto], almacen).get(producto, 0)
 
 
 @frappe.whitelist()
@@ -40,12 +200,20 @@ def get_stock_detallado(producto, almacen):
 	Returns:
 		dict: Información detallada de stock
 	"""
-	producto_doc = frappe.get_doc("Producto", producto)
+	producto_doc = frappe.db.get_value(
+		"Producto",
+		producto,
+		["requiere_lote", "requiere_serie"],
+		as_dict=True
+	)
+
+	if not producto_doc:
+		frappe.throw(_("El producto {0} no existe").format(producto))
 
 	resultado = {
 		"producto": producto,
 		"almacen": almacen,
-		"cantidad_disponible": producto_doc.cantidad_disponible or 0,
+		"cantidad_disponible": get_existencias([producto], almacen).get(producto, 0),
 		"requiere_lote": producto_doc.requiere_lote or 0,
 		"requiere_serie": producto_doc.requiere_serie or 0,
 		"lotes": [],
@@ -91,54 +259,191 @@ def check_availability(items, almacen):
 		almacen (str): Nombre del almacén
 
 	Returns:
-		dict: {"valido": bool, "errores": list}
+		dict: {"valido": bool, "errores": list, "detalle": list}
 	"""
 	if isinstance(items, str):
 		items = json.loads(items)
 
-	errores = []
+	resultado = validar_disponibilidad(items, almacen)
 
-	for item in items:
-		producto = item.get("producto")
-		cantidad = float(item.get("cantidad", 0))
+	return {
+		"valido": resultado["valido"],
+		"errores": [e["mensaje"] for e in resultado["errores"]],
+		"detalle": resultado["errores"]
+	}
 
-		producto_doc = frappe.get_doc("Producto", producto)
 
-		# Validar stock si mantiene control
-		if producto_doc.mantener_stock:
-			stock_disponible = producto_doc.cantidad_disponible or 0
+def _bloquear_stock_almacen(productos, almacen):
+	"""
+	Asegura que exista la fila de Stock por Almacen de cada producto y la bloquea.
 
-			if cantidad > stock_disponible:
-				errores.append(
-					_("Stock insuficiente para {0}. Disponible: {1}, Requerido: {2}").format(
-						producto, stock_disponible, cantidad
-					)
-				)
+	Returns:
+		dict: producto -> cantidad disponible en el almacén
+	"""
+	existentes = frappe.db.sql("""
+		SELECT producto
+		FROM `tabStock por Almacen`
+		WHERE almacen = %(almacen)s AND producto IN %(productos)s
+	""", {"almacen": almacen, "productos": tuple(productos)}, pluck=True)
+
+	for producto in set(productos) - set(existentes):
+		try:
+			frappe.get_doc({
+				"doctype": "Stock por Almacen",
+				"producto": producto,
+				"almacen": almacen,
+				"cantidad_disponible": 0
+			}).db_insert()
+		except frappe.DuplicateEntryError:
+			# Otra caja la creó en paralelo; el índice único lo garantiza
+			pass
 
-		# Validar lotes si es requerido
-		if producto_doc.requiere_lote:
-			detalle_lotes = item.get("detalle_lote_serie", [])
-			total_lotes = sum(float(d.get("cantidad", 0)) for d in detalle_lotes if d.get("lote"))
+	filas = frappe.db.sql("""
+		SELECT producto, cantidad_disponible
+		FROM `tabStock por Almacen`
+		WHERE almacen = %(almacen)s AND producto IN %(productos)s
+		ORDER BY producto
+		FOR UPDATE
+	""", {"almacen": almacen, "productos": tuple(productos)})
 
-			if total_lotes < cantidad:
-				errores.append(
-					_("Debe especificar lotes para {0}").format(producto)
-				)
+	return {producto: flt(cantidad) for producto, cantidad in filas}
 
-		# Validar series si es requerido
-		if producto_doc.requiere_serie:
-			detalle_series = item.get("detalle_lote_serie", [])
-			series_count = len([d for d in detalle_series if d.get("serie")])
 
-			if series_count < cantidad:
-				errores.append(
-					_("Debe especificar {0} series para {1}").format(int(cantidad), producto)
-				)
+def aplicar_deltas_stock(deltas, almacen=None, tipo_movimiento=None, referencia=None, es_cancelacion=False):
+	"""
+	Aplica los cambios de cantidad de un movimiento de forma atómica.
 
-	return {
-		"valido": len(errores) == 0,
-		"errores": errores
-	}
+	Bloquea las filas de los productos (en orden de nombre, para evitar deadlocks
+	entre cajas), valida que ninguna cantidad quede negativa y aplica todos los
+	deltas con un solo UPDATE. Los productos sin control de stock se ignoran.
+	Las cancelaciones no validan negativos: revertir una entrada ya consumida
+	siempre se permite, igual que antes de agrupar los deltas.
+
+	Con almacén, además actualiza Stock por Almacen (la validación de negativos
+	se hace contra la existencia del almacén) y agrega una entrada por producto
+	al Registro de Stock.
+
+	Args:
+		deltas (dict): producto -> cantidad a sumar (negativa para salidas)
+		almacen (str, optional): Almacén del movimiento
+		tipo_movimiento (str, optional): Tipo de movimiento, para el evento realtime
+		referencia (str, optional): Movimiento de Stock que origina el cambio
+		es_cancelacion (bool): Si el cambio revierte un movimiento cancelado
+
+	Returns:
+		dict: producto -> {"anterior": float, "nuevo": float[, "almacen_anterior", "almacen_nuevo"]}
+	"""
+	deltas = {p: flt(d) for p, d in deltas.items() if p and flt(d)}
+	if not deltas:
+		return {}
+
+	productos = frappe.db.sql("""
+		SELECT name, nombre_del_producto, cantidad_disponible
+		FROM `tabProducto`
+		WHERE name IN %(productos)s AND mantener_stock = 1
+		ORDER BY name
+		FOR UPDATE
+	""", {"productos": tuple(deltas)}, as_dict=True)
+
+	if not productos:
+		return {}
+
+	existencias_almacen = _bloquear_stock_almacen([p.name for p in productos], almacen) if almacen else {}
+
+	cambios = {}
+	for producto in productos:
+		delta = deltas[producto.name]
+		cambio = {
+			"anterior": flt(producto.cantidad_disponible),
+			"nuevo": flt(producto.cantidad_disponible) + delta
+		}
+		disponible = cambio["anterior"]
+
+		if almacen:
+			cambio["almacen_anterior"] = existencias_almacen.get(producto.name, 0)
+			cambio["almacen_nuevo"] = cambio["almacen_anterior"] + delta
+			disponible = cambio["almacen_anterior"]
+
+		if not es_cancelacion and disponible + delta < 0:
+			frappe.throw(_("Stock insuficiente para {0}. Disponible: {1}, Requerido: {2}").format(
+				producto.nombre_del_producto or producto.name,
+				disponible,
+				-delta
+			))
+
+		cambios[producto.name] = cambio
+
+	casos = " ".join(["WHEN %s THEN %s"] * len(cambios))
+	valores = []
+	for producto in cambios:
+		valores.extend([producto, deltas[producto]])
+
+	# `modified` cambia para que get_catalog_changes detecte el stock global sin almacén
+	frappe.db.sql(f"""
+		UPDATE `tabProducto`
+		SET cantidad_disponible = COALESCE(cantidad_disponible, 0) + CASE name {casos} ELSE 0 END,
+			modified = %s
+		WHERE name IN %s AND mantener_stock = 1
+	""", (*valores, now_datetime(), tuple(cambios)))
+
+	if almacen:
+		frappe.db.sql(f"""
+			UPDATE `tabStock por Almacen`
+			SET cantidad_disponible = COALESCE(cantidad_disponible, 0) + CASE producto {casos} ELSE 0 END,
+				modified = %s
+			WHERE almacen = %s AND producto IN %s
+		""", (*valores, now_datetime(), almacen, tuple(cambios)))
+
+		_registrar_stock(cambios, deltas, almacen, tipo_movimiento, referencia, es_cancelacion)
+
+	for producto, cambio in cambios.items():
+		# Emitir evento de actualización de stock en tiempo real
+		frappe.publish_realtime(
+			event='stock_updated',
+			message={
+				'producto': producto,
+				'almacen': almacen,
+				'cantidad_disponible': cambio.get("almacen_nuevo", cambio["nuevo"]),
+				'cantidad_total': cambio["nuevo"],
+				'tipo_movimiento': tipo_movimiento
+			},
+			doctype='Producto',
+			docname=producto
+		)
+
+		frappe.logger().info(
+			f"Movimiento de Stock: {referencia} | "
+			f"Producto: {producto} | "
+			f"Almacén: {almacen} | "
+			f"Tipo: {tipo_movimiento} | "
+			f"Cantidad: {deltas[producto]} | "
+			f"Stock Anterior: {cambio['anterior']} | "
+			f"Stock Nuevo: {cambio['nuevo']}"
+		)
+
+	return cambios
+
+
+def _registrar_stock(cambios, deltas, almacen, tipo_movimiento, referencia, es_cancelacion):
+	"""Agrega al Registro de Stock una entrada por producto con un solo INSERT"""
+	ahora = now_datetime()
+	usuario = frappe.session.user
+	campos = [
+		"name", "creation", "modified", "owner", "modified_by", "docstatus",
+		"producto", "almacen", "fecha", "cantidad", "cantidad_resultante",
+		"tipo_movimiento", "movimiento_de_stock", "es_cancelacion"
+	]
+
+	valores = [
+		(
+			frappe.generate_hash(length=10), ahora, ahora, usuario, usuario, 0,
+			producto, almacen, ahora, deltas[producto], cambio["almacen_nuevo"],
+			tipo_movimiento, referencia, 1 if es_cancelacion else 0
+		)
+		for producto, cambio in cambios.items()
+	]
+
+	frappe.db.bulk_insert("Registro de Stock", campos, valores)
 
 
 def decrement_stock(nota_venta_doc, method=None):
@@ -177,10 +482,17 @@ def decrement_stock(nota_venta_doc, method=None):
 		"detalles": []
 	})
 
+	# Reutilizar los datos precargados por create_sale; si no existen, una sola consulta
+	contexto = nota_venta_doc.flags.get("contexto_venta")
+	if contexto and contexto.perfil.almacen == almacen:
+		datos = contexto.datos_stock
+	else:
+		datos = get_datos_stock([item.producto for item in nota_venta_doc.tabla_de_productos])
+
 	for item in nota_venta_doc.tabla_de_productos:
-		producto_doc = frappe.get_doc("Producto", item.producto)
+		producto_doc = datos.get(item.producto)
 
-		if not producto_doc.mantener_stock:
+		if not producto_doc or not producto_doc.mantener_stock:
 			continue
 
 		cantidad = float(item.cantidad)
@@ -214,8 +526,11 @@ def decrement_stock(nota_venta_doc, method=None):
 
 		movimiento.append("detalles", detalle)
 
-	# Guardar y enviar el movimiento (esto actualizará el stock automáticamente)
+	# Guardar y enviar el movimiento (esto actualizará el stock automáticamente).
+	# La disponibilidad ya se validó en la nota y aplicar_deltas_stock vuelve a
+	# comprobarla con las filas bloqueadas, así que se omite la validación previa.
 	if movimiento.detalles:
+		movimiento.flags.omitir_validacion_stock = True
 		movimiento.insert(ignore_permissions=True)
 		movimiento.submit()
 
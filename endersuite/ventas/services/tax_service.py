@@ -0,0 +1,142 @@
+import frappe
+from frappe.utils import flt
+
+
+# Contador en Redis (por sitio) con la versión de la tabla de impuestos
+CLAVE_VERSION_IMPUESTOS = "endersuite:impuestos:contador"
+
+# Tablas de impuestos en memoria del proceso: sitio -> (versión, tabla).
+# Un worker atiende varios sitios del bench, así que nunca se comparten entre sitios
+_tasas = {}
+
+
+# ============================================================================
+# TABLA DE TASAS
+# ============================================================================
+
+def _version_actual():
+	# Contador entero sin el prefijado automático de RedisWrapper; make_key ya lo limita al sitio
+	pipe = frappe.cache.pipeline(transaction=False)
+	pipe.get(frappe.cache.make_key(CLAVE_VERSION_IMPUESTOS))
+	return int(pipe.execute()[0] or 0)
+
+
+def getget_tabla_tasas():
+	"""
+	Tabla completa de impuestos del sitio en este proceso.
+
+	El catálogo de impuestos es pequeño, así que se carga entero en una sola
+	consulta y se reutiliza hasta que otro proceso incremente la versión en
+	Redis al guardar un impuesto. Cada llamada lee esa versión, así que quien
+	consulta varias líneas debe obtener la tabla una vez y buscar en ella.
+
+	Returns:
+		dict: impuesto -> frappe._dict(porciento_impuesto, incluido_en_el_precio)
+	"""
+	version = _version_actual()
+	cargada = _tasas.get(frappe.local.site)
+	if not cargada or cargada[0] != version:
+		tabla = {
+			imp.name: frappe._dict({
+				"porciento_impuesto": flt(imp.porciento_impuesto),
+				"incluido_en_el_precio": imp.incluido_en_el_precio or 0
+			})
+			for imp in frappe.get_all(
+				"Impuestos",
+				fields=["name", "porciento_impuesto", "incluido_en_el_precio"],
+				limit_page_length=0
+			)
+		}
+		cargada = _tasas[frappe.local.site] = (version, tabla)
+
+	return cargada[1]
+
+
+def get_tasa(impuesto):
+	"""
+	Datos de un impuesto desde la tabla en memoria.
+
+	Args:
+		impuesto (str): Nombre del impuesto
+
+	Returns:
+		frappe._dict|None: {porciento_impuesto, incluido_en_el_precio}
+	"""
+	if not impuesto:
+		return None
+	return get_tabla_tasas().get(impuesto)
+
+
+def get_porcentaje(impuesto):
+	"""
+	Porcentaje de un impuesto; 0 si no existe o no se indica.
+
+	Args:
+		impuesto (str): Nombre del impuesto
+
+	Returns:
+		float: Porcentaje del impuesto
+	"""
+	tasa = get_tasa(impuesto)
+	return tasa.porciento_impuesto if tasa else 0
+
+
+def get_impuestos_productos(productos):
+	"""
+	Impuesto de cada producto de un documento en una sola consulta.
+
+	Args:
+		productos (list): Nombres de producto; se ignoran vacíos y repetidos
+
+	Returns:
+		dict: producto -> frappe._dict(tipo_de_impuesto, porciento_impuesto,
+			incluido_en_el_precio). Los productos sin impuesto tienen porcentaje 0.
+	"""
+	productos = list({p for p in productos or [] if p})
+	if not productos:
+		return {}
+
+	tasas = get_tabla_tasas()
+	resultado = {}
+	for producto, impuesto in frappe.get_all(
+		"Producto",
+		filters={"name": ["in", productos]},
+		fields=["name", "tipo_de_impuesto"],
+		as_list=True,
+		limit_page_length=0
+	):
+		tasa = tasas.get(impuesto) if impuesto else None
+		resultado[producto] = frappe._dict({
+			"tipo_de_impuesto": impuesto if tasa else None,
+			"porciento_impuesto": tasa.porciento_impuesto if tasa else 0,
+			"incluido_en_el_precio": tasa.incluido_en_el_precio if tasa else 0
+		})
+
+	return resultado
+
+
+# ============================================================================
+# INVALIDACIÓN
+# ============================================================================
+
+def invalidar_tasas(doc=None, method=None):
+	"""
+	Invalida la tabla de impuestos del sitio en todos los procesos.
+	Llamado desde hooks on_update y on_trash de Impuestos.
+
+	Args:
+		doc: Documento de Impuestos
+		method: Nombre del método del hook (pasado automáticamente por Frappe)
+	"""
+	_tasas.pop(frappe.local.site, None)
+
+	_incrementar_version()
+	# Otra vez al confirmar, por si otro proceso recargó la tabla antes del commit
+	frappe.db.after_commit.add(_incrementar_version)
+
+
+def _incrementar_version():
+	# INCRBY es atómico: dos invalidaciones simultáneas dan dos versiones distintas
+	pipe = frappe.cache.pipeline(transaction=False)
+	pipe.incrby(frappe.cache.make_key(CLAVE_VERSION_IMPUESTOS), 1)
+	pipe.execute()
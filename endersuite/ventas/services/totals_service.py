@@ -0,0 +1,206 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from frappe.utils import cint, flt
+
+from endersuite.ventas.services.tax_service import get_impuestos_productos, get_tabla_tasas
+
+
+CERO = Decimal(0)
+CIEN = Decimal(100)
+
+
+# ============================================================================
+# MOTOR DE TOTALES
+# ============================================================================
+
+def _decimal(valor):
+	"""Convierte a Decimal usando la representación corta del float, no su binario"""
+	if isinstance(valor, Decimal):
+		return valor
+	return Decimal(str(flt(valor)))
+
+
+def _columna(valores, n, defecto=CERO):
+	if valores is None:
+		return [defecto] * n
+	return [_decimal(v) for v in valores]
+
+
+def _redondear(valor, cuanto):
+	return float(valor.quantize(cuanto, rounding=ROUND_HALF_UP))
+
+
+def calcular_totales(cantidades, precios, descuentos=None, tasas=None, incluidos=None,
+					 descuento_global=0, descuento_con_impuesto=False, precision=2):
+	"""
+	Calcula importes por línea y totales de un documento en una sola pasada.
+
+	Recibe las líneas por columnas y opera con Decimal sin redondeos intermedios;
+	solo los valores devueltos se redondean a `precision` (medio hacia arriba).
+
+	Semántica por defecto (Nota de Venta, Orden de Venta, Cotización):
+		subtotal = cantidad × precio; descuento = subtotal × descuento%;
+		base = subtotal − descuento; impuesto = base × tasa%.
+		El descuento global se calcula sobre el subtotal y reduce la base total;
+		los impuestos se prorratean en la misma proporción.
+
+	Con `descuento_con_impuesto` (Factura de Venta) el impuesto se calcula sobre
+	el subtotal completo y el descuento de la línea sobre el precio con impuesto.
+
+	Con `incluidos` el precio de esas líneas ya trae el impuesto y se separa antes
+	de calcular.
+
+	Args:
+		cantidades (list): Cantidad por línea
+		precios (list): Precio unitario por línea
+		descuentos (list, optional): Porcentaje de descuento por línea
+		tasas (list, optional): Porcentaje de impuesto por línea
+		incluidos (list, optional): Si el precio de la línea incluye el impuesto
+		descuento_global (float): Porcentaje de descuento global del documento
+		descuento_con_impuesto (bool): Semántica de descuento de Factura de Venta
+		precision (int): Decimales de los importes devueltos
+
+	Returns:
+		dict: {lineas: {subtotal, descuento, base, impuesto, total} (listas),
+			subtotal, descuento_lineas, descuento_global, base_imponible,
+			impuestos, total}
+	"""
+	n = len(cantidades)
+	cuanto = Decimal(1).scaleb(-cint(precision))
+
+	cantidades = _columna(cantidades, n)
+	precios = _columna(precios, n)
+	descuentos = _columna(descuentos, n)
+	tasas = _columna(tasas, n)
+	incluidos = [bool(cint(v)) for v in incluidos] if incluidos is not None else [False] * n
+
+	lineas = {"subtotal": [], "descuento": [], "base": [], "impuesto": [], "total": []}
+	suma_subtotal = suma_descuento = suma_base = suma_impuesto = CERO
+
+	for cantidad, precio, descuento, tasa, incluido in zip(cantidades, precios, descuentos, tasas, incluidos, strict=True):
+		factor_impuesto = tasa / CIEN
+		subtotal = cantidad * precio
+		if incluido:
+			subtotal = subtotal / (1 + factor_impuesto)
+
+		if descuento_con_impuesto:
+			impuesto = subtotal * factor_impuesto
+			descuento_monto = (subtotal + impuesto) * descuento / CIEN
+			base = subtotal
+			total = subtotal + impuesto - descuento_monto
+		else:
+			descuento_monto = subtotal * descuento / CIEN
+			base = subtotal - descuento_monto
+			impuesto = base * factor_impuesto
+			total = base + impuesto
+
+		suma_subtotal += subtotal
+		suma_descuento += descuento_monto
+		suma_base += base
+		suma_impuesto += impuesto
+
+		lineas["subtotal"].append(_redondear(subtotal, cuanto))
+		lineas["descuento"].append(_redondear(descuento_monto, cuanto))
+		lineas["base"].append(_redondear(base, cuanto))
+		lineas["impuesto"].append(_redondear(impuesto, cuanto))
+		lineas["total"].append(_redondear(total, cuanto))
+
+	if descuento_con_impuesto:
+		monto_global = CERO
+		base_imponible = suma_base
+		impuestos = suma_impuesto
+		total = suma_subtotal + suma_impuesto - suma_descuento
+	else:
+		monto_global = suma_subtotal * _decimal(descuento_global) / CIEN
+		base_imponible = suma_base - monto_global
+		impuestos = suma_impuesto
+		# Prorratear impuestos con el descuento global
+		if monto_global > 0 and suma_base > 0:
+			impuestos = impuestos * base_imponible / suma_base
+		total = base_imponible + impuestos
+
+	return {
+		"lineas": lineas,
+		"subtotal": _redondear(suma_subtotal, cuanto),
+		"descuento_lineas": _redondear(suma_descuento, cuanto),
+		"descuento_global": _redondear(monto_global, cuanto),
+		"base_imponible": _redondear(base_imponible, cuanto),
+		"impuestos": _redondear(impuestos, cuanto),
+		"total": _redondear(total, cuanto)
+	}
+
+
+def calcular_totales_factura(items, precision=2):
+	"""
+	Calcula los totales de una Factura de Venta desde sus conceptos, con el
+	impuesto de cada producto en una sola consulta. El CFDI se arma con los
+	mismos importes por línea (ver pac_service), así sus sumas cuadran con la factura.
+
+	Impuesto sobre el importe completo y descuento sobre el precio con impuestos;
+	las líneas sin producto no llevan descuento.
+
+	Args:
+		items (list): Filas con producto__servicio, cantidad, valor y descuento
+		precision (int): Decimales de los importes devueltos
+
+	Returns:
+		dict: Resultado de calcular_totales más `impuestos_lineas`, el impuesto
+			del producto de cada línea (frappe._dict o None)
+	"""
+	impuestos = get_impuestos_productos([item.producto__servicio for item in items])
+	por_linea = [impuestos.get(item.producto__servicio) for item in items]
+
+	resultado = calcular_totales(
+		[item.cantidad for item in items],
+		[item.valor for item in items],
+		[item.descuento if item.producto__servicio else 0 for item in items],
+		[imp.porciento_impuesto if imp else 0 for imp in por_linea],
+		[imp.incluido_en_el_precio if imp else 0 for imp in por_linea],
+		descuento_con_impuesto=True,
+		precision=precision
+	)
+	resultado["impuestos_lineas"] = por_linea
+	return resultado
+
+
+def aplicar_totales_venta(doc, tabla):
+	"""
+	Calcula y asigna los totales de un documento de venta con líneas de producto
+	(Nota de Venta, Orden de Venta, Cotización), que comparten nombres de campo.
+
+	El porcentaje de cada fila y si su precio ya incluye el impuesto salen del
+	Impuesto de la fila (`incluido_en_el_precio`), desde la tabla en memoria.
+
+	Args:
+		doc: Documento con descuento_global_porcentaje
+		tabla (list): Filas con cantidad, precio_unitario, descuento_porcentaje e impuesto
+	"""
+	# La tabla se resuelve una vez por documento, no por línea
+	tabla_tasas = get_tabla_tasas()
+	impuestos = [tabla_tasas.get(item.impuesto) if item.impuesto else None for item in tabla]
+	tasas = [imp.porciento_impuesto if imp else 0 for imp in impuestos]
+
+	resultado = calcular_totales(
+		[item.cantidad for item in tabla],
+		[item.precio_unitario for item in tabla],
+		[item.descuento_porcentaje for item in tabla],
+		tasas,
+		[imp.incluido_en_el_precio if imp else 0 for imp in impuestos],
+		descuento_global=doc.descuento_global_porcentaje,
+		precision=doc.precision("total_final") or 2
+	)
+
+	lineas = resultado["lineas"]
+	for i, item in enumerate(tabla):
+		item.porcentaje_impuesto = flt(tasas[i])
+		item.subtotal_sin_impuesto = lineas["subtotal"][i]
+		item.descuento_monto = lineas["descuento"][i]
+		item.base_imponible = lineas["base"][i]
+		item.impuesto_monto = lineas["impuesto"][i]
+		item.total_linea = lineas["total"][i]
+
+	doc.subtotal = resultado["subtotal"]
+	doc.descuento_global_monto = resultado["descuento_global"]
+	doc.base_imponible_total = resultado["base_imponible"]
+	doc.total_impuestos = resultado["impuestos"]
+	doc.total_final = resultado["total"]